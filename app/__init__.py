@@ -164,9 +164,18 @@ def create_app(config_name=None):
         return redirect(url_for('auth.admin_login', next=next_url))
 
     with app.app_context():
+        from app.services import write_queue, metrics
+        from app.utils.sqlite_profile import apply_sqlite_profile
+        # Background writers only need to take turns when the database allows a single writer
+        write_queue.set_enabled(apply_sqlite_profile(app, db.engine))
+        metrics.init_app(app, db.engine)
+        # Registered before the other request hooks so their queries are profiled too
+        from app.utils.sql_profiler import init_sql_profiler
+        init_sql_profiler(app, db.engine)
+
         initialize_settings_from_db(app)
         
-        # Initialize plugin system only if plugins table exists
+        # Register plugins only if plugins table exists; their modules are imported on first use
         try:
             from app.services.plugin_manager import plugin_manager
             from app.models_plugins import Plugin
@@ -176,8 +185,7 @@ def create_app(config_name=None):
             try:
                 engine_conn = db.engine.connect()
                 if db.engine.dialect.has_table(engine_conn, Plugin.__tablename__):
-                    plugin_manager.initialize_core_plugins()
-                    plugin_manager.load_all_enabled_plugins()
+                    plugin_manager.discover_plugins()
                     current_app.logger.info("Plugin system initialized successfully.")
                 else:
                     current_app.logger.warning("Plugins table not found during initialization. Plugin system will be initialized after migrations.")
@@ -214,6 +222,8 @@ def create_app(config_name=None):
                 scheduler.init_app(app)
                 scheduler.start(paused=app.config.get('SCHEDULER_PAUSED_ON_START', False))
                 app.logger.info("APScheduler started successfully")
+                from app.services import metrics
+                metrics.watch_scheduler(scheduler)
                 
                 is_werkzeug_main_process = os.environ.get("WERKZEUG_RUN_MAIN") == "true"
                 should_schedule_tasks = False
@@ -264,6 +274,12 @@ def create_app(config_name=None):
     # Make datetime functions available in templates
     app.jinja_env.globals['datetime'] = datetime
 
+    # Compiled templates are cached on disk, and the first pages are compiled now rather than on the first request
+    from app.utils.template_cache import apply_template_cache, warm_templates
+    apply_template_cache(app)
+    if not app.testing:
+        warm_templates(app)
+
     @app.context_processor
     def inject_current_year():
         from app.utils.timezone_utils import now
@@ -336,19 +352,17 @@ def create_app(config_name=None):
         g.plex_url = None; g.app_base_url = None
         g.discord_oauth_enabled_for_invite = False; g.setup_complete = False 
 
-        # Initialize plugin system if not already done and tables exist
+        # Plugins are discovered at app creation; this catches a database that was migrated afterwards
         try:
             from app.services.plugin_manager import plugin_manager
             from app.models_plugins import Plugin
             
-            if not hasattr(plugin_manager, '_initialized'):
+            if not plugin_manager.initialized:
                 engine_conn = None
                 try:
                     engine_conn = db.engine.connect()
                     if db.engine.dialect.has_table(engine_conn, Plugin.__tablename__):
-                        plugin_manager.initialize_core_plugins()
-                        plugin_manager.load_all_enabled_plugins()
-                        plugin_manager._initialized = True
+                        plugin_manager.discover_plugins()
                         current_app.logger.info("Plugin system initialized successfully after migrations.")
                 finally:
                     if engine_conn:
@@ -418,6 +432,7 @@ def create_app(config_name=None):
             'auth.',
             'static',
             'api.',
+            'metrics.',
             # Plugin management endpoints - needed during setup
             'plugin_management.',
             # Media server routes - needed for setup
@@ -480,7 +495,7 @@ def create_app(config_name=None):
                 allowed_endpoints = [
                     'plugin_management.index', 'plugins.enable_plugin', 'plugins.disable_plugin',
                     'plugins.reload_plugins', 'plugins.install_plugin', 'plugins.uninstall_plugin',
-                    'auth.app_login', 'auth.logout', 'static', 'api.health',
+                    'auth.app_login', 'auth.logout', 'static', 'api.health', 'metrics.prometheus',
                     # Plugin management endpoints for server configuration
                     'plugin_management.configure', 'plugin_management.edit_server', 'plugin_management.add_server',
                     'plugin_management.disable_server', 'plugin_management.enable_server', 'plugin_management.delete_server',
@@ -545,6 +560,8 @@ def create_app(config_name=None):
     app.register_blueprint(streaming_bp, url_prefix='/admin')
     from .routes.libraries import bp as libraries_bp
     app.register_blueprint(libraries_bp, url_prefix='/admin')
+    from .routes.metrics import bp as metrics_bp
+    app.register_blueprint(metrics_bp)  # /metrics, for Prometheus
     
 
     register_error_handlers(app)
@@ -0,0 +1,14 @@
+# File: app/bench/__init__.py
+"""
+Performance benchmark suite (``flask bench``).
+
+``generator`` fills a scratch database with a synthetic but realistically
+shaped dataset; ``scenarios`` times the real view functions and the session
+monitor against it. Both run in a separate app created with the
+``benchmark`` config, so the database configured for MUM itself is never
+touched.
+
+``fake_servers`` provides local fake Plex, Jellyfin, Emby, Kavita, Komga,
+Audiobookshelf and RomM servers; ``fleet`` registers them in the scratch
+database and times the real sync and session-monitor code against them.
+"""
@@ -0,0 +1,196 @@
+# File: app/bench/cli.py
+"""``flask bench`` commands: generate a dataset, run scenarios, compare reports, drive a fake server fleet."""
+import json
+import os
+import sys
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+bench_cli = AppGroup('bench', help="Generate synthetic datasets and run performance benchmarks.")
+
+_database_option = click.option(
+    '--database-url', envvar='MUM_BENCH_DATABASE_URL', default=None,
+    help="Scratch database, e.g. sqlite:////tmp/mum-bench.db or postgresql://... "
+         "Defaults to instance/bench.db. Never point this at MUM's own database."
+)
+
+
+def _bench_app(database_url):
+    """Create a separate app on the scratch database, refusing to reuse the live one."""
+    from app import create_app
+    if database_url:
+        os.environ['MUM_BENCH_DATABASE_URL'] = database_url
+    app = create_app('benchmark')
+    if app.config['SQLALCHEMY_DATABASE_URI'] == current_app.config.get('SQLALCHEMY_DATABASE_URI'):
+        raise click.UsageError("The benchmark database must not be the database MUM itself uses.")
+    return app
+
+
+@bench_cli.command('generate')
+@_database_option
+@click.option('--profile', type=click.Choice(['small', 'medium', 'large']), default='small', show_default=True,
+              help="Dataset size preset; large is 50k users, 200k items and 5M history rows.")
+@click.option('--users', type=int, default=None, help="Service users (overrides the profile).")
+@click.option('--items', type=int, default=None, help="Media items (overrides the profile).")
+@click.option('--history', type=int, default=None, help="Stream history rows (overrides the profile).")
+@click.option('--seed', type=int, default=1, show_default=True)
+@click.option('--reset', is_flag=True, help="Drop and recreate all tables first.")
+def generate_command(database_url, profile, users, items, history, seed, reset):
+    """Fill the scratch database with a synthetic dataset."""
+    from app.extensions import db
+    from .generator import PROFILES, generate_dataset
+
+    sizes = dict(PROFILES[profile])
+    for key, value in (('users', users), ('items', items), ('history', history)):
+        if value is not None:
+            sizes[key] = value
+
+    app = _bench_app(database_url)
+    with app.app_context():
+        click.echo(f"Generating {sizes} into {db.engine.url.render_as_string(hide_password=True)}")
+        if reset:
+            db.drop_all()
+        try:
+            summary = generate_dataset(seed=seed, echo=click.echo, **sizes)
+        except RuntimeError as e:
+            raise click.ClickException(str(e))
+    click.echo(json.dumps(summary, indent=2))
+
+
+@bench_cli.command('run')
+@_database_option
+@click.option('--scenario', 'scenarios', multiple=True,
+              help="Scenario to run, repeatable (dashboard, users_list, library_browse, library_stats, "
+                   "media_detail, media_search, logs_page, purge_preview, monitor_tick). Defaults to all.")
+@click.option('--iterations', type=int, default=20, show_default=True)
+@click.option('--warmup', type=int, default=2, show_default=True)
+@click.option('--seed', type=int, default=1, show_default=True)
+@click.option('--output', type=click.Path(dir_okay=False, writable=True), default=None,
+              help="Also write the JSON report to this file.")
+def run_command(database_url, scenarios, iterations, warmup, seed, output):
+    """Time the scenarios and print a JSON report with p50/p95 latency and query counts."""
+    from .scenarios import run_scenarios
+
+    app = _bench_app(database_url)
+    with app.app_context():
+        try:
+            report = run_scenarios(list(scenarios) or None, iterations=iterations, warmup=warmup, seed=seed,
+                                   echo=lambda message: click.echo(message, err=True))
+        except (RuntimeError, ValueError) as e:
+            raise click.ClickException(str(e))
+    payload = json.dumps(report, indent=2, default=str)
+    if output:
+        with open(output, 'w') as handle:
+            handle.write(payload)
+    click.echo(payload)
+
+
+@bench_cli.command('compare')
+@click.argument('baseline', type=click.File('r'))
+@click.argument('candidate', type=click.File('r'))
+@click.option('--threshold', type=float, default=0.10, show_default=True,
+              help="Relative growth in p95 latency or p50 query count reported as a regression.")
+def compare_command(baseline, candidate, threshold):
+    """Compare two `flask bench run` reports; exits with status 1 on a regression."""
+    from .scenarios import compare_reports
+
+    rows, regressed = compare_reports(json.load(baseline), json.load(candidate), threshold)
+    for name, metric, before, after, change in rows:
+        marker = ' <-- regression' if (name, metric, before, after, change) in regressed else ''
+        click.echo(f"{name:16s} {metric:12s} {before:>10} -> {after:<10} {change:+.1%}{marker}")
+    if regressed:
+        sys.exit(1)
+
+
+def _parse_fleet_spec(values):
+    from .fake_servers import FAKE_SERVER_TYPES
+
+    counts = {}
+    for value in values or ('plex:1', 'jellyfin:1'):
+        service_type, _, count = value.partition(':')
+        if service_type not in FAKE_SERVER_TYPES:
+            raise click.BadParameter(f"unknown server type {service_type!r}; choose from {', '.join(FAKE_SERVER_TYPES)}",
+                                     param_hint='--server')
+        try:
+            counts[service_type] = counts.get(service_type, 0) + (int(count) if count else 1)
+        except ValueError:
+            raise click.BadParameter(f"{value!r} is not TYPE or TYPE:COUNT", param_hint='--server')
+    return counts
+
+
+@bench_cli.command('fleet')
+@_database_option
+@click.option('--server', 'servers', multiple=True, metavar='TYPE[:COUNT]',
+              help="Fake servers to start, repeatable, e.g. --server plex:2 --server jellyfin. "
+                   "Types: plex, jellyfin, emby, kavita, komga, audiobookshelf, romm. Defaults to one Plex and one Jellyfin.")
+@click.option('--users', type=int, default=50, show_default=True, help="Users per fake server.")
+@click.option('--libraries', type=int, default=2, show_default=True, help="Libraries per fake server.")
+@click.option('--items', type=int, default=500, show_default=True, help="Top-level items per library.")
+@click.option('--seasons', type=int, default=2, show_default=True, help="Seasons per show.")
+@click.option('--episodes', type=int, default=8, show_default=True, help="Episodes per season (books per series).")
+@click.option('--sessions', type=int, default=10, show_default=True, help="Concurrent playback sessions per fake server.")
+@click.option('--churn', type=float, default=0.2, show_default=True, help="Share of sessions replaced on every tick.")
+@click.option('--latency-ms', type=float, default=0, show_default=True, help="Added to every fake response.")
+@click.option('--jitter-ms', type=float, default=0, show_default=True, help="Random extra latency, 0 to this value.")
+@click.option('--error-rate', type=float, default=0.0, show_default=True, help="Share of requests answered with a 500.")
+@click.option('--seed', type=int, default=1, show_default=True)
+@click.option('--ticks', type=int, default=5, show_default=True, help="Session monitor ticks to run.")
+@click.option('--skip-content', is_flag=True, help="Don't sync library content.")
+@click.option('--reset', is_flag=True, help="Drop and recreate all tables first.")
+@click.option('--output', type=click.Path(dir_okay=False, writable=True), default=None,
+              help="Also write the JSON report to this file.")
+@click.option('--serve', is_flag=True, help="Only start the fakes, print their URLs and credentials and keep them "
+                                            "running until interrupted. The database is not touched.")
+@click.option('--session-interval', type=float, default=30, show_default=True,
+              help="With --serve: seconds between session updates.")
+def fleet_command(database_url, servers, users, libraries, items, seasons, episodes, sessions, churn, latency_ms,
+                  jitter_ms, error_rate, seed, ticks, skip_content, reset, output, serve, session_interval):
+    """Run library/user/content sync, episode prefetch and the session monitor against local fake media servers."""
+    import time
+    from app.extensions import db
+    from app.models import User, UserType
+    from .fake_servers import FakeServerOptions, start_fleet, stop_fleet
+    from .generator import _setup_app_state
+
+    counts = _parse_fleet_spec(servers)
+    options = FakeServerOptions(users=users, libraries=libraries, items=items, seasons=seasons, episodes=episodes,
+                                sessions=sessions, session_churn=churn, latency_ms=latency_ms, jitter_ms=jitter_ms,
+                                error_rate=error_rate, seed=seed)
+    fleet = start_fleet(counts, options)
+    try:
+        if serve:
+            for fake in fleet:
+                credentials = ', '.join(f"{key}={value}" for key, value in fake.credentials().items())
+                click.echo(f"{fake.name:28s} {fake.service_type:15s} {fake.url}  {credentials}")
+            click.echo(f"Advancing sessions every {session_interval:g}s; press Ctrl-C to stop.")
+            try:
+                while True:
+                    time.sleep(session_interval)
+                    for fake in fleet:
+                        fake.advance_sessions()
+            except KeyboardInterrupt:
+                return
+
+        from .fleet import run_fleet
+        app = _bench_app(database_url)
+        with app.app_context():
+            if reset:
+                db.drop_all()
+            db.create_all()
+            if User.query.filter_by(userType=UserType.OWNER).first() is None:
+                _setup_app_state()
+            try:
+                report = run_fleet(fleet, ticks=ticks, sync_content=not skip_content,
+                                   echo=lambda message: click.echo(message, err=True))
+            except RuntimeError as e:
+                raise click.ClickException(str(e))
+    finally:
+        stop_fleet(fleet)
+
+    payload = json.dumps(report, indent=2, default=str)
+    if output:
+        with open(output, 'w') as handle:
+            handle.write(payload)
+    click.echo(payload)
@@ -0,0 +1,57 @@
+# File: app/bench/fake_servers/__init__.py
+"""
+Local fake media servers for load-testing sync and session monitoring.
+
+Each fake speaks the subset of its service's API that the plugin in
+``app/services/<service>_media_service.py`` uses: server info, libraries,
+paged items, users, sessions and images. Datasets are generated from a seed,
+so the same options always produce the same catalog; latency, jitter and an
+error rate are applied to every request.
+
+Known gaps, because the real flow leaves the server:
+
+- Plex user sync goes through plex.tv (``MyPlexAccount``); ``flask bench
+  fleet`` seeds the Plex service users directly instead.
+- Kavita and Komga have no playback sessions, and Kavita content isn't synced
+  by MUM, so those fakes only serve libraries and users (plus Komga series).
+"""
+from .audiobookshelf import FakeAudiobookshelfServer
+from .base import FakeMediaServer, FakeServerOptions
+from .jellyfin import FakeEmbyServer, FakeJellyfinServer
+from .kavita import FakeKavitaServer
+from .komga import FakeKomgaServer
+from .plex import FakePlexServer
+from .romm import FakeRommServer
+
+__all__ = [
+    'FAKE_SERVER_TYPES', 'FakeMediaServer', 'FakeServerOptions', 'FakePlexServer', 'FakeJellyfinServer',
+    'FakeEmbyServer', 'FakeKavitaServer', 'FakeKomgaServer', 'FakeAudiobookshelfServer', 'FakeRommServer',
+    'start_fleet', 'stop_fleet',
+]
+
+FAKE_SERVER_TYPES = {
+    cls.service_type: cls for cls in (FakePlexServer, FakeJellyfinServer, FakeEmbyServer, FakeKavitaServer,
+                                      FakeKomgaServer, FakeAudiobookshelfServer, FakeRommServer)
+}
+
+
+def start_fleet(counts, options=None, host='127.0.0.1'):
+    """
+    Start ``counts[service_type]`` fakes of each type on free ports and return
+    them in start order. Servers are named ``fake-<type>-<n>``.
+    """
+    fleet = []
+    try:
+        for service_type, count in counts.items():
+            cls = FAKE_SERVER_TYPES[service_type]
+            for index in range(1, count + 1):
+                fleet.append(cls(f"fake-{service_type}-{index}", options, host=host).start())
+    except Exception:
+        stop_fleet(fleet)
+        raise
+    return fleet
+
+
+def stop_fleet(fleet):
+    for server in fleet:
+        server.stop()
@@ -0,0 +1,128 @@
+# File: app/bench/fake_servers/audiobookshelf.py
+"""Fake Audiobookshelf server: libraries, paged items, users and listening sessions."""
+import zlib
+from datetime import datetime, timezone
+
+from .base import FakeMediaServer, epoch_ms, image_response, json_response
+
+
+class FakeAudiobookshelfServer(FakeMediaServer):
+    service_type = 'audiobookshelf'
+    library_kinds = ('audiobook',)
+
+    def __init__(self, name, *args, **kwargs):
+        self._salt = f"{zlib.crc32(name.encode()):08x}"
+        super().__init__(name, *args, **kwargs)
+
+    def routes(self):
+        return [
+            ('POST', '/api/authorize', self._authorize),
+            ('GET', '/api/me', self._me),
+            ('GET', '/api/libraries', self._libraries),
+            ('GET', '/api/libraries/([\\w-]+)/items', self._library_items),
+            ('GET', '/api/items/([\\w-]+)', self._item),
+            ('GET', '/api/items/([\\w-]+)/cover', self._image),
+            ('GET', '/api/users', self._users),
+            ('GET', '/api/sessions', self._sessions),
+            ('POST', '/api/sessions/([\\w-]+)/close', self._close_session),
+        ]
+
+    def authorized(self, request):
+        return request.headers.get('Authorization') == f"Bearer {self.token}"
+
+    # Ids are UUIDs on a real server; the last group carries the catalog number
+    def _id(self, space, n):
+        return f"{self._salt}-0000-4000-800{space}-{n:012x}"
+
+    def _parse(self, value, space):
+        if not value.startswith(self._salt) or value[19:23] != f"800{space}":
+            return None
+        try:
+            return int(value[24:], 16)
+        except ValueError:
+            return None
+
+    def _item_json(self, item):
+        return {
+            'id': self._id(0, item.n), 'libraryId': self._id(1, item.library.n), 'mediaType': 'book',
+            'path': f"/audiobooks/{item.title}", 'isFile': False,
+            'addedAt': epoch_ms(item.added_at), 'updatedAt': epoch_ms(item.added_at),
+            'media': {
+                'duration': item.duration_ms / 1000, 'coverPath': f"/metadata/items/{item.n}/cover.jpg",
+                'numAudioFiles': 12, 'numChapters': 12, 'size': item.duration_ms * 16,
+                'metadata': {'title': item.title, 'authors': [{'id': f"aut_{item.n % 97}", 'name': f"Author {item.n % 97}"}],
+                             'authorName': f"Author {item.n % 97}", 'narrators': ['Fake Narrator'],
+                             'series': [{'id': f"ser_{item.n % 31}", 'name': f"Series {item.n % 31}", 'sequence': '1'}],
+                             'publishedYear': str(item.year), 'description': f"Synthetic audiobook served by {self.name}.",
+                             'genres': ['Fiction'], 'language': 'English'},
+            },
+        }
+
+    def _authorize(self, request):
+        return json_response({'user': {'id': 'root', 'username': 'root', 'type': 'root'},
+                              'userDefaultLibraryId': self._id(1, self.catalog.libraries[0].n) if self.catalog.libraries else None,
+                              'serverSettings': {'version': '2.17.2', 'id': 'server-settings'}})
+
+    def _me(self, request):
+        return json_response({'id': 'root', 'username': 'root', 'type': 'root', 'isActive': True})
+
+    def _libraries(self, request):
+        return json_response({'libraries': [
+            {'id': self._id(1, library.n), 'name': library.title, 'mediaType': 'book', 'provider': 'audible',
+             'folders': [{'id': f"fol_{library.n}", 'fullPath': f"/audiobooks/{library.title.lower()}"}],
+             'createdAt': epoch_ms(library.added_at), 'lastUpdate': epoch_ms(library.added_at)}
+            for library in self.catalog.libraries
+        ]})
+
+    def _library_items(self, request):
+        library = self.entry(self._parse(request.params[0], 1), 'library')
+        if library is None:
+            return json_response({'error': 'Library not found'}, status=404)
+        items = sorted(library.children, key=lambda entry: (entry.title.lower(), entry.n))
+        limit = request.arg('limit', 0, int)
+        page = request.arg('page', 0, int)
+        # limit=0 returns the whole library, just like the real server
+        selected = items[page * limit:(page + 1) * limit] if limit else items
+        return json_response({'results': [self._item_json(item) for item in selected], 'total': len(items),
+                              'limit': limit, 'page': page, 'mediaType': 'book', 'minified': False})
+
+    def _item(self, request):
+        item = self.entry(self._parse(request.params[0], 0), 'audiobook')
+        if item is None:
+            return json_response({'error': 'Item not found'}, status=404)
+        return json_response(self._item_json(item))
+
+    def _image(self, request):
+        return image_response()
+
+    def _users(self, request):
+        return json_response({'users': [
+            {'id': self._id(2, user.n), 'username': user.username, 'email': user.email,
+             'type': 'admin' if user.is_admin else 'user', 'isActive': True, 'createdAt': epoch_ms(user.created_at),
+             'lastSeen': epoch_ms(user.created_at),
+             'permissions': {'download': True, 'update': user.is_admin, 'delete': user.is_admin,
+                             'accessAllLibraries': user.library_ns is None,
+                             'librariesAccessible': [self._id(1, n) for n in (user.library_ns or [])]}}
+            for user in self.catalog.users
+        ]})
+
+    def _sessions(self, request):
+        # The plugin drops sessions not updated in the last 15 seconds, so every live session was "just" updated
+        now_ms = epoch_ms(datetime.now(timezone.utc))
+        return json_response({'sessions': [
+            {'id': self._id(3, session.n), 'userId': self._id(2, session.user.n),
+             'user': {'id': self._id(2, session.user.n), 'username': session.user.username},
+             'libraryId': self._id(1, session.item.library.n), 'libraryItemId': self._id(0, session.item.n),
+             'mediaType': 'book', 'displayTitle': session.item.title, 'displayAuthor': f"Author {session.item.n % 97}",
+             'mediaMetadata': {'title': session.item.title, 'authors': [{'name': f"Author {session.item.n % 97}"}]},
+             'duration': session.item.duration_ms / 1000, 'currentTime': session.position_ms / 1000,
+             'playMethod': 0, 'mediaPlayer': 'html5', 'startedAt': epoch_ms(session.started_at),
+             'updatedAt': now_ms,
+             'deviceInfo': {'ipAddress': session.address, 'browserName': 'Firefox', 'osName': 'Linux',
+                            'clientName': 'Abs Web', 'deviceName': f"Browser {session.n % 7}"}}
+            for session in self.sessions.current()
+        ], 'total': len(self.sessions.current())})
+
+    def _close_session(self, request):
+        self.sessions.stop(self._parse(request.params[0], 3))
+        return json_response({})
@@ -0,0 +1,463 @@
+# File: app/bench/fake_servers/base.py
+"""
+Shared plumbing for the fake media servers: options, a seeded catalog, a
+rolling session pool and a small threaded HTTP server with a route table.
+
+Each fake serves real HTTP on 127.0.0.1 so the plugins run unchanged
+(``requests`` / ``plexapi`` included). Every request first sleeps for the
+configured latency and then fails with a 500 at the configured error rate,
+before the route handler runs.
+"""
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# 1x1 transparent PNG returned for every image endpoint
+PNG_PIXEL = bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000d49444154789c6360000002000001e221bc330000000049454e44ae426082'
+)
+
+_WORDS = ('Silent', 'Crimson', 'Last', 'Hidden', 'Golden', 'Broken', 'Distant', 'Electric', 'Frozen', 'Midnight',
+          'River', 'Empire', 'Signal', 'Harbor', 'Garden', 'Machine', 'Horizon', 'Shadow', 'Summer', 'Voyage')
+
+
+class FakeServerOptions:
+    """Dataset size and failure behaviour of one fake server."""
+
+    def __init__(self, users=50, libraries=2, items=500, seasons=2, episodes=8, sessions=10, session_churn=0.2,
+                 latency_ms=0, jitter_ms=0, error_rate=0.0, seed=1):
+        self.users = users
+        self.libraries = libraries
+        self.items = items  # top-level items (movies, shows, series, books, roms) per library
+        self.seasons = seasons  # seasons per show
+        self.episodes = episodes  # episodes per season, books per series
+        self.sessions = sessions  # concurrent playback sessions
+        self.session_churn = session_churn  # share of sessions replaced on each advance
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.seed = seed
+
+    def to_dict(self):
+        return dict(vars(self))
+
+
+class CatalogEntry:
+    """One library, item, season or episode. ``n`` is unique per catalog and used to derive service ids."""
+
+    __slots__ = ('n', 'kind', 'title', 'year', 'added_at', 'duration_ms', 'index', 'parent', 'library', 'children',
+                 'holds')
+
+    def __init__(self, n, kind, title, year=None, added_at=None, duration_ms=None, index=None, parent=None, library=None,
+                 holds=None):
+        self.n = n
+        self.kind = kind
+        self.holds = holds  # for libraries: the kind of their top-level items
+        self.title = title
+        self.year = year
+        self.added_at = added_at
+        self.duration_ms = duration_ms
+        self.index = index
+        self.parent = parent
+        self.library = library
+        self.children = []
+
+    @property
+    def grandparent(self):
+        return self.parent.parent if self.parent is not None else None
+
+
+class FakeUser:
+    __slots__ = ('n', 'username', 'email', 'created_at', 'is_admin', 'library_ns')
+
+    def __init__(self, n, username, email, created_at, is_admin, library_ns):
+        self.n = n
+        self.username = username
+        self.email = email
+        self.created_at = created_at
+        self.is_admin = is_admin
+        self.library_ns = library_ns  # None means all libraries
+
+
+class FakeCatalog:
+    """
+    Deterministic users and libraries for one server.
+
+    ``library_kinds`` lists the kind of each library in rotation, e.g.
+    ``('movie', 'show')``; kinds with children are ``show`` (seasons, then
+    episodes) and ``series`` (books).
+    """
+
+    def __init__(self, options, name, library_kinds):
+        rng = random.Random(f"{options.seed}:{name}")
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+        self._next_n = 0
+        self.by_n = {}
+        self.libraries = []
+        self.users = []
+
+        for index in range(options.libraries):
+            kind = library_kinds[index % len(library_kinds)]
+            library = self._add(kind='library', title=f"{_library_label(kind)} {index + 1}", holds=kind,
+                                added_at=now - timedelta(days=1500))
+            self.libraries.append(library)
+            for _ in range(options.items):
+                added_at = now - timedelta(days=rng.randint(0, 1500), seconds=rng.randint(0, 86399))
+                item = self._add(kind=kind, title=f"{rng.choice(_WORDS)} {rng.choice(_WORDS)} {self._next_n}",
+                                 year=rng.randint(1960, 2025), added_at=added_at, parent=library, library=library,
+                                 duration_ms=rng.randint(20, 180) * 60000 if kind in ('movie', 'audiobook') else None)
+                library.children.append(item)
+                if kind == 'show':
+                    for season_index in range(1, options.seasons + 1):
+                        season = self._add(kind='season', title=f"Season {season_index}", index=season_index,
+                                           added_at=added_at, parent=item, library=library)
+                        item.children.append(season)
+                        for episode_index in range(1, options.episodes + 1):
+                            season.children.append(self._add(
+                                kind='episode', title=f"Episode {episode_index}", index=episode_index,
+                                added_at=added_at, duration_ms=rng.randint(20, 60) * 60000,
+                                parent=season, library=library))
+                elif kind == 'series':
+                    for book_index in range(1, options.episodes + 1):
+                        item.children.append(self._add(kind='book', title=f"{item.title} #{book_index}",
+                                                       index=book_index, added_at=added_at, parent=item,
+                                                       library=library))
+
+        library_ns = [library.n for library in self.libraries]
+        for index in range(options.users):
+            shared = None if rng.random() < 0.7 else rng.sample(library_ns, max(1, len(library_ns) // 2))
+            self.users.append(FakeUser(
+                n=index + 1, username=f"fake_user_{index + 1}", email=f"fake_user_{index + 1}@example.com",
+                created_at=now - timedelta(days=rng.randint(1, 1500)), is_admin=index == 0, library_ns=shared))
+
+    def _add(self, **fields):
+        self._next_n += 1
+        entry = CatalogEntry(self._next_n, **fields)
+        self.by_n[entry.n] = entry
+        return entry
+
+    def playable(self):
+        """Leaf items a session can play: movies, episodes, audiobooks, books and roms."""
+        leaves = []
+        for library in self.libraries:
+            stack = list(library.children)
+            while stack:
+                entry = stack.pop()
+                if entry.children:
+                    stack.extend(entry.children)
+                elif entry.kind in ('movie', 'episode', 'audiobook', 'book', 'rom'):
+                    leaves.append(entry)
+        leaves.sort(key=lambda entry: entry.n)
+        return leaves
+
+
+def _library_label(kind):
+    return {'movie': 'Movies', 'show': 'Shows', 'series': 'Comics', 'book': 'Books',
+            'audiobook': 'Audiobooks', 'rom': 'Platform'}.get(kind, kind.title())
+
+
+class FakeSession:
+    __slots__ = ('n', 'user', 'item', 'position_ms', 'started_at', 'paused', 'address')
+
+    def __init__(self, n, user, item, started_at, address):
+        self.n = n
+        self.user = user
+        self.item = item
+        self.position_ms = 0
+        self.started_at = started_at
+        self.paused = False
+        self.address = address
+
+
+class SessionPool:
+    """
+    The set of sessions a fake reports as playing.
+
+    Nothing changes between calls to ``advance``: the load driver calls it
+    once per monitor tick, ``flask bench fleet --serve`` on a timer. Each
+    advance moves every session forward a minute and replaces
+    ``session_churn`` of them with new ones.
+    """
+
+    def __init__(self, options, catalog, name):
+        self._rng = random.Random(f"{options.seed}:{name}:sessions")
+        self._lock = threading.Lock()
+        self._size = options.sessions
+        self._churn = options.session_churn
+        self._users = [user for user in catalog.users if not user.is_admin] or catalog.users
+        self._items = catalog.playable()
+        self._counter = 0
+        self.sessions = []
+        self.advance()
+
+    def _new_session(self):
+        self._counter += 1
+        return FakeSession(self._counter, self._rng.choice(self._users), self._rng.choice(self._items),
+                           datetime.now(timezone.utc), f"10.{self._counter % 200}.{self._rng.randint(0, 255)}.{self._rng.randint(1, 254)}")
+
+    def advance(self):
+        with self._lock:
+            if not self._users or not self._items:
+                self.sessions = []
+                return self.sessions
+            kept = []
+            for session in self.sessions:
+                if self._rng.random() < self._churn:
+                    continue
+                session.position_ms += 60000
+                session.paused = self._rng.random() < 0.1
+                kept.append(session)
+            while len(kept) < self._size:
+                kept.append(self._new_session())
+            self.sessions = kept
+            return list(self.sessions)
+
+    def current(self):
+        with self._lock:
+            return list(self.sessions)
+
+    def stop(self, session_n):
+        with self._lock:
+            before = len(self.sessions)
+            self.sessions = [session for session in self.sessions if session.n != session_n]
+            return len(self.sessions) != before
+
+
+class FakeRequest:
+    def __init__(self, method, path, query, headers, body, params):
+        self.method = method
+        self.path = path
+        self.query = query  # first value of every query parameter
+        self.headers = headers
+        self.body = body
+        self.params = params  # regex groups of the matched route
+
+    def arg(self, name, default=None, cast=None):
+        value = self.query.get(name)
+        if value is None:
+            value = self.headers.get(name)
+        if value is None:
+            return default
+        if cast is not None:
+            try:
+                return cast(value)
+            except (TypeError, ValueError):
+                return default
+        return value
+
+    def json(self):
+        try:
+            return json.loads(self.body or b'null')
+        except ValueError:
+            return None
+
+
+class FakeResponse:
+    def __init__(self, status=200, body=b'', content_type='application/json'):
+        self.status = status
+        self.body = body
+        self.content_type = content_type
+
+
+def json_response(data, status=200):
+    return FakeResponse(status, json.dumps(data, default=str).encode(), 'application/json; charset=utf-8')
+
+
+def text_response(text, status=200):
+    return FakeResponse(status, text.encode(), 'text/plain; charset=utf-8')
+
+
+def image_response():
+    return FakeResponse(200, PNG_PIXEL, 'image/png')
+
+
+def empty_response(status=204):
+    return FakeResponse(status, b'', 'text/plain')
+
+
+def iso(value):
+    """``2024-01-02T03:04:05.0000000Z``-style timestamp as used by the .NET and Java servers."""
+    return value.strftime('%Y-%m-%dT%H:%M:%S.0000000Z') if value else None
+
+
+def epoch_ms(value):
+    return int(value.timestamp() * 1000) if value else None
+
+
+class FakeMediaServer:
+    """
+    Base class for one fake server. Subclasses set ``service_type`` and
+    ``library_kinds``, and return their ``(method, pattern, handler)`` table
+    from ``routes()``; patterns are matched against the path without the
+    query string.
+    """
+
+    service_type = None
+    library_kinds = ('movie',)
+    has_sessions = True
+
+    def __init__(self, name, options=None, host='127.0.0.1', port=0, token='fake-token'):
+        self.name = name
+        self.options = options or FakeServerOptions()
+        self.host = host
+        self.port = port
+        self.token = token
+        self.catalog = FakeCatalog(self.options, name, self.library_kinds)
+        self.sessions = SessionPool(self.options, self.catalog, name) if self.has_sessions else None
+        self._routes = [(method, re.compile(f"^{pattern}$"), handler) for method, pattern, handler in self.routes()]
+        self._fault_rng = random.Random(f"{self.options.seed}:{name}:faults")
+        self._fault_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {}
+        self._httpd = None
+        self._thread = None
+
+    # --- Subclass hooks ---
+
+    def routes(self):
+        return []
+
+    def authorized(self, request):
+        return True
+
+    def credentials(self):
+        """Fields for the ``MediaServer`` row that points MUM at this fake."""
+        return {'api_key': self.token}
+
+    def not_found(self, request):
+        return json_response({'error': f"No fake route for {request.method} {request.path}"}, status=404)
+
+    # --- Lifecycle ---
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def start(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _handle(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                response = server.dispatch(self.command, self.path, dict(self.headers.items()), body)
+                self.send_response(response.status)
+                self.send_header('Content-Type', response.content_type)
+                self.send_header('Content-Length', str(len(response.body)))
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(response.body)
+
+            do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_HEAD = _handle
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name=f"fake-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def advance_sessions(self):
+        return self.sessions.advance() if self.sessions else []
+
+    # --- Request handling ---
+
+    def dispatch(self, method, raw_path, headers, body):
+        started = time.perf_counter()
+        parts = urlsplit(raw_path)
+        query = {key: values[0] for key, values in parse_qs(parts.query, keep_blank_values=True).items()}
+        path = parts.path.rstrip('/') or '/'
+
+        handler, params, route_name = None, (), 'unmatched'
+        for route_method, pattern, route_handler in self._routes:
+            if route_method != method and not (route_method == 'GET' and method == 'HEAD'):
+                continue
+            match = pattern.match(path)
+            if match:
+                handler, params, route_name = route_handler, match.groups(), f"{route_method} {pattern.pattern[1:-1]}"
+                break
+        request = FakeRequest(method, path, query, headers, body, params)
+
+        delay_ms, fail = self._faults()
+        if delay_ms:
+            time.sleep(delay_ms / 1000)
+        if fail:
+            response = json_response({'error': 'Injected failure'}, status=500)
+        elif not self.authorized(request):
+            response = json_response({'error': 'Unauthorized'}, status=401)
+        elif handler is None:
+            response = self.not_found(request)
+        else:
+            try:
+                response = handler(request)
+            except Exception as e:  # a broken fake should show up as a 500, not kill the server thread
+                response = json_response({'error': f"Fake handler error: {e}"}, status=500)
+        self._record(route_name, response, time.perf_counter() - started)
+        return response
+
+    def _faults(self):
+        options = self.options
+        with self._fault_lock:
+            delay_ms = options.latency_ms + (self._fault_rng.uniform(0, options.jitter_ms) if options.jitter_ms else 0)
+            fail = options.error_rate > 0 and self._fault_rng.random() < options.error_rate
+        return delay_ms, fail
+
+    def _record(self, route_name, response, elapsed):
+        with self._stats_lock:
+            entry = self._stats.setdefault(route_name, {'requests': 0, 'errors': 0, 'bytes': 0, 'seconds': 0.0})
+            entry['requests'] += 1
+            entry['errors'] += 1 if response.status >= 400 else 0
+            entry['bytes'] += len(response.body)
+            entry['seconds'] += elapsed
+
+    def stats(self):
+        """Per-route request, error and byte counts since start (or the last ``reset_stats``)."""
+        with self._stats_lock:
+            return {route: dict(entry, seconds=round(entry['seconds'], 3)) for route, entry in sorted(self._stats.items())}
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._stats = {}
+
+    # --- Helpers for subclasses ---
+
+    def entry(self, n, *kinds):
+        """Catalog entry ``n`` (an int or numeric string), optionally restricted to ``kinds``."""
+        try:
+            entry = self.catalog.by_n.get(int(n))
+        except (TypeError, ValueError):
+            return None
+        if entry is None or (kinds and entry.kind not in kinds):
+            return None
+        return entry
+
+    def user(self, n):
+        try:
+            n = int(n)
+        except (TypeError, ValueError):
+            return None
+        return self.catalog.users[n - 1] if 0 < n <= len(self.catalog.users) else None
+
+    @staticmethod
+    def page(entries, offset, limit):
+        offset = max(0, offset or 0)
+        if limit is None or limit < 0:
+            return entries[offset:]
+        return entries[offset:offset + limit]
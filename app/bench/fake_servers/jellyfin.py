@@ -0,0 +1,235 @@
+# File: app/bench/fake_servers/jellyfin.py
+"""Fake Jellyfin and Emby servers (the Emby API is the same under an ``/emby`` prefix)."""
+import zlib
+
+from .base import FakeMediaServer, empty_response, image_response, iso, json_response
+
+_TYPES = {'movie': 'Movie', 'show': 'Series', 'season': 'Season', 'episode': 'Episode'}
+_COLLECTION_TYPES = {'movie': 'movies', 'show': 'tvshows'}
+_TICKS_PER_MS = 10000
+
+
+class FakeJellyfinServer(FakeMediaServer):
+    service_type = 'jellyfin'
+    library_kinds = ('movie', 'show')
+    prefix = ''
+    server_name = 'Fake Jellyfin'
+    version = '10.9.11'
+
+    def __init__(self, name, *args, **kwargs):
+        # Ids look like Jellyfin's 32 hex digit GUIDs and differ between servers of the fleet
+        self._salt = f"{zlib.crc32(name.encode()):08x}"
+        self._listings = {}
+        super().__init__(name, *args, **kwargs)
+
+    def routes(self):
+        p = self.prefix
+        return [
+            ('GET', f'{p}/System/Info', self._system_info),
+            ('GET', f'{p}/System/Info/Public', self._system_info),
+            ('GET', f'{p}/Library/VirtualFolders', self._virtual_folders),
+            ('GET', f'{p}/Items', self._items),
+            ('GET', f'{p}/Items/([0-9a-f]{{32}})', self._item),
+            ('GET', f'{p}/Items/([0-9a-f]{{32}})/Images/(\\w+)(?:/\\d+)?', self._image),
+            ('GET', f'{p}/Users', self._users),
+            ('GET', f'{p}/Users/([0-9a-f]{{32}})', self._user),
+            ('GET', f'{p}/Users/([0-9a-f]{{32}})/Policy', self._user_policy),
+            ('GET', f'{p}/Users/([0-9a-f]{{32}})/Images/(\\w+)', self._image),
+            ('GET', f'{p}/Sessions', self._sessions),
+            ('POST', f'{p}/Sessions/([0-9a-f]{{32}})/Playing/Stop', self._stop_session),
+        ]
+
+    def authorized(self, request):
+        if request.path.endswith('/System/Info/Public'):
+            return True
+        token = request.headers.get('X-Emby-Token') or request.query.get('api_key') or request.query.get('ApiKey')
+        return token == self.token
+
+    # --- Ids ---
+
+    def _id(self, space, n):
+        return f"{self._salt}{space}{n:023x}"
+
+    def _parse(self, value, space):
+        if not value or len(value) != 32 or value[:8] != self._salt or value[8] != space:
+            return None
+        return int(value[9:], 16)
+
+    def item_id(self, entry):
+        return self._id('0', entry.n)
+
+    # --- Serialisers ---
+
+    def _item_json(self, entry):
+        if entry.kind == 'library':
+            return {'Name': entry.title, 'ServerId': self._salt, 'Id': self.item_id(entry), 'Type': 'CollectionFolder',
+                    'CollectionType': _COLLECTION_TYPES.get(entry.holds, 'mixed'), 'IsFolder': True,
+                    'DateCreated': iso(entry.added_at)}
+        data = {
+            'Name': entry.title,
+            'ServerId': self._salt,
+            'Id': self.item_id(entry),
+            'Type': _TYPES.get(entry.kind, entry.kind.title()),
+            'IsFolder': bool(entry.children),
+            'ParentId': self.item_id(entry.parent),
+            'DateCreated': iso(entry.added_at),
+            'SortName': entry.title.lower(),
+            'Overview': f"Synthetic {entry.kind} served by {self.name}.",
+            'ImageTags': {'Primary': f"{entry.n:x}"},
+        }
+        if entry.year:
+            data['ProductionYear'] = entry.year
+            data['PremiereDate'] = f"{entry.year}-01-01T00:00:00.0000000Z"
+            data['CommunityRating'] = round(5 + (entry.n % 50) / 10, 1)
+        if entry.duration_ms:
+            data['RunTimeTicks'] = entry.duration_ms * _TICKS_PER_MS
+            data['Container'] = 'mkv'
+            data['MediaStreams'] = [
+                {'Type': 'Video', 'Codec': 'h264', 'Height': 1080, 'Width': 1920, 'BitRate': 8000000, 'Index': 0},
+                {'Type': 'Audio', 'Codec': 'aac', 'Channels': 6, 'IsDefault': True, 'DisplayTitle': 'English - AAC - 5.1', 'Index': 1},
+            ]
+        if entry.kind == 'show':
+            data['Status'] = 'Continuing' if entry.n % 3 else 'Ended'
+            data['ChildCount'] = len(entry.children)
+        elif entry.kind == 'season':
+            data.update({'IndexNumber': entry.index, 'SeriesId': self.item_id(entry.parent), 'SeriesName': entry.parent.title})
+        elif entry.kind == 'episode':
+            season, show = entry.parent, entry.grandparent
+            data.update({'IndexNumber': entry.index, 'ParentIndexNumber': season.index,
+                         'SeasonId': self.item_id(season), 'SeasonName': season.title,
+                         'SeriesId': self.item_id(show), 'SeriesName': show.title})
+        return data
+
+    def _user_json(self, user):
+        library_ids = [self.item_id(self.catalog.by_n[n]) for n in (user.library_ns or [])]
+        return {
+            'Name': user.username,
+            'ServerId': self._salt,
+            'Id': self._id('1', user.n),
+            'HasPassword': True,
+            'HasConfiguredPassword': True,
+            'EnableAutoLogin': False,
+            'LastLoginDate': iso(user.created_at),
+            'LastActivityDate': iso(user.created_at),
+            'Configuration': {'PlayDefaultAudioTrack': True, 'SubtitleMode': 'Default'},
+            'Policy': {
+                'IsAdministrator': user.is_admin, 'IsHidden': False, 'IsDisabled': False,
+                'EnableAllFolders': user.library_ns is None, 'EnabledFolders': library_ids,
+                'EnableRemoteAccess': True, 'EnableMediaPlayback': True, 'EnableContentDownloading': False,
+            },
+        }
+
+    def _session_json(self, session):
+        item = self._item_json(session.item)
+        transcoding = session.n % 4 == 0
+        data = {
+            'Id': self._id('2', session.n),
+            'UserId': self._id('1', session.user.n),
+            'UserName': session.user.username,
+            'Client': 'Jellyfin Web',
+            'DeviceName': f"Browser {session.n % 7}",
+            'DeviceId': f"device-{session.n}",
+            'ApplicationVersion': self.version,
+            'RemoteEndPoint': session.address,
+            'IsActive': True,
+            'SupportsRemoteControl': True,
+            'LastActivityDate': iso(session.started_at),
+            'PlayState': {'PositionTicks': session.position_ms * _TICKS_PER_MS, 'CanSeek': True,
+                          'IsPaused': session.paused, 'IsMuted': False,
+                          'PlayMethod': 'Transcode' if transcoding else 'DirectPlay'},
+            'NowPlayingItem': item,
+        }
+        if transcoding:
+            data['TranscodingInfo'] = {'Container': 'ts', 'VideoCodec': 'h264', 'AudioCodec': 'aac', 'AudioChannels': 2,
+                                       'Height': 720, 'Width': 1280, 'Bitrate': 4000000, 'IsVideoDirect': False,
+                                       'IsAudioDirect': False, 'HardwareAccelerationType': 'none'}
+        return data
+
+    # --- Handlers ---
+
+    def _system_info(self, request):
+        return json_response({'ServerName': self.server_name, 'Version': self.version, 'Id': self._salt * 4,
+                              'OperatingSystem': 'Linux', 'ProductName': self.server_name})
+
+    def _virtual_folders(self, request):
+        return json_response([
+            {'Name': library.title, 'ItemId': self.item_id(library), 'Locations': [f"/media/{library.title.lower()}"],
+             'CollectionType': _COLLECTION_TYPES.get(library.holds, 'mixed'), 'RefreshStatus': 'Idle',
+             'LibraryOptions': {}}
+            for library in self.catalog.libraries
+        ])
+
+    def _listing(self, parent_n, recursive, types):
+        """Entries under a parent (or the whole catalog), filtered and sorted by name; cached per query shape."""
+        key = (parent_n, recursive, types)
+        listing = self._listings.get(key)
+        if listing is None:
+            entries = list(self.catalog.by_n[parent_n].children if parent_n else self.catalog.libraries)
+            if recursive:
+                stack, entries = entries, []
+                while stack:
+                    entry = stack.pop()
+                    entries.append(entry)
+                    stack.extend(entry.children)
+            if types:
+                entries = [entry for entry in entries if _TYPES.get(entry.kind) in types]
+            listing = sorted(entries, key=lambda entry: (entry.title.lower(), entry.n))
+            self._listings[key] = listing
+        return listing
+
+    def _items(self, request):
+        parent_n = None
+        if request.arg('ParentId'):
+            parent_n = self._parse(request.arg('ParentId'), '0')
+            if parent_n not in self.catalog.by_n:
+                return json_response({'Items': [], 'TotalRecordCount': 0, 'StartIndex': 0})
+        recursive = str(request.arg('Recursive', 'false')).lower() == 'true'
+        types = frozenset(filter(None, (request.arg('IncludeItemTypes') or '').split(',')))
+        listing = self._listing(parent_n, recursive, types)
+        start = request.arg('StartIndex', 0, int)
+        limit = request.arg('Limit', None, int)
+        return json_response({'Items': [self._item_json(entry) for entry in self.page(listing, start, limit)],
+                              'TotalRecordCount': len(listing), 'StartIndex': start})
+
+    def _item(self, request):
+        entry = self.entry(self._parse(request.params[0], '0'))
+        if entry is None:
+            return json_response({'error': 'Item not found'}, status=404)
+        return json_response(self._item_json(entry))
+
+    def _image(self, request):
+        return image_response()
+
+    def _users(self, request):
+        return json_response([self._user_json(user) for user in self.catalog.users])
+
+    def _user(self, request):
+        user = self.user(self._parse(request.params[0], '1'))
+        if user is None:
+            return json_response({'error': 'User not found'}, status=404)
+        return json_response(self._user_json(user))
+
+    def _user_policy(self, request):
+        user = self.user(self._parse(request.params[0], '1'))
+        if user is None:
+            return json_response({'error': 'User not found'}, status=404)
+        return json_response(self._user_json(user)['Policy'])
+
+    def _sessions(self, request):
+        sessions = [self._session_json(session) for session in self.sessions.current()]
+        # Real servers also list connected clients that aren't playing anything
+        sessions.extend({'Id': self._id('3', index), 'UserName': user.username, 'Client': 'Jellyfin Android',
+                         'DeviceName': 'Phone', 'ApplicationVersion': self.version, 'PlayState': {}}
+                        for index, user in enumerate(self.catalog.users[:2], start=1))
+        return json_response(sessions)
+
+    def _stop_session(self, request):
+        self.sessions.stop(self._parse(request.params[0], '2'))
+        return empty_response()
+
+
+class FakeEmbyServer(FakeJellyfinServer):
+    service_type = 'emby'
+    prefix = '/emby'
+    server_name = 'Fake Emby'
+    version = '4.8.10.0'
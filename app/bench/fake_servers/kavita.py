@@ -0,0 +1,72 @@
+# File: app/bench/fake_servers/kavita.py
+"""Fake Kavita server. Kavita has no playback sessions and MUM doesn't sync its content, so only libraries and users matter."""
+from .base import FakeMediaServer, iso, json_response, text_response
+
+_LIBRARY_TYPES = (0, 1, 2)  # manga, comic, book
+
+
+class FakeKavitaServer(FakeMediaServer):
+    service_type = 'kavita'
+    library_kinds = ('series',)
+    has_sessions = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.jwt = f"fake-jwt-{self.token}"
+
+    def routes(self):
+        return [
+            ('POST', '/api/Plugin/authenticate', self._authenticate),
+            ('GET', '/api/Health', self._health),
+            ('GET', '/api/Library/libraries', self._libraries),
+            ('GET', '/api/Users', self._users),
+            ('GET', '/api/Server/server-info-slim', self._server_info),
+            ('GET', '/api/Stats/user/(\\d+)/read', self._user_stats),
+            ('GET', '/api/Stats/user/reading-history', self._reading_history),
+            ('GET', '/api/Stats/user/(\\d+)/reading-history', self._reading_history),
+        ]
+
+    def authorized(self, request):
+        if request.path == '/api/Plugin/authenticate':
+            return request.query.get('apiKey') == self.token
+        return request.headers.get('Authorization') == f"Bearer {self.jwt}"
+
+    def _authenticate(self, request):
+        return json_response({'username': 'admin', 'token': self.jwt, 'refreshToken': f"refresh-{self.token}",
+                              'apiKey': self.token, 'kavitaVersion': '0.8.4.2'})
+
+    def _health(self, request):
+        return text_response('Ok')
+
+    def _libraries(self, request):
+        return json_response([
+            {'id': library.n, 'name': library.title, 'type': _LIBRARY_TYPES[index % len(_LIBRARY_TYPES)],
+             'seriesCount': len(library.children), 'lastScanned': iso(library.added_at),
+             'folders': [f"/data/{library.title.lower()}"]}
+            for index, library in enumerate(self.catalog.libraries)
+        ])
+
+    def _users(self, request):
+        all_libraries = self.catalog.libraries
+        return json_response([
+            {'id': user.n, 'username': user.username, 'email': user.email, 'created': iso(user.created_at),
+             'lastActive': iso(user.created_at), 'isAdmin': user.is_admin, 'roles': ['Admin'] if user.is_admin else ['Pleb'],
+             'libraries': [{'id': library.n, 'name': library.title} for library in all_libraries
+                           if user.library_ns is None or library.n in user.library_ns]}
+            for user in self.catalog.users
+        ])
+
+    def _server_info(self, request):
+        return json_response({'installId': f"fake-{self.name}", 'kavitaVersion': '0.8.4.2', 'isDocker': True,
+                              'firstInstallVersion': '0.7.0', 'firstInstallDate': iso(self.catalog.libraries[0].added_at)
+                              if self.catalog.libraries else None})
+
+    def _user_stats(self, request):
+        user = self.user(request.params[0])
+        n = user.n if user else 0
+        return json_response({'totalPagesRead': n * 37, 'totalWordsRead': n * 9100, 'timeSpentReading': n * 3,
+                              'chaptersRead': n * 2, 'lastActive': iso(user.created_at) if user else None,
+                              'avgHoursPerWeekSpentReading': 1.5})
+
+    def _reading_history(self, request):
+        return json_response([])
@@ -0,0 +1,128 @@
+# File: app/bench/fake_servers/komga.py
+"""Fake Komga server: libraries, paged series and books, users. Komga has no playback sessions."""
+import zlib
+
+from .base import FakeMediaServer, image_response, iso, json_response
+
+
+class FakeKomgaServer(FakeMediaServer):
+    service_type = 'komga'
+    library_kinds = ('series',)
+    has_sessions = False
+
+    def __init__(self, name, *args, **kwargs):
+        self._salt = f"{zlib.crc32(name.encode()):08X}"
+        super().__init__(name, *args, **kwargs)
+
+    def routes(self):
+        return [
+            ('GET', '/actuator/info', self._info),
+            ('GET', '/api/v1/libraries', self._libraries),
+            ('GET', '/api/v1/series', self._series),
+            ('GET', '/api/v1/series/(\\w+)', self._one_series),
+            ('GET', '/api/v1/series/(\\w+)/books', self._books),
+            ('GET', '/api/v1/(?:series|books)/(\\w+)/thumbnail', self._image),
+            ('GET', '/api/v2/users', self._users),
+            ('GET', '/api/v2/users/(\\w+)/shared-libraries', self._shared_libraries),
+        ]
+
+    def authorized(self, request):
+        return request.headers.get('X-API-Key') == self.token
+
+    # Komga ids are 13 character ULID-style strings
+    def _id(self, n):
+        return f"{self._salt}{n:05X}"
+
+    def _parse(self, value):
+        if len(value) != 13 or not value.startswith(self._salt):
+            return None
+        try:
+            return self.entry(int(value[8:], 16))
+        except ValueError:
+            return None
+
+    def _library_json(self, library):
+        return {'id': self._id(library.n), 'name': library.title, 'root': f"/data/{library.title.lower()}",
+                'unavailable': False, 'seriesCount': len(library.children)}
+
+    def _series_json(self, series):
+        return {
+            'id': self._id(series.n), 'libraryId': self._id(series.library.n), 'name': series.title,
+            'url': f"/data/{series.library.title.lower()}/{series.title}", 'booksCount': len(series.children),
+            'booksReadCount': 0, 'booksUnreadCount': len(series.children), 'booksInProgressCount': 0,
+            'created': iso(series.added_at), 'createdDate': iso(series.added_at),
+            'lastModified': iso(series.added_at), 'lastModifiedDate': iso(series.added_at),
+            'metadata': {'title': series.title, 'titleSort': series.title.lower(), 'status': 'ONGOING',
+                         'summary': f"Synthetic series served by {self.name}.", 'publisher': 'Fake Press',
+                         'releaseYear': series.year, 'language': 'en', 'genres': [], 'tags': []},
+        }
+
+    def _book_json(self, book):
+        return {'id': self._id(book.n), 'seriesId': self._id(book.parent.n), 'libraryId': self._id(book.library.n),
+                'name': book.title, 'number': book.index, 'created': iso(book.added_at),
+                'lastModified': iso(book.added_at), 'sizeBytes': 25000000 + book.n,
+                'media': {'status': 'READY', 'mediaType': 'application/zip', 'pagesCount': 24},
+                'metadata': {'title': book.title, 'number': str(book.index), 'numberSort': book.index,
+                             'summary': '', 'releaseDate': f"{book.parent.year}-01-01"}}
+
+    @staticmethod
+    def _paged(items, page, size, serialise):
+        start = page * size
+        return json_response({
+            'content': [serialise(item) for item in items[start:start + size]],
+            'totalElements': len(items), 'totalPages': (len(items) + size - 1) // size if size else 0,
+            'number': page, 'size': size, 'numberOfElements': len(items[start:start + size]),
+            'first': page == 0, 'last': start + size >= len(items), 'empty': not items[start:start + size],
+        })
+
+    def _info(self, request):
+        return json_response({'build': {'version': '1.14.1', 'artifact': 'komga', 'name': 'komga'},
+                              'git': {'branch': 'HEAD'}})
+
+    def _libraries(self, request):
+        return json_response([self._library_json(library) for library in self.catalog.libraries])
+
+    def _series(self, request):
+        library_id = request.arg('library_id')
+        series = []
+        for library in self.catalog.libraries:
+            if not library_id or self._id(library.n) == library_id:
+                series.extend(library.children)
+        series.sort(key=lambda entry: (entry.title.lower(), entry.n))
+        return self._paged(series, request.arg('page', 0, int), request.arg('size', 20, int), self._series_json)
+
+    def _one_series(self, request):
+        series = self._parse(request.params[0])
+        if series is None or series.kind != 'series':
+            return json_response({'error': 'Not Found'}, status=404)
+        return json_response(self._series_json(series))
+
+    def _books(self, request):
+        series = self._parse(request.params[0])
+        if series is None or series.kind != 'series':
+            return json_response({'error': 'Not Found'}, status=404)
+        return self._paged(series.children, request.arg('page', 0, int), request.arg('size', 20, int), self._book_json)
+
+    def _image(self, request):
+        return image_response()
+
+    def _users(self, request):
+        return json_response([
+            {'id': f"{self._salt}U{user.n:04X}", 'email': user.email,
+             'roles': ['ADMIN', 'USER'] if user.is_admin else ['USER'],
+             'sharedAllLibraries': user.library_ns is None,
+             'sharedLibrariesIds': [self._id(n) for n in (user.library_ns or [])]}
+            for user in self.catalog.users
+        ])
+
+    def _shared_libraries(self, request):
+        value = request.params[0]
+        try:
+            user = self.user(int(value[9:], 16)) if value.startswith(f"{self._salt}U") else None
+        except ValueError:
+            user = None
+        if user is None:
+            return json_response({'error': 'Not Found'}, status=404)
+        libraries = [library for library in self.catalog.libraries
+                     if user.library_ns is None or library.n in user.library_ns]
+        return json_response([self._library_json(library) for library in libraries])
@@ -0,0 +1,235 @@
+# File: app/bench/fake_servers/plex.py
+"""Fake Plex Media Server: the XML endpoints ``plexapi`` reads for libraries, metadata and sessions."""
+import zlib
+import xml.etree.ElementTree as ET
+
+from .base import FakeMediaServer, FakeResponse, empty_response, image_response
+
+# plexapi's searchType() codes
+_SEARCH_TYPES = {'1': 'movie', '2': 'show', '3': 'season', '4': 'episode'}
+_MEDIA_ID_OFFSET = 5000000  # media ids are a separate id space from ratingKeys on a real server
+
+
+def _xml_response(element, status=200):
+    return FakeResponse(status, ET.tostring(element, encoding='utf-8', xml_declaration=True), 'text/xml; charset=utf-8')
+
+
+def _container(**attrs):
+    return ET.Element('MediaContainer', {key: str(value) for key, value in attrs.items() if value is not None})
+
+
+def _sub(parent, tag, **attrs):
+    return ET.SubElement(parent, tag, {key: str(value) for key, value in attrs.items() if value is not None})
+
+
+class FakePlexServer(FakeMediaServer):
+    service_type = 'plex'
+    library_kinds = ('movie', 'show')
+
+    def __init__(self, name, *args, **kwargs):
+        self.machine_identifier = f"{zlib.crc32(name.encode()):08x}" * 5
+        # Session keys are small integers on a real server; keep them apart across the fleet
+        self._session_key_base = (zlib.crc32(name.encode()) % 1000) * 10000
+        self._listings = {}
+        super().__init__(name, *args, **kwargs)
+
+    def routes(self):
+        return [
+            ('GET', '/', self._root),
+            ('GET', '/identity', self._root),
+            ('GET', '/library', self._library),
+            ('GET', '/library/sections', self._sections),
+            ('GET', '/library/sections/(\\d+)', self._section_root),
+            ('GET', '/library/sections/(\\d+)/all', self._section_all),
+            ('GET', '/library/sections/(\\d+)/collections', self._empty),
+            ('GET', '/library/metadata/(\\d+)', self._metadata),
+            ('GET', '/library/metadata/(\\d+)/children', self._children),
+            ('GET', '/library/metadata/(\\d+)/allLeaves', self._all_leaves),
+            ('GET', '/library/metadata/(\\d+)/(?:thumb|art)(?:/\\d+)?', self._image),
+            ('GET', '/photo/:/transcode', self._image),
+            ('GET', '/media/providers', self._empty),
+            ('GET', '/status/sessions', self._sessions),
+            ('GET', '/status/sessions/terminate', self._terminate),
+        ]
+
+    def authorized(self, request):
+        return (request.headers.get('X-Plex-Token') or request.query.get('X-Plex-Token')) == self.token
+
+    def not_found(self, request):
+        return _xml_response(_container(size=0), status=404)
+
+    # --- Serialisers ---
+
+    def _section_attrs(self, library):
+        return {'key': library.n, 'type': library.holds, 'title': library.title,
+                'uuid': f"{self.machine_identifier[:8]}-0000-4000-8000-{library.n:012x}",
+                'agent': 'tv.plex.agents.movie' if library.holds == 'movie' else 'tv.plex.agents.series',
+                'scanner': 'Plex Movie' if library.holds == 'movie' else 'Plex TV Series', 'language': 'en-US',
+                'updatedAt': int(library.added_at.timestamp()), 'createdAt': int(library.added_at.timestamp()),
+                'scannedAt': int(library.added_at.timestamp()), 'refreshing': 0,
+                'thumb': '/:/resources/movie.png', 'art': '/:/resources/movie-fanart.jpg'}
+
+    def _add_media(self, parent, entry, transcoding=False):
+        media = _sub(parent, 'Media', id=entry.n + _MEDIA_ID_OFFSET, duration=entry.duration_ms, bitrate=8000,
+                     width=1920, height=1080, videoResolution='1080', container='mkv', videoCodec='h264',
+                     audioCodec='aac', audioChannels=6, selected=0 if transcoding else None)
+        part = _sub(media, 'Part', id=entry.n + _MEDIA_ID_OFFSET, key=f"/library/parts/{entry.n}/file.mkv",
+                    duration=entry.duration_ms, file=f"/media/{entry.library.title}/{entry.title}.mkv",
+                    size=entry.duration_ms * 1000, container='mkv',
+                    decision='transcode' if transcoding else 'directplay')
+        _sub(part, 'Stream', id=entry.n * 10 + 1, streamType=1, codec='h264', height=1080, width=1920,
+             bitrate=8000, displayTitle='1080p (H.264)')
+        _sub(part, 'Stream', id=entry.n * 10 + 2, streamType=2, codec='aac', channels=6, selected=1,
+             language='English', displayTitle='English (AAC 5.1)')
+        return media
+
+    def _item_element(self, parent, entry, with_media=True):
+        library = entry.library
+        added = int(entry.added_at.timestamp())
+        attrs = {'ratingKey': entry.n, 'key': f"/library/metadata/{entry.n}", 'type': entry.kind,
+                 'title': entry.title, 'titleSort': entry.title.lower(), 'addedAt': added, 'updatedAt': added,
+                 'thumb': f"/library/metadata/{entry.n}/thumb/{added}",
+                 'librarySectionID': library.n, 'librarySectionTitle': library.title,
+                 'librarySectionKey': f"/library/sections/{library.n}"}
+        if entry.kind in ('movie', 'show'):
+            attrs.update({'guid': f"plex://{entry.kind}/{entry.n:024x}", 'year': entry.year,
+                          'summary': f"Synthetic {entry.kind} served by {self.name}.",
+                          'originallyAvailableAt': f"{entry.year}-01-01", 'audienceRating': 5 + (entry.n % 50) / 10,
+                          'contentRating': 'PG-13', 'studio': 'Fake Studios',
+                          'art': f"/library/metadata/{entry.n}/art/{added}"})
+        if entry.kind == 'show':
+            attrs.update({'childCount': len(entry.children),
+                          'leafCount': sum(len(season.children) for season in entry.children)})
+            return _sub(parent, 'Directory', **attrs)
+        if entry.kind == 'season':
+            attrs.update({'index': entry.index, 'parentRatingKey': entry.parent.n, 'parentTitle': entry.parent.title,
+                          'parentKey': f"/library/metadata/{entry.parent.n}", 'leafCount': len(entry.children)})
+            return _sub(parent, 'Directory', **attrs)
+        if entry.kind == 'episode':
+            season, show = entry.parent, entry.grandparent
+            attrs.update({'index': entry.index, 'parentIndex': season.index, 'parentRatingKey': season.n,
+                          'parentTitle': season.title, 'grandparentRatingKey': show.n,
+                          'grandparentTitle': show.title, 'grandparentKey': f"/library/metadata/{show.n}",
+                          'grandparentThumb': f"/library/metadata/{show.n}/thumb/{added}", 'year': show.year})
+        attrs['duration'] = entry.duration_ms
+        element = _sub(parent, 'Video', **attrs)
+        if with_media:
+            self._add_media(element, entry)
+        return element
+
+    def _items_response(self, request, entries, **container_attrs):
+        start = request.arg('X-Plex-Container-Start', 0, int)
+        size = request.arg('X-Plex-Container-Size', None, int)
+        page = self.page(entries, start, size)
+        container = _container(size=len(page), totalSize=len(entries), offset=start, **container_attrs)
+        for entry in page:
+            self._item_element(container, entry)
+        return _xml_response(container)
+
+    # --- Handlers ---
+
+    def _root(self, request):
+        return _xml_response(_container(
+            size=0, friendlyName=self.name, machineIdentifier=self.machine_identifier, version='1.41.3.9314-a0bfb8370',
+            platform='Linux', platformVersion='6.1', myPlex=0, transcoderActiveVideoSessions=0, allowSync=0))
+
+    def _library(self, request):
+        container = _container(size=1, title1='Plex Library')
+        _sub(container, 'Directory', key='sections', title='Library Sections')
+        return _xml_response(container)
+
+    def _sections(self, request):
+        container = _container(size=len(self.catalog.libraries), title1='Plex Library')
+        for library in self.catalog.libraries:
+            directory = _sub(container, 'Directory', **self._section_attrs(library))
+            _sub(directory, 'Location', id=library.n, path=f"/media/{library.title.lower()}")
+        return _xml_response(container)
+
+    def _section_root(self, request):
+        library = self.entry(request.params[0], 'library')
+        if library is None:
+            return self.not_found(request)
+        return _xml_response(_container(size=0, librarySectionID=library.n, title1=library.title))
+
+    def _section_all(self, request):
+        library = self.entry(request.params[0], 'library')
+        if library is None:
+            return self.not_found(request)
+        kind = _SEARCH_TYPES.get(request.arg('type'), library.holds)
+        key = (library.n, kind)
+        entries = self._listings.get(key)
+        if entries is None:
+            entries, stack = [], list(library.children)
+            while stack:
+                entry = stack.pop()
+                if entry.kind == kind:
+                    entries.append(entry)
+                stack.extend(entry.children)
+            entries.sort(key=lambda entry: (entry.title.lower(), entry.n))
+            self._listings[key] = entries
+        return self._items_response(request, entries, librarySectionID=library.n,
+                                    librarySectionTitle=library.title, librarySectionUUID=self._section_attrs(library)['uuid'])
+
+    def _metadata(self, request):
+        entry = self.entry(request.params[0])
+        if entry is None or entry.kind == 'library':
+            return self.not_found(request)
+        container = _container(size=1, librarySectionID=entry.library.n, librarySectionTitle=entry.library.title)
+        self._item_element(container, entry)
+        return _xml_response(container)
+
+    def _children(self, request):
+        entry = self.entry(request.params[0], 'show', 'season')
+        if entry is None:
+            return self.not_found(request)
+        return self._items_response(request, entry.children, key=entry.n, parentTitle=entry.title)
+
+    def _all_leaves(self, request):
+        show = self.entry(request.params[0], 'show')
+        if show is None:
+            return self.not_found(request)
+        leaves = [episode for season in show.children for episode in season.children]
+        return self._items_response(request, leaves, key=show.n, parentTitle=show.title)
+
+    def _image(self, request):
+        return image_response()
+
+    def _empty(self, request):
+        return _xml_response(_container(size=0))
+
+    def _sessions(self, request):
+        sessions = self.sessions.current()
+        container = _container(size=len(sessions))
+        for session in sessions:
+            entry = session.item
+            transcoding = session.n % 4 == 0
+            video = self._item_element(container, entry, with_media=False)
+            video.set('sessionKey', str(self._session_key_base + session.n))
+            video.set('viewOffset', str(session.position_ms))
+            if transcoding:
+                self._add_media(video, entry, transcoding=True)
+                _sub(video, 'Media', id=entry.n + _MEDIA_ID_OFFSET, bitrate=4000, height=720, width=1280,
+                     videoResolution='720', container='mpegts', selected=1)
+            else:
+                self._add_media(video, entry)
+            # Plex reports the owner as user id 1; fake users start above it
+            _sub(video, 'User', id=session.user.n + 1, title=session.user.username,
+                 thumb=f"https://plex.tv/users/{session.user.n:016x}/avatar")
+            _sub(video, 'Player', address=session.address, machineIdentifier=f"player-{session.n}",
+                 platform='Chrome', platformVersion='120.0', product='Plex Web', title=f"Browser {session.n % 7}",
+                 state='paused' if session.paused else 'playing', local=int(session.address.startswith('10.')),
+                 remotePublicAddress=session.address)
+            _sub(video, 'Session', id=f"session-{session.n}", bandwidth=8000, location='lan')
+            if transcoding:
+                _sub(video, 'TranscodeSession', key=f"/transcode/sessions/{session.n}", throttled=0, complete=0,
+                     progress=10.0, speed=2.5, duration=entry.duration_ms, videoDecision='transcode',
+                     audioDecision='transcode', subtitleDecision=None, protocol='hls', container='mpegts',
+                     videoCodec='h264', audioCodec='aac', audioChannels=2, width=1280, height=720,
+                     transcodeHwRequested=0)
+        return _xml_response(container)
+
+    def _terminate(self, request):
+        session_id = request.arg('sessionId', '')
+        if session_id.startswith('session-') and session_id[8:].isdigit():
+            self.sessions.stop(int(session_id[8:]))
+        return empty_response(200)
@@ -0,0 +1,87 @@
+# File: app/bench/fake_servers/romm.py
+"""Fake RomM server: platforms (libraries), paged ROMs, users and recent play activity."""
+import base64
+
+from .base import FakeMediaServer, image_response, iso, json_response
+
+_PLATFORMS = (('snes', 'Super Nintendo'), ('n64', 'Nintendo 64'), ('psx', 'PlayStation'), ('gba', 'Game Boy Advance'))
+
+
+class FakeRommServer(FakeMediaServer):
+    service_type = 'romm'
+    library_kinds = ('rom',)
+
+    def __init__(self, name, *args, username='admin', **kwargs):
+        self.username = username
+        super().__init__(name, *args, **kwargs)
+
+    def routes(self):
+        return [
+            ('GET', '/api/heartbeat', self._heartbeat),
+            ('GET', '/api/platforms', self._platforms),
+            ('GET', '/api/roms', self._roms),
+            ('GET', '/api/users', self._users),
+            ('GET', '/api/stats/recent-activity', self._recent_activity),
+            ('GET', '/assets/.*', self._image),
+        ]
+
+    def authorized(self, request):
+        if request.path == '/api/heartbeat' or request.path.startswith('/assets/'):
+            return True
+        expected = base64.b64encode(f"{self.username}:{self.token}".encode()).decode()
+        return request.headers.get('Authorization') == f"Basic {expected}"
+
+    def credentials(self):
+        return {'username': self.username, 'password': self.token}
+
+    def _platform(self, library):
+        slug, name = _PLATFORMS[self.catalog.libraries.index(library) % len(_PLATFORMS)]
+        return slug, name
+
+    def _heartbeat(self, request):
+        return json_response({'SYSTEM': {'VERSION': '3.7.3', 'SHOW_SETUP_WIZARD': False}})
+
+    def _platforms(self, request):
+        platforms = []
+        for library in self.catalog.libraries:
+            slug, name = self._platform(library)
+            platforms.append({'id': library.n, 'slug': slug, 'fs_slug': slug, 'name': name,
+                              'display_name': f"{name} ({library.title})", 'rom_count': len(library.children),
+                              'created_at': iso(library.added_at), 'updated_at': iso(library.added_at)})
+        return json_response(platforms)
+
+    def _roms(self, request):
+        library = self.entry(request.arg('platform_id'), 'library')
+        if library is None:
+            return json_response({'items': [], 'total': 0, 'total_count': 0})
+        _, platform_name = self._platform(library)
+        roms = sorted(library.children, key=lambda entry: (entry.title.lower(), entry.n))
+        offset = request.arg('offset', 0, int)
+        limit = request.arg('limit', 50, int)
+        return json_response({'items': [
+            {'id': rom.n, 'platform_id': library.n, 'name': rom.title, 'summary': f"Synthetic ROM served by {self.name}.",
+             'fs_name': f"{rom.title}.zip", 'fs_path': f"roms/{library.n}", 'fs_size_bytes': 4000000 + rom.n,
+             'platform_display_name': platform_name, 'created_at': iso(rom.added_at),
+             'metadatum': {'first_release_date': f"{rom.year}-01-01", 'genres': ['Action']},
+             'path_cover_large': f"/assets/romm/resources/roms/{library.n}/{rom.n}/cover/big.png"}
+            for rom in self.page(roms, offset, limit)
+        ], 'total': len(roms), 'total_count': len(roms), 'offset': offset, 'limit': limit})
+
+    def _users(self, request):
+        return json_response([
+            {'id': user.n, 'username': user.username, 'email': user.email, 'enabled': True,
+             'role': 'admin' if user.is_admin else 'viewer', 'created_at': iso(user.created_at),
+             'last_active_at': iso(user.created_at)}
+            for user in self.catalog.users
+        ])
+
+    def _recent_activity(self, request):
+        return json_response({'recent_plays': [
+            {'id': session.n, 'user_id': session.user.n, 'username': session.user.username,
+             'rom_name': session.item.title, 'platform_name': self._platform(session.item.library)[1],
+             'played_at': iso(session.started_at), 'is_active': not session.paused}
+            for session in self.sessions.current()
+        ]})
+
+    def _image(self, request):
+        return image_response()
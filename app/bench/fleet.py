@@ -0,0 +1,173 @@
+# File: app/bench/fleet.py
+"""
+Drive library sync, user sync and the session monitor against a fleet of
+local fake media servers (``app.bench.fake_servers``).
+
+The fakes are registered as ordinary ``MediaServer`` rows in the scratch
+database, so every step runs the real code path: ``MediaServiceManager``
+and ``MediaSyncService`` build the plugins, the plugins talk HTTP to the
+fakes, and ``monitor_media_sessions_task`` polls them. Each step records wall
+time and SQL statement count per server (or per library / tick).
+"""
+import time
+from contextlib import contextmanager
+
+from flask import current_app
+from sqlalchemy import func
+
+from app.extensions import db, scheduler
+from app.models import User, UserType
+from app.models_media_services import MediaServer, MediaLibrary, MediaItem, MediaStreamHistory, ServiceType
+from app.utils.timezone_utils import utcnow
+
+from .scenarios import _QueryCounter
+
+
+def register_fleet(fleet):
+    """Add a ``MediaServer`` row for every fake and enable the plugins they need. Returns ``{fake name: server id}``."""
+    from app.models_plugins import Plugin, PluginStatus
+
+    now = utcnow().replace(tzinfo=None)
+    server_ids = {}
+    for fake in fleet:
+        server = MediaServer(server_nickname=fake.name, server_name=fake.name, service_type=ServiceType(fake.service_type),
+                             url=fake.url, is_active=True, last_status=True, last_status_check=now, config={},
+                             **fake.credentials())
+        db.session.add(server)
+        db.session.flush()
+        server_ids[fake.name] = server.id
+    for service_type in {fake.service_type for fake in fleet}:
+        plugin = Plugin.query.filter_by(plugin_id=service_type).first()
+        if plugin:
+            plugin.status = PluginStatus.ENABLED
+    db.session.commit()
+    return server_ids
+
+
+def seed_plex_users(fake, server_id):
+    """
+    Create the service users of a fake Plex server directly: the real user
+    sync lists shared users through plex.tv, which no local fake can stand in for.
+    """
+    import uuid
+    now = utcnow().replace(tzinfo=None)
+    for user in fake.catalog.users:
+        db.session.add(User(
+            uuid=str(uuid.uuid4()), userType=UserType.SERVICE, server_id=server_id,
+            external_user_id=str(user.n + 1),  # matches the <User id> the fake reports in sessions
+            external_username=user.username, external_email=user.email, allowed_library_ids=[],
+            is_home_user=False, shares_back=False, service_join_date=user.created_at.replace(tzinfo=None),
+            created_at=now, updated_at=now))
+    db.session.commit()
+    return len(fake.catalog.users)
+
+
+def _timed(func, *args, **kwargs):
+    with _QueryCounter(db.engine) as counter:
+        started = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:  # one failing server shouldn't abort the rest of the run
+            db.session.rollback()
+            result = {'success': False, 'error': str(e)}
+        seconds = time.perf_counter() - started
+    db.session.remove()
+    return result, {'seconds': round(seconds, 3), 'queries': counter.count}
+
+
+def _outcome(result):
+    if not isinstance(result, dict):
+        return {'success': bool(result)}
+    outcome = {'success': result.get('success', 'error' not in result)}
+    for key in ('message', 'error', 'added', 'updated', 'removed', 'total_items', 'refreshed', 'failed', 'items_added', 'items_updated'):
+        if result.get(key) not in (None, '', [], {}):
+            outcome[key] = result[key] if not isinstance(result[key], list) else len(result[key])
+    return outcome
+
+
+@contextmanager
+def _monitor_harness(app):
+    """Point the scheduled monitor at this app with an empty set of tracked sessions."""
+    from app.services import task_service
+
+    original_active = dict(task_service._active_stream_sessions)
+    original_app = getattr(scheduler, 'app', None)
+    scheduler_was_running = scheduler.running
+    if scheduler_was_running:
+        scheduler.pause()
+    task_service._active_stream_sessions.clear()
+    scheduler.app = app
+    try:
+        yield task_service
+    finally:
+        scheduler.app = original_app
+        task_service._active_stream_sessions.clear()
+        task_service._active_stream_sessions.update(original_active)
+        if scheduler_was_running:
+            scheduler.resume()
+
+
+def run_fleet(fleet, ticks=5, sync_content=True, echo=None):
+    """
+    Register ``fleet`` in the current (scratch) database, then run library
+    sync, user sync, content sync, episode prefetch and ``ticks`` monitor
+    ticks against it. Expects a database without media servers. Returns the report dict.
+    """
+    from app.services.media_service_factory import MediaServiceFactory
+    from app.services.media_service_manager import MediaServiceManager
+    from app.services.media_sync_service import MediaSyncService
+    from app.services import episode_prefetch
+
+    echo = echo or (lambda message: None)
+    if MediaServer.query.first() is not None:
+        raise RuntimeError("The database already has media servers; run `flask bench fleet` with --reset.")
+
+    server_ids = register_fleet(fleet)
+    by_name = {fake.name: fake for fake in fleet}
+    report = {'servers': [{'name': fake.name, 'service_type': fake.service_type, 'url': fake.url} for fake in fleet],
+              'options': fleet[0].options.to_dict() if fleet else {}, 'steps': {}}
+
+    def record(step, name, result, timing):
+        row = dict(name=name, **timing, **_outcome(result))
+        report['steps'].setdefault(step, []).append(row)
+        echo(f"{step:14s} {name:28s} {timing['seconds']:8.3f}s {timing['queries']:6d} queries  "
+             f"{'ok' if row['success'] else 'FAILED ' + str(row.get('error') or row.get('message'))}")
+
+    for name, server_id in server_ids.items():
+        record('libraries', name, *_timed(MediaServiceManager.sync_server_libraries, server_id))
+
+    for name, server_id in server_ids.items():
+        if by_name[name].service_type == 'plex':
+            record('users', name, *_timed(lambda: {'success': True, 'added': seed_plex_users(by_name[name], server_id),
+                                                   'message': 'seeded directly (plex.tv is not faked)'}))
+        else:
+            record('users', name, *_timed(MediaServiceManager.sync_server_users, server_id))
+
+    if sync_content:
+        libraries = MediaLibrary.query.filter(MediaLibrary.server_id.in_(server_ids.values())).order_by(MediaLibrary.id).all()
+        targets = []
+        for library in libraries:
+            service = MediaServiceFactory.create_service_from_db(library.server)
+            if service is not None and hasattr(service, 'get_library_content'):
+                targets.append((library.id, f"{library.server.server_nickname}/{library.name}"))
+        db.session.remove()
+        for library_id, label in targets:
+            record('content', label, *_timed(MediaSyncService.sync_library_content, library_id, force_full_sync=True))
+        for library_id, label in targets:
+            if db.session.query(MediaItem.id).filter_by(library_id=library_id, item_type='show').first():
+                record('episodes', label, *_timed(episode_prefetch.prefetch_episodes, library_ids=[library_id]))
+
+    app = current_app._get_current_object()
+    first_history_id = db.session.query(func.max(MediaStreamHistory.id)).scalar() or 0
+    with _monitor_harness(app) as task_service:
+        for tick in range(1, ticks + 1):
+            playing = sum(len(fake.advance_sessions()) for fake in fleet)
+            _, timing = _timed(task_service.monitor_media_sessions_task)
+            tracked = len(task_service._active_stream_sessions)
+            report['steps'].setdefault('monitor', []).append(dict(tick=tick, playing=playing, tracked=tracked, **timing))
+            echo(f"{'monitor':14s} tick {tick:<23d} {timing['seconds']:8.3f}s {timing['queries']:6d} queries  "
+                 f"{playing} playing, {tracked} tracked")
+
+    report['history_rows'] = MediaStreamHistory.query.filter(MediaStreamHistory.id > first_history_id).count()
+    report['fake_requests'] = {fake.name: fake.stats() for fake in fleet}
+    return report
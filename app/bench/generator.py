@@ -0,0 +1,286 @@
+# File: app/bench/generator.py
+"""
+Synthetic dataset generator for the benchmark suite.
+
+Rows are written with Core ``INSERT`` executemany batches rather than ORM
+objects so multi-million row datasets build in minutes. All randomness comes
+from one seeded ``random.Random``, so the same profile and seed produce the
+same dataset (timestamps are relative to the time of generation).
+"""
+import random
+import time
+import uuid
+from datetime import timedelta
+
+from flask import current_app
+from sqlalchemy import insert
+
+from app.extensions import db
+from app.models import User, UserType, Setting, SettingValueType, HistoryLog, EventType
+from app.models_media_services import MediaServer, MediaLibrary, MediaItem, MediaStreamHistory, ServiceType
+from app.utils.timezone_utils import utcnow
+
+BENCH_OWNER_USERNAME = 'bench'
+BENCH_OWNER_PASSWORD = 'bench'
+BENCH_DATASET_SETTING = 'BENCH_DATASET'
+
+PROFILES = {
+    'small': {'users': 500, 'items': 2000, 'history': 20000},
+    'medium': {'users': 5000, 'items': 20000, 'history': 500000},
+    'large': {'users': 50000, 'items': 200000, 'history': 5000000},
+}
+
+# Unroutable address: a scenario that accidentally reaches a media server fails fast instead of hanging
+_SERVER_URL = 'http://127.0.0.1:9'
+
+_BATCH_SIZE = 10000
+_HISTORY_DAYS = 365
+
+
+class _Progress:
+    def __init__(self, echo):
+        self.echo = echo or (lambda message: None)
+        self.started = time.monotonic()
+
+    def __call__(self, message):
+        self.echo(f"[{time.monotonic() - self.started:7.1f}s] {message}")
+
+
+def _uuid(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def _insert_batches(table, rows_iter, total, progress, label):
+    batch = []
+    written = 0
+    for row in rows_iter:
+        batch.append(row)
+        if len(batch) >= _BATCH_SIZE:
+            db.session.execute(insert(table), batch)
+            db.session.commit()
+            written += len(batch)
+            batch = []
+            if written % (_BATCH_SIZE * 20) == 0:
+                progress(f"{label}: {written}/{total}")
+    if batch:
+        db.session.execute(insert(table), batch)
+        db.session.commit()
+        written += len(batch)
+    progress(f"{label}: {written} rows")
+    return written
+
+
+def _setup_app_state():
+    """Owner, base settings and enabled plugins, as after finishing the setup wizard."""
+    from app.models_plugins import Plugin, PluginStatus
+    from app.services.plugin_manager import plugin_manager
+
+    owner = User.create_owner(BENCH_OWNER_USERNAME, BENCH_OWNER_PASSWORD)
+    db.session.add(owner)
+    db.session.commit()
+    Setting.set('APP_BASE_URL', 'http://localhost')
+    plugin_manager.initialize_core_plugins()
+    for plugin_id in ('plex', 'jellyfin'):
+        plugin = Plugin.query.filter_by(plugin_id=plugin_id).first()
+        if plugin:
+            plugin.status = PluginStatus.ENABLED
+    db.session.commit()
+
+
+def _create_servers_and_libraries(now):
+    servers = [
+        MediaServer(server_nickname='bench-plex', server_name='Bench Plex', service_type=ServiceType.PLEX,
+                    url=_SERVER_URL, api_key='bench', is_active=True, last_status=True, last_status_check=now),
+        MediaServer(server_nickname='bench-jellyfin', server_name='Bench Jellyfin', service_type=ServiceType.JELLYFIN,
+                    url=_SERVER_URL, api_key='bench', is_active=True, last_status=True, last_status_check=now),
+    ]
+    db.session.add_all(servers)
+    db.session.commit()
+
+    libraries = []
+    for server in servers:
+        libraries.append(MediaLibrary(server_id=server.id, external_id='1', name='Movies', library_type='movie', last_scanned=now))
+        libraries.append(MediaLibrary(server_id=server.id, external_id='2', name='Shows', library_type='show', last_scanned=now))
+    db.session.add_all(libraries)
+    db.session.commit()
+    return servers, libraries
+
+
+def generate_dataset(users=500, items=2000, history=20000, seed=1, echo=None):
+    """
+    Create the schema and fill it with a synthetic dataset. Expects an empty database.
+
+    ``items`` is split roughly 40% movies, 6% shows and 54% episodes across one
+    Plex and one Jellyfin server; ``users`` are service users spread over both
+    servers, one in ten linked to a local user. Returns a summary dict that is
+    also stored in the ``BENCH_DATASET`` setting.
+    """
+    rng = random.Random(seed)
+    progress = _Progress(echo)
+    now = utcnow().replace(tzinfo=None)  # History and the stats queries use naive UTC
+
+    db.create_all()
+    if User.query.first() is not None:
+        raise RuntimeError("The benchmark database is not empty; use --reset to recreate it.")
+
+    _setup_app_state()
+    servers, libraries = _create_servers_and_libraries(now)
+    progress(f"Created {len(servers)} servers and {len(libraries)} libraries")
+
+    # --- Users ---
+    service_users = []  # (uuid, server_id, username)
+
+    def user_rows():
+        for n in range(users):
+            server = servers[n % len(servers)]
+            user_uuid = _uuid(rng)
+            username = f"bench_user_{n}"
+            service_users.append((user_uuid, server.id, username))
+            joined = now - timedelta(days=rng.randint(1, 3 * _HISTORY_DAYS))
+            yield {
+                'uuid': user_uuid, 'userType': UserType.SERVICE, 'server_id': server.id,
+                'external_user_id': str(100000 + n), 'external_username': username,
+                'external_email': f"{username}@example.com", 'allowed_library_ids': [],
+                'service_settings': {},
+                'allow_downloads': False, 'allow_4k_transcode': True, 'is_active': True,
+                'is_discord_bot_whitelisted': False, 'is_purge_whitelisted': rng.random() < 0.02,
+                'is_home_user': rng.random() < 0.05, 'shares_back': rng.random() < 0.02,
+                'preferred_user_list_view': 'cards', 'force_password_change': False,
+                'service_join_date': joined, 'created_at': joined, 'updated_at': now,
+            }
+
+    _insert_batches(User.__table__, user_rows(), users, progress, "Service users")
+
+    local_count = users // 10
+    local_uuids = [_uuid(rng) for _ in range(local_count)]
+
+    def local_rows():
+        for n, local_uuid in enumerate(local_uuids):
+            yield {
+                'uuid': local_uuid, 'userType': UserType.LOCAL, 'localUsername': f"bench_local_{n}",
+                'allowed_library_ids': [], 'service_settings': {},
+                'allow_downloads': False, 'allow_4k_transcode': True, 'is_active': True,
+                'is_discord_bot_whitelisted': False, 'is_purge_whitelisted': False, 'is_home_user': False,
+                'shares_back': False, 'preferred_user_list_view': 'cards', 'force_password_change': False,
+                'created_at': now - timedelta(days=rng.randint(1, _HISTORY_DAYS)), 'updated_at': now,
+            }
+
+    _insert_batches(User.__table__, local_rows(), local_count, progress, "Local users")
+    users_table = User.__table__
+    for n, local_uuid in enumerate(local_uuids):
+        db.session.execute(users_table.update().where(users_table.c.uuid == service_users[n * 10][0])
+                           .values(linkedUserId=local_uuid))
+    db.session.commit()
+
+    # --- Media items ---
+    movie_count = int(items * 0.40)
+    show_count = max(1, int(items * 0.06))
+    episode_count = max(0, items - movie_count - show_count)
+    catalog = {server.id: {'movies': [], 'episodes': []} for server in servers}
+    libraries_by_key = {(library.server_id, library.library_type): library for library in libraries}
+    item_ids = iter(range(1, items + 1))
+    shows = []  # (item id, server id, external id, title)
+
+    def item_rows():
+        for n in range(movie_count):
+            server = servers[n % len(servers)]
+            library = libraries_by_key[(server.id, 'movie')]
+            item_id = next(item_ids)
+            title = f"Movie {n}"
+            duration = rng.randint(80, 180) * 60
+            catalog[server.id]['movies'].append((item_id, str(item_id), title, library, duration))
+            yield _item_row(item_id, library, server, 'movie', title, now, rng, duration)
+        for n in range(show_count):
+            server = servers[n % len(servers)]
+            library = libraries_by_key[(server.id, 'show')]
+            item_id = next(item_ids)
+            title = f"Show {n}"
+            shows.append((item_id, server.id, str(item_id), title))
+            yield _item_row(item_id, library, server, 'show', title, now, rng, None)
+        for n in range(episode_count):
+            show_id, server_id, show_external_id, show_title = shows[n % len(shows)]
+            server = servers[0] if servers[0].id == server_id else servers[1]
+            library = libraries_by_key[(server_id, 'show')]
+            item_id = next(item_ids)
+            title = f"Episode {n}"
+            duration = rng.randint(20, 60) * 60
+            catalog[server_id]['episodes'].append((item_id, str(item_id), title, library, duration, show_id, show_external_id, show_title))
+            row = _item_row(item_id, library, server, 'episode', title, now, rng, duration)
+            row['parent_id'] = show_external_id
+            row['season_number'] = 1 + (n // len(shows)) // 10
+            row['episode_number'] = 1 + (n // len(shows)) % 10
+            yield row
+
+    _insert_batches(MediaItem.__table__, item_rows(), items, progress, "Media items")
+    for library in libraries:
+        library.item_count = MediaItem.query.filter_by(library_id=library.id).filter(MediaItem.item_type != 'episode').count()
+    db.session.commit()
+
+    # --- Stream history ---
+    users_by_server = {}
+    for user_uuid, server_id, username in service_users:
+        users_by_server.setdefault(server_id, []).append(user_uuid)
+    # A minority of users stream most of the time, like on real servers
+    active_users = {server_id: uuids[:max(1, len(uuids) // 4)] for server_id, uuids in users_by_server.items()}
+
+    def history_rows():
+        for n in range(history):
+            server = servers[n % len(servers)]
+            pool = active_users[server.id] if rng.random() < 0.8 else users_by_server[server.id]
+            user_uuid = rng.choice(pool)
+            started = now - timedelta(seconds=rng.randint(0, _HISTORY_DAYS * 86400))
+            episodes = catalog[server.id]['episodes']
+            if episodes and rng.random() < 0.6:
+                item_id, external_id, title, library, duration, show_id, show_external_id, show_title = rng.choice(episodes)
+                media_type, grandparent_title, grandparent_id = 'episode', show_title, show_id
+            else:
+                item_id, external_id, title, library, duration = rng.choice(catalog[server.id]['movies'])
+                media_type, grandparent_title, grandparent_id = 'movie', None, None
+            watched = int(duration * rng.uniform(0.05, 1.0))
+            yield {
+                'user_uuid': user_uuid, 'server_id': server.id, 'session_key': f"bench-{n}",
+                'rating_key': external_id, 'external_media_item_id': external_id,
+                'started_at': started, 'stopped_at': started + timedelta(seconds=watched),
+                'duration_seconds': watched, 'platform': rng.choice(('Android', 'iOS', 'Chrome', 'Roku', 'tvOS')),
+                'product': 'Bench', 'player': 'bench-player', 'ip_address': f"10.0.{n % 250}.{(n // 250) % 250}",
+                'is_lan': rng.random() < 0.3, 'media_title': title, 'media_type': media_type,
+                'grandparent_title': grandparent_title, 'parent_title': None, 'library_name': library.name,
+                'library_id': library.id, 'media_item_id': item_id, 'grandparent_media_item_id': grandparent_id,
+                'media_duration_seconds': duration, 'view_offset_at_end_seconds': watched,
+            }
+
+    _insert_batches(MediaStreamHistory.__table__, history_rows(), history, progress, "Stream history")
+
+    from app.services.activity_summary_service import rebuild_activity_summaries
+    rebuild_activity_summaries()
+    progress("Rebuilt activity summaries")
+
+    event_types = list(EventType)
+
+    def event_rows():
+        for n in range(min(10000, max(100, history // 100))):
+            yield {'timestamp': now - timedelta(seconds=rng.randint(0, 30 * 86400)),
+                   'event_type': rng.choice(event_types), 'message': f"Bench event {n}", 'details': {}}
+
+    _insert_batches(HistoryLog.__table__, event_rows(), None, progress, "History log")
+
+    summary = {
+        'seed': seed, 'generated_at': now.isoformat(), 'servers': len(servers), 'libraries': len(libraries),
+        'service_users': users, 'local_users': local_count, 'media_items': items,
+        'movies': movie_count, 'shows': show_count, 'episodes': episode_count, 'stream_history': history,
+    }
+    Setting.set(BENCH_DATASET_SETTING, summary, SettingValueType.JSON)
+    current_app.logger.info(f"Bench generator: dataset ready {summary}")
+    progress("Done")
+    return summary
+
+
+def _item_row(item_id, library, server, item_type, title, now, rng, duration):
+    return {
+        'id': item_id, 'library_id': library.id, 'server_id': server.id, 'external_id': str(item_id),
+        'rating_key': str(item_id), 'title': title, 'sort_title': title.lower(), 'item_type': item_type,
+        'summary': f"Synthetic {item_type} for benchmarks.", 'year': rng.randint(1960, 2026),
+        'rating': round(rng.uniform(1, 10), 1), 'duration': duration * 1000 if duration else None,
+        'added_at': now - timedelta(days=rng.randint(0, 5 * _HISTORY_DAYS)), 'last_synced': now,
+        'season_number': None, 'episode_number': None, 'studio': None,
+    }
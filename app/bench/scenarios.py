@@ -0,0 +1,357 @@
+# File: app/bench/scenarios.py
+"""
+Timed benchmark scenarios.
+
+Each scenario performs one unit of work per iteration: a request through the
+Flask test client (so routing, auth, queries and template rendering are all
+included) or one session monitor tick. For every iteration the wall time and
+the number of SQL statements are recorded; the report gives p50/p95 for both.
+
+The monitor tick runs against synthetic Jellyfin-style sessions for users of
+the generated dataset instead of calling a media server. Each tick ends a few
+sessions and starts new ones, so the start, update and stop paths all run.
+"""
+import math
+import random
+import statistics
+import subprocess
+import time
+from contextlib import contextmanager
+
+from flask import current_app
+from sqlalchemy import event, func
+
+from app.extensions import db, scheduler
+from app.models import User, UserType, Setting, HistoryLog, EventType
+from app.models_media_services import MediaServer, MediaLibrary, MediaItem, MediaStreamHistory, ServiceType
+from app.services import history_service
+from app.utils.helpers import encode_url_component
+
+from .generator import BENCH_DATASET_SETTING
+
+_scenarios = {}  # name -> func(ctx)
+
+
+def scenario(name):
+    """Register ``func(ctx)`` as one iteration of scenario ``name``."""
+    def decorator(func):
+        _scenarios[name] = func
+        return func
+    return decorator
+
+
+def scenario_names():
+    return list(_scenarios)
+
+
+class _QueryCounter:
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _on_execute(self, *args, **kwargs):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
+
+
+class BenchContext:
+    """Shared state for one benchmark run: a logged-in client and sample ids to request."""
+
+    def __init__(self, app, seed):
+        self.app = app
+        self.rng = random.Random(seed)
+        self.client = app.test_client()
+        owner = User.query.filter_by(userType=UserType.OWNER).first()
+        if owner is None:
+            raise RuntimeError("The benchmark database has no owner; run `flask bench generate` first.")
+        with self.client.session_transaction() as session:
+            session['_user_id'] = owner.get_id()
+            session['_fresh'] = True
+
+        self.libraries = [(library.server.server_nickname, library.name, library.id, library.library_type)
+                          for library in MediaLibrary.query.order_by(MediaLibrary.id).all()]
+        movie_ids = [row.id for row in db.session.query(MediaItem.id).filter(MediaItem.item_type == 'movie')
+                     .order_by(MediaItem.id).limit(5000).all()]
+        self.movies = []
+        for movie_id in self.rng.sample(movie_ids, min(200, len(movie_ids))):
+            item = db.session.get(MediaItem, movie_id)
+            self.movies.append((item.server.server_nickname, item.library.name, item.id))
+        self.user_pages = max(1, User.query.filter(User.userType.in_([UserType.LOCAL, UserType.SERVICE])).count() // 24)
+        log_ids = [row.id for row in db.session.query(HistoryLog.id).order_by(HistoryLog.id).all()]
+        sampled_logs = HistoryLog.query.filter(HistoryLog.id.in_(self.rng.sample(log_ids, min(200, len(log_ids))))).all()
+        self.log_cursors = [history_service.encode_log_cursor(log) for log in sampled_logs]
+        self.log_total = len(log_ids)
+
+    def get(self, url):
+        response = self.client.get(url)
+        return response.status_code
+
+    def post(self, url, data):
+        response = self.client.post(url, data=data)
+        return response.status_code
+
+
+@scenario('dashboard')
+def _dashboard(ctx):
+    return ctx.get('/admin/dashboard')
+
+
+@scenario('users_list')
+def _users_list(ctx):
+    page = ctx.rng.randint(1, min(ctx.user_pages, 50))
+    sort_by = ctx.rng.choice(('username_asc', 'last_streamed_desc', 'total_plays_desc', 'created_at_desc'))
+    view = ctx.rng.choice(('cards', 'table'))
+    return ctx.get(f'/admin/users/?view={view}&page={page}&per_page=24&sort_by={sort_by}')
+
+
+@scenario('library_browse')
+def _library_browse(ctx):
+    server_nickname, library_name, _, _ = ctx.rng.choice(ctx.libraries)
+    page = ctx.rng.randint(1, 20)
+    sort_by = ctx.rng.choice(('title_asc', 'added_at_desc', 'total_streams_desc'))
+    return ctx.get(f'/admin/library/{encode_url_component(server_nickname)}/{encode_url_component(library_name)}'
+                   f'?tab=media&page={page}&sort_by={sort_by}')
+
+
+@scenario('library_stats')
+def _library_stats(ctx):
+    server_nickname, library_name, _, _ = ctx.rng.choice(ctx.libraries)
+    days = ctx.rng.choice(('7', '30', '365'))
+    return ctx.get(f'/admin/library/{encode_url_component(server_nickname)}/{encode_url_component(library_name)}'
+                   f'?tab=stats&days={days}')
+
+
+@scenario('media_detail')
+def _media_detail(ctx):
+    if not ctx.movies:
+        return None
+    server_nickname, library_name, item_id = ctx.rng.choice(ctx.movies)
+    return ctx.get(f'/admin/library/{encode_url_component(server_nickname)}/{encode_url_component(library_name)}'
+                   f'/{item_id}?tab=activity&days=365')
+
+
+@scenario('media_search')
+def _media_search(ctx):
+    query = ctx.rng.choice(('movie', 'show', 'synthetic', f'movie {ctx.rng.randint(1, 999)}', f'sho {ctx.rng.randint(1, 99)}'))
+    return ctx.get(f'/admin/api/search?q={query}&limit=25')
+
+
+@scenario('logs_page')
+def _logs_page(ctx):
+    # A deep Next page of the log viewer, sometimes filtered by event type or a message search
+    url = '/admin/settings/logs/partial?per_page=50'
+    if ctx.log_cursors:
+        url += f'&page=2&total={ctx.log_total}&after={ctx.rng.choice(ctx.log_cursors)}'
+    choice = ctx.rng.random()
+    if choice < 0.3:
+        url += f'&event_type={ctx.rng.choice(list(EventType)).name}'
+    elif choice < 0.6:
+        url += f'&search_message=bench+{ctx.rng.randint(1, 999)}'
+    return ctx.get(url)
+
+
+@scenario('purge_preview')
+def _purge_preview(ctx):
+    return ctx.post('/admin/users/purge_inactive/preview', {
+        'inactive_days': ctx.rng.choice(('30', '90', '180')), 'exclude_sharers': 'true',
+        'exclude_whitelisted': 'true', 'ignore_creation_date': 'false', 'page': '1'
+    })
+
+
+class _SyntheticSessions:
+    """Rolling set of Jellyfin-style session dicts for users of the bench Jellyfin server."""
+
+    def __init__(self, rng, size=50, churn=0.2):
+        self.rng = rng
+        self.size = size
+        self.churn = churn
+        self.counter = 0
+        server = MediaServer.query.filter_by(service_type=ServiceType.JELLYFIN).first()
+        self.usernames = [row.external_username for row in db.session.query(User.external_username)
+                          .filter(User.userType == UserType.SERVICE, User.server_id == server.id)
+                          .order_by(User.id).limit(2000).all()] if server else []
+        self.items = [(item.external_id, item.title, item.item_type, item.duration) for item in
+                      MediaItem.query.filter(MediaItem.server_id == server.id, MediaItem.item_type == 'movie')
+                      .order_by(MediaItem.id).limit(2000).all()] if server else []
+        self.sessions = {}
+
+    def _new_session(self):
+        self.counter += 1
+        external_id, title, _, duration_ms = self.rng.choice(self.items)
+        return {
+            'Id': f"bench-session-{self.counter}",
+            'UserName': self.rng.choice(self.usernames),
+            'Client': 'Bench', 'ApplicationVersion': '1.0', 'DeviceName': 'bench-device',
+            'RemoteEndPoint': f"10.1.{self.counter % 250}.1", 'IsLocal': True,
+            'NowPlayingItem': {'Id': external_id, 'Name': title, 'Type': 'Movie',
+                               'RunTimeTicks': (duration_ms or 0) * 10000, 'ParentName': 'Movies'},
+            'PlayState': {'PositionTicks': 0},
+        }
+
+    def tick(self):
+        if not self.usernames or not self.items:
+            return []
+        for key in list(self.sessions):
+            if self.rng.random() < self.churn:
+                del self.sessions[key]
+            else:
+                self.sessions[key]['PlayState']['PositionTicks'] += 60 * 10_000_000
+        while len(self.sessions) < self.size:
+            session = self._new_session()
+            self.sessions[session['Id']] = session
+        return list(self.sessions.values())
+
+
+@contextmanager
+def _monitor_harness(ctx):
+    """
+    Point the session monitor at the bench app and synthetic sessions, restoring
+    everything afterwards. History rows written by the ticks are deleted again
+    so repeated runs see the same dataset.
+    """
+    from app.services import task_service, library_stats_cache
+    from app.services.activity_summary_service import rebuild_activity_summaries
+    from app.services.media_service_manager import MediaServiceManager
+
+    sessions = _SyntheticSessions(ctx.rng)
+    last_history_id = db.session.query(func.max(MediaStreamHistory.id)).scalar() or 0
+    original_sessions_call = MediaServiceManager.__dict__['get_all_active_sessions']
+    original_active = dict(task_service._active_stream_sessions)
+    original_app = getattr(scheduler, 'app', None)
+    scheduler_was_running = scheduler.running
+    if scheduler_was_running:
+        scheduler.pause()
+    MediaServiceManager.get_all_active_sessions = staticmethod(sessions.tick)
+    task_service._active_stream_sessions.clear()
+    scheduler.app = ctx.app
+    try:
+        yield
+    finally:
+        scheduler.app = original_app
+        MediaServiceManager.get_all_active_sessions = original_sessions_call
+        task_service._active_stream_sessions.clear()
+        task_service._active_stream_sessions.update(original_active)
+        if scheduler_was_running:
+            scheduler.resume()
+        db.session.remove()
+        added = MediaStreamHistory.query.filter(MediaStreamHistory.id > last_history_id)
+        touched_users = [row.user_uuid for row in added.with_entities(MediaStreamHistory.user_uuid).distinct()]
+        added.delete(synchronize_session=False)
+        rebuild_activity_summaries(touched_users, commit=False)
+        db.session.commit()
+        library_stats_cache.invalidate_all()
+
+
+@scenario('monitor_tick')
+def _monitor_tick(ctx):
+    from app.services import task_service
+    task_service.monitor_media_sessions_task()
+    return 200
+
+
+@contextmanager
+def _null_context():
+    yield
+
+
+def _percentile(values, percent):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, math.ceil(percent / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=current_app.root_path).decode().strip()
+    except Exception:
+        return None
+
+
+def run_scenarios(names=None, iterations=20, warmup=2, seed=1, echo=None):
+    """
+    Run the named scenarios (all by default) and return the JSON-serialisable report.
+
+    Warm-up iterations are executed but not recorded, so one-off costs such as
+    template compilation don't skew the percentiles.
+    """
+    echo = echo or (lambda message: None)
+    app = current_app._get_current_object()
+    names = names or scenario_names()
+    unknown = [name for name in names if name not in _scenarios]
+    if unknown:
+        raise ValueError(f"Unknown scenario(s): {', '.join(unknown)}. Available: {', '.join(scenario_names())}")
+
+    ctx = BenchContext(app, seed)
+    report = {
+        'revision': _git_revision(),
+        'database': db.engine.dialect.name,
+        'dataset': Setting.get(BENCH_DATASET_SETTING),
+        'iterations': iterations,
+        'warmup': warmup,
+        'scenarios': {},
+    }
+
+    for name in names:
+        func = _scenarios[name]
+        harness = _monitor_harness(ctx) if name == 'monitor_tick' else _null_context()
+        timings_ms, query_counts, statuses = [], [], {}
+        with harness:
+            for iteration in range(warmup + iterations):
+                with _QueryCounter(db.engine) as counter:
+                    started = time.perf_counter()
+                    status = func(ctx)
+                    elapsed_ms = (time.perf_counter() - started) * 1000
+                db.session.remove()
+                if iteration < warmup:
+                    continue
+                timings_ms.append(elapsed_ms)
+                query_counts.append(counter.count)
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+        result = {
+            'p50_ms': round(_percentile(timings_ms, 50), 2) if timings_ms else None,
+            'p95_ms': round(_percentile(timings_ms, 95), 2) if timings_ms else None,
+            'mean_ms': round(statistics.mean(timings_ms), 2) if timings_ms else None,
+            'max_ms': round(max(timings_ms), 2) if timings_ms else None,
+            'queries_p50': _percentile(query_counts, 50),
+            'queries_p95': _percentile(query_counts, 95),
+            'statuses': statuses,
+        }
+        report['scenarios'][name] = result
+        echo(f"{name:16s} p50 {result['p50_ms']} ms  p95 {result['p95_ms']} ms  queries p50 {result['queries_p50']}  statuses {statuses}")
+    return report
+
+
+def compare_reports(baseline, candidate, threshold=0.10):
+    """
+    Compare two reports scenario by scenario.
+
+    Returns rows of ``(scenario, metric, baseline, candidate, change)`` where
+    ``change`` is the relative difference; ``regressed`` lists rows whose p95
+    latency or p50 query count grew by more than ``threshold``.
+    """
+    rows = []
+    regressed = []
+    for name, base in baseline.get('scenarios', {}).items():
+        other = candidate.get('scenarios', {}).get(name)
+        if not other:
+            continue
+        for metric in ('p50_ms', 'p95_ms', 'queries_p50'):
+            before, after = base.get(metric), other.get(metric)
+            if before is None or after is None:
+                continue
+            change = (after - before) / before if before else (0.0 if after == before else math.inf)
+            row = (name, metric, before, after, change)
+            rows.append(row)
+            if metric in ('p95_ms', 'queries_p50') and change > threshold:
+                regressed.append(row)
+    return rows, regressed
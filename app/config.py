@@ -52,6 +52,105 @@ class Config:
     DEFAULT_INVITES_PER_PAGE = 10
     DEFAULT_HISTORY_PER_PAGE = 20
 
+    # Remote user removal (mass delete, purge, expiry) - limits apply per media server
+    DEPROVISION_MAX_CONCURRENCY_PER_SERVER = int(os.environ.get('DEPROVISION_MAX_CONCURRENCY_PER_SERVER', 4))
+    DEPROVISION_MAX_REQUESTS_PER_SECOND = float(os.environ.get('DEPROVISION_MAX_REQUESTS_PER_SECOND', 5))
+    DEPROVISION_DB_BATCH_SIZE = 50 # Users removed from the database per commit
+
+    # Access expiry: users are removed when the earliest expiry is due (a one-shot job that re-arms itself) instead of
+    # on a polling interval. The next expiry is also re-read on this interval, in case dates changed outside the app
+    EXPIRATION_RESYNC_MINUTES = int(os.environ.get('EXPIRATION_RESYNC_MINUTES', 60))
+    EXPIRATION_RETRY_SECONDS = 300 # Users whose removal failed are tried again after this long
+
+    # Background job queue (library sync, user sync, mass edits, purges)
+    BACKGROUND_JOB_WORKERS = int(os.environ.get('BACKGROUND_JOB_WORKERS', 2))
+    BACKGROUND_JOB_POLL_SECONDS = 5 # How often queued jobs are picked up if nothing woke the workers
+    # Each process refreshes the heartbeat of the jobs it runs; a running job whose heartbeat is older than
+    # BACKGROUND_JOB_STALE_SECONDS belonged to a process that died and is marked failed
+    BACKGROUND_JOB_HEARTBEAT_SECONDS = 30
+    BACKGROUND_JOB_STALE_SECONDS = int(os.environ.get('BACKGROUND_JOB_STALE_SECONDS', 120))
+
+    # Library statistics are cached per (library, window) and dropped when new history arrives
+    LIBRARY_STATS_CACHE_TTL_SECONDS = 300
+
+    # Episode lists of TV shows are prefetched in the background after library syncs and on this interval
+    EPISODE_PREFETCH_WORKERS = int(os.environ.get('EPISODE_PREFETCH_WORKERS', 3)) # Concurrent upstream episode fetches
+    EPISODE_PREFETCH_MAX_AGE_HOURS = int(os.environ.get('EPISODE_PREFETCH_MAX_AGE_HOURS', 24)) # Older lists are refreshed
+    EPISODE_PREFETCH_INTERVAL_HOURS = int(os.environ.get('EPISODE_PREFETCH_INTERVAL_HOURS', 6)) # 0 disables the periodic refresh
+    EPISODE_TAB_FETCH_TIMEOUT_SECONDS = 8 # A show's tab opened before its first prefetch fetches it inline for this long
+
+    # Overseerr: movie/TV details used on request pages are cached across users; the user list is reloaded on this interval
+    OVERSEERR_DETAILS_CACHE_TTL_SECONDS = int(os.environ.get('OVERSEERR_DETAILS_CACHE_TTL_SECONDS', 6 * 3600))
+    OVERSEERR_DETAILS_CACHE_MAX_ENTRIES = int(os.environ.get('OVERSEERR_DETAILS_CACHE_MAX_ENTRIES', 2000)) # Least recently used are dropped
+    OVERSEERR_ENRICH_WORKERS = int(os.environ.get('OVERSEERR_ENRICH_WORKERS', 8)) # Concurrent details fetches per request page
+    OVERSEERR_USER_REFRESH_MINUTES = int(os.environ.get('OVERSEERR_USER_REFRESH_MINUTES', 30)) # 0 disables the scheduled refresh
+    OVERSEERR_USER_MISS_REFRESH_SECONDS = 60 # A lookup that finds nobody reloads the user list at most this often
+
+    # Live updates of the streaming page (Server-Sent Events); each open page holds one server thread
+    STREAMING_EVENTS_MAX_CLIENTS = int(os.environ.get('STREAMING_EVENTS_MAX_CLIENTS', 20)) # Further pages fall back to polling
+    STREAMING_EVENTS_KEEPALIVE_SECONDS = 25
+    STREAMING_EVENTS_MAX_SECONDS = 600 # Streams are closed after this long; the browser reconnects and resumes
+
+    # Polled partials answer If-None-Match with 304 when their data hasn't changed. The dashboard's server status
+    # card answers from a check this recent instead of contacting the servers again (?refresh=1 always re-checks)
+    SERVER_STATUS_REUSE_SECONDS = int(os.environ.get('SERVER_STATUS_REUSE_SECONDS', 15))
+
+    # GeoIP lookups of stream IPs: kept in memory and in the geoip_cache table. GEOIP_DATABASE_PATH points to an
+    # optional offline .mmdb City database (needs the 'maxminddb' package); GEOIP_OFFLINE_ONLY never asks plex.tv
+    GEOIP_CACHE_TTL_DAYS = int(os.environ.get('GEOIP_CACHE_TTL_DAYS', 30))
+    GEOIP_MEMORY_CACHE_SIZE = int(os.environ.get('GEOIP_MEMORY_CACHE_SIZE', 1024)) # Addresses kept in process
+    GEOIP_LOOKUP_WORKERS = int(os.environ.get('GEOIP_LOOKUP_WORKERS', 4)) # Concurrent upstream lookups per batch
+    GEOIP_NEGATIVE_TTL_SECONDS = int(os.environ.get('GEOIP_NEGATIVE_TTL_SECONDS', 300)) # Failed lookups aren't retried for this long
+    GEOIP_DATABASE_PATH = os.environ.get('GEOIP_DATABASE_PATH')
+    GEOIP_OFFLINE_ONLY = os.environ.get('GEOIP_OFFLINE_ONLY', 'false').lower() in ('1', 'true', 'yes')
+
+    # Retention policy: raw history older than this many days is archived to RETENTION_ARCHIVE_DIR and deleted
+    # (stream history is first rolled up into daily totals). 0 keeps rows forever.
+    STREAM_HISTORY_RETENTION_DAYS = int(os.environ.get('STREAM_HISTORY_RETENTION_DAYS', 0))
+    HISTORY_LOG_RETENTION_DAYS = int(os.environ.get('HISTORY_LOG_RETENTION_DAYS', 0))
+    RETENTION_ARCHIVE_DIR = os.environ.get('RETENTION_ARCHIVE_DIR') # Defaults to <instance>/archives
+    RETENTION_BATCH_SIZE = int(os.environ.get('RETENTION_BATCH_SIZE', 1000)) # Rows per delete transaction
+    RETENTION_BATCH_PAUSE_SECONDS = 0.05 # Gap between batches so the session monitor can write
+    RETENTION_RUN_HOUR = int(os.environ.get('RETENTION_RUN_HOUR', 4)) # Daily run, server local time
+
+    # Discord bot: database queries and media-server removals run on worker threads, off the gateway event loop.
+    # Members who left while the bot was offline are found by comparing the guild with the linked Discord ids an earlier
+    # pass saw in it, on this interval (accounts that never joined are left alone); a pass that would remove more than
+    # DISCORD_BOT_RECONCILE_MAX_REMOVALS users is skipped
+    DISCORD_BOT_DB_WORKERS = int(os.environ.get('DISCORD_BOT_DB_WORKERS', 2))
+    DISCORD_BOT_RECONCILE_MINUTES = int(os.environ.get('DISCORD_BOT_RECONCILE_MINUTES', 30))
+    DISCORD_BOT_RECONCILE_MAX_REMOVALS = int(os.environ.get('DISCORD_BOT_RECONCILE_MAX_REMOVALS', 10))
+
+    # Metrics: Prometheus text format at /metrics and a summary on Settings > Metrics. Scrapers send
+    # "Authorization: Bearer <METRICS_TOKEN>"; without a token only signed-in admins can read them
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+    # SQL profiler (opt-in, every config): records every statement of each request, flags a statement shape
+    # repeated SQL_PROFILER_N1_THRESHOLD times as a possible N+1, and logs requests slower than SQL_PROFILER_SLOW_REQUEST_MS.
+    # Recent requests are listed on Settings > API Debug; only admins get the X-SQL-Profile / Server-Timing headers
+    SQL_PROFILER_ENABLED = os.environ.get('SQL_PROFILER_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    SQL_PROFILER_N1_THRESHOLD = int(os.environ.get('SQL_PROFILER_N1_THRESHOLD', 5))
+    SQL_PROFILER_SLOW_REQUEST_MS = int(os.environ.get('SQL_PROFILER_SLOW_REQUEST_MS', 500))
+    SQL_PROFILER_HISTORY = 50 # Profiled requests kept for the panel
+
+    # Worker startup: compiled Jinja templates are kept in <instance>/template_cache, and the templates listed in
+    # TEMPLATE_WARMUP (comma-separated) are compiled at app creation so the first page doesn't pay for it
+    TEMPLATE_BYTECODE_CACHE = os.environ.get('TEMPLATE_BYTECODE_CACHE', 'true').lower() in ('1', 'true', 'yes')
+    TEMPLATE_WARMUP = os.environ.get('TEMPLATE_WARMUP', ','.join([
+        'base.html', 'layouts/navigation/admin_navbar.html', 'layouts/navigation/user_navbar.html',
+        'layouts/navigation/public_navbar.html', 'components/alerts/flash_messages.html',
+        'auth/login_admin.html', 'auth/login_user.html',
+        'dashboard/index.html', 'dashboard/_partials/multi_service_status.html', 'errors/404.html',
+    ]))
+
+    # SQLite connection profile (ignored for other databases). WAL lets readers run while a write is in progress;
+    # set SQLITE_JOURNAL_MODE=DELETE if the database sits on a filesystem without shared-memory support (e.g. NFS)
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL').upper()
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL').upper() # NORMAL is durable enough under WAL
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 15000)) # How long a writer waits for the lock
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)) # 0 disables memory-mapped reads
+
     @staticmethod
     def init_app(app):
         # Create instance folder if it doesn't exist
@@ -87,6 +186,21 @@ class TestingConfig(Config):
     SECRET_KEY = 'test_secret_key'
 
 
+class BenchmarkConfig(Config):
+    """Used by ``flask bench``: a scratch database and no scheduler."""
+    TESTING = True
+    WTF_CSRF_ENABLED = False
+    SECRET_KEY = 'bench_secret_key'
+    SCHEDULER_API_ENABLED = False # Don't start APScheduler; the bench drives the monitor tick itself
+
+    @staticmethod
+    def init_app(app):
+        Config.init_app(app)
+        # Read at app creation rather than import so the CLI can point each run at a different database
+        app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('MUM_BENCH_DATABASE_URL') or \
+            'sqlite:///' + os.path.join(app.instance_path, 'bench.db')
+
+
 class ProductionConfig(Config):
     DEBUG = False
     # In production, SECRET_KEY MUST be set securely and come from the database after setup.
@@ -99,6 +213,7 @@ class ProductionConfig(Config):
 config = {
     'development': DevelopmentConfig,
     'testing': TestingConfig,
+    'benchmark': BenchmarkConfig,
     'production': ProductionConfig,
     'default': DevelopmentConfig # Change to ProductionConfig for default deployment
 }
@@ -10,9 +10,11 @@ from sqlalchemy.types import TypeDecorator, TEXT
 from sqlalchemy.ext.mutable import MutableDict, MutableList
 from app.extensions import db, JSONEncodedDict
 import secrets
-from flask import current_app 
-from sqlalchemy import Table, Column, Integer, ForeignKey
+from flask import current_app, g
+from sqlalchemy import Table, Column, Integer, ForeignKey, event
+from sqlalchemy.exc import OperationalError
 from app.models_media_services import MediaServer
+from app.models_payloads import raw_payload
 
 # Many-to-many relationship table for users and roles
 app_user_roles = db.Table('app_user_roles',
@@ -148,9 +150,9 @@ class User(db.Model, UserMixin):
     # Access Expiration
     access_expires_at = db.Column(db.DateTime, nullable=True, index=True)
     
-    # Raw Data Storage
-    user_raw_data = db.Column(MutableDict.as_mutable(JSONEncodedDict), default=dict)
-    stream_raw_data = db.Column(MutableDict.as_mutable(JSONEncodedDict), default=dict)
+    # Raw Data Storage (compressed in raw_payloads, loaded on access)
+    user_raw_data = raw_payload()
+    stream_raw_data = raw_payload()
     
     # Overseerr Integration
     overseerr_user_id = db.Column(db.Integer, nullable=True, index=True)
@@ -169,12 +171,29 @@ class User(db.Model, UserMixin):
     plex_username = db.Column(db.String(255), nullable=True)
     plex_thumb = db.Column(db.String(512), nullable=True)
     
+    # Users list sort keys: lowercased display name and email of either user type, kept current on every
+    # insert/update (see _set_list_sort_keys) so the list can be ordered from an index
+    sort_name = db.Column(db.String(255), nullable=False, default='', server_default='')
+    sort_email = db.Column(db.String(255), nullable=False, default='', server_default='')
+    
     # Relationships
     linked_parent = db.relationship('User', remote_side=[uuid], backref='linked_children')
     roles = db.relationship('Role', secondary='app_user_roles', lazy='subquery',
                             backref=db.backref('users', lazy=True))
     server = db.relationship('MediaServer', foreign_keys=[server_id], back_populates='users')
     
+    # Composite indexes backing the SQL-side users listing (type filter + sort key)
+    __table_args__ = (
+        db.Index('ix_users_type_created_at', 'userType', 'created_at'),
+        db.Index('ix_users_type_local_username', 'userType', 'localUsername'),
+        db.Index('ix_users_type_external_username', 'userType', 'external_username'),
+        db.Index('ix_users_linked_join_date', 'linkedUserId', 'service_join_date'),
+        db.Index('ix_users_sort_name', 'sort_name', 'id'),
+        db.Index('ix_users_type_sort_name', 'userType', 'sort_name', 'id'),
+        db.Index('ix_users_sort_email', 'sort_email', 'id'),
+        db.Index('ix_users_type_sort_email', 'userType', 'sort_email', 'id'),
+    )
+    
     def __repr__(self):
         if self.userType == UserType.OWNER:
             return f'<User(OWNER) {self.localUsername}>'
@@ -455,7 +474,7 @@ class User(db.Model, UserMixin):
             
             # Try to find the user in Overseerr
             overseerr = OverseerrService(server.overseerr_url, server.overseerr_api_key)
-            success, overseerr_user, message = overseerr.get_user_by_plex_username(plex_username)
+            success, overseerr_user, message = overseerr.get_user_by_plex_username(plex_username, plex_id=plex_user_id)
             
             if not success:
                 return False, None, f"Failed to check Overseerr: {message}"
@@ -474,6 +493,16 @@ class User(db.Model, UserMixin):
             db.session.rollback()
             return False, None, f"Error linking user: {str(e)}"
 
+@event.listens_for(User, 'before_insert')
+@event.listens_for(User, 'before_update')
+def _set_list_sort_keys(mapper, connection, user):
+    if user.userType == UserType.SERVICE:
+        name, email = user.external_username, user.external_email
+    else:
+        name, email = user.localUsername, user.email
+    user.sort_name = (name or '').lower()[:255]
+    user.sort_email = (email or '').lower()[:255]
+
 # Legacy aliases removed - use unified User model directly
 
 class Setting(db.Model): # ... (Setting model remains the same structure, new keys will be added via UI/code) ...
@@ -595,14 +624,146 @@ class InviteUsage(db.Model): # ... (as before)
 
 class HistoryLog(db.Model): # ... (as before)
     __tablename__ = 'history_logs'; id = db.Column(db.Integer, primary_key=True)
-    timestamp = db.Column(db.DateTime, default=utcnow, index=True)
-    event_type = db.Column(db.Enum(EventType), nullable=False, index=True); message = db.Column(db.Text, nullable=False)
+    timestamp = db.Column(db.DateTime, default=utcnow)
+    event_type = db.Column(db.Enum(EventType), nullable=False); message = db.Column(db.Text, nullable=False)
     details = db.Column(MutableDict.as_mutable(JSONEncodedDict), nullable=True)
     owner_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True); owner = db.relationship('User', foreign_keys='HistoryLog.owner_id')
     local_user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True); affected_local_user = db.relationship('User', foreign_keys='HistoryLog.local_user_id')
     invite_id = db.Column(db.Integer, db.ForeignKey('invites.id'), nullable=True); related_invite = db.relationship('Invite')
+
+    # The log viewer pages by (timestamp, id), optionally within one event type
+    __table_args__ = (
+        db.Index('ix_history_logs_timestamp_id', 'timestamp', 'id'),
+        db.Index('ix_history_logs_event_type_timestamp', 'event_type', 'timestamp'),
+    )
+
     def __repr__(self): return f'<HistoryLog {self.timestamp} [{self.event_type.name}]: {self.message[:50]}>'
 
+# SQLite full-text index over log messages and details, kept current by triggers (see history_service)
+HISTORY_SEARCH_FTS_TABLE = 'history_logs_fts'
+HISTORY_SEARCH_SQLITE_DDL = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS history_logs_fts USING fts5(
+        message, details, content='history_logs', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3')""",
+    """CREATE TRIGGER IF NOT EXISTS history_logs_fts_insert AFTER INSERT ON history_logs BEGIN
+        INSERT INTO history_logs_fts(rowid, message, details) VALUES (new.id, new.message, new.details);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS history_logs_fts_delete AFTER DELETE ON history_logs BEGIN
+        INSERT INTO history_logs_fts(history_logs_fts, rowid, message, details) VALUES ('delete', old.id, old.message, old.details);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS history_logs_fts_update AFTER UPDATE OF message, details ON history_logs BEGIN
+        INSERT INTO history_logs_fts(history_logs_fts, rowid, message, details) VALUES ('delete', old.id, old.message, old.details);
+        INSERT INTO history_logs_fts(rowid, message, details) VALUES (new.id, new.message, new.details);
+    END""",
+)
+
+@event.listens_for(HistoryLog.__table__, 'after_create')
+def create_history_search_index(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        try:
+            for statement in HISTORY_SEARCH_SQLITE_DDL:
+                connection.exec_driver_sql(statement)
+        except OperationalError:  # SQLite built without FTS5; searches fall back to LIKE
+            pass
+
+@event.listens_for(HistoryLog.__table__, 'before_drop')
+def drop_history_search_index(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql(f"DROP TABLE IF EXISTS {HISTORY_SEARCH_FTS_TABLE}")
+
+class DeprovisionRun(db.Model):
+    """A batch removal of users from MUM and their media servers (mass delete, purge or expiry)."""
+    __tablename__ = 'deprovision_runs'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # 'mass_delete', 'purge', 'expiration' or 'discord_left'
+    status = db.Column(db.String(20), default='pending', nullable=False, index=True)  # pending, running, completed, failed
+    admin_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'), nullable=True)
+    total = db.Column(db.Integer, default=0, nullable=False)
+    processed = db.Column(db.Integer, default=0, nullable=False)
+    removed = db.Column(db.Integer, default=0, nullable=False)
+    failed = db.Column(db.Integer, default=0, nullable=False)
+    remote_errors = db.Column(db.Integer, default=0, nullable=False)
+    message = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    outcomes = db.relationship('DeprovisionOutcome', back_populates='run', cascade="all, delete-orphan", lazy='dynamic')
+
+    @property
+    def is_finished(self): return self.status in ('completed', 'failed')
+
+    @property
+    def percent(self): return int(self.processed * 100 / self.total) if self.total else 100
+
+    def __repr__(self): return f'<DeprovisionRun {self.id} {self.kind} {self.status} {self.processed}/{self.total}>'
+
+class DeprovisionOutcome(db.Model):
+    """Per-user result of a DeprovisionRun. User columns are copies since the user row is deleted."""
+    __tablename__ = 'deprovision_outcomes'
+    id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(db.Integer, db.ForeignKey('deprovision_runs.id', ondelete='CASCADE'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    user_uuid = db.Column(db.String(36), nullable=True)
+    user_type = db.Column(db.String(10), nullable=False)  # 'local' or 'service'
+    username = db.Column(db.String(255), nullable=True)
+    status = db.Column(db.String(20), default='pending', nullable=False)  # pending, removed, failed
+    remote_total = db.Column(db.Integer, default=0, nullable=False)
+    remote_removed = db.Column(db.Integer, default=0, nullable=False)
+    error = db.Column(db.Text, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    run = db.relationship('DeprovisionRun', back_populates='outcomes')
+    def __repr__(self): return f'<DeprovisionOutcome run={self.run_id} user={self.user_id} {self.status}>'
+
+class BackgroundJob(db.Model):
+    """A long-running admin operation executed by the background job workers (see job_service)."""
+    __tablename__ = 'background_jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    job_type = db.Column(db.String(50), nullable=False)
+    # Identical work (e.g. two syncs of the same library) shares a key; only one such job is active at a time
+    dedupe_key = db.Column(db.String(255), nullable=True, index=True)
+    status = db.Column(db.String(20), default='queued', nullable=False, index=True)  # queued, running, completed, failed, cancelled
+    title = db.Column(db.String(255), nullable=True)
+    params = db.Column(MutableDict.as_mutable(JSONEncodedDict), default=dict)
+    result = db.Column(MutableDict.as_mutable(JSONEncodedDict), nullable=True)
+    progress_current = db.Column(db.Integer, default=0, nullable=False)
+    progress_total = db.Column(db.Integer, nullable=True)  # None while the amount of work is unknown
+    progress_message = db.Column(db.String(255), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    cancel_requested = db.Column(db.Boolean, default=False, nullable=False)
+    admin_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'), nullable=True)
+    created_at = db.Column(db.DateTime, default=utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    # Process running the job ("host:pid") and its last sign of life, so a restart elsewhere can't fail a live job
+    worker_id = db.Column(db.String(128), nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+
+    @property
+    def is_finished(self): return self.status in ('completed', 'failed', 'cancelled')
+
+    @property
+    def percent(self):
+        if self.status == 'completed': return 100
+        if not self.progress_total: return None
+        return min(100, int(self.progress_current * 100 / self.progress_total))
+
+    def __repr__(self): return f'<BackgroundJob {self.id} {self.job_type} {self.status}>'
+
+class HistoryArchive(db.Model):
+    """One gzip-compressed JSONL file of rows the retention policy moved out of a history table (see retention_service)."""
+    __tablename__ = 'history_archives'
+    id = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(64), nullable=False)  # 'media_stream_history' or 'history_logs'
+    period = db.Column(db.String(7), nullable=False)  # YYYY-MM of the archived rows' timestamps
+    path = db.Column(db.String(255), nullable=False)  # Relative to RETENTION_ARCHIVE_DIR
+    first_at = db.Column(db.DateTime, nullable=True)
+    last_at = db.Column(db.DateTime, nullable=True)
+    row_count = db.Column(db.Integer, default=0, nullable=False)
+    size_bytes = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=utcnow, onupdate=utcnow)
+    __table_args__ = (db.UniqueConstraint('table_name', 'period', name='uq_history_archives_table_period'),)
+    def __repr__(self): return f'<HistoryArchive {self.table_name} {self.period} rows={self.row_count}>'
+
 # StreamHistory model removed - replaced by MediaStreamHistory in models_media_services.py
 
 class UserPreferences(db.Model):
@@ -647,4 +808,5 @@ class UserPreferences(db.Model):
             prefs.time_format = time_format
         
         db.session.commit()
+        g.pop('_timezone_preference', None)  # cached per request by format_datetime_user
         return prefs
@@ -8,7 +8,9 @@ from sqlalchemy.types import TypeDecorator, TEXT
 from sqlalchemy.ext.mutable import MutableDict, MutableList
 from app.extensions import db, JSONEncodedDict
 from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
 from app.models_plugins import Plugin
+from app.models_payloads import raw_payload
 
 class ServiceType(enum.Enum):
     PLEX = "plex"
@@ -189,9 +191,17 @@ class MediaItem(db.Model):
     added_at = db.Column(db.DateTime)  # When added to media server
     updated_at = db.Column(db.DateTime)  # Last modified on media server
     last_synced = db.Column(db.DateTime, default=datetime.utcnow)  # When we last synced this item
+    episodes_synced_at = db.Column(db.DateTime, nullable=True)  # Shows only: when the episode list was last fetched
     
-    # Additional metadata (JSON for flexibility)
-    extra_metadata = db.Column(db.JSON)
+    studio = db.Column(db.String(255), nullable=True)  # Studio or publisher
+    
+    # Episode numbering and edition, copied out of the raw metadata at sync time
+    season_number = db.Column(db.Integer, nullable=True)
+    episode_number = db.Column(db.Integer, nullable=True)
+    edition = db.Column(db.String(255), nullable=True)
+    
+    # Raw metadata from the service (compressed in raw_payloads, loaded on access)
+    extra_metadata = raw_payload()
     
     # Relationships
     library = db.relationship('MediaLibrary', backref='media_items')
@@ -212,8 +222,11 @@ class MediaItem(db.Model):
     def __repr__(self):
         return f'<MediaItem {self.title} ({self.item_type})>'
     
-    def to_dict(self):
-        """Convert to dictionary format compatible with current media grid"""
+    def to_dict(self, include_raw_data=True):
+        """
+        Convert to dictionary format compatible with current media grid.
+        Grids pass ``include_raw_data=False`` so the raw payload isn't loaded per item.
+        """
         # Handle different thumbnail formats for different services
         thumb_url = None
         if self.thumb_path:
@@ -230,46 +243,84 @@ class MediaItem(db.Model):
                 # Plex format: regular path that needs proxy construction
                 thumb_url = f"/admin/api/media/{self.server.service_type.value}/images/proxy?path={self.thumb_path.lstrip('/')}"
         
-        # Extract season and episode numbers for episodes
-        season_number = None
-        episode_number = None
-        if self.item_type == 'episode' and self.extra_metadata:
-            # Try different possible field names for season/episode numbers
-            # Use 'is not None' to handle season 0 (specials) correctly
-            if self.extra_metadata.get('seasonNumber') is not None:
-                season_number = self.extra_metadata.get('seasonNumber')
-            elif self.extra_metadata.get('season_number') is not None:
-                season_number = self.extra_metadata.get('season_number')
-            elif self.extra_metadata.get('season') is not None:
-                season_number = self.extra_metadata.get('season')
-            elif self.extra_metadata.get('parentIndex') is not None:
-                season_number = self.extra_metadata.get('parentIndex')
-            
-            if self.extra_metadata.get('episodeNumber') is not None:
-                episode_number = self.extra_metadata.get('episodeNumber')
-            elif self.extra_metadata.get('episode_number') is not None:
-                episode_number = self.extra_metadata.get('episode_number')
-            elif self.extra_metadata.get('episode') is not None:
-                episode_number = self.extra_metadata.get('episode')
-            elif self.extra_metadata.get('index') is not None:
-                episode_number = self.extra_metadata.get('index')
-
         return {
             'id': self.id,  # Use database ID for new URL structure
             'external_id': self.external_id,  # Keep external_id for backward compatibility
             'title': self.title,
             'year': self.year,
-            'season_number': season_number,  # Add season number for episodes
-            'episode_number': episode_number,  # Add episode number for episodes
-            'edition': self.extra_metadata.get('edition') if self.extra_metadata else None,
+            'season_number': self.season_number if self.item_type == 'episode' else None,
+            'episode_number': self.episode_number if self.item_type == 'episode' else None,
+            'edition': self.edition,
             'thumb': thumb_url,
             'type': self.item_type,
             'summary': self.summary,
             'rating': self.rating,
             'duration': self.duration,
             'added_at': self.added_at.isoformat() if self.added_at else None,
-            'raw_data': self.extra_metadata or {}
+            'raw_data': (self.extra_metadata or {}) if include_raw_data else {}
         }
+    
+    @staticmethod
+    def numbering_from_metadata(raw):
+        """
+        ``(season_number, episode_number, edition)`` from a raw service payload.
+        Services name the numbers differently; season 0 (specials) is kept.
+        """
+        if not isinstance(raw, dict):
+            return None, None, None
+        
+        def first_number(*keys):
+            for key in keys:
+                if raw.get(key) is not None:
+                    try:
+                        return int(raw[key])
+                    except (TypeError, ValueError):
+                        return None
+            return None
+        
+        edition = raw.get('edition')
+        return (first_number('seasonNumber', 'season_number', 'season', 'parentIndex'),
+                first_number('episodeNumber', 'episode_number', 'episode', 'index'),
+                str(edition)[:255] if edition else None)
+
+# Full-text index over media items (see app/services/media_search.py). On SQLite it is an FTS5
+# external-content table kept current by triggers, created together with media_items so that
+# `db.create_all()` databases get it too. Postgres uses an expression GIN index from the migration.
+MEDIA_SEARCH_FTS_TABLE = 'media_items_fts'
+MEDIA_SEARCH_SQLITE_DDL = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS media_items_fts USING fts5(
+        title, sort_title, summary, studio, year,
+        content='media_items', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3')""",
+    """CREATE TRIGGER IF NOT EXISTS media_items_fts_insert AFTER INSERT ON media_items BEGIN
+        INSERT INTO media_items_fts(rowid, title, sort_title, summary, studio, year)
+        VALUES (new.id, new.title, new.sort_title, new.summary, new.studio, new.year);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS media_items_fts_delete AFTER DELETE ON media_items BEGIN
+        INSERT INTO media_items_fts(media_items_fts, rowid, title, sort_title, summary, studio, year)
+        VALUES ('delete', old.id, old.title, old.sort_title, old.summary, old.studio, old.year);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS media_items_fts_update AFTER UPDATE OF title, sort_title, summary, studio, year ON media_items BEGIN
+        INSERT INTO media_items_fts(media_items_fts, rowid, title, sort_title, summary, studio, year)
+        VALUES ('delete', old.id, old.title, old.sort_title, old.summary, old.studio, old.year);
+        INSERT INTO media_items_fts(rowid, title, sort_title, summary, studio, year)
+        VALUES (new.id, new.title, new.sort_title, new.summary, new.studio, new.year);
+    END""",
+)
+
+@event.listens_for(MediaItem.__table__, 'after_create')
+def create_media_search_index(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        try:
+            for statement in MEDIA_SEARCH_SQLITE_DDL:
+                connection.exec_driver_sql(statement)
+        except OperationalError:  # SQLite built without FTS5; searches fall back to LIKE
+            pass
+
+@event.listens_for(MediaItem.__table__, 'before_drop')
+def drop_media_search_index(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql(f"DROP TABLE IF EXISTS {MEDIA_SEARCH_FTS_TABLE}")
 
 class MediaStreamHistory(db.Model):
     """Enhanced stream history that supports multiple services"""
@@ -306,17 +357,31 @@ class MediaStreamHistory(db.Model):
     library_name = db.Column(db.String(255), nullable=True)
     external_media_item_id = db.Column(db.String(255), nullable=True)  # Media ID from service (media array for Plex, rating_key for shows)
     
+    # Resolved references to the synced library and items, NULL when they couldn't be matched
+    library_id = db.Column(db.Integer, db.ForeignKey('media_libraries.id', ondelete='SET NULL'), nullable=True)
+    media_item_id = db.Column(db.Integer, db.ForeignKey('media_items.id', ondelete='SET NULL'), nullable=True)  # The played movie/episode/track
+    grandparent_media_item_id = db.Column(db.Integer, db.ForeignKey('media_items.id', ondelete='SET NULL'), nullable=True)  # Show or artist
+    
     media_duration_seconds = db.Column(db.Integer, nullable=True)
     view_offset_at_end_seconds = db.Column(db.Integer, nullable=True)
     
-    # Service-specific data stored as JSON
-    service_data = db.Column(MutableDict.as_mutable(JSONEncodedDict), default=dict)
+    # Service-specific data (compressed in raw_payloads, loaded on access)
+    service_data = raw_payload()
     
     # Relationships - Unified user relationship
     user = db.relationship('User', foreign_keys=[user_uuid], 
                           backref=db.backref('stream_history', lazy='dynamic'))
     server = db.relationship('MediaServer', backref=db.backref('stream_history', lazy='dynamic'))
     
+    # Indexes for performance
+    __table_args__ = (
+        db.Index('ix_media_stream_history_user_started', 'user_uuid', 'started_at'),
+        db.Index('ix_media_stream_history_library_started', 'server_id', 'library_name', 'started_at'),
+        db.Index('ix_media_stream_history_library_id_started', 'library_id', 'started_at'),
+        db.Index('ix_media_stream_history_media_item_started', 'media_item_id', 'started_at'),
+        db.Index('ix_media_stream_history_grandparent_item_started', 'grandparent_media_item_id', 'started_at'),
+    )
+    
     def __repr__(self):
         username = self.user.get_display_name() if self.user else 'Unknown User'
         server_name = self.server.server_nickname if self.server else 'Unknown Server'
@@ -360,4 +425,82 @@ class MediaStreamHistory(db.Model):
             return 0
         
         percentage = (self.view_offset_at_end_seconds / self.media_duration_seconds) * 100
-        return min(100, max(0, percentage))  # Clamp between 0 and 100
\ No newline at end of file
+        return min(100, max(0, percentage))  # Clamp between 0 and 100
+
+class UserActivitySummary(db.Model):
+    """Denormalized per-user streaming activity, kept current by the session monitor.
+
+    One row per service user (keyed by ``user_uuid`` like ``MediaStreamHistory``)
+    so list pages and profile headers can read a single indexed row instead of
+    aggregating the whole stream history. Rebuildable from history at any time.
+    """
+    __tablename__ = 'user_activity_summary'
+
+    user_uuid = db.Column(db.String(36), db.ForeignKey('users.uuid', ondelete='CASCADE'), primary_key=True)
+
+    # Most recent stream
+    last_stream_at = db.Column(db.DateTime, nullable=True, index=True)
+    last_ip = db.Column(db.String(45), nullable=True)
+    last_media_title = db.Column(db.String(255), nullable=True)
+    last_media_type = db.Column(db.String(50), nullable=True)
+    last_grandparent_title = db.Column(db.String(255), nullable=True)
+    last_parent_title = db.Column(db.String(255), nullable=True)
+    last_rating_key = db.Column(db.String(255), nullable=True)
+    last_server_id = db.Column(db.Integer, db.ForeignKey('media_servers.id', ondelete='SET NULL'), nullable=True)
+
+    # Running totals
+    total_plays = db.Column(db.Integer, nullable=False, default=0)
+    total_seconds = db.Column(db.Integer, nullable=False, default=0)
+
+    updated_at = db.Column(db.DateTime, default=utcnow, onupdate=utcnow)
+
+    user = db.relationship('User', foreign_keys=[user_uuid],
+                           backref=db.backref('activity_summary', uselist=False, cascade='all, delete-orphan'))
+
+    def __repr__(self):
+        return f'<UserActivitySummary {self.user_uuid} plays={self.total_plays}>'
+
+class StreamHistoryRollup(db.Model):
+    """Daily totals of stream history rows removed by the retention policy (see retention_service).
+
+    One row per (day, user, server, library, media type). Activity summaries and
+    library charts add these to the live ``media_stream_history`` rows, so totals
+    survive when old raw rows are archived and deleted.
+    """
+    __tablename__ = 'stream_history_rollups'
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)  # UTC calendar day of started_at
+    user_uuid = db.Column(db.String(36), nullable=True, index=True)  # Kept after the user is deleted, like history
+    server_id = db.Column(db.Integer, db.ForeignKey('media_servers.id', ondelete='CASCADE'), nullable=False)
+    library_id = db.Column(db.Integer, db.ForeignKey('media_libraries.id', ondelete='SET NULL'), nullable=True)
+    media_type = db.Column(db.String(50), nullable=True)
+
+    plays = db.Column(db.Integer, nullable=False, default=0)
+    duration_seconds = db.Column(db.Integer, nullable=False, default=0)  # Sum of duration_seconds (user totals)
+    watched_seconds = db.Column(db.Integer, nullable=False, default=0)  # Duration, else final view offset (charts)
+    untimed_plays = db.Column(db.Integer, nullable=False, default=0)  # Plays without either; charts count them as a minute
+
+    __table_args__ = (
+        db.Index('ix_stream_history_rollups_library_day', 'library_id', 'day'),
+        db.Index('ix_stream_history_rollups_day', 'day'),
+    )
+
+    def __repr__(self):
+        return f'<StreamHistoryRollup {self.day} user={self.user_uuid} library={self.library_id} plays={self.plays}>'
+
+class GeoIPCache(db.Model):
+    """GeoIP data of a public IP address, cached by geoip_service for ``GEOIP_CACHE_TTL_DAYS``.
+
+    ``data`` has the keys of Plex's geoip response (country, city, latitude, ...)
+    whichever source answered, so the templates don't care where it came from.
+    """
+    __tablename__ = 'geoip_cache'
+
+    ip_address = db.Column(db.String(45), primary_key=True)
+    data = db.Column(JSONEncodedDict, nullable=False)
+    source = db.Column(db.String(20), nullable=False)  # 'plex' or 'offline'
+    fetched_at = db.Column(db.DateTime, nullable=False, default=utcnow, index=True)
+
+    def __repr__(self):
+        return f'<GeoIPCache {self.ip_address} ({self.source})>'
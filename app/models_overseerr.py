@@ -99,7 +99,7 @@ class OverseerrUserLink(db.Model):
             
             # Try to find the user in Overseerr
             overseerr = OverseerrService(server.overseerr_url, server.overseerr_api_key)
-            success, overseerr_user, message = overseerr.get_user_by_plex_username(plex_username)
+            success, overseerr_user, message = overseerr.get_user_by_plex_username(plex_username, plex_id=plex_user_id)
             
             if not success:
                 return False, None, f"Failed to check Overseerr: {message}"
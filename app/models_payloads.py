@@ -0,0 +1,198 @@
+# File: app/models_payloads.py
+"""
+Compressed side storage for raw service payloads.
+
+The raw JSON a media server returns for a user, a stream or a media item is
+kept for the debug and raw-data views, but nothing in the lists needs it.
+Keeping it inline meant every row load decoded it. These payloads now live in
+``raw_payloads``, one zlib-compressed row per (owner table, owner id, field).
+They are read only when the attribute is accessed.
+
+Models declare them with ``raw_payload()``:
+
+    class User(db.Model):
+        user_raw_data = raw_payload()
+
+Reading ``user.user_raw_data`` loads and caches the payload; assigning it
+writes it with the next flush, and a rollback or expire before that discards
+it like any other attribute change. In-place changes to the returned dict are not
+tracked, so assign a new dict instead. ``prefetch_payloads`` loads one field
+for many rows in a single query. ``delete_payloads`` cleans up after bulk
+``Query.delete()`` calls, which skip the ORM hooks.
+"""
+import json
+import zlib
+
+from sqlalchemy import event, select, delete, and_
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy.orm.attributes import flag_dirty
+from sqlalchemy.inspection import inspect as sa_inspect
+
+from app.extensions import db
+from app.utils.timezone_utils import utcnow
+
+_COMPRESSION_LEVEL = 6
+
+_owner_fields = {}  # model class -> set of payload field names
+
+
+class RawPayload(db.Model):
+    __tablename__ = 'raw_payloads'
+
+    id = db.Column(db.Integer, primary_key=True)
+    owner_type = db.Column(db.String(64), nullable=False)  # __tablename__ of the owning model
+    owner_id = db.Column(db.Integer, nullable=False)
+    field = db.Column(db.String(64), nullable=False)
+    encoding = db.Column(db.String(16), nullable=False, default='zlib')
+    data = db.Column(db.LargeBinary, nullable=False)
+    raw_size = db.Column(db.Integer, nullable=True)  # Uncompressed JSON size in bytes
+    updated_at = db.Column(db.DateTime, default=utcnow, onupdate=utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('owner_type', 'owner_id', 'field', name='uq_raw_payloads_owner_field'),
+    )
+
+    def __repr__(self):
+        return f'<RawPayload {self.owner_type}:{self.owner_id}.{self.field} {len(self.data or b"")}B>'
+
+
+def encode_payload(value):
+    """Returns ``(compressed bytes, uncompressed size)``."""
+    raw = json.dumps(value, separators=(',', ':'), default=str).encode('utf-8')
+    return zlib.compress(raw, _COMPRESSION_LEVEL), len(raw)
+
+
+def decode_payload(data, encoding='zlib'):
+    if data is None:
+        return {}
+    if encoding == 'zlib':
+        data = zlib.decompress(data)
+    return json.loads(data.decode('utf-8'))
+
+
+class raw_payload:
+    """Descriptor for a payload stored in ``raw_payloads``. Missing payloads read as ``{}``."""
+
+    def __set_name__(self, owner, name):
+        self.field = name
+        if owner not in _owner_fields:
+            event.listen(owner, 'expire', _drop_loaded)
+        _owner_fields.setdefault(owner, set()).add(name)
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        loaded = instance.__dict__.setdefault('_raw_payloads', {})
+        if self.field not in loaded:
+            loaded[self.field] = _load(instance, self.field)
+        return loaded[self.field]
+
+    def __set__(self, instance, value):
+        value = value if value else {}
+        loaded = instance.__dict__.setdefault('_raw_payloads', {})
+        if self.field in loaded and loaded[self.field] == value:
+            return
+        loaded[self.field] = value
+        instance.__dict__.setdefault('_raw_payloads_dirty', set()).add(self.field)
+        state = sa_inspect(instance)
+        if state.persistent:
+            flag_dirty(instance)  # so a payload-only change still goes through a flush
+
+
+def _owner_type(instance):
+    return type(instance).__tablename__
+
+
+def _owner_id(instance):
+    # Objects inserted by the current flush don't have an identity key yet, but their primary key is set
+    return sa_inspect(instance).mapper.primary_key_from_instance(instance)[0]
+
+
+def _load(instance, field):
+    state = sa_inspect(instance)
+    if state.identity is None:
+        return {}
+    session = object_session(instance) or db.session
+    row = session.execute(
+        select(RawPayload.data, RawPayload.encoding).where(
+            RawPayload.owner_type == _owner_type(instance),
+            RawPayload.owner_id == state.identity[0],
+            RawPayload.field == field)
+    ).first()
+    return decode_payload(row.data, row.encoding) if row else {}
+
+
+def _drop_loaded(target, attrs):
+    # A full expire (after commit or rollback, or an explicit expire) also forgets loaded payloads.
+    # Like expired column attributes, an assignment that wasn't flushed yet is discarded with them.
+    if attrs is None:
+        target.__dict__.pop('_raw_payloads', None)
+        target.__dict__.pop('_raw_payloads_dirty', None)
+
+
+def prefetch_payloads(instances, field):
+    """Load ``field`` for every instance in one query. Instances may be of one model only."""
+    instances = [instance for instance in instances if sa_inspect(instance).identity is not None
+                 and field not in instance.__dict__.get('_raw_payloads', {})]
+    if not instances:
+        return
+    owner_type = _owner_type(instances[0])
+    by_id = {sa_inspect(instance).identity[0]: instance for instance in instances}
+    found = {}
+    ids = list(by_id)
+    for start in range(0, len(ids), 500):
+        rows = db.session.execute(
+            select(RawPayload.owner_id, RawPayload.data, RawPayload.encoding).where(
+                RawPayload.owner_type == owner_type, RawPayload.field == field,
+                RawPayload.owner_id.in_(ids[start:start + 500]))
+        )
+        for row in rows:
+            found[row.owner_id] = decode_payload(row.data, row.encoding)
+    for owner_id, instance in by_id.items():
+        instance.__dict__.setdefault('_raw_payloads', {})[field] = found.get(owner_id, {})
+
+
+def delete_payloads(model, owner_ids):
+    """Delete every payload of ``model`` rows in ``owner_ids`` (a list or a select of ids). Not committed."""
+    db.session.execute(delete(RawPayload).where(
+        RawPayload.owner_type == model.__tablename__, RawPayload.owner_id.in_(owner_ids)))
+
+
+@event.listens_for(Session, 'after_flush')
+def _write_pending_payloads(session, flush_context):
+    writes = {}  # (owner_type, field) -> {owner_id: value}
+    for instance in list(session.new) + list(session.dirty):
+        dirty = instance.__dict__.get('_raw_payloads_dirty')
+        if not dirty or type(instance) not in _owner_fields:
+            continue
+        owner_id = _owner_id(instance)
+        for field in dirty:
+            writes.setdefault((_owner_type(instance), field), {})[owner_id] = instance.__dict__['_raw_payloads'][field]
+        dirty.clear()
+
+    removed = {}  # owner_type -> [owner ids]
+    for instance in session.deleted:
+        if type(instance) in _owner_fields:
+            removed.setdefault(_owner_type(instance), []).append(_owner_id(instance))
+
+    if not writes and not removed:
+        return
+    table = RawPayload.__table__
+    connection = session.connection()
+    for owner_type, owner_ids in removed.items():
+        connection.execute(table.delete().where(and_(table.c.owner_type == owner_type, table.c.owner_id.in_(owner_ids))))
+    now = utcnow()
+    for (owner_type, field), values in writes.items():
+        owner_ids = list(values)
+        for start in range(0, len(owner_ids), 500):
+            connection.execute(table.delete().where(and_(
+                table.c.owner_type == owner_type, table.c.field == field,
+                table.c.owner_id.in_(owner_ids[start:start + 500]))))
+        rows = []
+        for owner_id, value in values.items():
+            if value:  # an empty payload is stored as no row at all
+                data, raw_size = encode_payload(value)
+                rows.append({'owner_type': owner_type, 'owner_id': owner_id, 'field': field, 'encoding': 'zlib',
+                             'data': data, 'raw_size': raw_size, 'updated_at': now})
+        if rows:
+            connection.execute(table.insert(), rows)
@@ -10,7 +10,7 @@ from app.utils.helpers import permission_required
 from app.extensions import db
 from app.services.media_service_factory import MediaServiceFactory
 from app.services.media_service_manager import MediaServiceManager
-from app.services import user_service
+from app.services import user_service, activity_summary_service
 from app.forms import UserEditForm
 from app.routes.user_modules.helpers import check_if_user_is_admin, enhance_history_records_with_media_ids
 import urllib.parse
@@ -237,8 +237,8 @@ def view_service_user(server_nickname, server_username):
     user.last_known_ip = last_ip if last_ip else 'N/A'
     
     # Populate last_streamed_at field for the profile display
-    last_stream = MediaStreamHistory.query.filter_by(user_uuid=user.uuid).order_by(MediaStreamHistory.started_at.desc()).first()
-    user.last_streamed_at = last_stream.started_at if last_stream else None
+    activity_summary = activity_summary_service.get_activity_summary(user.uuid)
+    user.last_streamed_at = activity_summary.last_stream_at if activity_summary else None
     
     # Initialize history and reading data
     stream_history_pagination = None
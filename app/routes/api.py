@@ -1,15 +1,17 @@
 # File: app/routes/api.py
-from flask import Blueprint, request, current_app, render_template, Response, abort, jsonify, make_response
+from flask import Blueprint, request, current_app, render_template, Response, abort, jsonify, make_response, url_for
 from flask_login import login_required, current_user
 import requests
 import json
 from app.models import User, UserType, EventType, Invite, Setting
-from app.utils.helpers import log_event, permission_required
+from app.utils.helpers import log_event, permission_required, conditional_response
 from app.utils.timeout_helper import get_api_timeout
 from app.extensions import csrf, db
 from app.models_media_services import ServiceType, MediaServer
 from app.services.media_service_factory import MediaServiceFactory
 from app.services.media_service_manager import MediaServiceManager
+from app.services import media_item_index, session_feed
+from app.models_payloads import delete_payloads
 import time
 from datetime import datetime, timedelta
 
@@ -234,6 +236,7 @@ def get_session_monitoring_interval():
 
 @bp.route('/settings/navbar-stream-badge-status')
 @login_required
+@conditional_response(lambda: Setting.get_bool('ENABLE_NAVBAR_STREAM_BADGE', False))
 def get_navbar_stream_badge_status():
     """Get the current navbar stream badge setting"""
     enabled = Setting.get_bool('ENABLE_NAVBAR_STREAM_BADGE', False)
@@ -282,8 +285,25 @@ def check_server_status(server_id):
     }
     return render_template('dashboard/_partials/multi_service_status.html', server_status=server_status_data)
 
+def _server_status_version():
+    """
+    Stored status of the active servers if every one was checked within
+    SERVER_STATUS_REUSE_SECONDS, so repeated loads don't re-check them;
+    None if a check is due or asked for with ``?refresh=1``.
+    """
+    if request.args.get('refresh'):
+        return None
+    rows = db.session.query(MediaServer.id, MediaServer.last_status_check, MediaServer.last_status,
+                            MediaServer.last_version, MediaServer.last_status_error) \
+        .filter(MediaServer.is_active.is_(True)).order_by(MediaServer.id).all()
+    cutoff = datetime.utcnow() - timedelta(seconds=current_app.config.get('SERVER_STATUS_REUSE_SECONDS', 15))
+    if not rows or any(row.last_status_check is None or row.last_status_check < cutoff for row in rows):
+        return None
+    return [tuple(row) for row in rows]
+
 @bp.route('/dashboard/server-status', methods=['GET'])
 @login_required
+@conditional_response(_server_status_version)
 def get_dashboard_server_status():
     """Get server status for dashboard - loads asynchronously with real-time data"""
     current_app.logger.info("=== API ENDPOINT: /dashboard/server-status called ===")
@@ -310,22 +330,30 @@ def get_all_servers_modal():
 
     return render_template('components/modals/all_servers_status_modal_content.html', server_status=server_status_data)
 
+def _active_streams_version():
+    """The session count the monitor noted on its last tick, or None if it's out of date."""
+    return session_feed.active_count(max_age_seconds=session_feed.fresh_age_seconds())
+
 @bp.route('/dashboard/active-streams-count', methods=['GET'])
 @login_required
+@conditional_response(_active_streams_version)
 def get_active_streams_count():
-    """Get active streams count for dashboard - real-time data, no caching"""
+    """Get active streams count for dashboard - the monitor's count from its last tick, else real-time data"""
     current_app.logger.info("=== API ENDPOINT: /dashboard/active-streams-count called ===")
-    current_app.logger.debug("Api.py - get_active_streams_count(): Loading real-time active streams count")
+    current_app.logger.debug("Api.py - get_active_streams_count(): Loading active streams count")
     
-    active_streams_count = 0
-    try:
-        current_app.logger.info("API: Fetching real-time active sessions from all servers")
-        active_sessions_list = MediaServiceManager.get_all_active_sessions()
-        if active_sessions_list:
-            active_streams_count = len(active_sessions_list)
-        current_app.logger.debug(f"API: Real-time active streams count: {active_streams_count}")
-    except Exception as e:
-        current_app.logger.error(f"API: Failed to get active streams count: {e}")
+    active_streams_count = _active_streams_version()
+    if active_streams_count is None:
+        active_streams_count = 0
+        try:
+            current_app.logger.info("API: Fetching real-time active sessions from all servers")
+            active_sessions_list = MediaServiceManager.get_all_active_sessions()
+            if active_sessions_list:
+                active_streams_count = len(active_sessions_list)
+            session_feed.note_count(active_streams_count)
+            current_app.logger.debug(f"API: Real-time active streams count: {active_streams_count}")
+        except Exception as e:
+            current_app.logger.error(f"API: Failed to get active streams count: {e}")
     
     # Return the card content HTML
     return f'''
@@ -622,162 +650,162 @@ def sync_server_libraries(server_id):
 @login_required
 @csrf.exempt
 def sync_server_users(server_id):
-    """Sync users for a server"""
-    result = MediaServiceManager.sync_server_users(server_id)
-    return jsonify(result)
+    """Queue a user sync for a server; poll status_url for the result"""
+    from app.services import job_service
+    server = MediaServiceManager.get_server_by_id(server_id)
+    if not server:
+        return jsonify({'success': False, 'message': 'Server not found'}), 404
+
+    job, created = job_service.enqueue(
+        'server_user_sync', {'server_id': server_id},
+        dedupe_key=job_service.make_dedupe_key('server_user_sync', server_id=server_id),
+        admin_id=current_user.id, title=f"User sync for {server.server_nickname}"
+    )
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': url_for('api.job_status', job_id=job.id),
+        'message': f"User sync for {server.server_nickname} started." if created else f"User sync for {server.server_nickname} is already running."
+    }), 202
 
 @bp.route('/libraries/<int:library_id>/sync', methods=['POST'])
 @login_required
 @csrf.exempt
 def sync_library_content(library_id):
-    """Sync content for a specific library"""
+    """Queue a content sync for a specific library and show its progress in the results modal"""
+    from app.services import job_service
+    from app.models_media_services import MediaLibrary
+
+    library = MediaLibrary.query.get(library_id)
+    if not library:
+        return jsonify({'success': False, 'error': 'Library not found'}), 404
+
     try:
-        from app.services.media_sync_service import MediaSyncService
-        from app.models_media_services import MediaLibrary
-        import time
-        
-        # Check if library exists
-        library = MediaLibrary.query.get(library_id)
-        if not library:
-            return jsonify({'success': False, 'error': 'Library not found'}), 404
-        
-        current_app.logger.info(f"Starting library content sync for: {library.name}")
-        start_time = time.time()
-        
-        # Perform the sync
-        result = MediaSyncService.sync_library_content(library_id)
-        end_time = time.time()
-        duration = end_time - start_time
-        
-        if result['success']:
-            current_app.logger.info(f"Library content sync completed successfully")
-            current_app.logger.debug(f"Full sync result keys: {list(result.keys())}")
-            
-            # Add duration to result
-            result['duration'] = duration
-            
-            # Check if there are any changes to determine response type
-            # Use the count values, not the list values
-            added = result.get('added', 0)
-            updated = result.get('updated', 0)
-            removed = result.get('removed', 0)
-            
-            # Debug logging to identify the issue
-            current_app.logger.debug(f"SYNC RESULT: added={added} (type: {type(added)})")
-            current_app.logger.debug(f"SYNC RESULT: updated={updated} (type: {type(updated)})")
-            current_app.logger.debug(f"SYNC RESULT: removed={removed} (type: {type(removed)})")
-            current_app.logger.debug(f"SYNC RESULT: errors={result.get('errors')} (type: {type(result.get('errors'))})")
-            current_app.logger.debug(f"SYNC RESULT: total_items={result.get('total_items', 'NOT_SET')}")
-            
-            try:
-                errors_list = result.get('errors', [])
-                current_app.logger.debug(f"SYNC RESULT: errors_list = {errors_list} (type: {type(errors_list)})")
-                current_app.logger.debug(f"SYNC RESULT: len(errors_list) = {len(errors_list)}")
-                
-                # Break down the logic step by step
-                added_check = added > 0
-                updated_check = updated > 0
-                removed_check = removed > 0
-                errors_check = bool(errors_list and len(errors_list) > 0)
-                
-                current_app.logger.debug(f"SYNC RESULT: added_check = {added_check}")
-                current_app.logger.debug(f"SYNC RESULT: updated_check = {updated_check}")
-                current_app.logger.debug(f"SYNC RESULT: removed_check = {removed_check}")
-                current_app.logger.debug(f"SYNC RESULT: errors_check = {errors_check}")
-                
-                has_changes = added_check or updated_check or removed_check or errors_check
-                current_app.logger.debug(f"SYNC RESULT: has_changes = {has_changes} (type: {type(has_changes)})")
-            except Exception as e:
-                current_app.logger.debug(f"Error in has_changes comparison: {e}")
-                current_app.logger.debug(f"Full result data: {result}")
-                raise
-            
-            if has_changes:
-                # Use the original result (which already has the correct list and count fields)
-                normalized_result = result.copy()
-                current_app.logger.debug(f"About to render template with normalized_result keys: {list(normalized_result.keys())}")
-                
-                try:
-                    # Show modal for changes or errors
-                    modal_html = render_template('libraries/_partials/library_content_sync_results_modal.html',
-                                               sync_result=normalized_result,
-                                               library_name=library.name)
-                    current_app.logger.debug(f"Template rendered successfully")
-                except Exception as e:
-                    current_app.logger.debug(f"Error rendering template: {e}")
-                    current_app.logger.debug(f"normalized_result data: {normalized_result}")
-                    raise
-                
-                try:
-                    if result.get('errors') and len(result.get('errors', [])) > 0:
-                        message = f"Library sync completed with {len(result.get('errors', []))} errors. See details."
-                        category = "warning"
-                    else:
-                        message = f"Library sync complete. {added} added, {updated} updated, {removed} removed."
-                        category = "success"
-                    current_app.logger.debug(f"Message created: {message}")
-                except Exception as e:
-                    current_app.logger.debug(f"Error creating message: {e}")
-                    raise
-                
-                trigger_payload = {
-                    "showToastEvent": {"message": message, "category": category},
-                    "openLibraryContentSyncResultsModal": True,
-                    "refreshLibraryPage": True
-                }
-                headers = {
-                    'HX-Retarget': '#library_content_sync_results_modal',
-                    'HX-Reswap': 'innerHTML',
-                    'HX-Trigger-After-Swap': json.dumps(trigger_payload)
-                }
-                return make_response(modal_html, 200, headers)
-            else:
-                # No changes - just show toast (no page refresh needed)
-                current_app.logger.debug("Taking NO CHANGES path - should show toast only")
-                total_items = result.get('total_items', 0)
-                trigger_payload = {
-                    "showToastEvent": {
-                        "message": f"Library sync complete. No changes were made to {total_items} items.",
-                        "category": "success"
-                    }
-                }
-                headers = {
-                    'HX-Trigger': json.dumps(trigger_payload)
-                }
-                current_app.logger.debug(f"Returning empty response with headers: {headers}")
-                current_app.logger.debug(f"Trigger payload: {trigger_payload}")
-                response = make_response("", 200, headers)
-                current_app.logger.debug(f"Response created successfully, returning to client")
-                return response
-        else:
-            current_app.logger.error(f"Library sync failed: {result.get('error', 'Unknown error')}")
-            
-            # Return error response
-            toast_payload = {
-                "showToastEvent": {
-                    "message": f"Library sync failed: {result.get('error', 'Unknown error')}",
-                    "category": "error"
-                }
-            }
-            
-            response = make_response("", 500)
-            response.headers['HX-Trigger'] = json.dumps(toast_payload)
-            return response
-            
+        job, created = job_service.enqueue(
+            'library_content_sync', {'library_id': library_id},
+            dedupe_key=job_service.make_dedupe_key('library_content_sync', library_id=library_id),
+            admin_id=current_user.id, title=f"Content sync for {library.name}"
+        )
     except Exception as e:
-        current_app.logger.error(f"Error in library sync endpoint: {e}")
-        
-        # Return error response
-        toast_payload = {
+        current_app.logger.error(f"Error queuing library sync for {library.name}: {e}", exc_info=True)
+        toast_payload = {"showToastEvent": {"message": f"Library sync failed: {str(e)}", "category": "error"}}
+        return make_response("", 500, {'HX-Trigger': json.dumps(toast_payload)})
+
+    current_app.logger.info(f"Library content sync for {library.name} {'queued' if created else 'already active'} as job {job.id}")
+    modal_html = render_template('libraries/_partials/library_content_sync_progress.html',
+                                 progress=job_service.get_job_progress(job.id),
+                                 library_name=library.name)
+    headers = {
+        'HX-Retarget': '#library_content_sync_results_modal',
+        'HX-Reswap': 'innerHTML',
+        'HX-Trigger-After-Swap': json.dumps({"openLibraryContentSyncResultsModal": True})
+    }
+    return make_response(modal_html, 202, headers)
+
+@bp.route('/libraries/sync/jobs/<int:job_id>')
+@login_required
+def library_content_sync_status(job_id):
+    """Polled by the sync modal: progress while the job runs, then the sync results"""
+    from app.services import job_service
+
+    progress = job_service.get_job_progress(job_id) if job_service.get_accessible_job(job_id, current_user) else None
+    if not progress or progress['job_type'] != 'library_content_sync':
+        return jsonify({'success': False, 'error': 'Sync job not found'}), 404
+
+    result = progress['result'] or {}
+    library_name = result.get('library_name') or progress['title']
+    if not progress['is_finished']:
+        return render_template('libraries/_partials/library_content_sync_progress.html',
+                               progress=progress, library_name=library_name)
+
+    if progress['status'] != 'completed':
+        if progress['status'] == 'cancelled':
+            toast = {"message": "Library sync cancelled. No changes were saved.", "category": "info"}
+        else:
+            toast = {"message": f"Library sync failed: {progress['error'] or 'Unknown error'}", "category": "error"}
+        headers = {'HX-Trigger': json.dumps({"showToastEvent": toast, "closeLibraryContentSyncResultsModal": True})}
+        return make_response("", 200, headers)
+
+    added = result.get('added', 0)
+    updated = result.get('updated', 0)
+    removed = result.get('removed', 0)
+    errors = result.get('errors') or []
+
+    if not (added or updated or removed or errors):
+        # No changes - just show toast (no page refresh needed)
+        trigger_payload = {
             "showToastEvent": {
-                "message": f"Library sync failed: {str(e)}",
-                "category": "error"
-            }
+                "message": f"Library sync complete. No changes were made to {result.get('total_items', 0)} items.",
+                "category": "success"
+            },
+            "closeLibraryContentSyncResultsModal": True
         }
-        
-        response = make_response("", 500)
-        response.headers['HX-Trigger'] = json.dumps(toast_payload)
-        return response
+        return make_response("", 200, {'HX-Trigger': json.dumps(trigger_payload)})
+
+    modal_html = render_template('libraries/_partials/library_content_sync_results_modal.html',
+                                 sync_result=result,
+                                 library_name=library_name)
+    if errors:
+        message = f"Library sync completed with {len(errors)} errors. See details."
+        category = "warning"
+    else:
+        message = f"Library sync complete. {added} added, {updated} updated, {removed} removed."
+        category = "success"
+    trigger_payload = {
+        "showToastEvent": {"message": message, "category": category},
+        "refreshLibraryPage": True
+    }
+    return make_response(modal_html, 200, {'HX-Trigger-After-Swap': json.dumps(trigger_payload)})
+
+@bp.route('/jobs/<int:job_id>')
+@login_required
+def job_status(job_id):
+    """JSON snapshot of a background job"""
+    from app.services import job_service
+    progress = job_service.get_job_progress(job_id) if job_service.get_accessible_job(job_id, current_user) else None
+    if not progress:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    for key in ('created_at', 'started_at', 'finished_at'):
+        progress[key] = progress[key].isoformat() if progress[key] else None
+    return jsonify(progress)
+
+@bp.route('/jobs/<int:job_id>/progress')
+@login_required
+def job_progress(job_id):
+    """Progress panel for a background job, polled by HTMX until the job finishes"""
+    from app.services import job_service
+    progress = job_service.get_job_progress(job_id) if job_service.get_accessible_job(job_id, current_user) else None
+    if not progress:
+        return render_template('components/alerts/alert_message.html', message="This background job no longer exists.", category='warning'), 404
+
+    response = make_response(render_template('components/jobs/job_progress.html', progress=progress))
+    if progress['is_finished']:
+        # The finished panel stops polling, so this fires exactly once
+        trigger_payload = {}
+        if progress['refresh_event']:
+            trigger_payload[progress['refresh_event']] = True
+        if progress['status'] == 'completed':
+            trigger_payload["showToastEvent"] = {"message": progress['message'] or f"{progress['title']} finished.", "category": "success"}
+        elif progress['status'] == 'failed':
+            trigger_payload["showToastEvent"] = {"message": f"{progress['title']} failed: {progress['error']}", "category": "error"}
+        response.headers['HX-Trigger'] = json.dumps(trigger_payload)
+    return response
+
+@bp.route('/jobs/<int:job_id>/cancel', methods=['POST'])
+@login_required
+def cancel_job(job_id):
+    """Cancel a queued job or ask a running one to stop"""
+    from app.services import job_service
+    job = job_service.cancel_job(job_id) if job_service.get_accessible_job(job_id, current_user) else None
+    if not job:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    if request.headers.get('HX-Request'):
+        if job.job_type == 'library_content_sync':
+            return render_template('libraries/_partials/library_content_sync_progress.html',
+                                   progress=job_service.get_job_progress(job_id), library_name=job.title)
+        return render_template('components/jobs/job_progress.html', progress=job_service.get_job_progress(job_id))
+    return jsonify({'success': True, 'status': job.status, 'cancel_requested': job.cancel_requested})
 
 @bp.route('/libraries/<int:library_id>/purge', methods=['POST'])
 @login_required
@@ -798,6 +826,8 @@ def purge_library_content(library_id):
         item_count = MediaItem.query.filter_by(library_id=library_id).count()
         
         # Delete all media items for this library
+        media_item_index.unlink_library(library_id)
+        delete_payloads(MediaItem, MediaItem.query.filter_by(library_id=library_id).with_entities(MediaItem.id))
         deleted_count = MediaItem.query.filter_by(library_id=library_id).delete()
         
         # Commit the changes
@@ -1301,16 +1331,27 @@ def terminate_plex_session():
 
 @bp.route('/streaming/sessions/count')
 @login_required
+@conditional_response(_active_streams_version)
 def get_session_count():
-    """Get the current count of active streaming sessions - real-time data, no caching"""
+    """Get the current count of active streaming sessions - the monitor's count from its last tick, else real-time data"""
     try:
+        total_sessions = _active_streams_version()
+        if total_sessions is not None:
+            return jsonify({
+                'success': True,
+                'count': total_sessions,
+                'cached': True,
+                'real_time': False
+            })
+
         current_app.logger.debug("API: Fetching real-time session count")
         
-        # Get active sessions from all services (no caching)
+        # Get active sessions from all services
         active_sessions_data = MediaServiceManager.get_all_active_sessions()
         
         # Count total sessions
         total_sessions = len(active_sessions_data)
+        session_feed.note_count(total_sessions)
         current_app.logger.debug(f"API: Real-time session count: {total_sessions}")
         
         return jsonify({
@@ -1395,13 +1436,17 @@ def refresh_plugins_servers_count():
 @login_required
 def geoip_lookup(ip_address):
     """Look up GeoIP information for a given IP address and return HTML partial"""
-    plex_servers = MediaServiceManager.get_servers_by_type(ServiceType.PLEX)
-    if not plex_servers:
-        abort(503)
-    
-    # Use the first active Plex server
-    plex_service = MediaServiceFactory.create_service_from_db(plex_servers[0])
-    if not plex_service:
-        abort(503)
-    geoip_data = plex_service.get_geoip_info(ip_address)
+    from app.services import geoip_service
+    geoip_data = geoip_service.lookup(ip_address)
     return render_template('components/modals/geoip_modal.html', geoip_data=geoip_data, ip_address=ip_address)
+
+@bp.route('/network/geoip')
+@login_required
+def geoip_batch_lookup():
+    """Look up several addresses at once (?ip=...&ip=...). Returns JSON keyed by address."""
+    from app.services import geoip_service
+    ip_addresses = [ip for ip in request.args.getlist('ip') if ip][:200]
+    if not ip_addresses:
+        return jsonify({'success': False, 'message': 'No IP addresses given'}), 400
+    resolve = request.args.get('cached_only', 'false').lower() not in ('1', 'true', 'yes')
+    return jsonify({'success': True, 'results': geoip_service.lookup_many(ip_addresses, resolve=resolve)})
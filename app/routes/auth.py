@@ -10,8 +10,6 @@ from app.utils.timeout_helper import get_api_timeout
 from app.models import User, UserType, Setting, EventType, SettingValueType
 from app.forms import LoginForm, UserLoginForm
 from app.extensions import db, csrf # <<< IMPORT CSRF
-from plexapi.myplex import MyPlexAccount 
-from plexapi.exceptions import Unauthorized, NotFound, PlexApiException
 from datetime import datetime, timezone, timedelta
 from app.utils.plex_auth_helpers import create_plex_pin_login, check_plex_pin_status, get_plex_auth_url
 import requests
@@ -293,6 +291,8 @@ def plex_sso_login_admin():
 
 @bp.route('/plex_sso_callback_admin') 
 def plex_sso_callback_admin():
+    from plexapi.myplex import MyPlexAccount
+    from plexapi.exceptions import PlexApiException
     pin_id_from_session = session.get('plex_pin_id_admin_login')
     pin_code_from_session = session.get('plex_pin_code_admin_login')
     client_id_from_session = session.get('plex_client_id_admin_login')
@@ -5,8 +5,6 @@ OAuth callback handlers - Plex and Discord authentication callbacks
 import time
 from flask import redirect, url_for, flash, request, current_app, session
 from markupsafe import Markup
-from plexapi.myplex import MyPlexAccount
-from plexapi.exceptions import PlexApiException
 from app.models import User, UserType, Invite, Setting, EventType
 from app.utils.helpers import setup_required, log_event
 from app.utils.timeout_helper import get_api_timeout
@@ -19,6 +17,8 @@ DISCORD_API_BASE_URL = 'https://discord.com/api/v10'
 @invites_bp.route('/plex_callback') # Path is /invites/plex_callback
 @setup_required
 def plex_oauth_callback():
+    from plexapi.myplex import MyPlexAccount
+    from plexapi.exceptions import PlexApiException
     invite_id = session.get('plex_oauth_invite_id')
     pin_code_from_session = session.get('plex_pin_code_invite_flow')
     pin_id_from_session = session.get('plex_pin_id_invite_flow')
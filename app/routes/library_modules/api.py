@@ -4,6 +4,7 @@ from flask import current_app, make_response, json, request
 from flask_login import login_required, current_user
 from app.utils.helpers import setup_required, permission_required
 from app.services.media_service_factory import MediaServiceFactory
+from app.services import media_item_index
 from app.models_media_services import MediaLibrary, MediaServer, MediaItem
 from app.extensions import db
 from datetime import datetime
@@ -120,8 +121,10 @@ def purge_show_episodes_api(show_id):
         deleted_titles = [ep.title for ep in episodes_to_delete[:10]]  # First 10 for logging
         
         # Delete episodes
+        media_item_index.unlink_items([episode.id for episode in episodes_to_delete])
         for episode in episodes_to_delete:
             db.session.delete(episode)
+        show.episodes_synced_at = None  # Fetched again by the next episode prefetch or tab visit
         
         # Commit changes
         db.session.commit()
@@ -143,6 +146,52 @@ def purge_show_episodes_api(show_id):
         return {'success': False, 'error': str(e)}, 500
 
 
+@libraries_bp.route('/api/search')
+@login_required
+@setup_required
+@permission_required('view_libraries')
+def search_media_api():
+    """Ranked full-text search across every synced library. Query args: q, limit, server_id, library_id, type."""
+    import time
+    from flask import url_for
+    from app.services import media_search
+    from app.utils.helpers import encode_url_component, generate_url_slug
+    
+    query = request.args.get('q', '').strip()
+    limit = min(max(request.args.get('limit', 25, type=int), 1), 100)
+    item_types = [t for t in request.args.get('type', '').split(',') if t] or None
+    started = time.perf_counter()
+    try:
+        matches = media_search.search(query, limit=limit, server_id=request.args.get('server_id', type=int),
+                                      library_id=request.args.get('library_id', type=int), item_types=item_types)
+    except Exception as e:
+        current_app.logger.error(f"Error in media search API for '{query}': {e}")
+        return {'success': False, 'error': str(e)}, 500
+    
+    results = []
+    for item, score in matches:
+        item_dict = item.to_dict(include_raw_data=False)
+        item_dict.update({
+            'score': round(float(score or 0), 4),
+            'server_id': item.server_id,
+            'server_name': item.server.server_nickname,
+            'service_type': item.server.service_type.value,
+            'library_id': item.library_id,
+            'library_name': item.library.name,
+            'url': url_for('libraries.media_detail', server_nickname=item.server.server_nickname,
+                           library_name=encode_url_component(item.library.name), media_id=item.id,
+                           slug=generate_url_slug(item.title))
+        })
+        results.append(item_dict)
+    return {
+        'success': True,
+        'query': query,
+        'backend': media_search.backend(),
+        'results': results,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+    }
+
+
 @libraries_bp.route('/api/media-output/<server_nickname>/<library_name>/<int:media_id>')
 @login_required
 @setup_required
@@ -7,6 +7,7 @@ from app.services.media_service_manager import MediaServiceManager
 from app.services.media_service_factory import MediaServiceFactory
 from app.models_media_services import MediaLibrary, MediaServer, MediaStreamHistory
 from app.models import User, UserType
+from app.models_payloads import prefetch_payloads
 from app.extensions import db
 from datetime import datetime, timezone, timedelta
 import urllib.parse
@@ -126,7 +127,6 @@ def episode_detail(server_nickname, library_name, media_id, tv_show_slug, episod
         episode_slug = urllib.parse.unquote(episode_slug)
         
         # Decode URL component back to original name for lookup
-        library_name_for_lookup = decode_url_component(library_name)
         tv_show_name = decode_url_component(tv_show_slug)
         episode_name = decode_url_component(episode_slug)
         
@@ -151,8 +151,6 @@ def episode_detail(server_nickname, library_name, media_id, tv_show_slug, episod
             name=variation
         ).first()
         if library:
-            # Store the actual library name that worked
-            library_name_for_lookup = variation
             break
     
     if not library:
@@ -196,9 +194,8 @@ def episode_detail(server_nickname, library_name, media_id, tv_show_slug, episod
     
     # Get streaming history for this specific episode
     activity_query = MediaStreamHistory.query.filter(
-        MediaStreamHistory.server_id == server.id,
-        MediaStreamHistory.library_name == library_name_for_lookup,
-        MediaStreamHistory.media_title == episode_details.get('title'),
+        MediaStreamHistory.grandparent_media_item_id == tv_show_item.id,
+        MediaStreamHistory.rating_key == str(episode_details.get('id')),
         MediaStreamHistory.started_at >= start_date,
         MediaStreamHistory.started_at <= end_date
     ).order_by(MediaStreamHistory.started_at.desc())
@@ -260,9 +257,6 @@ def media_detail(server_nickname, library_name, media_id, slug=None):
         server_nickname = urllib.parse.unquote(server_nickname)
         library_name = urllib.parse.unquote(library_name)
         
-        # Decode URL component back to original name for lookup
-        library_name_for_lookup = decode_url_component(library_name)
-        
     except Exception as e:
         current_app.logger.warning(f"Error decoding URL parameters: {e}")
         abort(400)
@@ -284,8 +278,6 @@ def media_detail(server_nickname, library_name, media_id, slug=None):
             name=variation
         ).first()
         if library:
-            # Store the actual library name that worked
-            library_name_for_lookup = variation
             break
     
     if not library:
@@ -303,11 +295,11 @@ def media_detail(server_nickname, library_name, media_id, slug=None):
     
     # Convert database item to the expected format
     media_details = media_item.to_dict()
-    content_name_for_lookup = media_item.title  # Use the actual title from database
     
     # Get episodes for TV shows
     episodes_content = None
     episodes_cached = False
+    episodes_prefetch_job = None
     if tab == 'episodes' and library.library_type and library.library_type.lower() in ['show', 'tv', 'series', 'tvshows']:
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 24, type=int)
@@ -339,11 +331,24 @@ def media_detail(server_nickname, library_name, media_id, slug=None):
             )
         ).count()
         
-        episodes_cached = cached_episodes_count > 0
+        episodes_cached = cached_episodes_count > 0 or media_item.episodes_synced_at is not None
         
         # Only get episodes if we have cached data
         if episodes_cached:
             episodes_content = get_show_episodes_by_item(server, library, media_item, page, per_page, search_query, sort_by)
+        else:
+            # Not fetched yet. On the first visit fetch this one show inline, within a time limit; a queued job could
+            # wait behind a running library sync. If that doesn't work, queue it and let the tab poll until it lands.
+            # Once that job has finished without result the tab falls back to a direct sync, which reports the error.
+            from app.models import BackgroundJob
+            from app.services import episode_prefetch, job_service
+            polled_job = db.session.get(BackgroundJob, request.args.get('prefetch_job', type=int) or 0)
+            if polled_job is None and episode_prefetch.fetch_show(
+                    media_item, current_app.config.get('EPISODE_TAB_FETCH_TIMEOUT_SECONDS', 8)):
+                episodes_content = get_show_episodes_by_item(server, library, media_item, page, per_page, search_query, sort_by)
+                episodes_cached = True
+            elif polled_job is None or polled_job.status in job_service.ACTIVE_STATUSES:
+                episodes_prefetch_job = polled_job or episode_prefetch.queue_show(media_item)
     
     # Get issues for comic series (Komga)
     issues_content = None
@@ -397,22 +402,18 @@ def media_detail(server_nickname, library_name, media_id, slug=None):
         start_date = end_date - timedelta(days=days_filter)
         
         # Get streaming history for this specific content
-        # For TV shows, we need to check grandparent_title (show name) instead of media_title (episode name)
+        # For TV shows, plays are recorded against the episodes, so match on the show they belong to
         if library.library_type and library.library_type.lower() in ['show', 'tv', 'series', 'tvshows']:
-            # For TV shows, filter by grandparent_title to get all episodes of the show
+            # For TV shows, filter by the resolved show to get all episodes of the show
             activity_query = MediaStreamHistory.query.filter(
-                MediaStreamHistory.server_id == server.id,
-                MediaStreamHistory.library_name == library_name_for_lookup,
-                MediaStreamHistory.grandparent_title == content_name_for_lookup,
+                MediaStreamHistory.grandparent_media_item_id == media_item.id,
                 MediaStreamHistory.started_at >= start_date,
                 MediaStreamHistory.started_at <= end_date
             ).order_by(MediaStreamHistory.started_at.desc())
         else:
-            # For movies and other content, filter by media_title
+            # For movies and other content, filter by the played item itself
             activity_query = MediaStreamHistory.query.filter(
-                MediaStreamHistory.server_id == server.id,
-                MediaStreamHistory.library_name == library_name_for_lookup,
-                MediaStreamHistory.media_title == content_name_for_lookup,
+                MediaStreamHistory.media_item_id == media_item.id,
                 MediaStreamHistory.started_at >= start_date,
                 MediaStreamHistory.started_at <= end_date
             ).order_by(MediaStreamHistory.started_at.desc())
@@ -457,6 +458,7 @@ def media_detail(server_nickname, library_name, media_id, slug=None):
             return render_template('library/_partials/episodes_content.html',
                                  episodes_content=episodes_content,
                                  episodes_cached=episodes_cached,
+                                 episodes_prefetch_job=episodes_prefetch_job,
                                  media_details=media_details,
                                  media_item=media_item,
                                  library=library,
@@ -484,6 +486,7 @@ def media_detail(server_nickname, library_name, media_id, slug=None):
                          server=server,
                          episodes_content=episodes_content,
                          episodes_cached=episodes_cached,
+                         episodes_prefetch_job=episodes_prefetch_job,
                          issues_content=issues_content,
                          streaming_history=streaming_history,
                          tab=tab,
@@ -503,9 +506,6 @@ def library_detail(server_nickname, library_name):
         server_nickname = urllib.parse.unquote(server_nickname)
         library_name = urllib.parse.unquote(library_name)
         
-        # Decode URL component back to original name for lookup
-        library_name_for_lookup = decode_url_component(library_name)
-        
         # If the URL contains spaces or other special characters, redirect to the proper format
         from flask import redirect, url_for
         proper_library_name = encode_url_component(library_name)
@@ -536,8 +536,6 @@ def library_detail(server_nickname, library_name):
             name=variation
         ).first()
         if library:
-            # Store the actual library name that worked
-            library_name_for_lookup = variation
             break
     
     if not library:
@@ -644,8 +642,7 @@ def library_detail(server_nickname, library_name):
         current_app.logger.info(f"ACTIVITY DEBUG: Using actual library name from DB: '{actual_library_name}'")
         
         activity_query = MediaStreamHistory.query.filter(
-            MediaStreamHistory.server_id == server.id,
-            MediaStreamHistory.library_name == actual_library_name,
+            MediaStreamHistory.library_id == library.id,
             MediaStreamHistory.started_at >= start_date,
             MediaStreamHistory.started_at <= end_date,
             MediaStreamHistory.user_uuid.isnot(None)  # Show all user activity
@@ -660,6 +657,11 @@ def library_detail(server_nickname, library_name):
             page=page, per_page=20, error_out=False
         )
         
+        # Users of this page in one query, with their raw sync payloads (avatar fallback) in another
+        page_user_uuids = {entry.user_uuid for entry in activity_pagination.items if entry.user_uuid}
+        users_by_uuid = {user.uuid: user for user in User.query.filter(User.uuid.in_(page_user_uuids))} if page_user_uuids else {}
+        prefetch_payloads(list(users_by_uuid.values()), 'user_raw_data')
+        
         # Enhance activity entries with user info and poster images
         for entry in activity_pagination.items:
             # Add poster information by looking up MediaItem
@@ -773,7 +775,7 @@ def library_detail(server_nickname, library_name):
                         entry.linked_media_item = media_item
             
             # Add user info using unified user_uuid
-            user = User.query.filter_by(uuid=entry.user_uuid).first()
+            user = users_by_uuid.get(entry.user_uuid)
             if user:
                 entry.user_display_name = user.get_display_name()
                 entry.user_type = 'service' if user.userType == UserType.SERVICE else 'local'
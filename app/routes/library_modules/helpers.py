@@ -1,10 +1,40 @@
 """Helper functions for library management"""
 
 from flask import current_app
-from app.models_media_services import MediaLibrary, MediaServer, MediaStreamHistory
+from app.models_media_services import MediaLibrary, MediaServer, MediaStreamHistory, StreamHistoryRollup
 from app.models import User, UserType
+from app.models_payloads import prefetch_payloads
 from app.extensions import db
-from datetime import datetime, timezone, timedelta
+from app.services import episode_prefetch, library_stats_cache, media_search
+from datetime import date, datetime, timezone, timedelta
+
+
+def _stream_counts_by(column, values, *filters):
+    """Number of history rows per value of ``column``, for the given values, in one grouped query."""
+    values = list({value for value in values if value is not None})
+    counts = {}
+    for start in range(0, len(values), 500):
+        rows = db.session.query(column, db.func.count(MediaStreamHistory.id)).filter(
+            column.in_(values[start:start + 500]), *filters
+        ).group_by(column).all()
+        counts.update(rows)
+    return counts
+
+
+def _library_item_stream_counts(library, media_items):
+    """Play counts per media item id: shows and artists count their episodes/tracks, albums match by title."""
+    parents = [item.id for item in media_items if item.item_type in ('show', 'artist')]
+    albums = [item for item in media_items if item.item_type == 'album']
+    others = [item.id for item in media_items if item.item_type not in ('show', 'artist', 'album')]
+
+    counts = _stream_counts_by(MediaStreamHistory.grandparent_media_item_id, parents)
+    counts.update(_stream_counts_by(MediaStreamHistory.media_item_id, others))
+    if albums:
+        album_counts = _stream_counts_by(MediaStreamHistory.parent_title, [album.title for album in albums],
+                                         MediaStreamHistory.library_id == library.id)
+        for album in albums:
+            counts[album.id] = album_counts.get(album.title, 0)
+    return counts
 
 
 def get_library_statistics(library):
@@ -12,33 +42,42 @@ def get_library_statistics(library):
     try:
         # Get streaming statistics for this library
         total_streams = MediaStreamHistory.query.filter(
-            MediaStreamHistory.server_id == library.server_id,
-            MediaStreamHistory.library_name == library.name
+            MediaStreamHistory.library_id == library.id
         ).count()
         
         # Get unique users who have accessed this library
         unique_users = db.session.query(MediaStreamHistory.user_uuid)\
             .filter(
-                MediaStreamHistory.server_id == library.server_id,
-                MediaStreamHistory.library_name == library.name,
+                MediaStreamHistory.library_id == library.id,
                 MediaStreamHistory.user_uuid.isnot(None)
-            ).distinct().count()
+            ).union(
+                db.session.query(StreamHistoryRollup.user_uuid).filter(
+                    StreamHistoryRollup.library_id == library.id,
+                    StreamHistoryRollup.user_uuid.isnot(None)
+                )
+            ).count()
         
         # Get total watch time (in seconds)
         total_watch_time = db.session.query(db.func.sum(MediaStreamHistory.duration_seconds))\
             .filter(
-                MediaStreamHistory.server_id == library.server_id,
-                MediaStreamHistory.library_name == library.name,
+                MediaStreamHistory.library_id == library.id,
                 MediaStreamHistory.duration_seconds.isnot(None)
             ).scalar() or 0
         
+        # Add history archived by the retention policy
+        archived_streams, archived_seconds = db.session.query(
+            db.func.coalesce(db.func.sum(StreamHistoryRollup.plays), 0),
+            db.func.coalesce(db.func.sum(StreamHistoryRollup.duration_seconds), 0)
+        ).filter(StreamHistoryRollup.library_id == library.id).one()
+        total_streams += archived_streams
+        total_watch_time += archived_seconds
+        
         # Get most popular content
         popular_content = db.session.query(
             MediaStreamHistory.media_title,
             db.func.count(MediaStreamHistory.id).label('play_count')
         ).filter(
-            MediaStreamHistory.server_id == library.server_id,
-            MediaStreamHistory.library_name == library.name
+            MediaStreamHistory.library_id == library.id
         ).group_by(MediaStreamHistory.media_title)\
          .order_by(db.func.count(MediaStreamHistory.id).desc())\
          .limit(5).all()
@@ -78,34 +117,41 @@ def get_library_statistics(library):
 
 def generate_library_chart_data(library, days=30):
     """Generate chart data for library streaming activity by user"""
+    return library_stats_cache.get_or_compute(library, 'chart', days,
+                                              lambda: _build_library_chart_data(library, days))
+
+
+def _build_library_chart_data(library, days):
     from collections import defaultdict
     from app.utils.helpers import format_duration
+    from .statistics import get_library_daily_activity
     
     # Calculate date range based on days parameter
     end_date = datetime.now(timezone.utc)
     if days == -1:  # All time
         # Get the earliest stream date for this library
-        earliest_stream = MediaStreamHistory.query.filter(
-            MediaStreamHistory.server_id == library.server_id,
-            MediaStreamHistory.library_name == library.name
-        ).order_by(MediaStreamHistory.started_at.asc()).first()
-        
-        if earliest_stream:
-            start_date = earliest_stream.started_at
+        earliest_started_at = db.session.query(db.func.min(MediaStreamHistory.started_at)).filter(
+            MediaStreamHistory.library_id == library.id
+        ).scalar()
+        earliest_archived_day = db.session.query(db.func.min(StreamHistoryRollup.day)).filter(
+            StreamHistoryRollup.library_id == library.id
+        ).scalar()
+        if earliest_archived_day:
+            archived_start = datetime.combine(earliest_archived_day, datetime.min.time())
+            if not earliest_started_at or archived_start < earliest_started_at.replace(tzinfo=None):
+                earliest_started_at = archived_start
+        
+        if earliest_started_at:
+            start_date = earliest_started_at
         else:
             start_date = end_date - timedelta(days=30)  # Fallback to 30 days
     else:
         start_date = end_date - timedelta(days=days-1)
     
-    # Get streaming history for this library
-    streaming_history = MediaStreamHistory.query.filter(
-        MediaStreamHistory.server_id == library.server_id,
-        MediaStreamHistory.library_name == library.name,
-        MediaStreamHistory.started_at >= start_date,
-        MediaStreamHistory.started_at <= end_date
-    ).all()
+    # Plays and watch time per day, aggregated in the database
+    daily_activity = get_library_daily_activity(library, start_date, end_date)
     
-    if not streaming_history:
+    if not daily_activity:
         return {
             'chart_data': [],
             'users': [],
@@ -132,9 +178,8 @@ def generate_library_chart_data(library, days=30):
     total_duration_seconds = 0
     total_plays = 0
     
-    for entry in streaming_history:
-        # Get the date (without time)
-        entry_date = entry.started_at.date()
+    for day_key, day_totals in daily_activity.items():
+        entry_date = date.fromisoformat(day_key)
         
         # Determine the grouping key based on grouping type
         if grouping_type == 'monthly':
@@ -146,21 +191,11 @@ def generate_library_chart_data(library, days=30):
         else:  # daily
             group_key = entry_date.isoformat()
         
-        # Get duration in minutes for the chart
-        duration_minutes = 0
-        if entry.duration_seconds and entry.duration_seconds > 0:
-            duration_minutes = entry.duration_seconds / 60
-            total_duration_seconds += entry.duration_seconds
-        elif entry.view_offset_at_end_seconds and entry.view_offset_at_end_seconds > 0:
-            duration_minutes = entry.view_offset_at_end_seconds / 60
-            total_duration_seconds += entry.view_offset_at_end_seconds
-        else:
-            duration_minutes = 1  # 1 minute minimum to show activity
-        
         # Add plays and time per group
-        grouped_data[group_key]['plays'] += 1
-        grouped_data[group_key]['time'] += duration_minutes
-        total_plays += 1
+        grouped_data[group_key]['plays'] += day_totals['plays']
+        grouped_data[group_key]['time'] += day_totals['minutes']
+        total_plays += day_totals['plays']
+        total_duration_seconds += day_totals['seconds']
     
     # Generate chart data for the date range
     chart_data_list = []
@@ -259,15 +294,18 @@ def generate_library_chart_data(library, days=30):
 
 def get_library_user_stats(library, days=30):
     """Get user statistics for a library"""
-    
+    return library_stats_cache.get_or_compute(library, 'user_stats', days,
+                                              lambda: _build_library_user_stats(library, days))
+
+
+def _build_library_user_stats(library, days):
     try:
         # Calculate date range based on days parameter
         end_date = datetime.now(timezone.utc)
         if days == -1:  # All time
             # Get the earliest stream date for this library
             earliest_stream = MediaStreamHistory.query.filter(
-                MediaStreamHistory.server_id == library.server_id,
-                MediaStreamHistory.library_name == library.name
+                MediaStreamHistory.library_id == library.id
             ).order_by(MediaStreamHistory.started_at.asc()).first()
             
             if earliest_stream:
@@ -289,8 +327,7 @@ def get_library_user_stats(library, days=30):
             User, 
             MediaStreamHistory.user_uuid == User.uuid
         ).filter(
-            MediaStreamHistory.server_id == library.server_id,
-            MediaStreamHistory.library_name == library.name,
+            MediaStreamHistory.library_id == library.id,
             MediaStreamHistory.started_at >= start_date,
             MediaStreamHistory.started_at <= end_date,
             MediaStreamHistory.user_uuid.isnot(None)
@@ -301,6 +338,11 @@ def get_library_user_stats(library, days=30):
             User.external_avatar_url
         ).order_by(db.func.count(MediaStreamHistory.id).desc()).all()
         
+        # Users without a stored avatar fall back to their sync data; load them and their raw payloads up front
+        fallback_uuids = [stat.user_uuid for stat in user_stats_query if not stat.external_avatar_url and stat.user_uuid]
+        fallback_users = {user.uuid: user for user in User.query.filter(User.uuid.in_(fallback_uuids))} if fallback_uuids else {}
+        prefetch_payloads(list(fallback_users.values()), 'user_raw_data')
+        
         # Format user stats
         user_stats = []
         for stat in user_stats_query:
@@ -324,7 +366,7 @@ def get_library_user_stats(library, days=30):
                 avatar_url = stat.external_avatar_url
             elif stat.user_uuid:
                 # Get the full user record to access raw_data and service_settings
-                user_access = User.query.filter_by(uuid=stat.user_uuid).first()
+                user_access = fallback_users.get(stat.user_uuid)
                 if user_access:
                     if library.server.service_type.value.lower() == 'plex':
                         # For Plex, check multiple possible locations for the thumb URL
@@ -520,17 +562,15 @@ def get_show_episodes_by_item(server, library, media_item, page=1, per_page=24,
         
         current_app.logger.debug(f"Found {total_episodes} cached episodes for show: {media_item.title} (external_id: {media_item.external_id}, rating_key: {media_item.rating_key})")
         
-        if total_episodes > 0:
+        # A search with no matches or a show with no episodes is still a cache hit
+        if total_episodes > 0 or search_query or media_item.episodes_synced_at is not None:
             # We have episodes in database - use them!
             current_app.logger.debug(f"Using cached episodes for show: {media_item.title} ({total_episodes} episodes)")
             
-            # Check if episodes need syncing (older than 24 hours)
-            needs_sync = False
-            if media_item.last_synced:
-                sync_age = datetime.utcnow() - media_item.last_synced
-                needs_sync = sync_age > timedelta(hours=24)
-            else:
-                needs_sync = True
+            # Serve the cached list and refresh it in the background if it is past EPISODE_PREFETCH_MAX_AGE_HOURS
+            needs_sync = episode_prefetch.is_stale(media_item)
+            if needs_sync:
+                episode_prefetch.queue_show(media_item)
             
             # Apply sorting (database level for cached episodes)
             current_app.logger.debug(f"Applying sort_by: {sort_by} to cached episodes query")
@@ -557,18 +597,11 @@ def get_show_episodes_by_item(server, library, media_item, page=1, per_page=24,
             all_episodes = query.all()
             
             # Convert to dict format and add stream counts
+            stream_counts = _stream_counts_by(MediaStreamHistory.media_item_id, [episode.id for episode in all_episodes])
             episodes_data = []
             for episode in all_episodes:
-                episode_dict = episode.to_dict()
-                
-                # Get stream count for this episode
-                stream_count = MediaStreamHistory.query.filter(
-                    MediaStreamHistory.server_id == server.id,
-                    MediaStreamHistory.library_name == library.name,
-                    MediaStreamHistory.media_title == episode.title,
-                    MediaStreamHistory.grandparent_title == media_item.title
-                ).count()
-                episode_dict['stream_count'] = stream_count
+                episode_dict = episode.to_dict(include_raw_data=False)
+                episode_dict['stream_count'] = stream_counts.get(episode.id, 0)
                 episodes_data.append(episode_dict)
             
             # Apply manual sorting for ALL episodes (for proper cross-page sorting)
@@ -619,97 +652,15 @@ def get_show_episodes_by_item(server, library, media_item, page=1, per_page=24,
                 'has_prev': page > 1,
                 'has_next': page < total_pages,
                 'needs_sync': needs_sync,
-                'last_synced': media_item.last_synced.isoformat() if media_item.last_synced else None,
+                'last_synced': media_item.episodes_synced_at.isoformat() if media_item.episodes_synced_at else None,
                 'show_id': media_item.id
             }
         
         else:
-            # No episodes in database - trigger automatic sync first
-            current_app.logger.info(f"No cached episodes found for show: {media_item.title}, triggering automatic sync")
-            
-            # Trigger episode sync automatically
-            from app.services.media_sync_service import MediaSyncService
-            sync_result = MediaSyncService.sync_show_episodes(media_item.id)
-            
-            if sync_result['success']:
-                current_app.logger.info(f"Auto-sync completed for {media_item.title}: {sync_result['added']} episodes added")
-                
-                # Now try to get episodes from database again
-                query = MediaItem.query.filter_by(
-                    library_id=library.id,
-                    item_type='episode',
-                    parent_id=media_item.external_id
-                )
-                
-                # Apply search filter if provided
-                if search_query:
-                    search_term = f"%{search_query.lower()}%"
-                    query = query.filter(
-                        or_(
-                            MediaItem.title.ilike(search_term),
-                            MediaItem.summary.ilike(search_term)
-                        )
-                    )
-                
-                total_episodes = query.count()
-                
-                if total_episodes > 0:
-                    # Apply sorting
-                    if sort_by == 'title_desc':
-                        query = query.order_by(MediaItem.sort_title.desc())
-                    elif sort_by == 'year_asc':
-                        query = query.order_by(MediaItem.year.asc().nullsfirst(), MediaItem.sort_title.asc())
-                    elif sort_by == 'year_desc':
-                        query = query.order_by(MediaItem.year.desc().nullslast(), MediaItem.sort_title.asc())
-                    elif sort_by == 'added_at_asc':
-                        query = query.order_by(MediaItem.added_at.asc().nullsfirst(), MediaItem.sort_title.asc())
-                    elif sort_by == 'added_at_desc':
-                        query = query.order_by(MediaItem.added_at.desc().nullslast(), MediaItem.sort_title.asc())
-                    else:  # Default to title_asc
-                        query = query.order_by(MediaItem.sort_title.asc())
-                    
-                    # Get all episodes for stream count calculation
-                    all_episodes = query.all()
-                    
-                    # Convert to dict format and add stream counts
-                    episodes_data = []
-                    for episode in all_episodes:
-                        episode_dict = episode.to_dict()
-                        
-                        # Get stream count for this episode
-                        stream_count = MediaStreamHistory.query.filter(
-                            MediaStreamHistory.server_id == server.id,
-                            MediaStreamHistory.library_name == library.name,
-                            MediaStreamHistory.media_title == episode.title,
-                            MediaStreamHistory.grandparent_title == media_item.title
-                        ).count()
-                        episode_dict['stream_count'] = stream_count
-                        episodes_data.append(episode_dict)
-                    
-                    # Apply manual pagination
-                    start_idx = (page - 1) * per_page
-                    end_idx = start_idx + per_page
-                    paginated_episodes = episodes_data[start_idx:end_idx]
-                    
-                    # Calculate pagination info
-                    total_pages = (total_episodes + per_page - 1) // per_page
-                    
-                    return {
-                        'items': paginated_episodes,
-                        'total': total_episodes,
-                        'page': page,
-                        'per_page': per_page,
-                        'pages': total_pages,
-                        'has_prev': page > 1,
-                        'has_next': page < total_pages,
-                        'needs_sync': False,  # Just synced
-                        'last_synced': media_item.last_synced.isoformat() if media_item.last_synced else None,
-                        'show_id': media_item.id,
-                        'auto_synced': True  # Flag to indicate this was auto-synced
-                    }
-            
-            # If auto-sync failed, fall back to API call
-            current_app.logger.warning(f"Auto-sync failed for {media_item.title}, falling back to API: {sync_result.get('error', 'Unknown error')}")
+            # Never fetched - queue a background fetch so the next visit is served from the cache,
+            # and answer this one straight from the server without writing anything
+            current_app.logger.info(f"No cached episodes found for show: {media_item.title}, queuing a background fetch")
+            episode_prefetch.queue_show(media_item)
             
             from app.services.media_service_factory import MediaServiceFactory
             
@@ -762,15 +713,14 @@ def get_show_episodes_by_item(server, library, media_item, page=1, per_page=24,
         
         # Add stream counts to episodes
         if episodes_data and episodes_data.get('items'):
+            # These episodes aren't cached as MediaItems; match plays of this show by the service's item key
+            stream_counts = _stream_counts_by(
+                MediaStreamHistory.rating_key,
+                [str(episode.get('id')) for episode in episodes_data['items'] if episode.get('id')],
+                MediaStreamHistory.grandparent_media_item_id == media_item.id
+            )
             for episode in episodes_data['items']:
-                # Filter by both episode title AND show title to avoid conflicts with episodes from other shows
-                stream_count = MediaStreamHistory.query.filter(
-                    MediaStreamHistory.server_id == server.id,
-                    MediaStreamHistory.library_name == library.name,
-                    MediaStreamHistory.media_title == episode.get('title', ''),
-                    MediaStreamHistory.grandparent_title == media_item.title
-                ).count()
-                episode['stream_count'] = stream_count
+                episode['stream_count'] = stream_counts.get(str(episode.get('id')), 0)
         
         # Apply sorting if needed (some services might not support server-side sorting)
         # Note: This must happen AFTER stream counts are added above
@@ -850,7 +800,6 @@ def get_library_media_content(library, page=1, per_page=24, search_query='', sor
     """Get media content from the library using cached data or live API"""
     try:
         from app.models_media_services import MediaItem
-        from sqlalchemy import or_
         
         # Query MediaItem table directly for this library
         current_app.logger.debug(f"Querying MediaItem for library_id={library.id}, library_name='{library.name}', library_type='{library.library_type}'")
@@ -885,15 +834,11 @@ def get_library_media_content(library, page=1, per_page=24, search_query='', sor
         total_all_items = MediaItem.query.count()
         current_app.logger.debug(f"Total MediaItem records in database: {total_all_items}")
         
-        # Apply search filter if provided
+        # Apply search filter if provided (full-text index, see media_search)
         if search_query:
-            search_term = f"%{search_query}%"
-            query = query.filter(
-                or_(
-                    MediaItem.title.ilike(search_term),
-                    MediaItem.summary.ilike(search_term)
-                )
-            )
+            search_filter = media_search.match_filter(search_query)
+            if search_filter is not None:
+                query = query.filter(search_filter)
         
         # Apply sorting (except for stream-based sorting which needs to be done after stream counts are calculated)
         if sort_by == 'title_desc':
@@ -921,45 +866,11 @@ def get_library_media_content(library, page=1, per_page=24, search_query='', sor
             total_items = len(all_media_items)
             
             # Convert ALL MediaItem objects to dict format and add stream counts
+            stream_counts = _library_item_stream_counts(library, all_media_items)
             all_items = []
             for media_item in all_media_items:
-                item_dict = media_item.to_dict()
-                
-                # Get stream count for this media item
-                if media_item.item_type == 'show':
-                    stream_count = MediaStreamHistory.query.filter(
-                        MediaStreamHistory.server_id == library.server_id,
-                        MediaStreamHistory.library_name == library.name,
-                        MediaStreamHistory.grandparent_title == media_item.title
-                    ).count()
-                elif media_item.item_type == 'movie':
-                    stream_count = MediaStreamHistory.query.filter(
-                        MediaStreamHistory.server_id == library.server_id,
-                        MediaStreamHistory.library_name == library.name,
-                        MediaStreamHistory.media_title == media_item.title
-                    ).count()
-                elif media_item.item_type in ['artist', 'album']:
-                    if media_item.item_type == 'artist':
-                        stream_count = MediaStreamHistory.query.filter(
-                            MediaStreamHistory.server_id == library.server_id,
-                            MediaStreamHistory.library_name == library.name,
-                            MediaStreamHistory.grandparent_title == media_item.title
-                        ).count()
-                    else:  # album
-                        stream_count = MediaStreamHistory.query.filter(
-                            MediaStreamHistory.server_id == library.server_id,
-                            MediaStreamHistory.library_name == library.name,
-                            MediaStreamHistory.parent_title == media_item.title
-                        ).count()
-                else:
-                    # For other media types, try exact title match
-                    stream_count = MediaStreamHistory.query.filter(
-                        MediaStreamHistory.server_id == library.server_id,
-                        MediaStreamHistory.library_name == library.name,
-                        MediaStreamHistory.media_title == media_item.title
-                    ).count()
-                
-                item_dict['stream_count'] = stream_count
+                item_dict = media_item.to_dict(include_raw_data=False)
+                item_dict['stream_count'] = stream_counts.get(media_item.id, 0)
                 all_items.append(item_dict)
             
             # Sort ALL items by stream count
@@ -999,45 +910,11 @@ def get_library_media_content(library, page=1, per_page=24, search_query='', sor
             )
             
             # Convert MediaItem objects to dict format and add stream counts
+            stream_counts = _library_item_stream_counts(library, paginated_query.items)
             items = []
             for media_item in paginated_query.items:
-                item_dict = media_item.to_dict()
-                
-                # Get stream count for this media item
-                if media_item.item_type == 'show':
-                    stream_count = MediaStreamHistory.query.filter(
-                        MediaStreamHistory.server_id == library.server_id,
-                        MediaStreamHistory.library_name == library.name,
-                        MediaStreamHistory.grandparent_title == media_item.title
-                    ).count()
-                elif media_item.item_type == 'movie':
-                    stream_count = MediaStreamHistory.query.filter(
-                        MediaStreamHistory.server_id == library.server_id,
-                        MediaStreamHistory.library_name == library.name,
-                        MediaStreamHistory.media_title == media_item.title
-                    ).count()
-                elif media_item.item_type in ['artist', 'album']:
-                    if media_item.item_type == 'artist':
-                        stream_count = MediaStreamHistory.query.filter(
-                            MediaStreamHistory.server_id == library.server_id,
-                            MediaStreamHistory.library_name == library.name,
-                            MediaStreamHistory.grandparent_title == media_item.title
-                        ).count()
-                    else:  # album
-                        stream_count = MediaStreamHistory.query.filter(
-                            MediaStreamHistory.server_id == library.server_id,
-                            MediaStreamHistory.library_name == library.name,
-                            MediaStreamHistory.parent_title == media_item.title
-                        ).count()
-                else:
-                    # For other media types, try exact title match
-                    stream_count = MediaStreamHistory.query.filter(
-                        MediaStreamHistory.server_id == library.server_id,
-                        MediaStreamHistory.library_name == library.name,
-                        MediaStreamHistory.media_title == media_item.title
-                    ).count()
-                
-                item_dict['stream_count'] = stream_count
+                item_dict = media_item.to_dict(include_raw_data=False)
+                item_dict['stream_count'] = stream_counts.get(media_item.id, 0)
                 items.append(item_dict)
             
             return {
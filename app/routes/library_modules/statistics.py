@@ -1,9 +1,10 @@
 """Statistics and analytics functionality for libraries"""
 
 from flask import current_app
-from app.models_media_services import MediaLibrary, MediaServer, MediaStreamHistory
+from app.models_media_services import MediaLibrary, MediaServer, MediaStreamHistory, StreamHistoryRollup
 from app.models import User, UserType
 from app.extensions import db
+from app.services import library_stats_cache
 from datetime import datetime, timezone, timedelta
 
 
@@ -50,56 +51,109 @@ def get_library_media_content(library, page=1, per_page=24, search_query='', sor
         }
 
 
+def _dialect_name():
+    return db.session.get_bind().dialect.name
+
+
+def _hour_of(column):
+    """SQL expression for the hour (0-23) of a datetime column."""
+    dialect = _dialect_name()
+    if dialect == 'sqlite':
+        return db.cast(db.func.strftime('%H', column), db.Integer)
+    if dialect in ('mysql', 'mariadb'):
+        return db.func.hour(column)
+    return db.cast(db.extract('hour', column), db.Integer)
+
+
+def _weekday_of(column):
+    """SQL expression for the day of week of a datetime column, Monday = 0 like ``datetime.weekday()``."""
+    dialect = _dialect_name()
+    if dialect == 'sqlite':
+        # %w counts from Sunday = 0
+        return (db.cast(db.func.strftime('%w', column), db.Integer) + 6) % 7
+    if dialect in ('mysql', 'mariadb'):
+        return db.func.weekday(column)
+    return db.cast(db.extract('isodow', column), db.Integer) - 1
+
+
+def _day_of(column):
+    """SQL expression for the calendar date of a datetime column."""
+    if _dialect_name() in ('sqlite', 'mysql', 'mariadb'):
+        return db.func.date(column)
+    return db.cast(column, db.Date)
+
+
+def _library_window_filters(library, days):
+    """Filters selecting a library's history rows started within the last ``days`` days."""
+    end_date = datetime.now(timezone.utc).replace(tzinfo=None)
+    start_date = end_date - timedelta(days=days)
+    return (
+        MediaStreamHistory.library_id == library.id,
+        MediaStreamHistory.started_at >= start_date,
+        MediaStreamHistory.started_at <= end_date
+    )
+
+
+def get_library_daily_activity(library, start_date, end_date):
+    """
+    Plays and watch time per calendar day for a library, aggregated in SQL.
+
+    Returns ``{'YYYY-MM-DD': {'plays', 'minutes', 'seconds'}}``. ``minutes``
+    counts a stream without a known duration as one minute so it still shows
+    up in charts; ``seconds`` only counts known durations.
+    """
+    known_seconds = db.case(
+        (MediaStreamHistory.duration_seconds > 0, MediaStreamHistory.duration_seconds),
+        (MediaStreamHistory.view_offset_at_end_seconds > 0, MediaStreamHistory.view_offset_at_end_seconds),
+        else_=0
+    )
+    chart_minutes = db.case(
+        (known_seconds > 0, known_seconds / 60.0),
+        else_=1
+    )
+    day = _day_of(MediaStreamHistory.started_at).label('day')
+    rows = db.session.query(
+        day,
+        db.func.count(MediaStreamHistory.id),
+        db.func.sum(chart_minutes),
+        db.func.sum(known_seconds)
+    ).filter(
+        MediaStreamHistory.library_id == library.id,
+        MediaStreamHistory.started_at >= start_date.replace(tzinfo=None),
+        MediaStreamHistory.started_at <= end_date.replace(tzinfo=None)
+    ).group_by(day).all()
+
+    activity = {}
+    for day_value, plays, minutes, seconds in rows:
+        if day_value is None:
+            continue
+        day_key = day_value if isinstance(day_value, str) else day_value.isoformat()
+        activity[day_key] = {'plays': plays, 'minutes': float(minutes or 0), 'seconds': int(seconds or 0)}
+
+    # Days whose raw rows were archived by the retention policy
+    rollup_rows = db.session.query(
+        StreamHistoryRollup.day,
+        db.func.sum(StreamHistoryRollup.plays),
+        db.func.sum(StreamHistoryRollup.watched_seconds),
+        db.func.sum(StreamHistoryRollup.untimed_plays)
+    ).filter(
+        StreamHistoryRollup.library_id == library.id,
+        StreamHistoryRollup.day >= start_date.date(),
+        StreamHistoryRollup.day <= end_date.date()
+    ).group_by(StreamHistoryRollup.day).all()
+    for day_value, plays, seconds, untimed_plays in rollup_rows:
+        day_totals = activity.setdefault(day_value.isoformat(), {'plays': 0, 'minutes': 0.0, 'seconds': 0})
+        day_totals['plays'] += plays or 0
+        day_totals['minutes'] += (seconds or 0) / 60.0 + (untimed_plays or 0)
+        day_totals['seconds'] += int(seconds or 0)
+    return activity
+
+
 def get_advanced_library_statistics(library, days=30):
     """Get advanced statistics for a library including trending content"""
     try:
-        end_date = datetime.now(timezone.utc)
-        start_date = end_date - timedelta(days=days)
-        
-        # Get streaming statistics for this library
-        library_streams = db.session.query(MediaStreamHistory).filter(
-            MediaStreamHistory.server_id == library.server_id,
-            MediaStreamHistory.library_name == library.name,
-            MediaStreamHistory.started_at >= start_date,
-            MediaStreamHistory.started_at <= end_date
-        ).all()
-        
-        # Calculate advanced metrics
-        stats = {
-            'total_streams': len(library_streams),
-            'unique_users': len(set(stream.user_uuid for stream in library_streams if stream.user_uuid)),
-            'total_duration': sum(stream.duration_seconds or 0 for stream in library_streams),
-            'average_session_length': 0,
-            'peak_hours': {},
-            'trending_content': [],
-            'completion_rates': {}
-        }
-        
-        # Calculate average session length
-        if stats['total_streams'] > 0:
-            stats['average_session_length'] = stats['total_duration'] / stats['total_streams']
-        
-        # Calculate peak viewing hours
-        hour_counts = {}
-        for stream in library_streams:
-            hour = stream.started_at.hour
-            hour_counts[hour] = hour_counts.get(hour, 0) + 1
-        
-        stats['peak_hours'] = dict(sorted(hour_counts.items(), key=lambda x: x[1], reverse=True)[:5])
-        
-        # Get trending content (most watched in the period)
-        content_counts = {}
-        for stream in library_streams:
-            title = stream.media_title or 'Unknown'
-            content_counts[title] = content_counts.get(title, 0) + 1
-        
-        stats['trending_content'] = [
-            {'title': title, 'streams': count}
-            for title, count in sorted(content_counts.items(), key=lambda x: x[1], reverse=True)[:10]
-        ]
-        
-        return stats
-        
+        return library_stats_cache.get_or_compute(library, 'advanced', days,
+                                                  lambda: _compute_advanced_library_statistics(library, days))
     except Exception as e:
         current_app.logger.error(f"Error getting advanced library statistics: {e}")
         return {
@@ -114,51 +168,50 @@ def get_advanced_library_statistics(library, days=30):
         }
 
 
+def _compute_advanced_library_statistics(library, days):
+    window = _library_window_filters(library, days)
+
+    total_streams, unique_users, total_duration = db.session.query(
+        db.func.count(MediaStreamHistory.id),
+        db.func.count(db.func.distinct(MediaStreamHistory.user_uuid)),
+        db.func.coalesce(db.func.sum(MediaStreamHistory.duration_seconds), 0)
+    ).filter(*window).one()
+
+    stats = {
+        'total_streams': total_streams,
+        'unique_users': unique_users,
+        'total_duration': int(total_duration or 0),
+        'average_session_length': 0,
+        'peak_hours': {},
+        'trending_content': [],
+        'completion_rates': {}
+    }
+
+    # Calculate average session length
+    if stats['total_streams'] > 0:
+        stats['average_session_length'] = stats['total_duration'] / stats['total_streams']
+
+    # Peak viewing hours (top 5)
+    hour = _hour_of(MediaStreamHistory.started_at).label('hour')
+    stream_count = db.func.count(MediaStreamHistory.id)
+    peak_hours = db.session.query(hour, stream_count).filter(*window)\
+        .group_by(hour).order_by(stream_count.desc(), hour).limit(5).all()
+    stats['peak_hours'] = {int(h): count for h, count in peak_hours if h is not None}
+
+    # Trending content (most watched in the period)
+    title = db.func.coalesce(MediaStreamHistory.media_title, 'Unknown').label('title')
+    trending = db.session.query(title, stream_count).filter(*window)\
+        .group_by(title).order_by(stream_count.desc(), title).limit(10).all()
+    stats['trending_content'] = [{'title': t, 'streams': count} for t, count in trending]
+
+    return stats
+
+
 def generate_library_activity_heatmap(library, days=30):
     """Generate heatmap data for library activity by day and hour"""
     try:
-        end_date = datetime.now(timezone.utc)
-        start_date = end_date - timedelta(days=days)
-        
-        # Get all streams for the library in the time period
-        streams = db.session.query(MediaStreamHistory).filter(
-            MediaStreamHistory.server_id == library.server_id,
-            MediaStreamHistory.library_name == library.name,
-            MediaStreamHistory.started_at >= start_date,
-            MediaStreamHistory.started_at <= end_date
-        ).all()
-        
-        # Initialize heatmap data structure
-        heatmap_data = {}
-        for day in range(7):  # 0 = Monday, 6 = Sunday
-            heatmap_data[day] = {}
-            for hour in range(24):
-                heatmap_data[day][hour] = 0
-        
-        # Populate heatmap with stream counts
-        for stream in streams:
-            day_of_week = stream.started_at.weekday()  # 0 = Monday
-            hour = stream.started_at.hour
-            heatmap_data[day_of_week][hour] += 1
-        
-        # Convert to format suitable for frontend visualization
-        heatmap_array = []
-        day_names = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-        
-        for day in range(7):
-            for hour in range(24):
-                heatmap_array.append({
-                    'day': day_names[day],
-                    'hour': hour,
-                    'value': heatmap_data[day][hour]
-                })
-        
-        return {
-            'heatmap_data': heatmap_array,
-            'max_value': max(item['value'] for item in heatmap_array) if heatmap_array else 0,
-            'total_streams': len(streams)
-        }
-        
+        return library_stats_cache.get_or_compute(library, 'heatmap', days,
+                                                  lambda: _compute_library_activity_heatmap(library, days))
     except Exception as e:
         current_app.logger.error(f"Error generating library activity heatmap: {e}")
         return {
@@ -169,60 +222,37 @@ def generate_library_activity_heatmap(library, days=30):
         }
 
 
+def _compute_library_activity_heatmap(library, days):
+    weekday = _weekday_of(MediaStreamHistory.started_at).label('weekday')
+    hour = _hour_of(MediaStreamHistory.started_at).label('hour')
+    cells = db.session.query(weekday, hour, db.func.count(MediaStreamHistory.id))\
+        .filter(*_library_window_filters(library, days))\
+        .group_by(weekday, hour).all()
+    counts = {(int(d), int(h)): count for d, h, count in cells if d is not None and h is not None}
+
+    # Convert to format suitable for frontend visualization, 0 = Monday
+    heatmap_array = []
+    day_names = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+    for day in range(7):
+        for hour_of_day in range(24):
+            heatmap_array.append({
+                'day': day_names[day],
+                'hour': hour_of_day,
+                'value': counts.get((day, hour_of_day), 0)
+            })
+
+    return {
+        'heatmap_data': heatmap_array,
+        'max_value': max(item['value'] for item in heatmap_array),
+        'total_streams': sum(counts.values())
+    }
+
+
 def get_library_user_engagement_metrics(library, days=30):
     """Get detailed user engagement metrics for a library"""
     try:
-        end_date = datetime.now(timezone.utc)
-        start_date = end_date - timedelta(days=days)
-        
-        # Get user engagement data
-        user_metrics = db.session.query(
-            MediaStreamHistory.user_uuid,
-            db.func.count(MediaStreamHistory.id).label('session_count'),
-            db.func.sum(MediaStreamHistory.duration_seconds).label('total_watch_time'),
-            db.func.avg(MediaStreamHistory.duration_seconds).label('avg_session_length'),
-            db.func.count(db.func.distinct(MediaStreamHistory.media_title)).label('unique_content_watched'),
-            db.func.max(MediaStreamHistory.started_at).label('last_activity')
-        ).filter(
-            MediaStreamHistory.server_id == library.server_id,
-            MediaStreamHistory.library_name == library.name,
-            MediaStreamHistory.started_at >= start_date,
-            MediaStreamHistory.started_at <= end_date,
-            MediaStreamHistory.user_uuid.isnot(None)
-        ).group_by(MediaStreamHistory.user_uuid).all()
-        
-        # Process metrics
-        engagement_data = []
-        for metric in user_metrics:
-            # Get user info
-            user = User.query.filter_by(uuid=metric.user_uuid).first()
-            
-            engagement_data.append({
-                'user_uuid': metric.user_uuid,
-                'username': user.localUsername if user else 'Unknown User',
-                'session_count': metric.session_count,
-                'total_watch_time': metric.total_watch_time or 0,
-                'avg_session_length': metric.avg_session_length or 0,
-                'unique_content_watched': metric.unique_content_watched,
-                'last_activity': metric.last_activity,
-                'engagement_score': calculate_engagement_score(
-                    metric.session_count,
-                    metric.total_watch_time or 0,
-                    metric.unique_content_watched,
-                    days
-                )
-            })
-        
-        # Sort by engagement score
-        engagement_data.sort(key=lambda x: x['engagement_score'], reverse=True)
-        
-        return {
-            'user_metrics': engagement_data,
-            'total_active_users': len(engagement_data),
-            'avg_sessions_per_user': sum(u['session_count'] for u in engagement_data) / len(engagement_data) if engagement_data else 0,
-            'avg_watch_time_per_user': sum(u['total_watch_time'] for u in engagement_data) / len(engagement_data) if engagement_data else 0
-        }
-        
+        return library_stats_cache.get_or_compute(library, 'engagement', days,
+                                                  lambda: _compute_library_user_engagement_metrics(library, days))
     except Exception as e:
         current_app.logger.error(f"Error getting user engagement metrics: {e}")
         return {
@@ -234,6 +264,55 @@ def get_library_user_engagement_metrics(library, days=30):
         }
 
 
+def _compute_library_user_engagement_metrics(library, days):
+    # Per-user aggregates with the user's name joined in, one query for all users
+    user_metrics = db.session.query(
+        MediaStreamHistory.user_uuid,
+        User.localUsername,
+        User.external_username,
+        db.func.count(MediaStreamHistory.id).label('session_count'),
+        db.func.sum(MediaStreamHistory.duration_seconds).label('total_watch_time'),
+        db.func.avg(MediaStreamHistory.duration_seconds).label('avg_session_length'),
+        db.func.count(db.func.distinct(MediaStreamHistory.media_title)).label('unique_content_watched'),
+        db.func.max(MediaStreamHistory.started_at).label('last_activity')
+    ).outerjoin(
+        User, User.uuid == MediaStreamHistory.user_uuid
+    ).filter(
+        *_library_window_filters(library, days),
+        MediaStreamHistory.user_uuid.isnot(None)
+    ).group_by(
+        MediaStreamHistory.user_uuid, User.localUsername, User.external_username
+    ).all()
+
+    engagement_data = []
+    for metric in user_metrics:
+        engagement_data.append({
+            'user_uuid': metric.user_uuid,
+            'username': metric.localUsername or metric.external_username or 'Unknown User',
+            'session_count': metric.session_count,
+            'total_watch_time': metric.total_watch_time or 0,
+            'avg_session_length': metric.avg_session_length or 0,
+            'unique_content_watched': metric.unique_content_watched,
+            'last_activity': metric.last_activity,
+            'engagement_score': calculate_engagement_score(
+                metric.session_count,
+                metric.total_watch_time or 0,
+                metric.unique_content_watched,
+                days
+            )
+        })
+
+    # Sort by engagement score
+    engagement_data.sort(key=lambda x: x['engagement_score'], reverse=True)
+
+    return {
+        'user_metrics': engagement_data,
+        'total_active_users': len(engagement_data),
+        'avg_sessions_per_user': sum(u['session_count'] for u in engagement_data) / len(engagement_data) if engagement_data else 0,
+        'avg_watch_time_per_user': sum(u['total_watch_time'] for u in engagement_data) / len(engagement_data) if engagement_data else 0
+    }
+
+
 def calculate_engagement_score(session_count, total_watch_time, unique_content, days):
     """Calculate a user engagement score based on various factors"""
     try:
@@ -271,8 +350,7 @@ def get_content_performance_metrics(library, days=30):
             db.func.avg(MediaStreamHistory.duration_seconds).label('avg_watch_time'),
             db.func.max(MediaStreamHistory.started_at).label('last_watched')
         ).filter(
-            MediaStreamHistory.server_id == library.server_id,
-            MediaStreamHistory.library_name == library.name,
+            MediaStreamHistory.library_id == library.id,
             MediaStreamHistory.started_at >= start_date,
             MediaStreamHistory.started_at <= end_date,
             MediaStreamHistory.media_title.isnot(None)
@@ -0,0 +1,35 @@
+# File: app/routes/metrics.py
+import hmac
+
+from flask import Blueprint, Response, abort, current_app, request
+from flask_login import current_user
+
+from app.models import UserType
+from app.services import metrics
+
+bp = Blueprint('metrics', __name__)
+
+
+def _authorized():
+    """A scraper with the METRICS_TOKEN bearer token, or a signed-in admin."""
+    token = current_app.config.get('METRICS_TOKEN')
+    authorization = request.headers.get('Authorization', '')
+    if token and authorization.startswith('Bearer ') and hmac.compare_digest(authorization[7:].strip(), token):
+        return True
+    if not current_user.is_authenticated:
+        return False
+    if current_user.userType == UserType.OWNER:
+        return True
+    return current_user.userType == UserType.LOCAL and current_user.has_permission('manage_advanced_settings')
+
+
+@bp.route('/metrics')
+def prometheus():
+    """Metrics of this process in the Prometheus text format."""
+    if not metrics.enabled():
+        abort(404)
+    if not _authorized():
+        return Response("Unauthorized\n", status=401, mimetype='text/plain',
+                        headers={'WWW-Authenticate': 'Bearer realm="metrics"'})
+    return Response(metrics.render_text(), mimetype='text/plain; version=0.0.4; charset=utf-8',
+                    headers={'Cache-Control': 'no-store'})
@@ -178,6 +178,9 @@ def edit_server(plugin_id, server_id):
             server.is_active = form.is_active.data
             
             db.session.commit()
+            # Cached Overseerr users and media details may belong to the previous URL or key
+            from app.services import overseerr_service
+            overseerr_service.clear_caches()
             
             log_event(
                 EventType.SETTING_CHANGE,
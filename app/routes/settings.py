@@ -12,8 +12,9 @@ from app.forms import (
     GeneralSettingsForm, DiscordConfigForm, SetPasswordForm, ChangePasswordForm, TimezonePreferenceForm, AdvancedSettingsForm
 )
 from app.extensions import db
-from app.utils.helpers import log_event, setup_required, permission_required
-from app.services import history_service
+from app.utils.helpers import log_event, setup_required, permission_required, conditional_response
+from app.utils import sql_profiler
+from app.services import history_service, metrics
 import json
 from datetime import datetime 
 
@@ -410,24 +411,25 @@ def _get_history_logs_query():
     query = HistoryLog.query
     search_message = request.args.get('search_message')
     event_type_filter = request.args.get('event_type')
-    related_user_filter = request.args.get('related_user')
+    related_user_filter = (request.args.get('related_user') or '').strip()
 
-    if search_message: query = query.filter(HistoryLog.message.ilike(f"%{search_message}%"))
+    if search_message:
+        search_condition = history_service.message_filter(search_message)
+        if search_condition is not None: query = query.filter(search_condition)
     if event_type_filter:
         try: query = query.filter(HistoryLog.event_type == EventType[event_type_filter])
         except KeyError: flash(f"Invalid event type filter: {event_type_filter}", "warning") # Flash won't show on partial
     if related_user_filter:
-        from sqlalchemy import or_ 
-        query = query.join(Owner, User.id == HistoryLog.admin_id, isouter=True) \
-                     .join(Owner, User.id == HistoryLog.owner_id, isouter=True) \
-                     .join(User, User.id == HistoryLog.linkedUserId, isouter=True) \
-                     .filter(or_(
-                         User.localUsername.ilike(f"%{related_user_filter}%"), 
-                         User.plex_username.ilike(f"%{related_user_filter}%"), 
-                         User.localUsername.ilike(f"%{related_user_filter}%"), 
-                         HistoryLog.owner_id.cast(db.String).ilike(f"%{related_user_filter}%"), 
-                         HistoryLog.linkedUserId.cast(db.String).ilike(f"%{related_user_filter}%")
-                     ))
+        from sqlalchemy import or_
+        matching_users = db.session.query(User.id).filter(or_(
+            User.localUsername.ilike(f"%{related_user_filter}%"),
+            User.external_username.ilike(f"%{related_user_filter}%"),
+            User.plex_username.ilike(f"%{related_user_filter}%")
+        ))
+        user_conditions = [HistoryLog.owner_id.in_(matching_users), HistoryLog.local_user_id.in_(matching_users)]
+        if related_user_filter.isdigit():
+            user_conditions += [HistoryLog.owner_id == int(related_user_filter), HistoryLog.local_user_id == int(related_user_filter)]
+        query = query.filter(or_(*user_conditions))
     return query
 
 @bp.route('/logs/clear', methods=['POST'])
@@ -514,10 +516,19 @@ def logs():
                            event_types=event_types,
                            active_tab='logs')
 
+def _logs_version():
+    """
+    Newest and oldest log ids (new events, clears and retention all move one),
+    the per-page choice, and the minute, since rows show "5 minutes ago".
+    """
+    newest_id, oldest_id = db.session.query(db.func.max(HistoryLog.id), db.func.min(HistoryLog.id)).one()
+    return newest_id, oldest_id, session.get('logs_list_per_page'), datetime.utcnow().strftime('%Y%m%d%H%M')
+
 @bp.route('/logs/partial')
 @login_required
 @setup_required
 @permission_required('view_logs') # Renamed permission
+@conditional_response(_logs_version)
 def logs_partial():
     page = request.args.get('page', 1, type=int)
     session_per_page_key = 'logs_list_per_page' # New session key
@@ -533,8 +544,11 @@ def logs_partial():
             items_per_page = default_per_page
             session[session_per_page_key] = items_per_page
 
-    query = _get_history_logs_query() # This helper function can be reused as is
-    logs = query.order_by(HistoryLog.timestamp.desc()).paginate(page=page, per_page=items_per_page, error_out=False)
+    query = _get_history_logs_query()
+    # Previous/Next links carry (timestamp, id) cursors and the total, so deep pages cost the same as the first
+    logs = history_service.paginate_history_logs(query, page=page, per_page=items_per_page,
+                                                 after=request.args.get('after'), before=request.args.get('before'),
+                                                 total=request.args.get('total', type=int))
     event_types = list(EventType) 
     
     # This now renders the new partial for the log list content
@@ -612,6 +626,41 @@ def api_debug():
                          servers=servers)
 
 
+@bp.route('/metrics')
+@login_required
+@setup_required
+@permission_required('manage_advanced_settings')
+def metrics_page():
+    """Where time goes: media service calls, queries per endpoint, scheduled jobs and caches of this worker"""
+    return render_template('settings/index.html',
+                         title="Metrics",
+                         active_tab='metrics',
+                         metrics=metrics.summary(),
+                         metrics_token_set=bool(current_app.config.get('METRICS_TOKEN')))
+
+
+@bp.route('/api_debug/sql_profile')
+@login_required
+@setup_required
+@permission_required('manage_advanced_settings')
+def sql_profile_partial():
+    """SQL profiles of the last requests handled by this worker (SQL_PROFILER_ENABLED)"""
+    return render_template('settings/api_debug/_partials/sql_profile.html',
+                         profiler_enabled=sql_profiler.enabled(),
+                         profiles=sql_profiler.recent_profiles(),
+                         n1_threshold=current_app.config.get('SQL_PROFILER_N1_THRESHOLD', 5),
+                         slow_request_ms=current_app.config.get('SQL_PROFILER_SLOW_REQUEST_MS', 500))
+
+
+@bp.route('/api_debug/sql_profile/clear', methods=['POST'])
+@login_required
+@setup_required
+@permission_required('manage_advanced_settings')
+def sql_profile_clear():
+    sql_profiler.clear_profiles()
+    return sql_profile_partial()
+
+
 @bp.route('/api_debug_execute', methods=['POST'])
 @login_required
 @setup_required
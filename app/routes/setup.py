@@ -2,8 +2,6 @@
 import uuid
 from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, session, g
 from flask_login import login_user, logout_user, current_user, login_required
-from plexapi.exceptions import Unauthorized, NotFound, PlexApiException
-from plexapi.myplex import MyPlexAccount 
 import secrets
 import urllib.parse 
 from app.models import User, UserType, Setting, EventType, SettingValueType
@@ -57,6 +55,7 @@ def check_setup_status_for_blueprint():
 
 @bp.route('/account', methods=['GET', 'POST'])
 def account_setup():
+    from plexapi.exceptions import PlexApiException
     form = AccountSetupForm()
     error_message = None # Initialize error_message
 
@@ -211,6 +210,8 @@ def account_setup():
 
 @bp.route('/plex_sso_callback_setup_admin') 
 def plex_sso_callback_setup_admin():
+    from plexapi.myplex import MyPlexAccount
+    from plexapi.exceptions import PlexApiException
     # Debug session contents
     current_app.logger.info(f"Plex SSO Callback (Setup): Session keys: {list(session.keys())}")
     current_app.logger.info(f"Plex SSO Callback (Setup): Full session: {dict(session)}")
@@ -1,8 +1,10 @@
-from flask import Blueprint, render_template, request, current_app, flash, redirect, url_for
+import json
+import time
+from flask import Blueprint, render_template, request, current_app, flash, redirect, url_for, Response, stream_with_context
 from flask_login import login_required, current_user
-from app.utils.helpers import setup_required, permission_required
-from app.services.media_service_manager import MediaServiceManager
-from app.services.media_service_factory import MediaServiceFactory
+from app.utils.helpers import setup_required, permission_required, conditional_response
+from app.services import session_feed
+from app.extensions import db
 from app.models import User, UserType, Setting
 
 bp = Blueprint('streaming', __name__)
@@ -39,10 +41,19 @@ def index():
                            title="Active Streams", 
                            streaming_refresh_interval=streaming_refresh_interval_seconds)
 
+def _sessions_partial_version():
+    """Version of the current session snapshot, or None if the partial will take a new one."""
+    session_feed.note_demand()  # Also on 304s, so the monitor keeps publishing
+    if request.args.get('refresh'):
+        return None
+    snapshot = session_feed.current(max_age_seconds=session_feed.fresh_age_seconds())
+    return snapshot.version if snapshot else None
+
 @bp.route('/streaming/partial')
 @login_required
 @setup_required
 @permission_required('view_streaming')
+@conditional_response(_sessions_partial_version)
 def sessions_partial():
     # Redirect UserAppAccess without admin permissions away from admin pages
     if current_user.userType == UserType.LOCAL and not current_user.has_permission('view_streaming'):
@@ -50,146 +61,102 @@ def sessions_partial():
         return redirect(url_for('user.index'))
     
     view_mode = request.args.get('view', 'merged')
-    
-    active_sessions_data = []
-    sessions_by_server = {}  # For categorized view
-    sessions_by_service = {}  # For service view
-    summary_stats = {
-        "total_streams": 0,
-        "direct_play_count": 0,
-        "transcode_count": 0,
-        "total_bandwidth_mbps": 0.0,
-        "lan_bandwidth_mbps": 0.0,
-        "wan_bandwidth_mbps": 0.0
-    }
-
-    try:
-        # Get formatted sessions from all services using the new service methods
-        all_servers = MediaServiceManager.get_all_servers()
-        
-        for server in all_servers:
-            service = MediaServiceFactory.create_service_from_db(server)
-            if service:
-                try:
-                    # Use the service's get_formatted_sessions method
-                    formatted_sessions = service.get_formatted_sessions()
-                    active_sessions_data.extend(formatted_sessions)
-                except Exception as e:
-                    current_app.logger.error(f"Error getting formatted sessions from {server.server_nickname}: {e}")
 
-        # Calculate summary statistics from formatted sessions
-        summary_stats["total_streams"] = len(active_sessions_data)
-        
-        for session in active_sessions_data:
-            # Count transcoding vs direct play
-            if session.get('is_transcode_calc', False):
-                summary_stats["transcode_count"] += 1
-            else:
-                summary_stats["direct_play_count"] += 1
-            
-            # Calculate bandwidth
-            bitrate_calc = session.get('bitrate_calc', 0)
-            bitrate_mbps = bitrate_calc / 1000.0 if bitrate_calc else 0.0  # Convert kbps to Mbps
-            summary_stats["total_bandwidth_mbps"] += bitrate_mbps
-            
-            # LAN vs WAN bandwidth
-            if session.get('location_type_calc') == 'LAN':
-                summary_stats["lan_bandwidth_mbps"] += bitrate_mbps
-            else:
-                summary_stats["wan_bandwidth_mbps"] += bitrate_mbps
-            
-            # Group sessions for different view modes
-            server_name = session.get('server_name', 'Unknown Server')
-            service_type = session.get('service_type', 'unknown')
-            
-            # Initialize server grouping for categorized view
-            if view_mode == 'categorized':
-                if server_name not in sessions_by_server:
-                    sessions_by_server[server_name] = {
-                        'sessions': [],
-                        'stats': {
-                            'total_streams': 0,
-                            'direct_play_count': 0,
-                            'transcode_count': 0,
-                            'total_bandwidth_mbps': 0.0,
-                            'lan_bandwidth_mbps': 0.0,
-                            'wan_bandwidth_mbps': 0.0
-                        }
-                    }
-                sessions_by_server[server_name]['sessions'].append(session)
-                sessions_by_server[server_name]['stats']['total_streams'] += 1
-                
-                if session.get('is_transcode_calc', False):
-                    sessions_by_server[server_name]['stats']['transcode_count'] += 1
-                else:
-                    sessions_by_server[server_name]['stats']['direct_play_count'] += 1
-                
-                sessions_by_server[server_name]['stats']['total_bandwidth_mbps'] += bitrate_mbps
-                if session.get('location_type_calc') == 'LAN':
-                    sessions_by_server[server_name]['stats']['lan_bandwidth_mbps'] += bitrate_mbps
-                else:
-                    sessions_by_server[server_name]['stats']['wan_bandwidth_mbps'] += bitrate_mbps
-            
-            # Initialize service grouping for service view
-            elif view_mode == 'service':
-                service_display_name = service_type.title()
-                if service_display_name not in sessions_by_service:
-                    sessions_by_service[service_display_name] = {
-                        'sessions': [],
-                        'stats': {
-                            'total_streams': 0,
-                            'direct_play_count': 0,
-                            'transcode_count': 0,
-                            'total_bandwidth_mbps': 0.0,
-                            'lan_bandwidth_mbps': 0.0,
-                            'wan_bandwidth_mbps': 0.0
-                        }
-                    }
-                sessions_by_service[service_display_name]['sessions'].append(session)
-                sessions_by_service[service_display_name]['stats']['total_streams'] += 1
-                
-                if session.get('is_transcode_calc', False):
-                    sessions_by_service[service_display_name]['stats']['transcode_count'] += 1
-                else:
-                    sessions_by_service[service_display_name]['stats']['direct_play_count'] += 1
-                
-                sessions_by_service[service_display_name]['stats']['total_bandwidth_mbps'] += bitrate_mbps
-                if session.get('location_type_calc') == 'LAN':
-                    sessions_by_service[service_display_name]['stats']['lan_bandwidth_mbps'] += bitrate_mbps
-                else:
-                    sessions_by_service[service_display_name]['stats']['wan_bandwidth_mbps'] += bitrate_mbps
-        
-        # Round bandwidth values for display
-        summary_stats["total_bandwidth_mbps"] = round(summary_stats["total_bandwidth_mbps"], 1)
-        summary_stats["lan_bandwidth_mbps"] = round(summary_stats["lan_bandwidth_mbps"], 1)
-        summary_stats["wan_bandwidth_mbps"] = round(summary_stats["wan_bandwidth_mbps"], 1)
+    # The session monitor publishes a snapshot every tick while the page is open; only query
+    # the servers here if it hasn't lately (or on "Refresh Now")
+    snapshot = None
+    if not request.args.get('refresh'):
+        snapshot = session_feed.current(max_age_seconds=session_feed.fresh_age_seconds())
+    if snapshot is None:
+        try:
+            snapshot = session_feed.refresh()
+        except Exception as e:
+            current_app.logger.debug(f"Error during streaming_sessions_partial: {e}", exc_info=True)
+            snapshot = session_feed.current()
+    active_sessions_data = snapshot.sessions if snapshot else []
+    feed_version = snapshot.version if snapshot else 0
 
-        # Round server-specific bandwidth values
-        if view_mode == 'categorized':
-            for server_data in sessions_by_server.values():
-                server_data['stats']['total_bandwidth_mbps'] = round(server_data['stats']['total_bandwidth_mbps'], 1)
-                server_data['stats']['lan_bandwidth_mbps'] = round(server_data['stats']['lan_bandwidth_mbps'], 1)
-                server_data['stats']['wan_bandwidth_mbps'] = round(server_data['stats']['wan_bandwidth_mbps'], 1)
-        
-        # Round service-specific bandwidth values
-        elif view_mode == 'service':
-            for service_data in sessions_by_service.values():
-                service_data['stats']['total_bandwidth_mbps'] = round(service_data['stats']['total_bandwidth_mbps'], 1)
-                service_data['stats']['lan_bandwidth_mbps'] = round(service_data['stats']['lan_bandwidth_mbps'], 1)
-                service_data['stats']['wan_bandwidth_mbps'] = round(service_data['stats']['wan_bandwidth_mbps'], 1)
-
-    except Exception as e:
-        current_app.logger.debug(f"Error during streaming_sessions_partial: {e}", exc_info=True)
+    summary_stats, groups = session_feed.summarize(active_sessions_data, view_mode)
     
     if view_mode == 'categorized':
         return render_template('streaming/_partials/sessions_categorized.html', 
-                               sessions_by_server=sessions_by_server, 
-                               summary_stats=summary_stats)
+                               sessions_by_server=groups, 
+                               summary_stats=summary_stats,
+                               feed_version=feed_version)
     elif view_mode == 'service':
         return render_template('streaming/_partials/sessions_categorized_by_service.html', 
-                               sessions_by_service=sessions_by_service, 
-                               summary_stats=summary_stats)
+                               sessions_by_service=groups, 
+                               summary_stats=summary_stats,
+                               feed_version=feed_version)
     else:
         return render_template('streaming/_partials/sessions.html', 
                                sessions=active_sessions_data, 
-                               summary_stats=summary_stats)
\ No newline at end of file
+                               summary_stats=summary_stats,
+                               feed_version=feed_version)
+
+@bp.route('/streaming/events')
+@login_required
+@setup_required
+@permission_required('view_streaming')
+def session_events():
+    """
+    Server-Sent Events: session changes since the version the page rendered.
+
+    Sends a ``delta`` event (JSON with the added, updated and removed session
+    cards and the summary line if it changed) whenever the monitor publishes a
+    changed snapshot, and ``reload`` when the page should fetch the partial
+    again (the version is too old, or the categorized layout changed).
+    """
+    view_mode = request.args.get('view', 'merged')
+    since = request.headers.get('Last-Event-ID') or request.args.get('since', '')
+    if not session_feed.acquire_listener():
+        return Response("Too many live streaming pages open", status=503, mimetype='text/plain')
+
+    keepalive_seconds = current_app.config.get('STREAMING_EVENTS_KEEPALIVE_SECONDS', 25)
+    max_seconds = current_app.config.get('STREAMING_EVENTS_MAX_SECONDS', 600)
+    card_template = 'streaming/_partials/session_card.html' if view_mode == 'merged' else 'streaming/_partials/session_card_grouped.html'
+
+    def event(name, data, event_id=None):
+        lines = f"id: {event_id}\n" if event_id is not None else ""
+        return lines + f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+    def generate():
+        version = int(since) if since.isdigit() else None
+        state = session_feed.state_at(version) if version is not None else None
+        yield "retry: 5000\n\n"
+        if state is None:
+            yield event('reload', {})
+            return
+        fingerprints, summary_fingerprint = state
+        deadline = time.monotonic() + max_seconds
+        while time.monotonic() < deadline:
+            db.session.rollback()  # End the read transaction before waiting; objects reload on next use
+            snapshot = session_feed.wait_for_change(version, keepalive_seconds)
+            if snapshot is None or snapshot.version == version:
+                yield ": keepalive\n\n"
+                continue
+            added, updated, removed = session_feed.diff(fingerprints, snapshot)
+            summary_changed = snapshot.summary_fingerprint != summary_fingerprint
+            layout_changed = (added or removed or summary_changed) if view_mode != 'merged' \
+                else bool(added or removed) and (not fingerprints or not snapshot.fingerprints)
+            if layout_changed:
+                yield event('reload', {}, snapshot.version)
+                return
+            sessions = snapshot.by_id()
+            delta = {
+                'version': snapshot.version,
+                'added': [{'id': feed_id, 'html': render_template(card_template, session=sessions[feed_id])} for feed_id in added],
+                'updated': [{'id': feed_id, 'html': render_template(card_template, session=sessions[feed_id])} for feed_id in updated],
+                'removed': removed,
+                'summary': render_template('streaming/_partials/session_summary.html',
+                                           summary_stats=session_feed.summarize(snapshot.sessions, view_mode)[0],
+                                           grouped=view_mode != 'merged') if summary_changed else None
+            }
+            yield event('delta', delta, snapshot.version)
+            version, fingerprints, summary_fingerprint = snapshot.version, snapshot.fingerprints, snapshot.summary_fingerprint
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Don't let a reverse proxy buffer the stream
+    response.call_on_close(session_feed.release_listener)
+    return response
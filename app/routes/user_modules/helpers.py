@@ -532,10 +532,11 @@ def get_libraries_from_database(servers):
     return libraries_by_server
 
 
-def _get_local_user_avatar_url(app_user):
+def _get_local_user_avatar_url(app_user, access_records=None):
     """Get avatar URL for local users by checking their linked media access accounts"""
-    # Get all media access records for this local user
-    access_records = User.query.filter_by(userType=UserType.SERVICE).filter_by(linkedUserId=app_user.uuid).all()
+    # Get all media access records for this local user unless the caller already loaded them
+    if access_records is None:
+        access_records = User.query.filter_by(userType=UserType.SERVICE).filter_by(linkedUserId=app_user.uuid).all()
     
     for access in access_records:
         # First check for external avatar URL
@@ -5,9 +5,11 @@ from flask import render_template, redirect, url_for, flash, request, current_ap
 from flask_login import login_required, current_user
 from datetime import datetime, timezone, timedelta
 from app.models import User, UserType, EventType
-from app.models_media_services import MediaStreamHistory
+from app.models_media_services import MediaStreamHistory, StreamHistoryRollup
+from app.models_payloads import delete_payloads
 from app.extensions import db
 from app.utils.helpers import permission_required, log_event
+from app.services import activity_summary_service, library_stats_cache
 from . import user_bp
 import urllib.parse
 import json
@@ -88,9 +90,12 @@ def delete_stream_history(username=None, server_nickname=None, server_username=N
             total_count = direct_count + linked_count
             
             # Delete the records
+            delete_payloads(MediaStreamHistory, query.with_entities(MediaStreamHistory.id))
+            delete_payloads(MediaStreamHistory, linked_query.with_entities(MediaStreamHistory.id))
             query.delete(synchronize_session=False)
             linked_query.delete(synchronize_session=False)
             
+            affected_uuids = [user.uuid] + linked_uuids
             log_message = f"Deleted {total_count} streaming history records for user '{user.get_display_name()}'"
             
         else:  # user_media_access
@@ -104,14 +109,26 @@ def delete_stream_history(username=None, server_nickname=None, server_username=N
             
             # Count and delete
             count = query.count()
+            delete_payloads(MediaStreamHistory, query.with_entities(MediaStreamHistory.id))
             query.delete(synchronize_session=False)
             
+            affected_uuids = [access.uuid]
             log_message = f"Deleted {count} streaming history records for service user '{access.external_username}' on {server.server_nickname}"
         
+        # Plays the retention policy already archived live on as daily rollups; drop the deleted period's too.
+        # A rollup day counts as "older than" the threshold when it starts before it
+        rollups = StreamHistoryRollup.query.filter(StreamHistoryRollup.user_uuid.in_(affected_uuids))
+        if date_threshold:
+            rollups = rollups.filter(StreamHistoryRollup.day <= date_threshold.date())
+        rollups.delete(synchronize_session=False)
+
+        # Keep the per-user activity summary in line with the remaining history
+        activity_summary_service.rebuild_activity_summaries(affected_uuids, commit=False)
         db.session.commit()
+        library_stats_cache.invalidate_all()
         
         # Log the action
-        log_event(EventType.USER_EDIT, log_message, admin_id=current_user.id)
+        log_event(EventType.SETTING_CHANGE, log_message, admin_id=current_user.id)
         
         current_app.logger.info(log_message)
         
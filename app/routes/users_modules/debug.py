@@ -4,6 +4,7 @@
 from flask import render_template, request, current_app
 from flask_login import login_required, current_user
 from app.utils.helpers import permission_required
+from app.models_payloads import prefetch_payloads
 from . import users_bp
 
 
@@ -80,6 +81,8 @@ def get_user_debug_info(user_uuid):
         else:
             # For regular users, query by linkedUserId using actual_id
             user_accesses = User.query.filter_by(userType=UserType.SERVICE).filter_by(linkedUserId=actual_id).all()
+        # The raw payloads live in raw_payloads; load them in one query for the modal
+        prefetch_payloads(user_accesses, 'user_raw_data')
         
         has_service_data = False
         for access in user_accesses:
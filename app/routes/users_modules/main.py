@@ -3,13 +3,14 @@
 
 from flask import render_template, request, current_app, session, make_response, redirect, url_for, flash 
 from flask_login import login_required, current_user
-from sqlalchemy import or_, func, desc
+from sqlalchemy import func, desc
 from app.models import User, UserType, Setting, EventType
-from app.models_media_services import ServiceType, MediaStreamHistory
+from app.models_media_services import ServiceType
+from app.models_payloads import prefetch_payloads
 from app.forms import MassUserEditForm, UserEditForm
 from app.extensions import db
 from app.utils.helpers import log_event, setup_required, permission_required
-from app.services import user_service
+from app.services import user_list_service, activity_summary_service
 from app.services.unified_user_service import UnifiedUserService
 from app.services.media_service_manager import MediaServiceManager
 from app.services.media_service_factory import MediaServiceFactory
@@ -17,7 +18,42 @@ from app.routes.user_modules.helpers import get_libraries_from_database, _get_lo
 from . import users_bp
 import json
 import time
-from datetime import datetime, timezone, timedelta
+from datetime import timedelta
+
+
+class ServiceUserListItem:
+    """Presents a SERVICE user row with the attributes the user cards and table expect"""
+    _user_type = 'service'
+    _is_standalone = True
+
+    def __init__(self, access):
+        self.uuid = access.uuid
+        self.id = access.id
+        self.localUsername = access.external_username or 'Unknown'
+        self.email = access.external_email
+        self.notes = access.notes
+        self.created_at = access.created_at
+        self.last_login_at = access.last_activity_at
+        self.media_accesses = [access]
+        self.access_expires_at = access.access_expires_at
+        self.discord_user_id = access.discord_user_id
+        self.is_active = access.is_active
+        self._access_record = access
+        self.is_home_user = access.is_home_user
+        self.shares_back = access.shares_back
+        self.is_purge_whitelisted = access.is_purge_whitelisted
+        self.plex_join_date = access.service_join_date or access.created_at
+        self.avatar_url = access.external_avatar_url
+        self.last_streamed_at = getattr(access, 'last_streamed_at', None)
+        # Add template compatibility attributes
+        self.server = access.server
+        self.external_username = access.external_username
+
+    def get_display_name(self):
+        return self._access_record.external_username or 'Unknown'
+
+    def get_avatar(self, default_url=None):
+        return default_url
 
 
 @users_bp.route('/')
@@ -83,202 +119,67 @@ def list_users():
     media_service_manager = MediaServiceManager()
     all_servers = media_service_manager.get_all_servers()
     
-    # Get both local users and service users
-    current_app.logger.info(f"=== USERS LIST DEBUG: Loading users page ===")
-    current_app.logger.info(f"User type filter: {user_type_filter}")
-    current_app.logger.info(f"Search filters - username: '{search_username}', email: '{search_email}', notes: '{search_notes}', term: '{search_term}'")
+    current_app.logger.debug(f"Users list: type={user_type_filter}, search username='{search_username}', email='{search_email}', notes='{search_notes}', term='{search_term}'")
+    
+    # Filters, search, sort and pagination are all resolved in SQL - only the current page is loaded
+    sort_by_param = request.args.get('sort_by', 'username_asc')
+    users_query = user_list_service.build_users_query(
+        user_type_filter=user_type_filter,
+        server_id=request.args.get('server_id', 'all'),
+        search_username=search_username,
+        search_email=search_email,
+        search_notes=search_notes,
+        search_term=search_term
+    )
+    users_pagination = user_list_service.paginate_users(
+        users_query,
+        sort_by_param=sort_by_param,
+        page=page,
+        per_page=items_per_page,
+        after=request.args.get('after'),
+        before=request.args.get('before')
+    )
+    total_users = users_pagination.total
+    
+    # Batch-load the service accounts linked to the local users on this page
+    page_local_uuids = [u.uuid for u in users_pagination.items if u.userType == UserType.LOCAL]
+    linked_by_local_uuid = {local_uuid: [] for local_uuid in page_local_uuids}
+    if page_local_uuids:
+        linked_rows = User.query.filter(
+            User.userType == UserType.SERVICE,
+            User.linkedUserId.in_(page_local_uuids)
+        ).all()
+        for linked_user in linked_rows:
+            linked_by_local_uuid[linked_user.linkedUserId].append(linked_user)
+    else:
+        linked_rows = []
+    # Avatars and the service user cards fall back to the raw sync payload; load those in one query
+    prefetch_payloads(linked_rows + [u for u in users_pagination.items if u.userType == UserType.SERVICE], 'user_raw_data')
     
     app_users = []
     service_users = []
+    users_on_page = []
+    for row_user in users_pagination.items:
+        if row_user.userType == UserType.LOCAL:
+            linked_service_users = linked_by_local_uuid.get(row_user.uuid, [])
+            row_user._user_type = 'local'
+            row_user.avatar_url = _get_local_user_avatar_url(row_user, access_records=linked_service_users)
+            # plex_join_date for local users is the earliest service join date or created_at
+            earliest_join_date = row_user.created_at
+            for service_user in linked_service_users:
+                if service_user.service_join_date and (not earliest_join_date or service_user.service_join_date < earliest_join_date):
+                    earliest_join_date = service_user.service_join_date
+            row_user.plex_join_date = earliest_join_date
+            row_user.linked_service_users = linked_service_users
+            app_users.append(row_user)
+            users_on_page.append(row_user)
+        else:
+            list_item = ServiceUserListItem(row_user)
+            service_users.append(list_item)
+            users_on_page.append(list_item)
+    users_pagination.items = users_on_page
     
-    # Load actual users from database
-    if user_type_filter in ['all', 'local']:
-        # Query local users
-        current_app.logger.info("=== QUERYING LOCAL USERS ===")
-        app_user_query = User.query.filter_by(userType=UserType.LOCAL)
-        
-        # Build search filters for local users
-        local_search_filters = []
-        if search_username:
-            local_search_filters.append(User.localUsername.ilike(f"%{search_username}%"))
-        if search_email:
-            local_search_filters.append(User.discord_email.ilike(f"%{search_email}%"))
-        if search_notes:
-            local_search_filters.append(User.notes.ilike(f"%{search_notes}%"))
-        if search_term:
-            local_search_filters.append(or_(User.localUsername.ilike(f"%{search_term}%"), User.discord_email.ilike(f"%{search_term}%")))
-        
-        if local_search_filters:
-            app_user_query = app_user_query.filter(or_(*local_search_filters))
-        
-        app_users = app_user_query.all()
-        current_app.logger.info(f"Found {len(app_users)} local users")
-    
-    if user_type_filter in ['all', 'service']:
-        # Query service users - standalone service user records
-        current_app.logger.info("=== QUERYING SERVICE USERS ===")
-        all_access_query = User.query.filter_by(userType=UserType.SERVICE)
-        
-        # Build search filters for service users
-        search_filters = []
-        if search_username:
-            search_filters.append(User.external_username.ilike(f"%{search_username}%"))
-        if search_email:
-            search_filters.append(User.external_email.ilike(f"%{search_email}%"))
-        if search_notes:
-            search_filters.append(User.notes.ilike(f"%{search_notes}%"))
-        if search_term:
-            search_filters.append(or_(
-                User.external_username.ilike(f"%{search_term}%"), 
-                User.external_email.ilike(f"%{search_term}%")
-            ))
-        
-        if search_filters:
-            all_access_query = all_access_query.filter(or_(*search_filters))
-
-        # Apply server filter
-        server_filter_id = request.args.get('server_id', 'all')
-        if server_filter_id != 'all':
-            try:
-                server_filter_id_int = int(server_filter_id)
-                all_access_query = all_access_query.filter(User.server_id == server_filter_id_int)
-            except ValueError:
-                current_app.logger.warning(f"Invalid server_id received: {server_filter_id}")
-
-        all_access_records = all_access_query.all()
-        
-        # Convert service user records to user-like format for display
-        for access in all_access_records:
-            # Create a mock user object with necessary attributes
-            class MockUser:
-                def __init__(self, access):
-                    self.uuid = access.uuid
-                    self.id = access.id
-                    self.localUsername = access.external_username or 'Unknown'
-                    self.email = access.external_email
-                    self.notes = access.notes
-                    self.created_at = access.created_at
-                    self.last_login_at = access.last_activity_at
-                    self.media_accesses = [access]
-                    self.access_expires_at = access.access_expires_at
-                    self.discord_user_id = access.discord_user_id
-                    self.is_active = access.is_active
-                    self._is_standalone = True
-                    self._access_record = access
-                    self.is_home_user = access.is_home_user
-                    self.shares_back = access.shares_back
-                    self.is_purge_whitelisted = access.is_purge_whitelisted
-                    self.plex_join_date = access.service_join_date or access.created_at
-                    self.avatar_url = None
-                    self.last_streamed_at = None
-                    # Add template compatibility attributes
-                    self.server = access.server
-                    self.external_username = access.external_username
-                
-                def get_display_name(self):
-                    return self._access_record.external_username or 'Unknown'
-                
-                def get_avatar(self, default_url=None):
-                    return default_url
-            
-            mock_user = MockUser(access)
-            mock_user._user_type = 'service'
-            # Set avatar URL for service users directly from the access record
-            mock_user.avatar_url = access.external_avatar_url  # Use the external_avatar_url directly
-            service_users.append(mock_user)
-        
-        current_app.logger.info(f"Found {len(service_users)} service users")
-    
-    # Combine and process users
-    all_users = []
-    
-    # Add local users with a type indicator and process their avatars
-    current_app.logger.debug(f"Found {len(app_users)} local users")
-    for app_user in app_users:
-        app_user._user_type = 'local'
-        # Process avatar URL for local users using their linked media access accounts
-        app_user.avatar_url = _get_local_user_avatar_url(app_user)
-        # UUID is already available on the user object
-        
-        # Set plex_join_date for local users - use the earliest service join date or created_at
-        earliest_join_date = app_user.created_at
-        # Get linked service users for this local user
-        linked_service_users = User.query.filter_by(userType=UserType.SERVICE).filter_by(linkedUserId=app_user.uuid).all()
-        for service_user in linked_service_users:
-            if service_user.service_join_date and (not earliest_join_date or service_user.service_join_date < earliest_join_date):
-                earliest_join_date = service_user.service_join_date
-        app_user.plex_join_date = earliest_join_date
-        
-        # Attach linked service users to the user object for template access
-        app_user.linked_service_users = linked_service_users
-        
-        all_users.append(app_user)
-        current_app.logger.debug(f"Local user {app_user.localUsername} (UUID: {app_user.uuid}) added to list")
-    
-    # Add service users with a type indicator  
-    for service_user in service_users:
-        service_user._user_type = 'service'
-        all_users.append(service_user)
-    
-    # Store sort parameters for later use (after we populate streaming data)
-    sort_by_param = request.args.get('sort_by', 'username_asc')
-    
-    # For last_streamed sorting, we need to populate streaming data first before sorting
-    # For other sorts, we can sort immediately
-    if 'last_streamed' not in sort_by_param:
-        # Sort combined results immediately for non-streaming sorts
-        reverse_sort = 'desc' in sort_by_param
-        if 'username' in sort_by_param:
-            all_users.sort(key=lambda u: getattr(u, 'localUsername', '').lower(), reverse=reverse_sort)
-        elif 'created_at' in sort_by_param:
-            all_users.sort(key=lambda u: getattr(u, 'created_at', datetime.min.replace(tzinfo=timezone.utc)) or datetime.min.replace(tzinfo=timezone.utc), reverse=reverse_sort)
-        elif 'service_join_date' in sort_by_param:
-            all_users.sort(key=lambda u: getattr(u, 'service_join_date', None) or getattr(u, 'plex_join_date', None) or datetime.min.replace(tzinfo=timezone.utc), reverse=reverse_sort)
-        elif 'email' in sort_by_param:
-            all_users.sort(key=lambda u: getattr(u, 'email', '').lower(), reverse=reverse_sort)
-    
-    # For last_streamed sorting, we need to process ALL users before pagination
-    # For other sorts, we can paginate first to improve performance
-    total_users = len(all_users)
-    
-    if 'last_streamed' in sort_by_param:
-        users_on_page = all_users  # Process all users for streaming data
-    else:
-        # Manual pagination for combined results
-        start_idx = (page - 1) * items_per_page
-        end_idx = start_idx + items_per_page
-        users_on_page = all_users[start_idx:end_idx]
-    
-    # Create mock pagination object
-    class MockPagination:
-        def __init__(self, items, page, per_page, total):
-            self.items = items
-            self.page = page
-            self.per_page = per_page
-            self.total = total
-            self.pages = (total + per_page - 1) // per_page
-            self.has_prev = page > 1
-            self.has_next = page < self.pages
-            self.prev_num = page - 1 if self.has_prev else None
-            self.next_num = page + 1 if self.has_next else None
-        
-        def iter_pages(self, left_edge=2, right_edge=2, left_current=2, right_current=3):
-            last = self.pages
-            for num in range(1, last + 1):
-                if num <= left_edge or \
-                   (self.page - left_current - 1 < num < self.page + right_current) or \
-                   num > last - right_edge:
-                    yield num
-                elif num == left_edge + 1 or num == last - right_edge:
-                    yield None
-    
-    users_pagination = MockPagination(users_on_page, page, items_per_page, total_users)
-    
-    # Extract sort information for template
-    sort_by_param = request.args.get('sort_by', 'username_asc')
-    sort_parts = sort_by_param.rsplit('_', 1)
-    sort_column = sort_parts[0]
-    sort_direction = 'desc' if len(sort_parts) > 1 and sort_parts[1] == 'desc' else 'asc'
+    sort_column, sort_direction = user_list_service.parse_sort_param(sort_by_param)
 
     # Get Owner with plex_uuid for filtering (AppUsers don't have plex_uuid)
     owner = User.query.filter_by(userType=UserType.OWNER).filter(User.plex_uuid.isnot(None)).first()
@@ -286,58 +187,24 @@ def list_users():
     admins_by_uuid = {admin.plex_uuid: admin for admin in admin_accounts}
     
     # Get user UUIDs for additional data - both local and service users
-    all_user_uuids = []
-    
-    for user in users_on_page:
-        if hasattr(user, '_user_type'):
-            # Use UUIDs for both local and service users
-            all_user_uuids.append(user.uuid)
+    all_user_uuids = [user.uuid for user in users_on_page]
 
-    # Fetch additional data for all users (using UUIDs)
+    # Plays, watched time, last IP and last played item all come from one summary row per user
+    activity_summaries = activity_summary_service.get_activity_summaries(all_user_uuids)
     stream_stats = {}
     last_ips = {}
-    if all_user_uuids:
-        stream_stats = user_service.get_bulk_user_stream_stats(all_user_uuids)
-        last_ips = user_service.get_bulk_last_known_ips(all_user_uuids)
-
-    # Get last known IPs from streaming history for all users
-    all_user_uuids_for_ips = []
-    for user in users_on_page:
-        if hasattr(user, '_user_type'):
-            if user._user_type == 'local':
-                all_user_uuids_for_ips.append(user.uuid)
-            elif user._user_type == 'service':
-                all_user_uuids_for_ips.append(user.uuid)
-    
-    # Get most recent IP addresses from MediaStreamHistory for all users
-    last_known_ips_from_streams = {}
-    if all_user_uuids_for_ips:
-        from sqlalchemy import desc
-        # Query for the most recent stream for each user to get their last known IP
-        recent_streams = db.session.query(MediaStreamHistory).filter(
-            MediaStreamHistory.user_uuid.in_(all_user_uuids_for_ips)
-        ).order_by(MediaStreamHistory.started_at.desc()).all()
-        
-        # Group by user and take the most recent IP for each
-        seen_users = set()
-        for stream in recent_streams:
-            user_uuid = stream.user_uuid
-            if user_uuid and user_uuid not in seen_users and stream.ip_address:
-                last_known_ips_from_streams[user_uuid] = stream.ip_address
-                seen_users.add(user_uuid)
+    for user_uuid, summary in activity_summaries.items():
+        stream_stats[user_uuid] = {'play_count': summary.total_plays or 0, 'total_duration': summary.total_seconds or 0}
+        if summary.last_ip:
+            last_ips[user_uuid] = summary.last_ip
 
     # Attach the additional data directly to each user object
     for user in users_on_page:
-        if hasattr(user, '_user_type'):
-            # Use UUID to get stats for both local and service users
-            stats = stream_stats.get(user.uuid, {})
-            user.total_plays = stats.get('play_count', 0)
-            user.total_duration = stats.get('total_duration', 0)
-            # Use IP from streaming history first, then fall back to bulk IP lookup
-            user.last_known_ip = last_known_ips_from_streams.get(user.uuid) or last_ips.get(user.uuid, 'N/A')
-            # Initialize last_streamed_at - will be set below if streaming history exists
-            if not hasattr(user, 'last_streamed_at'):
-                user.last_streamed_at = None
+        # Use UUID to get stats for both local and service users
+        stats = stream_stats.get(user.uuid, {})
+        user.total_plays = stats.get('play_count', 0)
+        user.total_duration = stats.get('total_duration', 0)
+        user.last_known_ip = last_ips.get(user.uuid, 'N/A')
     
     # Get library access info for each user, organized by server
     user_library_access_by_server = {}  # user_id -> server_id -> [lib_ids]
@@ -354,18 +221,11 @@ def list_users():
         user_service_types[user_id] = []
         user_server_names[user_id] = []
         
-        # Get access records based on user type
-        if hasattr(user, '_user_type'):
-            if user._user_type == 'local':
-                # Local user - get all their service user records
-                access_records = User.query.filter_by(userType=UserType.SERVICE).filter(User.linkedUserId == user.uuid).all()
-            elif user._user_type == 'service':
-                # Service user - get their specific service user record
-                access_records = [user._access_record]
-            else:
-                access_records = []
+        # Get access records based on user type (linked accounts were batch-loaded above)
+        if user._user_type == 'local':
+            access_records = user.linked_service_users
         else:
-            access_records = []
+            access_records = [user._access_record]
         
         # Process the access records for this user
         for access in access_records:
@@ -443,86 +303,11 @@ def list_users():
 
     # Get last played content for each user - both local and service users
     user_last_played = {}
-    all_user_uuids_for_last_played = []
-    
-    # Extract UUIDs for all users (both local and service)
-    for user in users_pagination.items:
-        if hasattr(user, '_user_type'):
-            all_user_uuids_for_last_played.append(user.uuid)
-    
-    if all_user_uuids_for_last_played:
-        from sqlalchemy import desc
-        # Get the most recent stream for each user from MediaStreamHistory table
-        last_streams = db.session.query(MediaStreamHistory).filter(
-            MediaStreamHistory.user_uuid.in_(all_user_uuids_for_last_played)
-        ).order_by(MediaStreamHistory.started_at.desc()).all()
-        
-        # Group by user UUID and take the first (most recent) for each user
-        seen_users = set()
-        for stream in last_streams:
-            user_uuid = stream.user_uuid
-            if user_uuid and user_uuid not in seen_users:
-                # Find the user by UUID
-                user_for_stream = next((u for u in users_on_page if hasattr(u, '_user_type') and u.uuid == user_uuid), None)
-                if user_for_stream:
-                    # Build display title based on media type
-                    display_title = stream.media_title or 'Unknown Title'
-                    
-                    # For TV shows, combine show name and episode title
-                    if stream.media_type == 'episode' and stream.grandparent_title:
-                        if stream.parent_title:  # Season info
-                            display_title = f"{stream.grandparent_title} - {stream.media_title}"
-                        else:
-                            display_title = f"{stream.grandparent_title} - {stream.media_title}"
-                    elif stream.media_type == 'track' and stream.grandparent_title:  # Music
-                        display_title = f"{stream.grandparent_title} - {stream.media_title}"
-                    
-                    user_last_played[user_for_stream.uuid] = {
-                        'media_title': display_title,
-                        'original_media_title': stream.media_title,
-                        'media_type': stream.media_type,
-                        'grandparent_title': stream.grandparent_title,
-                        'parent_title': stream.parent_title,
-                        'started_at': stream.started_at,
-                        'rating_key': stream.rating_key,
-                        'server_id': stream.server_id if hasattr(stream, 'server_id') else None
-                    }
-                
-                    # Also set last_streamed_at on the user object for table display
-                    user_for_stream.last_streamed_at = stream.started_at
-                
-                seen_users.add(user_uuid)
-
-    # Handle last_streamed sorting after streaming data is populated
-    if 'last_streamed' in sort_by_param:
-        reverse_sort = 'desc' in sort_by_param
-        # Sort ALL users by last_streamed_at field (now that it's populated)
-        def get_sort_key(user):
-            last_streamed = getattr(user, 'last_streamed_at', None)
-            if last_streamed is None:
-                return datetime.min.replace(tzinfo=timezone.utc)
-            # Handle timezone-naive datetimes by assuming UTC
-            if last_streamed.tzinfo is None:
-                return last_streamed.replace(tzinfo=timezone.utc)
-            return last_streamed
-        
-        all_users.sort(key=get_sort_key, reverse=reverse_sort)
-        
-        # Re-paginate after sorting
-        start_idx = (page - 1) * items_per_page
-        end_idx = start_idx + items_per_page
-        users_on_page = all_users[start_idx:end_idx]
-        
-        # Update the pagination object with the newly sorted and paginated users
-        users_pagination.items = users_on_page
+    for user in users_on_page:
+        last_played = activity_summary_service.build_last_played(activity_summaries.get(user.uuid))
+        if last_played:
+            user_last_played[user.uuid] = last_played
 
-    # Add service types for standalone users to user_service_types
-    if user_type_filter in ['all', 'service'] and service_users:
-        for service_user in service_users:
-            if hasattr(service_user, '_is_standalone') and service_user._is_standalone:
-                # Add the service type for this standalone user
-                user_service_types[service_user.uuid] = [service_user._access_record.server.service_type]
-    
     # Check if user accounts feature is enabled
     allow_user_accounts = Setting.get_bool('ALLOW_USER_ACCOUNTS', False)
     
@@ -5,11 +5,11 @@ from flask import render_template, request, current_app, session, make_response
 from flask_login import login_required, current_user
 from sqlalchemy import or_, func
 from app.models_media_services import MediaStreamHistory, MediaServer
-from app.models import User, UserType
+from app.models import User, UserType, Setting
 from app.forms import MassUserEditForm
 from app.extensions import db
 from app.utils.helpers import setup_required, permission_required
-from app.services import user_service
+from app.services import user_service, deprovisioning_service, job_service
 from app.services.media_service_manager import MediaServiceManager
 from app.routes.user_modules.helpers import MassEditMockUser
 from . import users_bp
@@ -140,6 +140,8 @@ def mass_edit_users():
     user_ids_str = request.form.get('user_ids')
     toast_message = ""
     toast_category = "error"
+    deprovision_run = None
+    background_job = None
 
     # Instantiate form for the other fields that DO need validation
     form = MassUserEditForm(request.form)
@@ -223,9 +225,16 @@ def mass_edit_users():
                                 updates_by_server[server_id] = []
                             updates_by_server[server_id] = request.form.getlist(key)
 
-                    processed_count, error_count = user_service.mass_update_user_libraries_by_server(user_ids, updates_by_server, admin_id=current_user.id)
-                    toast_message = f"Mass library update: {processed_count} service users updated, {error_count} errors."
-                    toast_category = "success" if error_count == 0 else "warning"
+                    # Each user is updated on their media server, so this runs as a background job
+                    background_job, created = job_service.enqueue(
+                        'mass_update_libraries',
+                        {'user_ids': user_ids, 'updates_by_server': {str(k): v for k, v in updates_by_server.items()}},
+                        dedupe_key=job_service.make_dedupe_key('mass_update_libraries', user_ids=sorted(user_ids), updates=updates_by_server),
+                        admin_id=current_user.id
+                    )
+                    toast_message = (f"Mass library update started for {len(user_ids)} service users." if created
+                                     else "An identical mass library update is already running.")
+                    toast_category = "info"
                 elif action == 'extend_access':
                     days_to_extend = form.days_to_extend.data
                     if not days_to_extend or days_to_extend < 1:
@@ -250,7 +259,6 @@ def mass_edit_users():
                     toast_category = "success" if error_count == 0 else "warning"
                 elif action == 'merge_into_local_account':
                     # Check if user accounts are enabled
-                    from app.models import User, UserType, Setting
                     allow_user_accounts = Setting.get_bool('ALLOW_USER_ACCOUNTS', False)
                     
                     if not allow_user_accounts:
@@ -304,10 +312,10 @@ def mass_edit_users():
                         toast_message = "Deletion was not confirmed. No action taken."
                         toast_category = "warning"
                     else:
-                        # mass_delete_users already supports UUIDs, so pass them directly
-                        processed_count, error_count = user_service.mass_delete_users(user_ids, admin_id=current_user.id)
-                        toast_message = f"Mass delete: {processed_count} removed, {error_count} errors."
-                        toast_category = "success" if error_count == 0 else "warning"
+                        # mass_delete_users already supports UUIDs; removal continues in the background
+                        deprovision_run = user_service.mass_delete_users(user_ids, admin_id=current_user.id)
+                        toast_message = f"Mass delete started for {deprovision_run.total} users."
+                        toast_category = "info"
                 elif action.endswith('_whitelist'):
                     should_add = action.startswith('add_to')
                     whitelist_type = "Bot" if "bot" in action else "Purge"
@@ -590,6 +598,13 @@ def mass_edit_users():
     }
 
     response_html = render_template('users/_partials/user_list_content.html', **template_context)
+    if deprovision_run:
+        # Out-of-band progress panel that polls until the background deletion finishes
+        response_html += render_template('users/_partials/deprovision_progress_oob.html',
+                                         progress=deprovisioning_service.get_run_progress(deprovision_run.id))
+    if background_job:
+        response_html += render_template('components/jobs/job_progress_oob.html',
+                                         progress=job_service.get_job_progress(background_job.id))
     
     response = make_response(response_html)
     toast_payload = {"showToastEvent": {"message": toast_message, "category": toast_category}}
@@ -611,7 +626,7 @@ def purge_inactive_users():
     try:
         user_ids_to_purge = request.form.getlist('user_ids_to_purge')
         if not user_ids_to_purge:
-            return render_template('partials/_alert_message.html', message="No users were selected to be purged.", category='info'), 400
+            return render_template('components/alerts/alert_message.html', message="No users were selected to be purged.", category='info'), 400
 
         # Pass all criteria to the service layer for a final, safe check
         results = user_service.purge_inactive_users(
@@ -622,12 +637,16 @@ def purge_inactive_users():
             exclude_whitelisted=request.form.get('exclude_whitelisted') == 'true',
             ignore_creation_date_for_never_streamed=request.form.get('ignore_creation_date') == 'true'
         )
-        return render_template('partials/_alert_message.html', 
-                               message=results['message'], 
-                               category='success' if results['errors'] == 0 else 'warning')
+        response_html = render_template('components/alerts/alert_message.html', 
+                                        message=results['message'], 
+                                        category='info' if results.get('run_id') else 'warning')
+        if results.get('run_id'):
+            response_html += render_template('users/_partials/deprovision_progress_oob.html',
+                                             progress=deprovisioning_service.get_run_progress(results['run_id']))
+        return response_html
     except Exception as e:
         current_app.logger.error(f"Error during purge inactive users route: {e}", exc_info=True)
-        return render_template('partials/_alert_message.html', message=f"An unexpected error occurred: {e}", category='error'), 500
+        return render_template('components/alerts/alert_message.html', message=f"An unexpected error occurred: {e}", category='error'), 500
 
 
 @users_bp.route('/purge_inactive/preview', methods=['POST'])
@@ -642,22 +661,43 @@ def preview_purge_inactive_users():
         exclude_whitelisted = request.form.get('exclude_whitelisted') == 'true'
         ignore_creation_date = request.form.get('ignore_creation_date') == 'true'
         
-        # Get preview from service
+        page = request.form.get('page', 1, type=int)
+        
+        # Get one page of candidates from the service, counted and filtered in SQL
         preview_data = user_service.preview_purge_inactive_users(
             inactive_days_threshold=inactive_days,
             exclude_sharers=exclude_sharers,
             exclude_whitelisted=exclude_whitelisted,
-            ignore_creation_date_for_never_streamed=ignore_creation_date
+            ignore_creation_date_for_never_streamed=ignore_creation_date,
+            page=page
         )
+        purge_criteria = {
+            'inactive_days': inactive_days,
+            'exclude_sharers': exclude_sharers,
+            'exclude_whitelisted': exclude_whitelisted,
+            'ignore_creation_date': ignore_creation_date
+        }
         
-        return render_template('users/_partials/purge_preview_modal.html', 
-                               preview_data=preview_data,
-                               inactive_days=inactive_days,
-                               exclude_sharers=exclude_sharers,
-                               exclude_whitelisted=exclude_whitelisted,
-                               ignore_creation_date=ignore_creation_date)
+        # "Load more" requests only need the next batch of rows
+        template_name = 'users/_partials/purge_preview_rows.html' if page > 1 else 'users/_partials/purge_preview_modal.html'
+        return render_template(template_name, 
+                               preview=preview_data,
+                               eligible_users=preview_data['eligible_users'],
+                               purge_criteria=purge_criteria)
     except Exception as e:
         current_app.logger.error(f"Error during purge preview: {e}", exc_info=True)
-        return render_template('partials/_alert_message.html', 
+        return render_template('components/alerts/alert_message.html', 
                                message=f"Error generating preview: {e}", 
-                               category='error'), 500
\ No newline at end of file
+                               category='error'), 500
+
+
+@users_bp.route('/deprovision/<int:run_id>/progress')
+@login_required
+@setup_required
+@permission_required('view_users')
+def deprovision_progress(run_id):
+    """Progress panel for a background mass delete / purge run, polled by HTMX"""
+    progress = deprovisioning_service.get_run_progress(run_id)
+    if not progress:
+        return render_template('components/alerts/alert_message.html', message="This removal run no longer exists.", category='warning'), 404
+    return render_template('users/_partials/deprovision_progress.html', progress=progress)
@@ -0,0 +1,215 @@
+# File: app/services/activity_summary_service.py
+"""
+Maintenance and lookup of ``user_activity_summary``.
+
+The session monitor updates a user's summary row incrementally when a stream
+starts (play count and "last played" fields) and when it stops (watched
+seconds). Pages that only need per-user totals or the most recent stream read
+these rows instead of aggregating ``media_stream_history``.
+
+``rebuild_activity_summaries`` recomputes rows from history and is used by the
+``flask rebuild-activity-summary`` command and after history is deleted. Play
+counts and watched time of rows removed by the retention policy come from
+``stream_history_rollups``.
+"""
+from datetime import timezone
+
+from flask import current_app
+from sqlalchemy import func
+
+from app.extensions import db
+from app.models import User
+from app.models_media_services import MediaStreamHistory, StreamHistoryRollup, UserActivitySummary
+
+_REBUILD_BATCH_SIZE = 500
+
+
+def _apply_last_stream(summary, history_record):
+    """Copy the "last played" fields from a history row onto a summary row."""
+    summary.last_stream_at = history_record.started_at
+    summary.last_media_title = history_record.media_title
+    summary.last_media_type = history_record.media_type
+    summary.last_grandparent_title = history_record.grandparent_title
+    summary.last_parent_title = history_record.parent_title
+    summary.last_rating_key = history_record.rating_key
+    summary.last_server_id = history_record.server_id
+    if history_record.ip_address:
+        summary.last_ip = history_record.ip_address
+
+
+def _naive_utc(value):
+    """History rows are written with aware UTC datetimes but read back naive on SQLite."""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _get_or_create_summary(user_uuid):
+    summary = db.session.get(UserActivitySummary, user_uuid)
+    if summary is None:
+        summary = UserActivitySummary(user_uuid=user_uuid, total_plays=0, total_seconds=0)
+        db.session.add(summary)
+    return summary
+
+
+def record_stream_started(history_record):
+    """Count a new stream and make it the user's most recent one. Caller commits."""
+    if not history_record.user_uuid:
+        return None
+    summary = _get_or_create_summary(history_record.user_uuid)
+    summary.total_plays = (summary.total_plays or 0) + 1
+    if summary.last_stream_at is None or _naive_utc(history_record.started_at) >= _naive_utc(summary.last_stream_at):
+        _apply_last_stream(summary, history_record)
+    return summary
+
+
+def record_stream_stopped(history_record):
+    """Add the final watched duration of a stopped stream to the user's total. Caller commits."""
+    if not history_record.user_uuid:
+        return None
+    summary = db.session.get(UserActivitySummary, history_record.user_uuid)
+    if summary is None:
+        # Stream started before summaries existed; derive the row from history instead
+        rebuild_activity_summaries([history_record.user_uuid], commit=False)
+        return db.session.get(UserActivitySummary, history_record.user_uuid)
+    summary.total_seconds = (summary.total_seconds or 0) + (history_record.duration_seconds or 0)
+    return summary
+
+
+def _rebuild_batch(user_uuids):
+    """Recompute summary rows for one batch of user uuids (``None`` means every user with history)."""
+    totals_query = db.session.query(
+        MediaStreamHistory.user_uuid,
+        func.count(MediaStreamHistory.id),
+        func.coalesce(func.sum(MediaStreamHistory.duration_seconds), 0)
+    ).join(User, User.uuid == MediaStreamHistory.user_uuid).group_by(MediaStreamHistory.user_uuid)
+
+    latest_subquery = db.session.query(
+        MediaStreamHistory.id,
+        func.row_number().over(
+            partition_by=MediaStreamHistory.user_uuid,
+            order_by=(MediaStreamHistory.started_at.desc(), MediaStreamHistory.id.desc())
+        ).label('rn')
+    ).filter(MediaStreamHistory.user_uuid.isnot(None))
+
+    last_ip_subquery = db.session.query(
+        MediaStreamHistory.user_uuid,
+        MediaStreamHistory.ip_address,
+        func.row_number().over(
+            partition_by=MediaStreamHistory.user_uuid,
+            order_by=(MediaStreamHistory.started_at.desc(), MediaStreamHistory.id.desc())
+        ).label('rn')
+    ).filter(MediaStreamHistory.user_uuid.isnot(None), MediaStreamHistory.ip_address.isnot(None))
+
+    # Totals of history already archived by the retention policy
+    rollup_query = db.session.query(
+        StreamHistoryRollup.user_uuid,
+        func.sum(StreamHistoryRollup.plays),
+        func.sum(StreamHistoryRollup.duration_seconds)
+    ).join(User, User.uuid == StreamHistoryRollup.user_uuid).group_by(StreamHistoryRollup.user_uuid)
+
+    existing_query = UserActivitySummary.query
+    if user_uuids is not None:
+        totals_query = totals_query.filter(MediaStreamHistory.user_uuid.in_(user_uuids))
+        rollup_query = rollup_query.filter(StreamHistoryRollup.user_uuid.in_(user_uuids))
+        latest_subquery = latest_subquery.filter(MediaStreamHistory.user_uuid.in_(user_uuids))
+        last_ip_subquery = last_ip_subquery.filter(MediaStreamHistory.user_uuid.in_(user_uuids))
+        existing_query = existing_query.filter(UserActivitySummary.user_uuid.in_(user_uuids))
+
+    latest_subquery = latest_subquery.subquery()
+    last_ip_subquery = last_ip_subquery.subquery()
+
+    latest_rows = MediaStreamHistory.query.join(
+        latest_subquery, MediaStreamHistory.id == latest_subquery.c.id
+    ).filter(latest_subquery.c.rn == 1).all()
+    latest_by_uuid = {row.user_uuid: row for row in latest_rows}
+    last_ip_by_uuid = dict(
+        db.session.query(last_ip_subquery.c.user_uuid, last_ip_subquery.c.ip_address)
+        .filter(last_ip_subquery.c.rn == 1).all()
+    )
+    existing_by_uuid = {summary.user_uuid: summary for summary in existing_query.all()}
+
+    totals = {user_uuid: [plays or 0, int(seconds or 0)] for user_uuid, plays, seconds in rollup_query.all()}
+    for user_uuid, plays, seconds in totals_query.all():
+        user_totals = totals.setdefault(user_uuid, [0, 0])
+        user_totals[0] += plays or 0
+        user_totals[1] += int(seconds or 0)
+
+    rebuilt = 0
+    for user_uuid, (plays, seconds) in totals.items():
+        summary = existing_by_uuid.pop(user_uuid, None)
+        if summary is None:
+            summary = UserActivitySummary(user_uuid=user_uuid)
+            db.session.add(summary)
+        summary.total_plays = plays
+        summary.total_seconds = seconds
+        # Users whose history is all archived keep the "last played" fields they had
+        latest = latest_by_uuid.get(user_uuid)
+        if latest is not None:
+            _apply_last_stream(summary, latest)
+            summary.last_ip = last_ip_by_uuid.get(user_uuid)
+        rebuilt += 1
+
+    # Users whose history was removed entirely no longer have a summary
+    for stale_summary in existing_by_uuid.values():
+        db.session.delete(stale_summary)
+    return rebuilt
+
+
+def rebuild_activity_summaries(user_uuids=None, commit=True):
+    """
+    Recompute summary rows from ``media_stream_history``.
+
+    With ``user_uuids`` only those users are rebuilt; otherwise every summary
+    row is replaced. Returns the number of summary rows written.
+    """
+    if user_uuids is not None:
+        user_uuids = list({str(u) for u in user_uuids if u})
+        if not user_uuids:
+            return 0
+        rebuilt = 0
+        for start in range(0, len(user_uuids), _REBUILD_BATCH_SIZE):
+            rebuilt += _rebuild_batch(user_uuids[start:start + _REBUILD_BATCH_SIZE])
+    else:
+        rebuilt = _rebuild_batch(None)
+
+    if commit:
+        db.session.commit()
+    current_app.logger.info(f"Activity_Summary_Service.py - rebuild_activity_summaries(): Rebuilt {rebuilt} summary rows.")
+    return rebuilt
+
+
+def get_activity_summaries(user_uuids) -> dict:
+    """Return ``{user_uuid: UserActivitySummary}`` for the given uuids in one query."""
+    user_uuids = [u for u in (user_uuids or []) if u]
+    if not user_uuids:
+        return {}
+    summaries = UserActivitySummary.query.filter(UserActivitySummary.user_uuid.in_(user_uuids)).all()
+    return {summary.user_uuid: summary for summary in summaries}
+
+
+def get_activity_summary(user_uuid):
+    """Return the summary row for a single user, or ``None`` if they never streamed."""
+    if not user_uuid:
+        return None
+    return db.session.get(UserActivitySummary, user_uuid)
+
+
+def build_last_played(summary):
+    """Shape a summary row like the ``user_last_played`` entries the users templates expect."""
+    if summary is None or summary.last_stream_at is None:
+        return None
+    display_title = summary.last_media_title or 'Unknown Title'
+    # For TV shows and music, combine show/artist name and item title
+    if summary.last_media_type in ('episode', 'track') and summary.last_grandparent_title:
+        display_title = f"{summary.last_grandparent_title} - {summary.last_media_title}"
+    return {
+        'media_title': display_title,
+        'original_media_title': summary.last_media_title,
+        'media_type': summary.last_media_type,
+        'grandparent_title': summary.last_grandparent_title,
+        'parent_title': summary.last_parent_title,
+        'started_at': summary.last_stream_at,
+        'rating_key': summary.last_rating_key,
+        'server_id': summary.last_server_id
+    }
@@ -619,7 +619,10 @@ class AudiobookShelfMediaService(BaseMediaService):
 
     def get_formatted_sessions(self) -> List[Dict[str, Any]]:
         """Get active AudioBookshelf sessions formatted for display"""
-        raw_sessions = self.get_active_sessions()
+        return self.format_sessions(self.get_active_sessions())
+
+    def format_sessions(self, raw_sessions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Format sessions returned by get_active_sessions() for display"""
         if not raw_sessions:
             return []
         
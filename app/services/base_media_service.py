@@ -74,6 +74,13 @@ class BaseMediaService(ABC):
         """Get active sessions formatted for display with standardized structure"""
         pass
 
+    def format_sessions(self, raw_sessions: List[Any]) -> List[Dict[str, Any]]:
+        """
+        Format sessions already fetched with get_active_sessions(), like
+        get_formatted_sessions(). Services that can't reuse them fetch again.
+        """
+        return self.get_formatted_sessions()
+
     @abstractmethod
     def get_geoip_info(self, ip_address: str) -> Dict[str, Any]:
         """Get GeoIP information for a given IP address."""
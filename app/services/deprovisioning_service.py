@@ -0,0 +1,297 @@
+# File: app/services/deprovisioning_service.py
+"""
+Batched removal of users from MUM and their media servers.
+
+Mass delete, purge, access expiry and the Discord bot (members who left the
+guild) all create a ``DeprovisionRun`` with one ``DeprovisionOutcome`` per
+user. Executing a run fans the remote
+``delete_user`` calls out over a small thread pool per media server, with a
+per-server rate limit, while the coordinating thread deletes the database rows
+in batches and keeps the run counters current so the UI can poll progress.
+
+Only the coordinating thread touches the database session; worker threads
+just call the media service.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from flask import current_app
+
+from app.extensions import db
+from app.models import User, UserType, EventType, DeprovisionRun, DeprovisionOutcome
+from app.models_media_services import MediaServer
+from app.services.media_service_factory import MediaServiceFactory
+from app.utils.helpers import log_event
+from app.utils.timezone_utils import utcnow
+
+RUN_KINDS = ('mass_delete', 'purge', 'expiration', 'discord_left')
+
+
+class _RateLimiter:
+    """Spaces out call start times so a server sees at most ``rate`` calls per second."""
+
+    def __init__(self, rate_per_second):
+        self._interval = 1.0 / rate_per_second if rate_per_second and rate_per_second > 0 else 0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self._interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self._interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def create_run(kind, local_user_ids=(), service_user_ids=(), admin_id=None):
+    """Create a pending run with an outcome row per user. Unknown IDs are ignored."""
+    if kind not in RUN_KINDS:
+        raise ValueError(f"Unknown deprovision run kind: {kind}")
+
+    users = []
+    if local_user_ids:
+        users += User.query.filter(User.userType == UserType.LOCAL, User.id.in_(list(local_user_ids))).all()
+    if service_user_ids:
+        users += User.query.filter(User.userType == UserType.SERVICE, User.id.in_(list(service_user_ids))).all()
+
+    run = DeprovisionRun(kind=kind, admin_id=admin_id, status='pending', total=len(users))
+    db.session.add(run)
+    for user in users:
+        run.outcomes.append(DeprovisionOutcome(
+            user_id=user.id,
+            user_uuid=user.uuid,
+            user_type='local' if user.userType == UserType.LOCAL else 'service',
+            username=user.get_display_name(),
+            status='pending'
+        ))
+    db.session.commit()
+    current_app.logger.info(f"Deprovisioning_Service.py - create_run(): Created {kind} run {run.id} for {run.total} users.")
+    return run
+
+
+def start_run_in_background(run_id):
+    """Queue a run on the background job workers and return immediately."""
+    from app.services import job_service
+    run = db.session.get(DeprovisionRun, run_id)
+    job_service.enqueue('deprovision_run', {'run_id': run_id}, dedupe_key=f"deprovision_run:{run_id}",
+                        admin_id=run.admin_id if run else None)
+
+
+def abort_run(run_id, error):
+    """Mark a run that crashed part way as failed so its progress panel stops polling."""
+    db.session.rollback()
+    run = db.session.get(DeprovisionRun, run_id)
+    if run and not run.is_finished:
+        run.status = 'failed'
+        run.message = f"Run aborted: {error}"
+        run.finished_at = utcnow()
+        db.session.commit()
+
+
+def _service_accounts_for(outcome):
+    """The service user rows that have to be removed remotely for an outcome."""
+    if outcome.user_type == 'local':
+        if not outcome.user_uuid:
+            return []
+        return User.query.filter_by(userType=UserType.SERVICE, linkedUserId=outcome.user_uuid).all()
+    account = User.query.filter_by(userType=UserType.SERVICE, id=outcome.user_id).first()
+    return [account] if account else []
+
+
+def _remote_delete(app, service, limiter, external_user_id):
+    """Worker: remove one account from one server. Returns an error string or None."""
+    with app.app_context():
+        limiter.wait()
+        try:
+            if service.delete_user(external_user_id) is False:
+                return "server reported failure"
+            return None
+        except Exception as e:
+            return str(e) or e.__class__.__name__
+
+
+def _delete_from_database(outcome):
+    """Delete the user row(s) behind an outcome from the session (not committed)."""
+    if outcome.user_type == 'local':
+        for account in User.query.filter_by(userType=UserType.SERVICE, linkedUserId=outcome.user_uuid).all():
+            db.session.delete(account)
+        user = User.query.filter_by(userType=UserType.LOCAL, id=outcome.user_id).first()
+    else:
+        user = User.query.filter_by(userType=UserType.SERVICE, id=outcome.user_id).first()
+    if user:
+        db.session.delete(user)
+
+
+def _finish_outcome(run, outcome, status, error=None):
+    outcome.status = status
+    outcome.finished_at = utcnow()
+    if error:
+        outcome.error = f"{outcome.error}; {error}" if outcome.error else error
+    run.processed += 1
+    if status == 'removed':
+        run.removed += 1
+    else:
+        run.failed += 1
+
+
+def _commit_batch(run, outcomes):
+    """Remove a batch of users from the database with one commit, falling back to one commit per user."""
+    if not outcomes:
+        return
+    outcome_ids = [o.id for o in outcomes]
+    # Persist remote results and counters first so a failed removal can't roll them back
+    db.session.commit()
+    try:
+        for outcome in outcomes:
+            _delete_from_database(outcome)
+            _finish_outcome(run, outcome, 'removed')
+        db.session.commit()
+        return
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.warning(f"Deprovisioning_Service.py - batch commit failed for run {run.id}, retrying per user: {e}")
+
+    # Rollback expired everything, reload and retry one at a time so a single bad row doesn't sink the batch
+    run = db.session.get(DeprovisionRun, run.id)
+    for outcome_id in outcome_ids:
+        outcome = db.session.get(DeprovisionOutcome, outcome_id)
+        try:
+            _delete_from_database(outcome)
+            _finish_outcome(run, outcome, 'removed')
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            run = db.session.get(DeprovisionRun, run.id)
+            outcome = db.session.get(DeprovisionOutcome, outcome_id)
+            _finish_outcome(run, outcome, 'failed', error=f"Database removal failed: {e}")
+            db.session.commit()
+            current_app.logger.error(f"Deprovisioning_Service.py - could not remove user {outcome.username} (ID: {outcome.user_id}) from MUM: {e}")
+
+
+def execute_run(run_id):
+    """
+    Run a deprovisioning run to completion in the calling thread.
+
+    Remote deletions run concurrently per server; a failed remote deletion is
+    recorded on the outcome but the user is still removed from MUM, matching
+    the previous serial behaviour.
+    """
+    app = current_app._get_current_object()
+    run = db.session.get(DeprovisionRun, run_id)
+    if not run or run.is_finished:
+        return run
+
+    run.status = 'running'
+    run.started_at = utcnow()
+    db.session.commit()
+
+    concurrency = max(1, int(app.config.get('DEPROVISION_MAX_CONCURRENCY_PER_SERVER', 4)))
+    rate = app.config.get('DEPROVISION_MAX_REQUESTS_PER_SECOND', 5)
+    batch_size = max(1, int(app.config.get('DEPROVISION_DB_BATCH_SIZE', 50)))
+
+    outcomes = {o.id: o for o in run.outcomes.filter_by(status='pending').all()}
+    remaining = {}  # outcome id -> remote deletions still in flight
+    tasks_by_server = {}  # server id -> [(outcome id, external user id)]
+    for outcome in outcomes.values():
+        accounts = [a for a in _service_accounts_for(outcome) if a.external_user_id and a.server_id]
+        outcome.remote_total = len(accounts)
+        remaining[outcome.id] = len(accounts)
+        for account in accounts:
+            tasks_by_server.setdefault(account.server_id, []).append((outcome.id, account.external_user_id))
+    db.session.commit()
+
+    ready = [outcome_id for outcome_id, count in remaining.items() if count == 0]
+    pools = []
+    futures = {}
+    try:
+        for server_id, tasks in tasks_by_server.items():
+            server = db.session.get(MediaServer, server_id)
+            service = MediaServiceFactory.create_service_from_db(server) if server else None
+            if not service or not hasattr(service, 'delete_user'):
+                server_label = server.server_nickname if server else f"server {server_id}"
+                current_app.logger.warning(f"Deprovisioning_Service.py - cannot delete users from {server_label}: service not available or doesn't support deletion")
+                for outcome_id, _ in tasks:
+                    outcomes[outcome_id].error = f"{server_label}: service unavailable"
+                    run.remote_errors += 1
+                    remaining[outcome_id] -= 1
+                    if remaining[outcome_id] == 0:
+                        ready.append(outcome_id)
+                continue
+
+            limiter = _RateLimiter(rate)
+            pool = ThreadPoolExecutor(max_workers=min(concurrency, len(tasks)), thread_name_prefix=f"deprovision-{server_id}")
+            pools.append(pool)
+            for outcome_id, external_user_id in tasks:
+                future = pool.submit(_remote_delete, app, service, limiter, external_user_id)
+                futures[future] = (outcome_id, server.server_nickname)
+
+        # Users with nothing to remove remotely can go straight to the database
+        while len(ready) >= batch_size:
+            _commit_batch(run, [outcomes[i] for i in ready[:batch_size]])
+            ready = ready[batch_size:]
+
+        for future in as_completed(futures):
+            outcome_id, server_name = futures[future]
+            outcome = outcomes[outcome_id]
+            error = future.result()
+            if error:
+                run.remote_errors += 1
+                outcome.error = f"{outcome.error}; {server_name}: {error}" if outcome.error else f"{server_name}: {error}"
+                current_app.logger.error(f"Failed to delete user {outcome.username} from {server_name}: {error}")
+            else:
+                outcome.remote_removed += 1
+                current_app.logger.info(f"Deleted user {outcome.username} from {server_name}")
+            remaining[outcome_id] -= 1
+            if remaining[outcome_id] == 0:
+                ready.append(outcome_id)
+            if len(ready) >= batch_size:
+                _commit_batch(run, [outcomes[i] for i in ready])
+                ready = []
+
+        _commit_batch(run, [outcomes[i] for i in ready])
+    finally:
+        for pool in pools:
+            pool.shutdown(wait=True)
+
+    run = db.session.get(DeprovisionRun, run_id)
+    run.status = 'completed'
+    run.finished_at = utcnow()
+    run.message = f"{run.removed} users removed, {run.failed} failed."
+    if run.remote_errors:
+        run.message += f" {run.remote_errors} remote server errors."
+    db.session.commit()
+
+    log_event(EventType.MUM_USER_DELETED_FROM_MUM, f"{run.kind.replace('_', ' ').capitalize()}: {run.message}", admin_id=run.admin_id, details={
+        'deprovision_run_id': run.id, 'removed': run.removed, 'failed': run.failed, 'remote_errors': run.remote_errors,
+        'attempted_count': run.total
+    })
+    current_app.logger.info(f"Deprovisioning_Service.py - execute_run(): Run {run.id} ({run.kind}) finished. {run.message}")
+    return run
+
+
+def get_run_progress(run_id):
+    """Snapshot of a run for progress polling, or ``None`` if it doesn't exist."""
+    run = db.session.get(DeprovisionRun, run_id)
+    if not run:
+        return None
+    failures = run.outcomes.filter(
+        db.or_(DeprovisionOutcome.status == 'failed', DeprovisionOutcome.error.isnot(None))
+    ).order_by(DeprovisionOutcome.id).limit(20).all()
+    return {
+        'id': run.id,
+        'kind': run.kind,
+        'status': run.status,
+        'is_finished': run.is_finished,
+        'total': run.total,
+        'processed': run.processed,
+        'removed': run.removed,
+        'failed': run.failed,
+        'remote_errors': run.remote_errors,
+        'percent': run.percent,
+        'message': run.message,
+        'failures': [{'username': o.username, 'status': o.status, 'error': o.error} for o in failures]
+    }
@@ -0,0 +1,266 @@
+# File: app/services/episode_prefetch.py
+"""
+Background prefetch of TV show episode lists.
+
+The episodes tab of a show is served from the cached episode ``MediaItem``
+rows. Opening the tab no longer fetches the list from the server. Instead,
+an ``episode_prefetch`` background job refreshes every show whose list is
+missing or older than ``EPISODE_PREFETCH_MAX_AGE_HOURS``. Each show records
+when its list was last fetched in ``MediaItem.episodes_synced_at``.
+
+Shows are taken from a priority queue:
+
+1. Shows that were never fetched come first, since their tab has nothing to
+   show yet.
+2. The rest are ordered by their most recent play or, if later, the date
+   they were added. What people are watching is refreshed before the back
+   catalogue.
+
+Upstream requests run on up to ``EPISODE_PREFETCH_WORKERS`` threads. Only
+that many shows are in flight at a time. Results are written on the job
+thread, one show per short ``write_queue`` transaction.
+
+The job is queued in three cases:
+
+- after each library content sync of a show library;
+- on an interval by the scheduler (``EPISODE_PREFETCH_INTERVAL_HOURS``);
+- for a single show, when its tab is opened before the show was ever
+  fetched and ``fetch_show`` couldn't get the list within
+  ``EPISODE_TAB_FETCH_TIMEOUT_SECONDS``.
+
+Jobs run in queue order, so a show queued from its tab may wait behind a
+library sync. ``fetch_show`` therefore first tries the one show inline.
+"""
+import heapq
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FuturesTimeout
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func
+
+from app.extensions import db
+from app.models_media_services import MediaItem, MediaServer, MediaStreamHistory
+from app.services import media_item_index, write_queue
+from app.services.media_service_factory import MediaServiceFactory
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def max_age():
+    return timedelta(hours=current_app.config.get('EPISODE_PREFETCH_MAX_AGE_HOURS', 24))
+
+
+def is_stale(show):
+    """True if the show's cached episode list is missing or past ``EPISODE_PREFETCH_MAX_AGE_HOURS``."""
+    return show.episodes_synced_at is None or datetime.utcnow() - show.episodes_synced_at > max_age()
+
+
+def build_queue(library_ids=None, show_ids=None, force=False):
+    """
+    Heap of ``(never_fetched, -recency, show_id)`` entries for the shows that
+    need a refresh, so ``heapq.heappop`` returns the most urgent show first.
+    """
+    last_played = db.session.query(
+        MediaStreamHistory.grandparent_media_item_id.label('show_id'),
+        func.max(MediaStreamHistory.started_at).label('last_played')
+    ).filter(MediaStreamHistory.grandparent_media_item_id.isnot(None)) \
+        .group_by(MediaStreamHistory.grandparent_media_item_id).subquery()
+
+    query = db.session.query(MediaItem.id, MediaItem.episodes_synced_at, MediaItem.added_at, last_played.c.last_played) \
+        .outerjoin(last_played, last_played.c.show_id == MediaItem.id) \
+        .filter(MediaItem.item_type == 'show')
+    if library_ids:
+        query = query.filter(MediaItem.library_id.in_(library_ids))
+    if show_ids:
+        query = query.filter(MediaItem.id.in_(show_ids))
+    if not force:
+        cutoff = datetime.utcnow() - max_age()
+        query = query.filter(db.or_(MediaItem.episodes_synced_at.is_(None), MediaItem.episodes_synced_at < cutoff))
+
+    heap = []
+    for show_id, synced_at, added_at, played_at in query.all():
+        recency = max(value for value in (played_at, added_at, _EPOCH) if value is not None)
+        heap.append((synced_at is not None, -(recency - _EPOCH).total_seconds(), show_id))
+    heapq.heapify(heap)
+    return heap
+
+
+def _fetch(app, service, show_key):
+    """Worker: fetch one show's episode list. Returns the list, or None on failure."""
+    from app.services.media_sync_service import MediaSyncService
+    with app.app_context():
+        try:
+            return MediaSyncService.fetch_show_episodes(service, show_key)
+        except Exception as e:
+            current_app.logger.warning(f"Episode_Prefetch.py - fetch of show {show_key} failed: {e}")
+            return None
+
+
+def prefetch_episodes(library_ids=None, show_ids=None, force=False, progress_callback=None):
+    """
+    Refresh the cached episode lists of stale shows, most urgent first.
+
+    Args:
+        library_ids: Limit to shows in these libraries (default: all libraries)
+        show_ids: Limit to these shows
+        force: Refresh the selected shows even if their lists are fresh
+        progress_callback: Optional ``callback(current, total, message)``; returning
+            False stops after the shows already in flight
+
+    Returns:
+        Dict with counts of refreshed and failed shows
+    """
+    from app.services.media_sync_service import MediaSyncService
+
+    app = current_app._get_current_object()
+    heap = build_queue(library_ids, show_ids, force)
+    total = len(heap)
+    if not total:
+        return {'success': True, 'shows': 0, 'refreshed': 0, 'failed': 0, 'message': "Episode lists are up to date."}
+
+    workers = max(1, int(current_app.config.get('EPISODE_PREFETCH_WORKERS', 3)))
+    services = {}  # server_id -> service instance, or None if it can't be created
+    in_flight = {}  # future -> show_id
+    refreshed = failed = skipped = added = removed = done = 0
+    touched_servers = set()
+    cancelled = False
+
+    def submit_next():
+        nonlocal failed, skipped, done
+        while heap:
+            _, _, show_id = heapq.heappop(heap)
+            show = db.session.get(MediaItem, show_id)
+            if show is None:
+                done += 1
+                continue
+            if show.server_id not in services:
+                server = db.session.get(MediaServer, show.server_id)
+                services[show.server_id] = MediaServiceFactory.create_service_from_db(server) if server else None
+            service = services[show.server_id]
+            show_key = show.rating_key or show.external_id
+            if service is not None and not hasattr(service, 'get_show_episodes'):
+                skipped += 1  # The service has no per-show episode listing
+                done += 1
+                continue
+            if service is None or not show_key:
+                failed += 1
+                done += 1
+                continue
+            in_flight[pool.submit(_fetch, app, service, show_key)] = show_id
+            return True
+        return False
+
+    current_app.logger.info(f"Episode_Prefetch.py - prefetch_episodes(): Refreshing episodes for {total} shows ({workers} workers).")
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="episode-prefetch")
+    try:
+        for _ in range(workers):
+            if not submit_next():
+                break
+
+        while in_flight:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                show_id = in_flight.pop(future)
+                episodes = future.result()
+                show = db.session.get(MediaItem, show_id)
+                done += 1
+                if show is None or episodes is None:
+                    failed += 1
+                else:
+                    try:
+                        with write_queue.serialized('episode prefetch'):
+                            result = MediaSyncService.apply_show_episodes(show, episodes)
+                            db.session.commit()
+                        refreshed += 1
+                        added += result['added']
+                        removed += result['removed']
+                        if result['added'] or result['removed']:
+                            touched_servers.add(show.server_id)
+                    except Exception as e:
+                        db.session.rollback()
+                        failed += 1
+                        current_app.logger.error(f"Episode_Prefetch.py - could not save episodes of show {show_id}: {e}")
+
+                if progress_callback is not None and not cancelled:
+                    title = show.title if show is not None else f"show {show_id}"
+                    if progress_callback(done, total, f"Fetched episodes for {title}") is False:
+                        cancelled = True
+                if not cancelled:
+                    submit_next()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+    for server_id in touched_servers:
+        media_item_index.invalidate(server_id)
+
+    message = f"Refreshed episodes for {refreshed} of {total} shows: {added} added, {removed} removed."
+    if skipped:
+        message += f" {skipped} shows are on servers without episode listings."
+    if failed:
+        message += f" {failed} shows could not be fetched."
+    if cancelled:
+        message += " Stopped early."
+    current_app.logger.info(f"Episode_Prefetch.py - prefetch_episodes(): {message}")
+    return {'success': True, 'cancelled': cancelled, 'shows': total, 'refreshed': refreshed, 'failed': failed,
+            'skipped': skipped, 'added': added, 'removed': removed, 'message': message}
+
+
+def fetch_show(show, timeout):
+    """
+    Fetch and store one show's episode list in the calling request, giving up
+    after ``timeout`` seconds. Returns True if the list was stored.
+    """
+    from app.services.media_sync_service import MediaSyncService
+
+    server = db.session.get(MediaServer, show.server_id)
+    service = MediaServiceFactory.create_service_from_db(server) if server else None
+    show_key = show.rating_key or show.external_id
+    if service is None or not show_key or not hasattr(service, 'get_show_episodes'):
+        return False
+
+    pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="episode-fetch")
+    future = pool.submit(_fetch, current_app._get_current_object(), service, show_key)
+    try:
+        episodes = future.result(timeout=timeout)
+    except FuturesTimeout:
+        current_app.logger.info(f"Episode_Prefetch.py - fetch_show(): Episodes of '{show.title}' took over {timeout}s, queuing a prefetch instead.")
+        return False
+    finally:
+        pool.shutdown(wait=False)  # A timed-out fetch finishes in the background; its result is dropped
+    if episodes is None:
+        return False
+
+    try:
+        with write_queue.serialized('episode fetch'):
+            result = MediaSyncService.apply_show_episodes(show, episodes)
+            db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Episode_Prefetch.py - fetch_show(): Could not save episodes of show {show.id}: {e}")
+        return False
+    if result['added'] or result['removed']:
+        media_item_index.invalidate(show.server_id)
+    return True
+
+
+def queue_libraries(library_ids=None):
+    """Queue a prefetch of the stale shows in these libraries (all libraries if None). Returns the job."""
+    from app.services import job_service
+    library_ids = sorted(library_ids) if library_ids else None
+    job, _ = job_service.enqueue(
+        'episode_prefetch', params={'library_ids': library_ids},
+        dedupe_key=job_service.make_dedupe_key('episode_prefetch', library_ids=library_ids)
+    )
+    return job
+
+
+def queue_show(show):
+    """Queue a prefetch of a single show, e.g. when its episodes tab is opened. Returns the job."""
+    from app.services import job_service
+    job, _ = job_service.enqueue(
+        'episode_prefetch', params={'show_ids': [show.id]},
+        dedupe_key=job_service.make_dedupe_key('episode_prefetch', show_id=show.id),
+        title=f"Episodes for {show.title}"[:255]
+    )
+    return job
@@ -0,0 +1,248 @@
+# File: app/services/geoip_service.py
+"""
+Cached GeoIP lookups for streaming session IPs.
+
+A lookup goes through three layers and stops at the first that answers:
+
+1. An in-process LRU of ``GEOIP_MEMORY_CACHE_SIZE`` addresses. Repeat views of
+   the same viewers are answered here without a database query.
+2. The ``geoip_cache`` table. Rows are reused for ``GEOIP_CACHE_TTL_DAYS``.
+3. A source: the offline database at ``GEOIP_DATABASE_PATH`` if one is
+   configured (a MaxMind/DB-IP ``.mmdb`` file, read with the optional
+   ``maxminddb`` package), else plex.tv's geoip API through the first Plex
+   server.
+
+Results have the keys of Plex's geoip response whatever the source, which
+is what ``components/modals/geoip_modal.html`` expects. Failures are kept
+in memory only, for ``GEOIP_NEGATIVE_TTL_SECONDS``, so an erroring or
+rate-limiting plex.tv isn't asked again for every address on each poll.
+Local and private addresses never leave the process.
+
+``lookup_many`` resolves a batch, e.g. every WAN session on the streaming
+page, with one query for the cached rows and the misses fetched
+concurrently on up to ``GEOIP_LOOKUP_WORKERS`` threads.
+"""
+import ipaddress
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from app.extensions import db
+from app.models_media_services import GeoIPCache, ServiceType
+from app.services import metrics, write_queue
+
+LOCAL_ADDRESS = {"error": "This is a local address - no GeoIP data available"}
+
+_lock = threading.Lock()
+_memory = OrderedDict()  # ip -> (expires_at monotonic, data)
+
+_reader_lock = threading.Lock()
+_reader = None
+_reader_path = None
+
+
+def normalize_ip(ip_address):
+    """The canonical form of a public address, or None for local, private and invalid ones."""
+    if not ip_address:
+        return None
+    try:
+        address = ipaddress.ip_address(str(ip_address).strip())
+    except ValueError:
+        return None
+    if address.version == 6 and address.ipv4_mapped:
+        address = address.ipv4_mapped  # '::ffff:1.2.3.4' as reported by some servers
+    if not address.is_global:
+        return None
+    return str(address)
+
+
+def _ttl_seconds():
+    return current_app.config.get('GEOIP_CACHE_TTL_DAYS', 30) * 86400
+
+
+def _remember(ip, data, ttl_seconds=None):
+    max_entries = current_app.config.get('GEOIP_MEMORY_CACHE_SIZE', 1024)
+    expires_at = time.monotonic() + (_ttl_seconds() if ttl_seconds is None else ttl_seconds)
+    with _lock:
+        _memory[ip] = (expires_at, data)
+        _memory.move_to_end(ip)
+        while len(_memory) > max_entries:
+            _memory.popitem(last=False)
+
+
+def _recall(ip):
+    with _lock:
+        entry = _memory.get(ip)
+        if entry is None:
+            return None
+        if time.monotonic() >= entry[0]:
+            del _memory[ip]
+            return None
+        _memory.move_to_end(ip)
+        return entry[1]
+
+
+def clear_memory_cache():
+    with _lock:
+        _memory.clear()
+
+
+def _offline_reader():
+    """The ``maxminddb`` reader for GEOIP_DATABASE_PATH, or None if not configured or unavailable."""
+    global _reader, _reader_path
+    path = current_app.config.get('GEOIP_DATABASE_PATH')
+    if not path:
+        return None
+    with _reader_lock:
+        if _reader_path != path:
+            _reader_path = path
+            _reader = None
+            try:
+                import maxminddb
+                _reader = maxminddb.open_database(path)
+                current_app.logger.info(f"GeoIP_Service.py - Using offline GeoIP database {path}")
+            except ImportError:
+                current_app.logger.warning("GeoIP_Service.py - GEOIP_DATABASE_PATH is set but the 'maxminddb' package is not installed; using plex.tv.")
+            except (OSError, ValueError) as e:
+                current_app.logger.warning(f"GeoIP_Service.py - Could not open GeoIP database {path}: {e}; using plex.tv.")
+        return _reader
+
+
+def _name(record):
+    names = (record or {}).get('names') or {}
+    return names.get('en') or next(iter(names.values()), None)
+
+
+def _from_offline_record(record):
+    """Map a GeoLite2/DB-IP City record to the keys of Plex's geoip response."""
+    location = record.get('location') or {}
+    data = {
+        'code': (record.get('country') or {}).get('iso_code'),
+        'country': _name(record.get('country')),
+        'continent_code': (record.get('continent') or {}).get('code'),
+        'city': _name(record.get('city')),
+        'subdivisions': _name((record.get('subdivisions') or [None])[0]),
+        'postal_code': (record.get('postal') or {}).get('code'),
+        'time_zone': location.get('time_zone'),
+        'european_union_member': str(bool((record.get('country') or {}).get('is_in_european_union'))).lower(),
+    }
+    if location.get('latitude') is not None and location.get('longitude') is not None:
+        data['latitude'] = str(location['latitude'])
+        data['longitude'] = str(location['longitude'])
+        data['coordinates'] = f"{data['latitude']}, {data['longitude']}"
+    return {key: value for key, value in data.items() if value is not None}
+
+
+def _plex_service():
+    from app.services.media_service_factory import MediaServiceFactory
+    from app.services.media_service_manager import MediaServiceManager
+    plex_servers = MediaServiceManager.get_servers_by_type(ServiceType.PLEX)
+    if not plex_servers:
+        return None
+    # Use the first active Plex server
+    return MediaServiceFactory.create_service_from_db(plex_servers[0])
+
+
+def _fetch(app, plex_service, ip):
+    """Worker: one upstream lookup. Returns ``(data, source)``; ``data`` has an 'error' key on failure."""
+    with app.app_context():
+        reader = _offline_reader()
+        if reader is not None:
+            try:
+                record = reader.get(ip)
+            except ValueError as e:
+                return {"error": f"Invalid address: {e}"}, 'offline'
+            if record:
+                return _from_offline_record(record), 'offline'
+        if plex_service is None:
+            return {"error": "No GeoIP source available: add a Plex server or set GEOIP_DATABASE_PATH"}, None
+        return plex_service.get_geoip_info(ip), 'plex'
+
+
+def lookup_many(ip_addresses, resolve=True):
+    """
+    GeoIP data for each address.
+
+    Args:
+        ip_addresses: Addresses to look up; duplicates and local addresses are fine
+        resolve: Fetch addresses that aren't cached; if False they are left out
+
+    Returns:
+        Dict of address (as given) to GeoIP data. Local addresses map to an
+        error dict, like Plex's response for them.
+    """
+    results = {}
+    wanted = {}  # normalized ip -> addresses as given
+    for given in ip_addresses:
+        ip = normalize_ip(given)
+        if ip is None:
+            results[given] = LOCAL_ADDRESS
+        else:
+            wanted.setdefault(ip, []).append(given)
+
+    found = {}
+    for ip in wanted:
+        data = _recall(ip)
+        if data is not None:
+            found[ip] = data
+
+    missing = [ip for ip in wanted if ip not in found]
+    if missing:
+        cutoff = datetime.utcnow() - timedelta(seconds=_ttl_seconds())
+        rows = GeoIPCache.query.filter(GeoIPCache.ip_address.in_(missing), GeoIPCache.fetched_at >= cutoff).all()
+        for row in rows:
+            found[row.ip_address] = row.data
+            _remember(row.ip_address, row.data)
+        missing = [ip for ip in missing if ip not in found]
+    metrics.record_cache('geoip', hits=len(found), misses=len(missing))
+
+    if missing and resolve:
+        app = current_app._get_current_object()
+        plex_service = None if _offline_reader() is not None and current_app.config.get('GEOIP_OFFLINE_ONLY') else _plex_service()
+        workers = min(len(missing), max(1, current_app.config.get('GEOIP_LOOKUP_WORKERS', 4)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="geoip") as pool:
+            fetched = dict(zip(missing, pool.map(lambda ip: _fetch(app, plex_service, ip), missing)))
+
+        now = datetime.utcnow()
+        new_rows = {ip: (data, source) for ip, (data, source) in fetched.items() if data and 'error' not in data}
+        if new_rows:
+            try:
+                with write_queue.serialized('geoip cache'):
+                    for ip, (data, source) in new_rows.items():
+                        db.session.merge(GeoIPCache(ip_address=ip, data=data, source=source, fetched_at=now))
+                    db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.warning(f"GeoIP_Service.py - lookup_many(): could not cache {len(new_rows)} lookups: {e}")
+        negative_ttl = current_app.config.get('GEOIP_NEGATIVE_TTL_SECONDS', 300)
+        for ip, (data, _) in fetched.items():
+            found[ip] = data
+            if ip in new_rows:
+                _remember(ip, data)
+            elif data and negative_ttl:
+                _remember(ip, data, negative_ttl)
+        current_app.logger.debug(f"GeoIP_Service.py - lookup_many(): {len(wanted)} addresses, {len(missing)} fetched, {len(new_rows)} cached")
+
+    for ip, givens in wanted.items():
+        if ip in found:
+            for given in givens:
+                results[given] = found[ip]
+    return results
+
+
+def lookup(ip_address):
+    """GeoIP data for one address (see ``lookup_many``)."""
+    return lookup_many([ip_address]).get(ip_address) or {"error": "No GeoIP data available"}
+
+
+def place_label(data):
+    """Short 'City, Country' text for a GeoIP result, or None."""
+    if not data or 'error' in data:
+        return None
+    parts = [data.get('city'), data.get('country')]
+    return ", ".join(part for part in parts if part) or None
+
@@ -1,7 +1,11 @@
 # File: app/services/history_service.py
+from datetime import datetime
 from flask import current_app
-from app.models import User, UserType, HistoryLog, EventType
+from sqlalchemy import and_, literal_column, or_, text
+from app.models import User, UserType, HistoryLog, EventType, HISTORY_SEARCH_FTS_TABLE, HISTORY_SEARCH_SQLITE_DDL
 from app.extensions import db
+from app.utils import fulltext_search
+from app.utils.pagination import KeysetPage
 from app.utils.helpers import log_event # For logging the clear action itself
 
 def clear_history_logs(event_types_to_clear: list[str] = None, admin_id: int = None):
@@ -64,4 +68,94 @@ def clear_history_logs(event_types_to_clear: list[str] = None, admin_id: int = N
         current_app.logger.error(f"History_Service.py - clear_history_logs(): Error clearing history logs: {e}", exc_info=True)
         # Optionally log this error to history as well, or raise it
         log_event(EventType.ERROR_GENERAL, f"Failed to clear history logs: {e}", admin_id=admin_id, details={"error": str(e)})
-        raise # Re-raise so the route can catch it and flash an error
\ No newline at end of file
+        raise # Re-raise so the route can catch it and flash an error
+
+
+# --- Log viewer search and pagination ---
+# Messages and details are full-text indexed: an FTS5 table kept current by triggers on SQLite
+# (see models.HISTORY_SEARCH_SQLITE_DDL), a GIN expression index on PostgreSQL, ILIKE otherwise.
+# Every search word is matched as a word prefix and all of them have to match.
+
+_REBUILD_COMMAND = 'rebuild-history-search'
+
+
+def search_backend():
+    """'fts5', 'postgres' or 'like' for the current database; checked once per database."""
+    return fulltext_search.search_backend(HISTORY_SEARCH_FTS_TABLE, _REBUILD_COMMAND)
+
+
+def _pg_document():
+    # Must compile to the expression of ix_history_logs_search for the planner to use the index
+    return fulltext_search.pg_document(HistoryLog.message, HistoryLog.details)
+
+
+def message_filter(search):
+    """Filter clause keeping logs whose message or details match ``search``; ``None`` for an empty search."""
+    terms = fulltext_search.search_terms(search)
+    if not terms:
+        return None
+    backend = search_backend()
+    if backend == 'fts5':
+        matches = text(f"SELECT rowid FROM {HISTORY_SEARCH_FTS_TABLE} WHERE {HISTORY_SEARCH_FTS_TABLE} MATCH :log_query") \
+            .bindparams(log_query=fulltext_search.fts_match(terms)).columns(literal_column('rowid'))
+        return HistoryLog.id.in_(matches)
+    if backend == 'postgres':
+        return _pg_document().op('@@')(fulltext_search.pg_query(terms))
+    pattern = f"%{search.strip()}%"
+    return or_(HistoryLog.message.ilike(pattern), HistoryLog.details.ilike(pattern))
+
+
+def rebuild_search_index():
+    """(Re)create the SQLite log index and its triggers and refill it. Returns the backend in use."""
+    return fulltext_search.rebuild_sqlite_index(HISTORY_SEARCH_FTS_TABLE, HISTORY_SEARCH_SQLITE_DDL, _REBUILD_COMMAND)
+
+
+def encode_log_cursor(log):
+    return f"{log.timestamp.isoformat()}_{log.id}" if log.timestamp else None
+
+
+def decode_log_cursor(cursor):
+    """``(timestamp, id)`` from ``encode_log_cursor``, or ``None`` for missing or malformed input."""
+    if not cursor:
+        return None
+    try:
+        timestamp, log_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(timestamp), int(log_id)
+    except ValueError:
+        current_app.logger.warning(f"History_Service.py - decode_log_cursor(): Ignoring malformed cursor {cursor!r}")
+        return None
+
+
+def paginate_history_logs(query, page=1, per_page=20, after=None, before=None, total=None):
+    """
+    Newest-first page of a ``HistoryLog`` query.
+
+    ``after`` (older entries) and ``before`` (newer entries) cursors seek on
+    (timestamp, id) through ``ix_history_logs_timestamp_id``, so Previous/Next
+    cost the same at any depth. Numbered page links fall back to OFFSET.
+    ``total`` can be passed back from the previous page to skip the count.
+    """
+    page = max(page or 1, 1)
+    if total is None:
+        total = query.order_by(None).count()
+
+    after_key = decode_log_cursor(after)
+    before_key = decode_log_cursor(before)
+    if after_key:
+        timestamp, log_id = after_key
+        items = query.filter(or_(HistoryLog.timestamp < timestamp,
+                                 and_(HistoryLog.timestamp == timestamp, HistoryLog.id < log_id))) \
+            .order_by(HistoryLog.timestamp.desc(), HistoryLog.id.desc()).limit(per_page).all()
+    elif before_key:
+        timestamp, log_id = before_key
+        items = query.filter(or_(HistoryLog.timestamp > timestamp,
+                                 and_(HistoryLog.timestamp == timestamp, HistoryLog.id > log_id))) \
+            .order_by(HistoryLog.timestamp.asc(), HistoryLog.id.asc()).limit(per_page).all()
+        items.reverse()
+    else:
+        items = query.order_by(HistoryLog.timestamp.desc(), HistoryLog.id.desc()) \
+            .offset((page - 1) * per_page).limit(per_page).all()
+
+    next_cursor = encode_log_cursor(items[-1]) if items else None
+    prev_cursor = encode_log_cursor(items[0]) if items else None
+    return KeysetPage(items, page, per_page, total, next_cursor=next_cursor, prev_cursor=prev_cursor)
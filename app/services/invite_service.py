@@ -440,6 +440,9 @@ def accept_invite_and_grant_access(invite: Invite, plex_user_uuid: str, plex_use
         
         db.session.commit()
         current_app.logger.info("✅ All changes committed to database")
+        if user_access_expires_at:
+            from app.services.task_service import schedule_next_expiration_check
+            schedule_next_expiration_check()
         
         # Get whitelist info from service user for logging
         first_media_access = created_user_media_accesses[0][0] if created_user_media_accesses else None
@@ -422,10 +422,14 @@ class JellyfinMediaService(BaseMediaService):
     
     def get_formatted_sessions(self) -> List[Dict[str, Any]]:
         """Get active Jellyfin sessions formatted for display"""
+        return self.format_sessions(self.get_active_sessions())
+
+    def format_sessions(self, raw_sessions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Format sessions returned by get_active_sessions() for display"""
+        from app.models import User, UserType
         from flask import url_for
         import json
         
-        raw_sessions = self.get_active_sessions()
         if not raw_sessions:
             return []
         
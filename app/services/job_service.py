@@ -0,0 +1,492 @@
+# File: app/services/job_service.py
+"""
+Persistent queue for long-running admin operations.
+
+Library content syncs, server user syncs, mass library edits, user removals,
+stream history link backfills, episode prefetches and retention runs are stored as ``BackgroundJob`` rows and executed by a small worker
+pool instead of inside the request. The route enqueues a job and returns its
+id straight away; the page then polls the job's progress.
+
+Handlers are registered per job type with ``@job_handler``. A handler gets a
+``JobContext`` for reporting progress and checking for cancellation, and
+returns a JSON-serialisable dict that is stored as the job result.
+
+Enqueuing wakes the workers immediately. An APScheduler interval job also
+dispatches queued rows, which covers jobs left queued by a restart. Each
+running job records the process that claimed it, and that process refreshes
+the job's heartbeat while it runs. The dispatcher marks a running job failed
+only once its heartbeat has gone stale, so a CLI command or a second worker
+starting up never fails jobs that are still running elsewhere.
+
+Progress and completion commits from the workers go through
+``write_queue`` like the other background writers.
+"""
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from flask import current_app
+from sqlalchemy import or_
+
+from app.extensions import db, scheduler
+from app.models import BackgroundJob, UserType
+from app.services import write_queue
+from app.utils.timezone_utils import utcnow
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+_handlers = {}  # job type -> JobHandler
+_executor = None
+_executor_lock = threading.Lock()
+_in_flight = set()  # job ids submitted to the pool by this process
+_heartbeat_thread = None
+_last_recovery = 0.0
+_jobs_table_ready = False
+
+
+class JobCancelled(Exception):
+    """Raised by ``JobContext.check_cancelled`` to stop a handler cooperatively."""
+
+
+class JobHandler:
+    def __init__(self, func, label, refresh_event=None, permissions=()):
+        self.func = func
+        self.label = label
+        self.refresh_event = refresh_event  # HX-Trigger event fired on the page when the job finishes
+        self.permissions = tuple(permissions)  # Any of these lets a local user see or cancel other admins' jobs
+
+
+def job_handler(job_type, label, refresh_event=None, permissions=()):
+    """Register ``func(context)`` as the handler for ``job_type``."""
+    def decorator(func):
+        _handlers[job_type] = JobHandler(func, label, refresh_event, permissions)
+        return func
+    return decorator
+
+
+def get_handler(job_type):
+    return _handlers.get(job_type)
+
+
+def can_access_job(job, user):
+    """Whether ``user`` may see or cancel ``job``: the owner, the admin who queued it, or a holder of its permission."""
+    if job is None or user is None or not user.is_authenticated:
+        return False
+    if user.userType == UserType.OWNER or (job.admin_id is not None and job.admin_id == user.id):
+        return True
+    handler = get_handler(job.job_type)
+    return user.userType == UserType.LOCAL and handler is not None and \
+        any(user.has_permission(permission) for permission in handler.permissions)
+
+
+def get_accessible_job(job_id, user):
+    """The job with ``job_id`` if ``user`` may access it, else ``None`` (callers answer 404 either way)."""
+    job = db.session.get(BackgroundJob, job_id)
+    return job if can_access_job(job, user) else None
+
+
+class JobContext:
+    """Handed to a job handler; progress and cancellation state live on the job row."""
+
+    def __init__(self, job):
+        self.job_id = job.id
+        self.params = dict(job.params or {})
+        self.admin_id = job.admin_id
+
+    def _job(self):
+        return db.session.get(BackgroundJob, self.job_id)
+
+    def update_progress(self, current=None, total=None, message=None):
+        job = self._job()
+        if current is not None:
+            job.progress_current = current
+        if total is not None:
+            job.progress_total = total
+        if message is not None:
+            job.progress_message = message[:255]
+        job.heartbeat_at = utcnow()
+        with write_queue.serialized('job progress'):
+            db.session.commit()
+
+    def is_cancel_requested(self):
+        # Another request sets the flag, so read it fresh rather than from the identity map
+        return bool(db.session.query(BackgroundJob.cancel_requested).filter_by(id=self.job_id).scalar())
+
+    def check_cancelled(self):
+        if self.is_cancel_requested():
+            raise JobCancelled()
+
+    def progress_callback(self, current, total=None, message=None):
+        """Callback for services that report progress; returns False once cancellation was requested."""
+        self.update_progress(current, total, message)
+        return not self.is_cancel_requested()
+
+
+def make_dedupe_key(job_type, **parts):
+    """Stable key for "the same work", e.g. ``make_dedupe_key('library_content_sync', library_id=3)``."""
+    digest = hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()[:16]
+    return f"{job_type}:{digest}"
+
+
+def enqueue(job_type, params=None, dedupe_key=None, admin_id=None, title=None):
+    """
+    Queue a job and wake the workers. Returns ``(job, created)``.
+
+    If an active job with the same ``dedupe_key`` already exists it is returned
+    instead and nothing new is queued.
+    """
+    handler = get_handler(job_type)
+    if handler is None:
+        raise ValueError(f"Unknown background job type: {job_type}")
+
+    # The duplicate check and the insert are one step, so two requests can't both queue the same work
+    with write_queue.serialized('job enqueue'):
+        if dedupe_key:
+            existing = BackgroundJob.query.filter(
+                BackgroundJob.dedupe_key == dedupe_key,
+                BackgroundJob.status.in_(ACTIVE_STATUSES)
+            ).order_by(BackgroundJob.id).first()
+            if existing:
+                current_app.logger.info(f"Job_Service.py - enqueue(): {job_type} already active as job {existing.id}, not queuing a duplicate.")
+                return existing, False
+
+        job = BackgroundJob(job_type=job_type, params=params or {}, dedupe_key=dedupe_key, admin_id=admin_id,
+                            title=title or handler.label, status='queued', progress_current=0, cancel_requested=False)
+        db.session.add(job)
+        db.session.commit()
+    current_app.logger.info(f"Job_Service.py - enqueue(): Queued {job_type} job {job.id}.")
+    dispatch_pending(current_app._get_current_object())
+    return job, True
+
+
+def _worker_id():
+    """This process as "host:pid"; read per call because gunicorn forks workers after import."""
+    return f"{socket.gethostname()}:{os.getpid()}"[:128]
+
+
+def _get_executor(app):
+    global _executor, _heartbeat_thread
+    with _executor_lock:
+        if _executor is None:
+            workers = max(1, int(app.config.get('BACKGROUND_JOB_WORKERS', 2)))
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mum-job")
+        if _heartbeat_thread is None:
+            _heartbeat_thread = threading.Thread(target=_heartbeat_loop, args=(app,), name="mum-job-heartbeat", daemon=True)
+            _heartbeat_thread.start()
+        return _executor
+
+
+def _heartbeat_loop(app):
+    """Refresh heartbeat_at of the jobs this process is running, so other processes know they're alive."""
+    interval = max(1, int(app.config.get('BACKGROUND_JOB_HEARTBEAT_SECONDS', 30)))
+    while True:
+        time.sleep(interval)
+        with _executor_lock:
+            job_ids = list(_in_flight)
+        if not job_ids:
+            continue
+        with app.app_context():
+            try:
+                with write_queue.serialized('job heartbeat'):
+                    BackgroundJob.query.filter(BackgroundJob.id.in_(job_ids), BackgroundJob.status == 'running').update(
+                        {'heartbeat_at': utcnow()}, synchronize_session=False
+                    )
+                    db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.warning(f"Job_Service.py - _heartbeat_loop(): Could not refresh job heartbeats: {e}")
+            finally:
+                db.session.remove()
+
+
+def _claim(job_id):
+    """Atomically move a queued job to running. Returns True if this call won it."""
+    now = utcnow()
+    claimed = BackgroundJob.query.filter_by(id=job_id, status='queued').update(
+        {'status': 'running', 'started_at': now, 'heartbeat_at': now, 'worker_id': _worker_id()}, synchronize_session=False
+    )
+    db.session.commit()
+    return claimed == 1
+
+
+def dispatch_pending(app):
+    """Hand queued jobs to free workers, oldest first."""
+    workers = max(1, int(app.config.get('BACKGROUND_JOB_WORKERS', 2)))
+    with app.app_context():
+        with _executor_lock:
+            free_slots = workers - len(_in_flight)
+        if free_slots <= 0:
+            return 0
+        queued_ids = [row.id for row in db.session.query(BackgroundJob.id)
+                      .filter_by(status='queued').order_by(BackgroundJob.id).limit(free_slots).all()]
+        dispatched = 0
+        for job_id in queued_ids:
+            if not _claim(job_id):
+                continue
+            with _executor_lock:
+                _in_flight.add(job_id)
+            _get_executor(app).submit(_run_job, app, job_id)
+            dispatched += 1
+        return dispatched
+
+
+def _json_safe(value):
+    return json.loads(json.dumps(value, default=str))
+
+
+def _finish(job_id, status, result=None, error=None, message=None):
+    job = db.session.get(BackgroundJob, job_id)
+    job.status = status
+    job.finished_at = utcnow()
+    if result is not None:
+        job.result = _json_safe(result)
+    if error:
+        job.error = error
+    if message:
+        job.progress_message = message[:255]
+    with write_queue.serialized('job finish'):
+        db.session.commit()
+
+
+def _run_job(app, job_id):
+    """Worker entry point: execute one claimed job and record how it ended."""
+    with app.app_context():
+        try:
+            job = db.session.get(BackgroundJob, job_id)
+            handler = get_handler(job.job_type)
+            if handler is None:
+                _finish(job_id, 'failed', error=f"No handler registered for {job.job_type}")
+                return
+            if job.cancel_requested:
+                _finish(job_id, 'cancelled', message="Cancelled before it started")
+                return
+            current_app.logger.info(f"Job_Service.py - _run_job(): Starting {job.job_type} job {job_id}.")
+            try:
+                result = handler.func(JobContext(job))
+            except JobCancelled:
+                db.session.rollback()
+                _finish(job_id, 'cancelled', message="Cancelled")
+                current_app.logger.info(f"Job_Service.py - _run_job(): Job {job_id} cancelled.")
+                return
+            result = result or {}
+            if result.get('cancelled'):
+                _finish(job_id, 'cancelled', result=result, message="Cancelled")
+            elif result.get('success') is False:
+                _finish(job_id, 'failed', result=result, error=result.get('error') or result.get('message') or 'Job failed')
+            else:
+                _finish(job_id, 'completed', result=result, message=result.get('message'))
+            current_app.logger.info(f"Job_Service.py - _run_job(): Job {job_id} finished.")
+        except Exception as e:
+            current_app.logger.error(f"Job_Service.py - _run_job(): Job {job_id} crashed: {e}", exc_info=True)
+            db.session.rollback()
+            try:
+                _finish(job_id, 'failed', error=str(e) or e.__class__.__name__)
+            except Exception as e_finish:
+                current_app.logger.error(f"Job_Service.py - _run_job(): Could not mark job {job_id} failed: {e_finish}")
+                db.session.rollback()
+        finally:
+            db.session.remove()
+            with _executor_lock:
+                _in_flight.discard(job_id)
+            # A slot just freed up, pick up anything that queued behind this job
+            dispatch_pending(app)
+
+
+def cancel_job(job_id):
+    """Cancel a queued job outright, or ask a running one to stop. Returns the job or ``None``."""
+    job = db.session.get(BackgroundJob, job_id)
+    if not job or job.is_finished:
+        return job
+    if job.status == 'queued':
+        job.status = 'cancelled'
+        job.finished_at = utcnow()
+        job.progress_message = "Cancelled before it started"
+    else:
+        job.cancel_requested = True
+        job.progress_message = "Cancelling..."
+    db.session.commit()
+    current_app.logger.info(f"Job_Service.py - cancel_job(): Cancellation requested for job {job_id} ({job.job_type}).")
+    return job
+
+
+def get_job_progress(job_id):
+    """Snapshot of a job for progress polling, or ``None`` if it doesn't exist."""
+    job = db.session.get(BackgroundJob, job_id)
+    if not job:
+        return None
+    handler = get_handler(job.job_type)
+    return {
+        'id': job.id,
+        'job_type': job.job_type,
+        'title': job.title,
+        'status': job.status,
+        'is_finished': job.is_finished,
+        'progress_current': job.progress_current,
+        'progress_total': job.progress_total,
+        'percent': job.percent,
+        'message': job.progress_message,
+        'error': job.error,
+        'cancel_requested': job.cancel_requested,
+        'result': job.result,
+        'params': job.params,
+        'refresh_event': handler.refresh_event if handler else None,
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at
+    }
+
+
+def recover_interrupted_jobs():
+    """
+    Mark running jobs whose process stopped sending heartbeats as failed.
+    Jobs running in this process are never touched, whatever their heartbeat.
+    """
+    stale_seconds = max(1, int(current_app.config.get('BACKGROUND_JOB_STALE_SECONDS', 120)))
+    last_seen = db.func.coalesce(BackgroundJob.heartbeat_at, BackgroundJob.started_at)
+    query = BackgroundJob.query.filter(
+        BackgroundJob.status == 'running',
+        or_(last_seen.is_(None), last_seen < utcnow() - timedelta(seconds=stale_seconds))
+    )
+    with _executor_lock:
+        own_job_ids = list(_in_flight)
+    if own_job_ids:
+        query = query.filter(BackgroundJob.id.notin_(own_job_ids))
+    interrupted = query.update(
+        {'status': 'failed', 'finished_at': utcnow(), 'error': 'Interrupted: the process running it stopped'},
+        synchronize_session=False
+    )
+    db.session.commit()
+    if interrupted:
+        current_app.logger.warning(f"Job_Service.py - recover_interrupted_jobs(): Marked {interrupted} interrupted jobs as failed.")
+    return interrupted
+
+
+def _table_ready():
+    """Whether background_jobs exists yet (it doesn't until the migrations have run)."""
+    global _jobs_table_ready
+    if not _jobs_table_ready:
+        _jobs_table_ready = db.inspect(db.engine).has_table(BackgroundJob.__tablename__)
+    return _jobs_table_ready
+
+
+def dispatch_pending_jobs_task():
+    """APScheduler entry point that fails abandoned jobs and picks up queued ones."""
+    global _last_recovery
+    app = scheduler.app
+    with app.app_context():
+        if not _table_ready():
+            return
+        # Heartbeats only move every BACKGROUND_JOB_HEARTBEAT_SECONDS, so checking more often finds nothing new
+        if time.monotonic() - _last_recovery >= app.config.get('BACKGROUND_JOB_HEARTBEAT_SECONDS', 30):
+            _last_recovery = time.monotonic()
+            try:
+                recover_interrupted_jobs()
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.error(f"Job_Service.py - dispatch_pending_jobs_task(): Could not recover interrupted jobs: {e}")
+    dispatch_pending(app)
+
+
+# --- Handlers ---
+
+@job_handler('library_content_sync', 'Library content sync', refresh_event='refreshLibraryPage', permissions=('sync_libraries',))
+def _library_content_sync(context):
+    import time
+    from app.services.media_sync_service import MediaSyncService
+    from app.services import media_item_index
+    from app.models_media_services import MediaLibrary, MediaItem
+    start_time = time.time()
+    result = MediaSyncService.sync_library_content(context.params['library_id'], progress_callback=context.progress_callback)
+    if result.get('success'):
+        # Newly synced items can now be matched to history recorded before they existed
+        library = db.session.get(MediaLibrary, context.params['library_id'])
+        context.update_progress(message="Linking stream history")
+        media_item_index.backfill_history_links(server_id=library.server_id)
+        if db.session.query(MediaItem.id).filter_by(library_id=library.id, item_type='show').first():
+            from app.services import episode_prefetch
+            episode_prefetch.queue_libraries([library.id])
+    result['duration'] = time.time() - start_time
+    if result.get('success'):
+        result['message'] = f"{result.get('added', 0)} added, {result.get('updated', 0)} updated, {result.get('removed', 0)} removed."
+    return result
+
+
+@job_handler('server_user_sync', 'Server user sync', refresh_event='refreshUserList', permissions=('view_users',))
+def _server_user_sync(context):
+    from app.services.media_service_manager import MediaServiceManager
+    context.update_progress(message="Fetching users from the server")
+    return MediaServiceManager.sync_server_users(context.params['server_id'])
+
+
+@job_handler('mass_update_libraries', 'Mass library update', refresh_event='refreshUserList', permissions=('mass_edit_users',))
+def _mass_update_libraries(context):
+    from app.services import user_service
+    updates_by_server = {int(server_id): library_ids for server_id, library_ids in context.params['updates_by_server'].items()}
+    user_ids = context.params['user_ids']
+    context.update_progress(0, len(user_ids), "Updating library access")
+    processed_count, error_count = user_service.mass_update_user_libraries_by_server(
+        user_ids, updates_by_server, admin_id=context.admin_id
+    )
+    context.update_progress(len(user_ids))
+    return {
+        'success': True,
+        'processed': processed_count,
+        'errors': error_count,
+        'message': f"Mass library update: {processed_count} service users updated, {error_count} errors."
+    }
+
+
+@job_handler('deprovision_run', 'User removal', refresh_event='refreshUserList', permissions=('mass_edit_users', 'purge_users'))
+def _deprovision_run(context):
+    from app.services import deprovisioning_service
+    try:
+        run = deprovisioning_service.execute_run(context.params['run_id'])
+    except Exception as e:
+        current_app.logger.error(f"Job_Service.py - deprovision run {context.params['run_id']} crashed: {e}", exc_info=True)
+        deprovisioning_service.abort_run(context.params['run_id'], e)
+        raise
+    if run is None:
+        return {'success': False, 'error': 'Removal run not found'}
+    return {'success': True, 'run_id': run.id, 'removed': run.removed, 'failed': run.failed, 'message': run.message}
+
+
+@job_handler('history_link_backfill', 'Stream history linking', refresh_event='refreshLibraryPage', permissions=('sync_libraries',))
+def _history_link_backfill(context):
+    from app.services import media_item_index
+    context.update_progress(message="Linking stream history to libraries and items")
+    return media_item_index.backfill_history_links(server_id=context.params.get('server_id'),
+                                                   progress_callback=context.progress_callback)
+
+
+@job_handler('episode_prefetch', 'Episode prefetch', refresh_event='refreshLibraryPage', permissions=('sync_libraries',))
+def _episode_prefetch(context):
+    from app.services import episode_prefetch
+    context.update_progress(message="Finding shows with stale episode lists")
+    return episode_prefetch.prefetch_episodes(library_ids=context.params.get('library_ids'),
+                                              show_ids=context.params.get('show_ids'),
+                                              progress_callback=context.progress_callback)
+
+
+def enqueue_episode_prefetch_task():
+    """APScheduler entry point for the periodic episode list refresh."""
+    from app.services import episode_prefetch
+    with scheduler.app.app_context():
+        episode_prefetch.queue_libraries()
+
+
+@job_handler('retention', 'History retention', permissions=('manage_advanced_settings',))
+def _retention(context):
+    from app.services import retention_service
+    context.update_progress(message="Archiving expired history")
+    return retention_service.apply_retention(progress_callback=context.progress_callback)
+
+
+def enqueue_retention_task():
+    """APScheduler entry point for the daily retention run."""
+    with scheduler.app.app_context():
+        enqueue('retention', dedupe_key=make_dedupe_key('retention'))
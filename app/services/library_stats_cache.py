@@ -0,0 +1,77 @@
+# File: app/services/library_stats_cache.py
+"""
+In-process cache for per-library statistics.
+
+Entries are keyed by (library, statistic, window). Each library id has a
+generation counter. The session monitor bumps it after committing a new or
+finished history row for that library. Entries computed under an older
+generation are recomputed on the next read.
+
+A short TTL also applies, because "the last N days" moves with the clock even
+when no new history arrives.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+from app.services import metrics
+
+_MAX_ENTRIES = 512
+
+_lock = threading.Lock()
+_entries = OrderedDict()  # (library_id, name, days) -> (generation, stored_at, value)
+_generations = {}  # library_id -> int
+
+
+def invalidate_library(library_id):
+    """Drop cached statistics for one library after its history changed."""
+    with _lock:
+        _generations[library_id] = _generations.get(library_id, 0) + 1
+
+
+def invalidate_libraries(library_ids):
+    """Invalidate several library ids at once."""
+    for library_id in library_ids:
+        invalidate_library(library_id)
+
+
+def invalidate_all():
+    """Drop every cached entry, e.g. after history rows were deleted."""
+    with _lock:
+        _entries.clear()
+        for key in _generations:
+            _generations[key] += 1
+
+
+def get_or_compute(library, name, days, compute):
+    """
+    Return the cached value for ``(library, name, days)`` or store ``compute()``.
+
+    Values are shared between requests and must be treated as read-only.
+    """
+    library_key = library.id
+    cache_key = (library_key, name, days)
+    ttl = current_app.config.get('LIBRARY_STATS_CACHE_TTL_SECONDS', 300)
+    now = time.monotonic()
+
+    with _lock:
+        generation = _generations.get(library_key, 0)
+        entry = _entries.get(cache_key)
+        if entry and entry[0] == generation and now - entry[1] < ttl:
+            _entries.move_to_end(cache_key)
+            metrics.record_cache('library_stats', hits=1)
+            return entry[2]
+
+    metrics.record_cache('library_stats', misses=1)
+    value = compute()
+
+    with _lock:
+        # If history changed while computing, the value is already stale; don't keep it
+        if _generations.get(library_key, 0) == generation:
+            _entries[cache_key] = (generation, now, value)
+            _entries.move_to_end(cache_key)
+            while len(_entries) > _MAX_ENTRIES:
+                _entries.popitem(last=False)
+    return value
@@ -0,0 +1,218 @@
+# File: app/services/media_item_index.py
+"""
+Resolve stream history rows to the synced library and media items.
+
+The session monitor sees rating keys and service item ids; the library pages
+work with ``MediaLibrary`` / ``MediaItem`` rows. A per-server in-memory index
+maps item keys (rating key and external id) and library keys (external id and
+name) to row ids, so a new ``MediaStreamHistory`` row can store
+``library_id``, ``media_item_id`` and ``grandparent_media_item_id`` without
+extra queries on the hot path.
+
+The index for a server is built on first use and dropped after a library
+content sync for that server or when items are deleted. A key that isn't in
+the index falls back to one indexed lookup, so items added since the last
+build still resolve. SQLite doesn't enforce the ``SET NULL`` foreign keys, so
+code that deletes items or libraries calls ``unlink_items`` /
+``unlink_library`` first.
+
+``backfill_history_links`` fills the same columns for rows recorded before
+they existed or before their items were synced, using set-based UPDATEs.
+"""
+import threading
+
+from flask import current_app
+from sqlalchemy import and_, func, or_, select, update
+
+from app.extensions import db
+from app.models_media_services import MediaItem, MediaLibrary, MediaStreamHistory
+
+_lock = threading.Lock()
+_indexes = {}  # server_id -> _ServerIndex
+
+
+class _ServerIndex:
+    def __init__(self, server_id):
+        self.server_id = server_id
+        self.items = {}  # rating key / external id -> (media_item_id, library_id)
+        self.libraries_by_external_id = {}
+        self.libraries_by_name = {}
+
+    def load(self):
+        rows = db.session.query(MediaItem.id, MediaItem.library_id, MediaItem.external_id, MediaItem.rating_key) \
+            .filter(MediaItem.server_id == self.server_id).all()
+        for item_id, library_id, external_id, rating_key in rows:
+            if external_id:
+                self.items.setdefault(str(external_id), (item_id, library_id))
+            if rating_key:
+                # A rating key is the more specific match, let it win over a colliding external id
+                self.items[str(rating_key)] = (item_id, library_id)
+        for library_id, external_id, name in db.session.query(MediaLibrary.id, MediaLibrary.external_id, MediaLibrary.name) \
+                .filter(MediaLibrary.server_id == self.server_id).all():
+            self.libraries_by_external_id[str(external_id)] = library_id
+            self.libraries_by_name.setdefault(name, library_id)
+        return self
+
+
+def _get_index(server_id):
+    with _lock:
+        index = _indexes.get(server_id)
+    if index is None:
+        index = _ServerIndex(server_id).load()
+        with _lock:
+            _indexes[server_id] = index
+    return index
+
+
+def invalidate(server_id=None):
+    """Drop the index for one server (or all servers) so it is rebuilt on next use."""
+    with _lock:
+        if server_id is None:
+            _indexes.clear()
+        else:
+            _indexes.pop(server_id, None)
+
+
+def unlink_items(item_ids):
+    """Clear history references to media items that are about to be deleted. Not committed."""
+    item_ids = [item_id for item_id in item_ids if item_id is not None]
+    history = MediaStreamHistory.__table__
+    for start in range(0, len(item_ids), 500):
+        chunk = item_ids[start:start + 500]
+        db.session.execute(update(history).where(history.c.media_item_id.in_(chunk)).values(media_item_id=None))
+        db.session.execute(update(history).where(history.c.grandparent_media_item_id.in_(chunk)).values(grandparent_media_item_id=None))
+    if item_ids:
+        invalidate()
+
+
+def unlink_library(library_id, include_library=False):
+    """
+    Clear history references to every item of a library before its items are
+    purged, and to the library itself when ``include_library`` is set. Not committed.
+    """
+    history = MediaStreamHistory.__table__
+    library_items = select(MediaItem.id).where(MediaItem.library_id == library_id)
+    db.session.execute(update(history).where(history.c.media_item_id.in_(library_items)).values(media_item_id=None))
+    db.session.execute(update(history).where(history.c.grandparent_media_item_id.in_(library_items)).values(grandparent_media_item_id=None))
+    if include_library:
+        db.session.execute(update(history).where(history.c.library_id == library_id).values(library_id=None))
+    invalidate()
+
+
+def _lookup_item(index, key):
+    key = str(key) if key not in (None, '', 'None') else None
+    if not key:
+        return None
+    match = index.items.get(key)
+    if match is None:
+        row = db.session.query(MediaItem.id, MediaItem.library_id).filter(
+            MediaItem.server_id == index.server_id,
+            or_(MediaItem.rating_key == key, MediaItem.external_id == key)
+        ).order_by(MediaItem.id).first()
+        if row:
+            match = (row.id, row.library_id)
+            with _lock:
+                index.items[key] = match
+    return match
+
+
+def resolve(server_id, rating_key=None, external_id=None, grandparent_key=None,
+            library_external_id=None, library_name=None):
+    """
+    Return ``(library_id, media_item_id, grandparent_media_item_id)`` for a session.
+
+    Any element is ``None`` when it couldn't be matched. The library comes from
+    the resolved item when possible, then the service's library id, then the
+    library name.
+    """
+    try:
+        index = _get_index(server_id)
+        item = _lookup_item(index, rating_key) or _lookup_item(index, external_id)
+        grandparent = _lookup_item(index, grandparent_key)
+
+        library_id = item[1] if item else None
+        if library_id is None and grandparent:
+            library_id = grandparent[1]
+        if library_id is None and library_external_id not in (None, ''):
+            library_id = index.libraries_by_external_id.get(str(library_external_id))
+        if library_id is None and library_name:
+            library_id = index.libraries_by_name.get(library_name)
+
+        return library_id, item[0] if item else None, grandparent[0] if grandparent else None
+    except Exception as e:
+        current_app.logger.warning(f"Media_Item_Index.py - resolve(): Could not resolve media for server {server_id}, key {rating_key}: {e}")
+        return None, None, None
+
+
+def backfill_history_links(server_id=None, batch_size=5000, progress_callback=None):
+    """
+    Fill missing library/item references on existing history rows.
+
+    Works through the table in id ranges so each UPDATE stays short. Rows
+    whose items aren't synced stay NULL and are retried by the next backfill.
+    ``progress_callback(current, total, message)`` may return False to stop early.
+    Returns a dict with the number of rows touched per column.
+    """
+    history = MediaStreamHistory.__table__
+    items = MediaItem.__table__
+    libraries = MediaLibrary.__table__
+
+    scope = [history.c.server_id == server_id] if server_id is not None else []
+    bounds = db.session.query(func.min(history.c.id), func.max(history.c.id)).filter(*scope).one()
+    if bounds[0] is None:
+        return {'success': True, 'media_items': 0, 'libraries': 0, 'grandparents': 0, 'message': 'No stream history to link.'}
+    low, high = bounds
+
+    item_by_rating_key = select(func.min(items.c.id)).where(
+        items.c.server_id == history.c.server_id, items.c.rating_key == history.c.rating_key
+    ).scalar_subquery()
+    item_by_external_id = select(func.min(items.c.id)).where(
+        items.c.server_id == history.c.server_id, items.c.external_id == history.c.rating_key
+    ).scalar_subquery()
+    library_of_item = select(items.c.library_id).where(items.c.id == history.c.media_item_id).scalar_subquery()
+    library_by_name = select(func.min(libraries.c.id)).where(
+        libraries.c.server_id == history.c.server_id, libraries.c.name == history.c.library_name
+    ).scalar_subquery()
+    grandparent_by_title = select(func.min(items.c.id)).where(
+        items.c.library_id == history.c.library_id,
+        items.c.item_type.in_(('show', 'artist')),
+        items.c.title == history.c.grandparent_title
+    ).scalar_subquery()
+    movie_by_title = select(func.min(items.c.id)).where(
+        items.c.library_id == history.c.library_id,
+        items.c.item_type == 'movie',
+        items.c.title == history.c.media_title
+    ).scalar_subquery()
+
+    totals = {'media_items': 0, 'libraries': 0, 'grandparents': 0}
+    span = high - low + 1
+    start = low
+    while start <= high:
+        end = start + batch_size - 1
+        in_batch = [history.c.id.between(start, end)] + scope
+
+        def run(column, value, *conditions):
+            result = db.session.execute(
+                update(history).where(*in_batch, history.c[column].is_(None), value.isnot(None), *conditions).values({column: value})
+            )
+            return result.rowcount or 0
+
+        # Keys first, then the item's library, then title matches that need the library
+        totals['media_items'] += run('media_item_id', item_by_rating_key, history.c.rating_key.isnot(None))
+        totals['media_items'] += run('media_item_id', item_by_external_id, history.c.rating_key.isnot(None))
+        totals['libraries'] += run('library_id', library_of_item, history.c.media_item_id.isnot(None))
+        totals['libraries'] += run('library_id', library_by_name, history.c.library_name.isnot(None))
+        totals['grandparents'] += run('grandparent_media_item_id', grandparent_by_title,
+                                      and_(history.c.grandparent_title.isnot(None), history.c.library_id.isnot(None)))
+        totals['media_items'] += run('media_item_id', movie_by_title,
+                                     and_(history.c.media_type == 'movie', history.c.library_id.isnot(None)))
+        db.session.commit()
+
+        done = min(end, high) - low + 1
+        if progress_callback and progress_callback(done, span, f"Linked history rows up to id {min(end, high)}") is False:
+            return dict(totals, success=False, cancelled=True, message='Backfill cancelled.')
+        start = end + 1
+
+    current_app.logger.info(f"Media_Item_Index.py - backfill_history_links(): Server {server_id or 'all'}: {totals}")
+    return dict(totals, success=True,
+                message=f"Linked {totals['media_items']} items, {totals['libraries']} libraries and {totals['grandparents']} shows/artists.")
@@ -0,0 +1,104 @@
+# File: app/services/media_search.py
+"""
+Full-text search over synced media items.
+
+Title, sort title, summary, studio and year are indexed for every item of
+every library:
+
+- SQLite: the FTS5 table ``media_items_fts`` (see ``models_media_services``).
+  Triggers on ``media_items`` update it whenever sync inserts, edits or
+  deletes an item, so there is no separate indexing step.
+- PostgreSQL: a GIN index on a ``to_tsvector('simple', ...)`` expression.
+  Queries repeat the same expression so the planner uses the index.
+- Anything else, or a SQLite database whose index is missing: the search
+  falls back to ``ILIKE`` on title and summary.
+
+Each word of the query is matched as a prefix, and all words have to match,
+so "star wa" finds "Star Wars". Results are ranked by relevance, with title
+matches counting the most.
+
+Alembic batch migrations recreate ``media_items`` on SQLite, which drops the
+triggers. Run ``flask rebuild-media-search`` after such a migration (it is
+safe to run at any time).
+"""
+from sqlalchemy import Text, cast, func, literal_column, or_, text
+
+from app.extensions import db
+from app.models_media_services import MEDIA_SEARCH_FTS_TABLE, MEDIA_SEARCH_SQLITE_DDL, MediaItem
+from app.utils import fulltext_search
+
+_REBUILD_COMMAND = 'rebuild-media-search'
+
+# bm25() weights per FTS column: title, sort_title, summary, studio, year
+_FTS_WEIGHTS = "10.0, 5.0, 1.0, 2.0, 2.0"
+
+
+def backend():
+    """'fts5', 'postgres' or 'like' for the current database; checked once per database."""
+    return fulltext_search.search_backend(MEDIA_SEARCH_FTS_TABLE, _REBUILD_COMMAND)
+
+
+def _pg_document():
+    """The tsvector expression of the GIN index, written so it compiles to the same SQL."""
+    return fulltext_search.pg_document(MediaItem.title, MediaItem.sort_title, MediaItem.studio,
+                                       cast(MediaItem.year, Text), MediaItem.summary)
+
+
+def match_filter(query):
+    """
+    A filter clause for ``MediaItem`` queries that keeps items matching
+    ``query``, or ``None`` when the query has no searchable words.
+    """
+    terms = fulltext_search.search_terms(query)
+    if not terms:
+        return None
+    kind = backend()
+    if kind == 'fts5':
+        matches = text(f"SELECT rowid FROM {MEDIA_SEARCH_FTS_TABLE} WHERE {MEDIA_SEARCH_FTS_TABLE} MATCH :fts_query") \
+            .bindparams(fts_query=fulltext_search.fts_match(terms)).columns(literal_column('rowid'))
+        return MediaItem.id.in_(matches)
+    if kind == 'postgres':
+        return _pg_document().op('@@')(fulltext_search.pg_query(terms))
+    pattern = f"%{query.strip()}%"
+    return or_(MediaItem.title.ilike(pattern), MediaItem.summary.ilike(pattern))
+
+
+def search(query, limit=25, server_id=None, library_id=None, item_types=None, include_episodes=False):
+    """
+    Ranked matches across all libraries (or one server / library).
+    Returns ``[(MediaItem, score)]``; a higher score is a better match.
+    """
+    terms = fulltext_search.search_terms(query)
+    if not terms:
+        return []
+    kind = backend()
+    if kind == 'fts5':
+        ranked = text(
+            f"SELECT rowid AS item_id, -bm25({MEDIA_SEARCH_FTS_TABLE}, {_FTS_WEIGHTS}) AS score "
+            f"FROM {MEDIA_SEARCH_FTS_TABLE} WHERE {MEDIA_SEARCH_FTS_TABLE} MATCH :fts_query"
+        ).bindparams(fts_query=fulltext_search.fts_match(terms)).columns(literal_column('item_id'), literal_column('score')).subquery('ranked')
+        score = ranked.c.score
+        items = db.session.query(MediaItem, score).join(ranked, ranked.c.item_id == MediaItem.id)
+    elif kind == 'postgres':
+        score = func.ts_rank(_pg_document(), fulltext_search.pg_query(terms))
+        items = db.session.query(MediaItem, score).filter(_pg_document().op('@@')(fulltext_search.pg_query(terms)))
+    else:
+        # No index: titles that start with the query first, then other title matches, then summary matches
+        phrase = query.strip()
+        score = db.case((MediaItem.title.ilike(f"{phrase}%"), 3), (MediaItem.title.ilike(f"%{phrase}%"), 2), else_=1)
+        items = db.session.query(MediaItem, score).filter(match_filter(query))
+
+    if server_id:
+        items = items.filter(MediaItem.server_id == server_id)
+    if library_id:
+        items = items.filter(MediaItem.library_id == library_id)
+    if item_types:
+        items = items.filter(MediaItem.item_type.in_(item_types))
+    elif not include_episodes:
+        items = items.filter(MediaItem.item_type != 'episode')
+    return items.order_by(score.desc(), MediaItem.sort_title, MediaItem.id).limit(limit).all()
+
+
+def rebuild_index():
+    """(Re)create the SQLite index and its triggers and refill it from media_items. Returns the backend in use."""
+    return fulltext_search.rebuild_sqlite_index(MEDIA_SEARCH_FTS_TABLE, MEDIA_SEARCH_SQLITE_DDL, _REBUILD_COMMAND)
@@ -3,6 +3,7 @@ from typing import Dict, Any, Optional
 from app.models_media_services import ServiceType, MediaServer
 from app.services.base_media_service import BaseMediaService
 from app.services.plugin_manager import plugin_manager
+from app.services import metrics
 
 class MediaServiceFactory:
     """Plugin-aware factory class for creating media service instances"""
@@ -41,7 +42,8 @@ class MediaServiceFactory:
             return None
         
         try:
-            service_instance = service_class(server_config)
+            # Calls to the plugin's BaseMediaService methods are timed per server (once per class)
+            service_instance = metrics.instrument_service_class(service_class)(server_config)
             return service_instance
         except Exception as e:
             current_app.logger.error(f"MediaServiceFactory - Error creating service instance: {e}")
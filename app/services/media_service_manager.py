@@ -3,7 +3,9 @@ from typing import List, Dict, Any, Optional
 from flask import current_app
 from app.models_media_services import MediaServer, MediaLibrary, ServiceType
 from app.models import User, UserType, Setting
+from app.models_payloads import prefetch_payloads
 from app.services.media_service_factory import MediaServiceFactory
+from app.services import media_item_index, write_queue
 from app.extensions import db
 from datetime import datetime
 
@@ -59,10 +61,13 @@ class MediaServiceManager:
         if not service:
             return {'success': False, 'message': 'Service type not supported'}
         
+        queued = False
         try:
             current_app.logger.info(f"Starting library sync for server {server_id} ({server.server_nickname})")
             libraries_data = service.get_libraries()
             current_app.logger.info(f"Retrieved {len(libraries_data)} libraries from {server.server_nickname}")
+            write_queue.acquire('library sync')
+            queued = True
             
             # Update database
             existing_libs = {lib.external_id: lib for lib in server.libraries}
@@ -138,11 +143,13 @@ class MediaServiceManager:
                         'server_name': server.server_nickname,
                         'external_id': external_id
                     })
+                    media_item_index.unlink_library(lib.id, include_library=True)
                     db.session.delete(lib)
                     removed_count += 1
             
             server.last_sync_at = datetime.utcnow()
             db.session.commit()
+            media_item_index.invalidate(server.id)
             current_app.logger.info(f"Library sync completed: {added_count} added, {updated_count} updated, {removed_count} removed")
             
             return {
@@ -160,6 +167,9 @@ class MediaServiceManager:
             db.session.rollback()
             current_app.logger.error(f"Error syncing libraries for server {server_id} ({server.server_nickname}): {e}", exc_info=True)
             return {'success': False, 'message': f'Sync failed: {str(e)}'}
+        finally:
+            if queued:
+                write_queue.release()
     
     @staticmethod
     def sync_server_users(server_id: int) -> Dict[str, Any]:
@@ -172,6 +182,7 @@ class MediaServiceManager:
         if not service:
             return {'success': False, 'message': 'Service type not supported'}
 
+        queued = False
         try:
             # Test connection first before attempting to sync users
             connection_test = service.test_connection()
@@ -192,6 +203,8 @@ class MediaServiceManager:
                     'message': f'No users returned from {server.server_nickname}. Server may be offline or experiencing issues.'
                 }
             
+            write_queue.acquire('user sync')
+            queued = True
             added_count = 0
             updated_count = 0
             removed_count = 0
@@ -203,6 +216,11 @@ class MediaServiceManager:
             server_libraries = {lib.external_id: lib.name for lib in server.libraries}
             external_user_ids_from_service = {str(u.get('id')) for u in users_data if u.get('id')}
 
+            # Load the stored raw payloads in one query so assigning an unchanged one doesn't rewrite it.
+            # Keeping the list referenced keeps these instances (and their payloads) in the identity map.
+            existing_service_users = User.query.filter_by(userType=UserType.SERVICE, server_id=server_id).all()
+            prefetch_payloads(existing_service_users, 'user_raw_data')
+
             for user_data in users_data:
                 user = MediaServiceManager._find_or_create_user(user_data, server)
                 
@@ -515,6 +533,9 @@ class MediaServiceManager:
             db.session.rollback()
             current_app.logger.error(f"Error syncing users for server {server_id}: {e}", exc_info=True)
             return {'success': False, 'message': f'Sync failed: {str(e)}'}
+        finally:
+            if queued:
+                write_queue.release()
     
     @staticmethod
     def _find_or_create_user(user_data: Dict[str, Any], server: MediaServer) -> Optional[User]:
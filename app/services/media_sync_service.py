@@ -4,25 +4,30 @@ Handles syncing media items from external services to local database for faster
 """
 
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable
 from flask import current_app
 from sqlalchemy import and_, or_
 from app.extensions import db
 from app.models_media_services import MediaItem, MediaLibrary, MediaServer
+from app.models_payloads import prefetch_payloads
 from app.services.media_service_factory import MediaServiceFactory
+from app.services import media_item_index, media_search, write_queue
 
 
 class MediaSyncService:
     """Service for syncing media items from external services to local database"""
     
     @staticmethod
-    def sync_library_content(library_id: int, force_full_sync: bool = False) -> Dict[str, Any]:
+    def sync_library_content(library_id: int, force_full_sync: bool = False,
+                             progress_callback: Optional[Callable[..., bool]] = None) -> Dict[str, Any]:
         """
         Sync content for a specific library
         
         Args:
             library_id: ID of the library to sync
             force_full_sync: If True, sync all items regardless of last sync time
+            progress_callback: Optional ``callback(current, total, message)`` called after each
+                fetched page. Returning False stops the sync before anything is written.
             
         Returns:
             Dict with sync results
@@ -67,6 +72,13 @@ class MediaSyncService:
                     all_items.extend(items)
                     current_app.logger.debug(f"Retrieved {len(items)} items from page {page}, total so far: {len(all_items)}")
                     
+                    if progress_callback is not None:
+                        expected_total = content_data.get('total') or library.item_count
+                        keep_going = progress_callback(len(all_items), expected_total, f"Fetched {len(all_items)} items from {library.name}")
+                        if keep_going is False:
+                            current_app.logger.info(f"Library sync for {library.name} cancelled after {len(all_items)} items")
+                            return {'success': False, 'cancelled': True, 'library_name': library.name, 'error': 'Sync cancelled'}
+                    
                     # Check if we've got all items
                     if len(items) < per_page:
                         break
@@ -84,15 +96,20 @@ class MediaSyncService:
             
             current_app.logger.info(f"Retrieved {len(all_items)} items from {library.name}")
             
-            # Sync items to database
-            sync_results = MediaSyncService._sync_items_to_db(library, all_items)
-            
-            # Note: Episodes are synced on-demand when users visit show pages, not during library sync
+            if progress_callback is not None:
+                progress_callback(len(all_items), len(all_items), f"Saving {len(all_items)} items")
             
-            # Update library last sync time
-            library.last_scanned = datetime.utcnow()
-            db.session.add(library)
-            db.session.commit()
+            # Sync items to database
+            with write_queue.serialized('library content sync'):
+                sync_results = MediaSyncService._sync_items_to_db(library, all_items)
+                
+                # Note: Episodes are fetched afterwards by the episode_prefetch background job
+                
+                # Update library last sync time
+                library.last_scanned = datetime.utcnow()
+                db.session.add(library)
+                db.session.commit()
+            media_item_index.invalidate(library.server_id)
             
             current_app.logger.info(f"Completed sync for library {library.name}: {sync_results}")
             
@@ -129,6 +146,8 @@ class MediaSyncService:
         # Get existing items for this library
         existing_items = {item.external_id: item for item in 
                          MediaItem.query.filter_by(library_id=library.id).all()}
+        # Load the stored payloads up front so unchanged ones aren't rewritten
+        prefetch_payloads(existing_items.values(), 'extra_metadata')
         
         current_external_ids = set()
         
@@ -177,6 +196,7 @@ class MediaSyncService:
         
         removed_count = 0
         removed_items = []
+        media_item_index.unlink_items([item.id for item in items_to_remove])
         for item in items_to_remove:
             removed_items.append({
                 'title': item.title,
@@ -262,6 +282,8 @@ class MediaSyncService:
             if raw_data and isinstance(raw_data, dict):
                 rating_key = raw_data.get('ratingKey')
             
+            season_number, episode_number, edition = MediaItem.numbering_from_metadata(raw_data)
+            
             media_item = MediaItem(
                 library_id=library.id,
                 server_id=library.server_id,
@@ -273,11 +295,15 @@ class MediaSyncService:
                 item_type=item_data.get('type', 'unknown'),
                 summary=item_data.get('summary') or item_data.get('plot') or item_data.get('overview'),
                 year=item_data.get('year'),
+                studio=MediaSyncService._studio_from(item_data),
                 rating=item_data.get('rating'),
                 duration=duration,
                 thumb_path=thumb_path,
                 added_at=added_at,
                 last_synced=datetime.utcnow(),
+                season_number=season_number,
+                episode_number=episode_number,
+                edition=edition,
                 extra_metadata=item_data.get('raw_data', {})
             )
             
@@ -288,6 +314,17 @@ class MediaSyncService:
             current_app.logger.error(f"Error creating media item: {e}")
             return None
     
+    @staticmethod
+    def _studio_from(item_data: Dict[str, Any]) -> Optional[str]:
+        """Studio (Plex), first of Studios (Jellyfin/Emby) or publisher (Komga) of a service item"""
+        studio = item_data.get('studio') or item_data.get('publisher')
+        if not studio:
+            raw_data = item_data.get('raw_data')
+            studios = raw_data.get('Studios') if isinstance(raw_data, dict) else None
+            if studios and isinstance(studios, list) and isinstance(studios[0], dict):
+                studio = studios[0].get('Name')
+        return str(studio)[:255] if studio else None
+    
     @staticmethod
     def _update_media_item(item: MediaItem, item_data: Dict[str, Any]) -> List[str]:
         """Update an existing MediaItem with new data"""
@@ -327,13 +364,19 @@ class MediaSyncService:
                 changes.append(f"Rating: {old_rating} → {new_rating_str}")
                 item.rating = new_rating
             
+            new_studio = MediaSyncService._studio_from(item_data)
+            if item.studio != new_studio:
+                changes.append(f"Studio: {item.studio} → {new_studio}")
+                item.studio = new_studio
+            
             if item.rating_key != new_rating_key:
                 changes.append(f"Rating Key: {item.rating_key} → {new_rating_key}")
                 item.rating_key = new_rating_key
             
-            # Always update last_synced and extra_metadata
+            # Always update last_synced and extra_metadata (the payload is only rewritten when it differs)
             item.last_synced = datetime.utcnow()
             item.extra_metadata = item_data.get('raw_data', {})
+            item.season_number, item.episode_number, item.edition = MediaItem.numbering_from_metadata(raw_data)
             
             if changes:
                 db.session.add(item)
@@ -396,6 +439,7 @@ class MediaSyncService:
                                 )
                             )
                             existing_episodes = {ep.external_id: ep for ep in existing_episodes_query.all()}
+                            prefetch_payloads(existing_episodes.values(), 'extra_metadata')
                             
                             current_episode_ids = set()
                             
@@ -432,6 +476,7 @@ class MediaSyncService:
                             episodes_to_remove = [ep for ep_id, ep in existing_episodes.items() 
                                                 if ep_id not in current_episode_ids]
                             
+                            media_item_index.unlink_items([episode.id for episode in episodes_to_remove])
                             for episode in episodes_to_remove:
                                 db.session.delete(episode)
                                 removed_count += 1
@@ -471,10 +516,143 @@ class MediaSyncService:
                 'errors': [str(e)]
             }
     
+    @staticmethod
+    def fetch_show_episodes(service, show_key: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        Fetch the episode list of a show from its service. Makes no database
+        calls, so background prefetch workers can run several at once.
+        
+        Args:
+            service: Media service instance for the show's server
+            show_key: The show's rating_key, or its external_id if it has none
+            
+        Returns:
+            List of episode dicts (empty if the show has none), or None if the
+            service could not be asked
+        """
+        if not show_key or not hasattr(service, 'get_show_episodes'):
+            return None
+        episodes = []
+        page = 1
+        while True:
+            episodes_data = service.get_show_episodes(show_key, page=page, per_page=1000)
+            if not episodes_data or episodes_data.get('error'):
+                return None
+            episodes.extend(episodes_data.get('items') or [])
+            if not episodes_data.get('has_next'):
+                return episodes
+            page += 1
+    
+    @staticmethod
+    def apply_show_episodes(show: MediaItem, episodes: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Write a fetched episode list into the cache: add new episodes, update
+        changed ones, remove those that are gone and stamp the show's
+        ``episodes_synced_at``. Not committed.
+        
+        Returns:
+            Dict with added/updated/removed counts, cached total and errors
+        """
+        library = show.library
+        added_count = 0
+        updated_count = 0
+        removed_count = 0
+        errors = []
+        existing_episodes = {}
+        
+        if episodes:
+            # Get existing episodes for this show - check both external_id and rating_key as parent_id
+            existing_episodes_query = MediaItem.query.filter(
+                MediaItem.library_id == library.id,
+                MediaItem.item_type == 'episode',
+                or_(
+                    MediaItem.parent_id == show.external_id,
+                    MediaItem.parent_id == show.rating_key
+                )
+            )
+            existing_episodes = {ep.external_id: ep for ep in existing_episodes_query.all()}
+            
+            # Also check for episodes that might exist without proper parent_id (orphaned episodes)
+            orphaned_episodes = MediaItem.query.filter(
+                MediaItem.library_id == library.id,
+                MediaItem.item_type == 'episode',
+                MediaItem.parent_id.is_(None)
+            ).all()
+            
+            current_app.logger.debug(f"Found {len(existing_episodes)} existing episodes with proper parent_id for show {show.title}")
+            current_app.logger.debug(f"Found {len(orphaned_episodes)} orphaned episodes (no parent_id) in library")
+            
+            # Add orphaned episodes to existing episodes dict to prevent duplicates
+            for ep in orphaned_episodes:
+                if ep.external_id not in existing_episodes:
+                    existing_episodes[ep.external_id] = ep
+                    current_app.logger.debug(f"Added orphaned episode to existing: {ep.title} (external_id: {ep.external_id})")
+            
+            prefetch_payloads(existing_episodes.values(), 'extra_metadata')
+            
+            current_episode_ids = set()
+            
+            for episode_data in episodes:
+                try:
+                    episode_external_id = str(episode_data.get('id', ''))
+                    if not episode_external_id:
+                        continue
+                    
+                    current_episode_ids.add(episode_external_id)
+                    
+                    # Check if episode exists
+                    existing_episode = existing_episodes.get(episode_external_id)
+                    
+                    if existing_episode:
+                        # Update existing episode
+                        changes = MediaSyncService._update_media_item(existing_episode, episode_data)
+                        if changes:
+                            updated_count += 1
+                    else:
+                        # Create new episode - use rating_key as parent_id if available, otherwise external_id
+                        episode_data['parent_id'] = show.rating_key if show.rating_key else show.external_id
+                        new_episode = MediaSyncService._create_media_item(library, episode_data)
+                        if new_episode:
+                            added_count += 1
+                        else:
+                            current_app.logger.error(f"Failed to create episode: {episode_data.get('title')}")
+                            
+                except Exception as e:
+                    error_msg = f"Error processing episode {episode_data.get('title', 'unknown')}: {str(e)}"
+                    current_app.logger.warning(error_msg)
+                    errors.append(error_msg)
+                    continue
+            
+            # Remove episodes that no longer exist
+            episodes_to_remove = [ep for ep_id, ep in existing_episodes.items() 
+                                if ep_id not in current_episode_ids]
+            
+            media_item_index.unlink_items([episode.id for episode in episodes_to_remove])
+            for episode in episodes_to_remove:
+                db.session.delete(episode)
+                removed_count += 1
+        else:
+            current_app.logger.debug(f"No episodes found for show: {show.title}")
+        
+        # Update show's last synced time for episodes
+        now = datetime.utcnow()
+        show.last_synced = now
+        show.episodes_synced_at = now
+        db.session.add(show)
+        
+        return {
+            'added': added_count,
+            'updated': updated_count,
+            'removed': removed_count,
+            'total_episodes': added_count + len(existing_episodes) - removed_count,
+            'errors': errors
+        }
+    
     @staticmethod
     def sync_show_episodes(show_id: int) -> Dict[str, Any]:
         """
-        Sync episodes for a single TV show on-demand
+        Sync episodes for a single TV show on-demand (the episode tab's Sync
+        button). Shows are normally kept current by ``episode_prefetch``.
         
         Args:
             show_id: Database ID of the show (MediaItem.id)
@@ -495,133 +673,38 @@ class MediaSyncService:
             current_app.logger.info(f"Starting episode sync for show: {show.title}")
             
             # Create service instance
-            from app.services.media_service_factory import MediaServiceFactory
             service = MediaServiceFactory.create_service_from_db(library.server)
             if not service:
                 return {'success': False, 'error': 'Could not create service instance'}
             
             # Use rating_key if available, otherwise external_id
-            show_external_id = show.rating_key if show.rating_key else show.external_id
-            if not show_external_id:
+            show_key = show.rating_key if show.rating_key else show.external_id
+            if not show_key:
                 return {'success': False, 'error': 'No show ID available'}
-            
-            added_count = 0
-            updated_count = 0
-            removed_count = 0
-            errors = []
-            
-            # Get episodes from service
-            if hasattr(service, 'get_show_episodes'):
-                episodes_data = service.get_show_episodes(show_external_id, page=1, per_page=1000)
-                if episodes_data and episodes_data.get('items'):
-                    episodes = episodes_data['items']
-                    
-                    # Get existing episodes for this show - check both external_id and rating_key as parent_id
-                    existing_episodes_query = MediaItem.query.filter(
-                        MediaItem.library_id == library.id,
-                        MediaItem.item_type == 'episode',
-                        or_(
-                            MediaItem.parent_id == show.external_id,
-                            MediaItem.parent_id == show.rating_key
-                        )
-                    )
-                    existing_episodes = {ep.external_id: ep for ep in existing_episodes_query.all()}
-                    
-                    # Also check for episodes that might exist without proper parent_id (orphaned episodes)
-                    orphaned_episodes_query = MediaItem.query.filter(
-                        MediaItem.library_id == library.id,
-                        MediaItem.item_type == 'episode',
-                        MediaItem.parent_id.is_(None)
-                    )
-                    orphaned_episodes = orphaned_episodes_query.all()
-                    
-                    current_app.logger.debug(f"Found {len(existing_episodes)} existing episodes with proper parent_id for show {show.title}")
-                    current_app.logger.debug(f"Found {len(orphaned_episodes)} orphaned episodes (no parent_id) in library")
-                    
-                    # Log some existing episodes for debugging
-                    if existing_episodes:
-                        sample_episodes = list(existing_episodes.values())[:3]
-                        for ep in sample_episodes:
-                            current_app.logger.debug(f"Existing episode: {ep.title} (external_id: {ep.external_id}, parent_id: {ep.parent_id})")
-                    
-                    # Add orphaned episodes to existing episodes dict to prevent duplicates
-                    for ep in orphaned_episodes:
-                        if ep.external_id not in existing_episodes:
-                            existing_episodes[ep.external_id] = ep
-                            current_app.logger.debug(f"Added orphaned episode to existing: {ep.title} (external_id: {ep.external_id})")
-                    
-                    current_app.logger.debug(f"Total episodes in existing_episodes dict after orphan check: {len(existing_episodes)}")
-                    
-                    current_episode_ids = set()
-                    
-                    for episode_data in episodes:
-                        try:
-                            episode_external_id = str(episode_data.get('id', ''))
-                            if not episode_external_id:
-                                continue
-                            
-                            current_episode_ids.add(episode_external_id)
-                            
-                            # Check if episode exists
-                            existing_episode = existing_episodes.get(episode_external_id)
-                            
-                            if existing_episode:
-                                # Update existing episode
-                                changes = MediaSyncService._update_media_item(existing_episode, episode_data)
-                                if changes:
-                                    updated_count += 1
-                            else:
-                                # Create new episode - use rating_key as parent_id if available, otherwise external_id
-                                parent_id_to_use = show.rating_key if show.rating_key else show.external_id
-                                episode_data['parent_id'] = parent_id_to_use
-                                current_app.logger.debug(f"Creating new episode: {episode_data.get('title')} with parent_id: {parent_id_to_use} for show: {show.title}")
-                                new_episode = MediaSyncService._create_media_item(library, episode_data)
-                                if new_episode:
-                                    added_count += 1
-                                    current_app.logger.debug(f"Successfully created episode: {new_episode.title} (external_id: {new_episode.external_id}, parent_id: {new_episode.parent_id})")
-                                else:
-                                    current_app.logger.error(f"Failed to create episode: {episode_data.get('title')}")
-                                    
-                        except Exception as e:
-                            error_msg = f"Error processing episode {episode_data.get('title', 'unknown')}: {str(e)}"
-                            current_app.logger.warning(error_msg)
-                            errors.append(error_msg)
-                            continue
-                    
-                    # Remove episodes that no longer exist
-                    episodes_to_remove = [ep for ep_id, ep in existing_episodes.items() 
-                                        if ep_id not in current_episode_ids]
-                    
-                    for episode in episodes_to_remove:
-                        db.session.delete(episode)
-                        removed_count += 1
-                        
-                else:
-                    current_app.logger.debug(f"No episodes found for show: {show.title}")
-            else:
+            if not hasattr(service, 'get_show_episodes'):
                 return {'success': False, 'error': 'Service does not support episode retrieval'}
             
-            # Update show's last synced time for episodes
-            show.last_synced = datetime.utcnow()
-            db.session.add(show)
+            # Get episodes from service
+            episodes = MediaSyncService.fetch_show_episodes(service, show_key)
+            if episodes is None:
+                return {'success': False, 'error': 'Could not fetch episodes from the server'}
             
-            # Commit changes
-            try:
-                db.session.commit()
-                current_app.logger.info(f"Episode sync completed for {show.title}: {added_count} added, {updated_count} updated, {removed_count} removed")
-            except Exception as e:
-                current_app.logger.error(f"Error committing episode sync changes: {e}")
-                db.session.rollback()
-                raise
+            with write_queue.serialized('episode sync'):
+                result = MediaSyncService.apply_show_episodes(show, episodes)
+                
+                # Commit changes
+                try:
+                    db.session.commit()
+                    current_app.logger.info(f"Episode sync completed for {show.title}: {result['added']} added, {result['updated']} updated, {result['removed']} removed")
+                except Exception as e:
+                    current_app.logger.error(f"Error committing episode sync changes: {e}")
+                    db.session.rollback()
+                    raise
             
             return {
                 'success': True,
                 'show_title': show.title,
-                'added': added_count,
-                'updated': updated_count,
-                'removed': removed_count,
-                'total_episodes': added_count + len(existing_episodes) - removed_count,
-                'errors': errors
+                **result
             }
             
         except Exception as e:
@@ -652,15 +735,11 @@ class MediaSyncService:
                 MediaItem.item_type != 'episode'
             )
             
-            # Apply search filter if provided
+            # Apply search filter if provided (full-text index, see media_search)
             if search_query:
-                search_term = f"%{search_query.lower()}%"
-                query = query.filter(
-                    or_(
-                        MediaItem.title.ilike(search_term),
-                        MediaItem.summary.ilike(search_term)
-                    )
-                )
+                search_filter = media_search.match_filter(search_query)
+                if search_filter is not None:
+                    query = query.filter(search_filter)
             
             # Apply sorting
             if sort_by.startswith('total_streams'):
@@ -668,9 +747,9 @@ class MediaSyncService:
                 from app.models_media_services import MediaStreamHistory
                 query = query.outerjoin(
                     MediaStreamHistory,
-                    and_(
-                        MediaStreamHistory.server_id == MediaItem.server_id,
-                        MediaStreamHistory.media_title == MediaItem.title
+                    or_(
+                        MediaStreamHistory.media_item_id == MediaItem.id,
+                        MediaStreamHistory.grandparent_media_item_id == MediaItem.id
                     )
                 ).group_by(MediaItem.id)
                 
@@ -710,30 +789,22 @@ class MediaSyncService:
             # Get ALL items first (for proper sorting by stream counts)
             all_items = query.all()
             
+            # Stream counts for all items in two grouped queries
+            # For TV shows, count all episodes (resolved to the show); for movies and other content, count direct plays
+            from app.models_media_services import MediaStreamHistory
+            show_ids = [item.id for item in all_items if item.item_type and item.item_type.lower() in ['show', 'series']]
+            other_ids = [item.id for item in all_items if not (item.item_type and item.item_type.lower() in ['show', 'series'])]
+            stream_counts = {}
+            for column, ids in ((MediaStreamHistory.grandparent_media_item_id, show_ids), (MediaStreamHistory.media_item_id, other_ids)):
+                for start in range(0, len(ids), 500):
+                    stream_counts.update(db.session.query(column, db.func.count(MediaStreamHistory.id))
+                                         .filter(column.in_(ids[start:start + 500])).group_by(column).all())
+            
             # Convert to dict format and add stream counts
             items_data = []
             for item in all_items:
-                item_dict = item.to_dict()
-                
-                # Get stream count for this item
-                from app.models_media_services import MediaStreamHistory
-                
-                # For TV shows, count all episodes (grandparent_title = show title)
-                # For movies and other content, count direct matches (media_title = content title)
-                if item.item_type and item.item_type.lower() in ['show', 'series']:
-                    # For TV shows, count all episodes of the show
-                    stream_count = MediaStreamHistory.query.filter(
-                        MediaStreamHistory.server_id == item.server_id,
-                        MediaStreamHistory.grandparent_title == item.title
-                    ).count()
-                else:
-                    # For movies and other content, count direct matches
-                    stream_count = MediaStreamHistory.query.filter(
-                        MediaStreamHistory.server_id == item.server_id,
-                        MediaStreamHistory.media_title == item.title
-                    ).count()
-                
-                item_dict['stream_count'] = stream_count
+                item_dict = item.to_dict(include_raw_data=False)
+                item_dict['stream_count'] = stream_counts.get(item.id, 0)
                 items_data.append(item_dict)
             
             # Apply manual sorting after adding stream counts (ensures consistent sorting)
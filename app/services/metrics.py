@@ -0,0 +1,383 @@
+# File: app/services/metrics.py
+"""
+In-process metrics, served in the Prometheus text format at ``/metrics`` and
+summarized on Settings > Metrics.
+
+- Media services: a latency histogram and an exception counter for every
+  ``BaseMediaService`` method, per server. The factory passes each plugin
+  class through ``instrument_service_class`` before building a service from
+  it, so third-party plugins are measured without changes.
+- Database: a duration histogram of the SQL statements run by each endpoint
+  (``background`` outside requests). Its count is the number of queries.
+- Scheduler: run time and errors of every APScheduler job, runs missed past
+  their misfire grace time, and runs skipped because the previous one was
+  still going (overlaps).
+- Caches: hits and misses of the in-process caches, and the hit ratio.
+- Session monitor: tick duration, and the active streams per server as of the
+  last tick.
+
+Each process keeps its own numbers; with several gunicorn workers every worker
+reports what it served. ``METRICS_ENABLED = False`` installs none of the hooks.
+"""
+import functools
+import threading
+import time
+from bisect import bisect_left
+
+from flask import has_request_context, request
+from sqlalchemy import event
+
+_registry = []
+_enabled = False
+_started_at = time.time()
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+_QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+_JOB_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+# BaseMediaService methods that don't talk to the server
+_UNTIMED_METHODS = {'supports_feature', 'log_info', 'log_error', 'log_warning'}
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}  # label values -> value
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def items(self):
+        with self._lock:
+            return [(key, value.copy() if isinstance(value, list) else value) for key, value in self._values.items()]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def lines(self):
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in sorted(self.items())]
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def replace(self, values):
+        """Set every series at once, dropping the ones not in ``values`` (label values tuple -> value)."""
+        with self._lock:
+            self._values = dict(values)
+
+    def lines(self):
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in sorted(self.items())]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=_LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)  # len(buckets) is the +Inf bucket
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    def lines(self):
+        lines = []
+        for key, state in sorted(self.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), state[:-1]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, ('le', _number(bound)))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(state[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+    def stats(self):
+        """Per series: (label values, count, sum, estimated 95th percentile)."""
+        return [(key, sum(state[:-1]), state[-1], _quantile(self.buckets, state[:-1], 0.95)) for key, state in self.items()]
+
+
+MEDIA_SERVICE_SECONDS = Histogram('mum_media_service_call_seconds', 'Duration of media service (plugin) method calls',
+                                  ('service', 'server', 'method'))
+MEDIA_SERVICE_ERRORS = Counter('mum_media_service_errors_total', 'Media service method calls that raised an exception',
+                               ('service', 'server', 'method'))
+DB_QUERY_SECONDS = Histogram('mum_db_query_seconds', 'Duration of SQL statements, by the endpoint that ran them',
+                             ('endpoint',), buckets=_QUERY_BUCKETS)
+JOB_SECONDS = Histogram('mum_scheduler_job_seconds', 'Run time of scheduled jobs', ('job',), buckets=_JOB_BUCKETS)
+JOB_ERRORS = Counter('mum_scheduler_job_errors_total', 'Scheduled job runs that raised an exception', ('job',))
+JOB_MISSED = Counter('mum_scheduler_job_missed_total', 'Scheduled job runs missed past their misfire grace time', ('job',))
+JOB_OVERLAPS = Counter('mum_scheduler_job_overlaps_total', 'Scheduled job runs skipped because the previous run was still going', ('job',))
+CACHE_LOOKUPS = Counter('mum_cache_lookups_total', 'In-process cache lookups', ('cache', 'result'))
+CACHE_HIT_RATIO = Gauge('mum_cache_hit_ratio', 'Share of cache lookups that were hits', ('cache',))
+MONITOR_TICK_SECONDS = Histogram('mum_session_monitor_tick_seconds', 'Duration of a session monitor tick', buckets=_LATENCY_BUCKETS)
+ACTIVE_STREAMS = Gauge('mum_active_streams', 'Active streams per server as of the last session monitor tick', ('server',))
+PROCESS_START = Gauge('mum_process_start_time_seconds', 'Start time of this process (Unix time)')
+PROCESS_START.set(_started_at)
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _quantile(buckets, counts, q):
+    """Estimate a quantile from bucket counts, interpolating linearly within the bucket (like histogram_quantile)."""
+    total = sum(counts)
+    if not total:
+        return None
+    rank = q * total
+    cumulative = 0
+    for index, count in enumerate(counts):
+        if cumulative + count >= rank:
+            if index >= len(buckets):
+                return buckets[-1]  # Beyond the largest bucket: all we know is that it's larger
+            lower = buckets[index - 1] if index else 0.0
+            return lower + (buckets[index] - lower) * ((rank - cumulative) / count if count else 0)
+        cumulative += count
+    return buckets[-1]
+
+
+def enabled():
+    return _enabled
+
+
+# --- Media services ---
+
+def _service_method_names():
+    from app.services.base_media_service import BaseMediaService
+    return [name for name, value in vars(BaseMediaService).items()
+            if not name.startswith('_') and callable(value) and name not in _UNTIMED_METHODS]
+
+
+def _service_labels(service, method_name):
+    try:
+        service_type = service.service_type.value
+    except Exception:
+        service_type = type(service).__name__
+    return {'service': service_type, 'server': service.name or str(service.server_id), 'method': method_name}
+
+
+def _timed_method(method_name, method):
+    @functools.wraps(method)
+    def timed(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        except Exception:
+            MEDIA_SERVICE_ERRORS.inc(**_service_labels(self, method_name))
+            raise
+        finally:
+            MEDIA_SERVICE_SECONDS.observe(time.perf_counter() - started, **_service_labels(self, method_name))
+    timed._metrics_timed = True
+    return timed
+
+
+def instrument_service_class(service_class):
+    """Time the ``BaseMediaService`` methods of a plugin class, in place (once per class). Returns the class."""
+    if not _enabled or service_class.__dict__.get('_metrics_instrumented'):
+        return service_class
+    for name in _service_method_names():
+        method = getattr(service_class, name, None)
+        if callable(method) and not getattr(method, '_metrics_timed', False):
+            setattr(service_class, name, _timed_method(name, method))
+    service_class._metrics_instrumented = True
+    return service_class
+
+
+# --- Database ---
+
+def _endpoint():
+    if not has_request_context():
+        return 'background'
+    return request.endpoint or 'unmatched'
+
+
+def instrument_engine(engine):
+    """Time every SQL statement run on ``engine``."""
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _query_started(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._metrics_started = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _query_finished(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_metrics_started', None)
+        if started is not None:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started, endpoint=_endpoint())
+
+
+# --- Scheduler ---
+
+_job_started = {}  # (job id, scheduled run time) -> perf_counter at submission
+_job_lock = threading.Lock()
+
+
+def _on_job_event(scheduler_event):
+    from apscheduler.events import EVENT_JOB_SUBMITTED, EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED, EVENT_JOB_ERROR
+    job_id = scheduler_event.job_id
+    if scheduler_event.code == EVENT_JOB_SUBMITTED:
+        now = time.perf_counter()
+        with _job_lock:
+            for run_time in scheduler_event.scheduled_run_times:
+                _job_started[(job_id, run_time)] = now
+        return
+    if scheduler_event.code == EVENT_JOB_MAX_INSTANCES:
+        JOB_OVERLAPS.inc(len(scheduler_event.scheduled_run_times) or 1, job=job_id)
+        return
+
+    with _job_lock:
+        started = _job_started.pop((job_id, scheduler_event.scheduled_run_time), None)
+    if scheduler_event.code == EVENT_JOB_MISSED:
+        JOB_MISSED.inc(job=job_id)
+        return
+    if started is not None:
+        JOB_SECONDS.observe(time.perf_counter() - started, job=job_id)
+    if scheduler_event.code == EVENT_JOB_ERROR:
+        JOB_ERRORS.inc(job=job_id)
+
+
+def watch_scheduler(scheduler):
+    """Record run times, errors, misfires and overlaps of the scheduler's jobs."""
+    if not _enabled:
+        return
+    from apscheduler.events import (EVENT_JOB_SUBMITTED, EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED,
+                                    EVENT_JOB_EXECUTED, EVENT_JOB_ERROR)
+    scheduler.add_listener(_on_job_event, EVENT_JOB_SUBMITTED | EVENT_JOB_MAX_INSTANCES | EVENT_JOB_MISSED |
+                           EVENT_JOB_EXECUTED | EVENT_JOB_ERROR)
+
+
+# --- Caches and the session monitor ---
+
+def record_cache(cache, hits=0, misses=0):
+    """Count lookups of an in-process cache."""
+    if hits:
+        CACHE_LOOKUPS.inc(hits, cache=cache, result='hit')
+    if misses:
+        CACHE_LOOKUPS.inc(misses, cache=cache, result='miss')
+
+
+def set_active_streams(servers, sessions):
+    """Active streams per server from the monitor's ``get_all_active_sessions()``; servers without any report 0."""
+    names = {server.id: server.server_nickname for server in servers}
+    counts = {server_id: 0 for server_id in names}
+    for session in sessions:
+        server_id = session.get('server_id') if isinstance(session, dict) else getattr(session, 'server_id', None)
+        counts[server_id] = counts.get(server_id, 0) + 1
+    ACTIVE_STREAMS.replace({(names.get(server_id, str(server_id)),): count for server_id, count in counts.items()})
+
+
+def _cache_totals():
+    totals = {}
+    for (cache, result), count in CACHE_LOOKUPS.items():
+        totals.setdefault(cache, {'hit': 0, 'miss': 0})[result] = count
+    return totals
+
+
+# --- Output ---
+
+def init_app(app, engine):
+    """Turn metrics on for this process (unless ``METRICS_ENABLED`` is off) and time ``engine``'s statements."""
+    global _enabled
+    if not app.config.get('METRICS_ENABLED', True):
+        return False
+    if not _enabled:
+        _enabled = True
+        instrument_engine(engine)
+    return True
+
+
+def render_text():
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    CACHE_HIT_RATIO.replace({(cache,): counts['hit'] / (counts['hit'] + counts['miss'])
+                             for cache, counts in _cache_totals().items() if counts['hit'] + counts['miss']})
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.lines())
+    return '\n'.join(lines) + '\n'
+
+
+def _rows(histogram, errors=None, scale=1000.0):
+    rows = []
+    for key, count, total, p95 in histogram.stats():
+        rows.append({
+            'labels': dict(zip(histogram.labelnames, key)),
+            'count': count,
+            'total': total * scale,
+            'avg': total * scale / count if count else 0.0,
+            'p95': p95 * scale if p95 is not None else None,
+            'errors': errors.value(**dict(zip(histogram.labelnames, key))) if errors else 0,
+        })
+    rows.sort(key=lambda row: row['total'], reverse=True)
+    return rows
+
+
+def summary():
+    """The metrics for the admin page, in milliseconds (jobs in seconds), most time spent first."""
+    jobs = {row['labels']['job']: row for row in _rows(JOB_SECONDS, JOB_ERRORS, scale=1.0)}
+    for metric in (JOB_MISSED, JOB_OVERLAPS):
+        for (job_id,), _ in metric.items():
+            jobs.setdefault(job_id, {'labels': {'job': job_id}, 'count': 0, 'total': 0.0, 'avg': 0.0, 'p95': None,
+                                     'errors': JOB_ERRORS.value(job=job_id)})
+    jobs = sorted(jobs.values(), key=lambda row: row['total'], reverse=True)
+    for row in jobs:
+        row['missed'] = JOB_MISSED.value(job=row['labels']['job'])
+        row['overlaps'] = JOB_OVERLAPS.value(job=row['labels']['job'])
+
+    caches = []
+    for cache, counts in sorted(_cache_totals().items()):
+        lookups = counts['hit'] + counts['miss']
+        caches.append({'cache': cache, 'hits': counts['hit'], 'misses': counts['miss'],
+                       'ratio': counts['hit'] / lookups if lookups else None})
+
+    monitor = _rows(MONITOR_TICK_SECONDS)
+    return {
+        'enabled': _enabled,
+        'uptime_seconds': time.time() - _started_at,
+        'media_services': _rows(MEDIA_SERVICE_SECONDS, MEDIA_SERVICE_ERRORS),
+        'database': _rows(DB_QUERY_SECONDS),
+        'jobs': jobs,
+        'caches': caches,
+        'monitor': monitor[0] if monitor else None,
+        'active_streams': sorted((key[0], count) for key, count in ACTIVE_STREAMS.items()),
+    }
@@ -1,8 +1,92 @@
 # File: app/services/overseerr_service.py
+"""
+Client for the Overseerr API.
+
+Two in-process caches are shared by every ``OverseerrService`` instance:
+
+- Movie and TV details used to enrich request lists, keyed by (Overseerr
+  URL, media type, TMDB id). Entries expire after
+  ``OVERSEERR_DETAILS_CACHE_TTL_SECONDS`` and the least recently used ones
+  are dropped beyond ``OVERSEERR_DETAILS_CACHE_MAX_ENTRIES``. Misses for a
+  page of requests are fetched together on up to ``OVERSEERR_ENRICH_WORKERS``
+  threads.
+- The Overseerr user list per instance, indexed by Plex username and Plex
+  id. It is refreshed by a scheduled task every
+  ``OVERSEERR_USER_REFRESH_MINUTES`` and on demand once it is that old, so
+  linking a user doesn't download the user list again. A lookup that finds
+  nobody reloads it once, at most every ``OVERSEERR_USER_MISS_REFRESH_SECONDS``,
+  so a newly created Overseerr user can be linked straight away.
+
+Both are dropped when a server's Overseerr settings are saved.
+
+With both warm, a user's request page costs one upstream call.
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 from typing import Dict, List, Tuple, Optional
 from flask import current_app
 
+from app.services import metrics
+
+_details_lock = threading.Lock()
+_details = OrderedDict()  # (base_url, media_type, tmdb_id) -> (stored_at, details)
+
+_users_lock = threading.Lock()
+_user_indexes = {}  # base_url -> _UserIndex
+
+
+class _UserIndex:
+    def __init__(self, users):
+        self.loaded_at = time.monotonic()
+        self.users = users
+        self.by_plex_username = {}
+        self.by_plex_username_lower = {}
+        self.by_plex_id = {}
+        for user in users:
+            plex_username = user.get('plexUsername')
+            if plex_username:
+                self.by_plex_username.setdefault(plex_username, user)
+                self.by_plex_username_lower.setdefault(plex_username.lower(), user)
+            if user.get('plexId') is not None:
+                self.by_plex_id.setdefault(str(user['plexId']), user)
+
+    def find(self, plex_username=None, plex_id=None):
+        """Exact Plex username, then Plex id, then case-insensitive username. Returns ``(user, how)``."""
+        if plex_username and plex_username in self.by_plex_username:
+            return self.by_plex_username[plex_username], 'exact'
+        if plex_id is not None and str(plex_id) in self.by_plex_id:
+            return self.by_plex_id[str(plex_id)], 'plex id'
+        if plex_username and plex_username.lower() in self.by_plex_username_lower:
+            return self.by_plex_username_lower[plex_username.lower()], 'case-insensitive'
+        return None, None
+
+
+def clear_caches():
+    """Drop cached media details and user indexes, e.g. after Overseerr settings changed."""
+    with _details_lock:
+        _details.clear()
+    with _users_lock:
+        _user_indexes.clear()
+
+
+def refresh_user_indexes():
+    """Reload the user index of every server with Overseerr enabled. Returns the number refreshed."""
+    from app.models_media_services import MediaServer
+    refreshed = 0
+    servers = MediaServer.query.filter(MediaServer.overseerr_enabled.is_(True)).all()
+    for base_url in {server.overseerr_url for server in servers if server.overseerr_url and server.overseerr_api_key}:
+        server = next(server for server in servers if server.overseerr_url == base_url)
+        success, _, message = OverseerrService(server.overseerr_url, server.overseerr_api_key).get_user_index(refresh=True)
+        if success:
+            refreshed += 1
+        else:
+            current_app.logger.warning(f"Overseerr_Service.py - refresh_user_indexes(): {base_url}: {message}")
+    return refreshed
+
 
 class OverseerrService:
     """Service for interacting with Overseerr API"""
@@ -62,34 +146,34 @@ class OverseerrService:
             return False, f"Unexpected error: {str(e)}"
     
     def get_users(self) -> Tuple[bool, List[Dict], str]:
-        """Get all users from Overseerr"""
+        """Get all users from Overseerr, 100 per request (the API maximum)"""
         try:
-            # Request more users to avoid pagination issues (max 100 per Overseerr API)
-            params = {
-                'take': 100,  # Maximum allowed by Overseerr API
-                'skip': 0
-            }
-            
-            response = self.session.get(f"{self.base_url}/api/v1/user", params=params, timeout=10)
-            
-            if response.status_code == 200:
-                data = response.json()
-                users = data.get('results', [])
-                total_results = data.get('pageInfo', {}).get('results', len(users))
+            users = []
+            total_results = None
+            while total_results is None or len(users) < total_results:
+                params = {
+                    'take': 100,  # Maximum allowed by Overseerr API
+                    'skip': len(users)
+                }
                 
-                current_app.logger.info(f"OVERSEERR API: Retrieved {len(users)} users out of {total_results} total")
+                response = self.session.get(f"{self.base_url}/api/v1/user", params=params, timeout=10)
                 
-                # If there are more users than we retrieved, log a warning
-                if total_results > len(users):
-                    current_app.logger.warning(f"OVERSEERR API: Only retrieved {len(users)} out of {total_results} total users. Some users may be missed.")
+                if response.status_code == 401:
+                    return False, [], "Invalid API key"
+                elif response.status_code == 403:
+                    return False, [], "API key does not have sufficient permissions to access users"
+                elif response.status_code != 200:
+                    return False, [], f"HTTP {response.status_code}: {response.text[:100]}"
                 
-                return True, users, f"Retrieved {len(users)} users (total: {total_results})"
-            elif response.status_code == 401:
-                return False, [], "Invalid API key"
-            elif response.status_code == 403:
-                return False, [], "API key does not have sufficient permissions to access users"
-            else:
-                return False, [], f"HTTP {response.status_code}: {response.text[:100]}"
+                data = response.json()
+                page = data.get('results', [])
+                users.extend(page)
+                total_results = data.get('pageInfo', {}).get('results', len(users))
+                if not page:
+                    break
+            
+            current_app.logger.info(f"OVERSEERR API: Retrieved {len(users)} users out of {total_results} total")
+            return True, users, f"Retrieved {len(users)} users (total: {total_results})"
                 
         except requests.exceptions.RequestException as e:
             return False, [], f"Request failed: {str(e)}"
@@ -97,6 +181,24 @@ class OverseerrService:
             current_app.logger.error(f"Overseerr get users error: {e}")
             return False, [], f"Unexpected error: {str(e)}"
     
+    def get_user_index(self, refresh: bool = False) -> Tuple[bool, Optional[_UserIndex], str]:
+        """The cached user index of this Overseerr instance, reloaded when older than OVERSEERR_USER_REFRESH_MINUTES"""
+        max_age = current_app.config.get('OVERSEERR_USER_REFRESH_MINUTES', 30) * 60
+        with _users_lock:
+            index = _user_indexes.get(self.base_url)
+        if index is not None and not refresh and time.monotonic() - index.loaded_at < max_age:
+            metrics.record_cache('overseerr_users', hits=1)
+            return True, index, f"{len(index.users)} users (cached)"
+        
+        metrics.record_cache('overseerr_users', misses=1)
+        success, users, message = self.get_users()
+        if not success:
+            return False, None, message
+        index = _UserIndex(users)
+        with _users_lock:
+            _user_indexes[self.base_url] = index
+        return True, index, message
+    
     def get_user_requests(self, user_id: int, take: int = 50, skip: int = 0) -> Tuple[bool, List[Dict], Dict, str]:
         """Get requests for a specific user with enhanced media information"""
         try:
@@ -123,10 +225,7 @@ class OverseerrService:
                 current_app.logger.info(f"OVERSEERR API: Retrieved {len(requests_list)} requests out of {total_results} total for user {user_id}")
                 
                 # Enrich requests with detailed media information
-                enriched_requests = []
-                for request in requests_list:
-                    enriched_request = self._enrich_request_with_media_details(request)
-                    enriched_requests.append(enriched_request)
+                enriched_requests = self._enrich_requests(requests_list)
                 
                 pagination_info = {
                     'current_page': page_info.get('page', 1),
@@ -187,75 +286,112 @@ class OverseerrService:
             current_app.logger.error(f"Overseerr get TV details error: {e}")
             return False, None, f"Unexpected error: {str(e)}"
     
-    def _enrich_request_with_media_details(self, request: Dict) -> Dict:
-        """Enrich a request with detailed media information"""
-        try:
-            media = request.get('media', {})
-            media_type = media.get('mediaType')
-            tmdb_id = media.get('tmdbId')
-            
-            if not tmdb_id or not media_type:
-                current_app.logger.debug(f"Request {request.get('id')} missing tmdb_id or media_type")
-                return request
-            
-            # Get detailed media info based on type
+    def _cached_details(self, media_type: str, tmdb_id) -> Optional[Dict]:
+        ttl = current_app.config.get('OVERSEERR_DETAILS_CACHE_TTL_SECONDS', 21600)
+        key = (self.base_url, media_type, tmdb_id)
+        with _details_lock:
+            entry = _details.get(key)
+            if entry and time.monotonic() - entry[0] < ttl:
+                _details.move_to_end(key)
+                metrics.record_cache('overseerr_details', hits=1)
+                return entry[1]
+        metrics.record_cache('overseerr_details', misses=1)
+        return None
+    
+    def _store_details(self, media_type: str, tmdb_id, details: Dict):
+        max_entries = current_app.config.get('OVERSEERR_DETAILS_CACHE_MAX_ENTRIES', 2000)
+        key = (self.base_url, media_type, tmdb_id)
+        with _details_lock:
+            _details[key] = (time.monotonic(), details)
+            _details.move_to_end(key)
+            while len(_details) > max_entries:
+                _details.popitem(last=False)
+    
+    def _fetch_details(self, app, media_type: str, tmdb_id):
+        """Worker: one movie/TV details call. Returns the details dict or None."""
+        with app.app_context():
             if media_type == 'movie':
                 success, details, message = self.get_movie_details(tmdb_id)
-            elif media_type == 'tv':
-                success, details, message = self.get_tv_details(tmdb_id)
             else:
-                current_app.logger.debug(f"Unknown media type: {media_type}")
-                return request
-            
+                success, details, message = self.get_tv_details(tmdb_id)
             if success and details:
-                # Merge the detailed information with the existing media object
-                enriched_media = {**media, **details}
-                request['media'] = enriched_media
-                current_app.logger.debug(f"Enriched request {request.get('id')} with detailed {media_type} info")
-            else:
-                current_app.logger.warning(f"Failed to get {media_type} details for TMDB ID {tmdb_id}: {message}")
-            
-            return request
+                self._store_details(media_type, tmdb_id, details)
+                return details
+            current_app.logger.warning(f"Failed to get {media_type} details for TMDB ID {tmdb_id}: {message}")
+            return None
+    
+    def _enrich_requests(self, requests_list: List[Dict]) -> List[Dict]:
+        """
+        Merge movie/TV details into each request's ``media``. Cached details are
+        used as they are; the rest are fetched concurrently, once per title.
+        """
+        try:
+            details_by_key = {}
+            missing = set()
+            for request in requests_list:
+                media = request.get('media') or {}
+                key = (media.get('mediaType'), media.get('tmdbId'))
+                if not key[1] or key[0] not in ('movie', 'tv'):
+                    current_app.logger.debug(f"Request {request.get('id')} missing tmdb_id or has unknown media type {key[0]}")
+                    continue
+                if key not in details_by_key and key not in missing:
+                    cached = self._cached_details(*key)
+                    if cached is not None:
+                        details_by_key[key] = cached
+                    else:
+                        missing.add(key)
+            
+            if missing:
+                app = current_app._get_current_object()
+                workers = min(len(missing), max(1, current_app.config.get('OVERSEERR_ENRICH_WORKERS', 8)))
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="overseerr-details") as pool:
+                    fetched = dict(zip(missing, pool.map(lambda key: self._fetch_details(app, *key), missing)))
+                details_by_key.update({key: details for key, details in fetched.items() if details})
+                current_app.logger.debug(f"OVERSEERR API: Fetched details for {len(missing)} titles, {len(requests_list)} requests on the page")
+            
+            for request in requests_list:
+                media = request.get('media') or {}
+                details = details_by_key.get((media.get('mediaType'), media.get('tmdbId')))
+                if details:
+                    # Merge the detailed information with the existing media object
+                    request['media'] = {**media, **details}
+            return requests_list
             
         except Exception as e:
-            current_app.logger.error(f"Error enriching request with media details: {e}")
-            return request
+            current_app.logger.error(f"Error enriching requests with media details: {e}")
+            return requests_list
     
-    def get_user_by_plex_username(self, plex_username: str) -> Tuple[bool, Optional[Dict], str]:
-        """Find Overseerr user by Plex username"""
+    def _enrich_request_with_media_details(self, request: Dict) -> Dict:
+        """Enrich a request with detailed media information"""
+        return self._enrich_requests([request])[0]
+    
+    def _reload_after_miss(self, index: _UserIndex) -> Optional[_UserIndex]:
+        """Reload the user index after a lookup found nobody, unless it was loaded too recently. Returns the new index or None."""
+        if time.monotonic() - index.loaded_at < current_app.config.get('OVERSEERR_USER_MISS_REFRESH_SECONDS', 60):
+            return None
+        success, new_index, _ = self.get_user_index(refresh=True)
+        return new_index if success else None
+    
+    def get_user_by_plex_username(self, plex_username: str, plex_id: str = None) -> Tuple[bool, Optional[Dict], str]:
+        """Find Overseerr user by Plex username (or Plex id) in the cached user index"""
         try:
-            success, users, message = self.get_users()
+            success, index, message = self.get_user_index()
             if not success:
                 return False, None, message
             
-            current_app.logger.info(f"OVERSEERR API DEBUG: Looking for Plex username '{plex_username}' in {len(users)} Overseerr users")
-            
-            # Debug: Log all users and their Plex usernames
-            for i, user in enumerate(users):
-                overseerr_username = user.get('username', 'N/A')
-                plex_username_in_overseerr = user.get('plexUsername', 'N/A')
-                user_email = user.get('email', 'N/A')
-                user_id = user.get('id', 'N/A')
-                current_app.logger.info(f"OVERSEERR API DEBUG: User {i+1}: id={user_id}, username='{overseerr_username}', email='{user_email}', plexUsername='{plex_username_in_overseerr}'")
-            
-            for user in users:
-                # Check if user has Plex account linked by username
-                if user.get('plexUsername') == plex_username:
-                    current_app.logger.info(f"OVERSEERR API DEBUG: Found exact match for '{plex_username}'")
-                    return True, user, f"Found user: {user.get('username', user.get('email', 'Unknown'))}"
-            
-            # Debug: Try case-insensitive matching
-            for user in users:
-                overseerr_plex_username = user.get('plexUsername', '')
-                if overseerr_plex_username.lower() == plex_username.lower():
-                    current_app.logger.info(f"OVERSEERR API DEBUG: Found case-insensitive match: '{overseerr_plex_username}' matches '{plex_username}'")
-                    return True, user, f"Found user (case-insensitive): {user.get('username', user.get('email', 'Unknown'))}"
-            
-            # Debug: Try email matching as fallback
-            current_app.logger.info(f"OVERSEERR API DEBUG: No plexUsername match found, checking if any users have email that might match")
+            user, how = index.find(plex_username, plex_id)
+            if user is None:
+                # The user may have been created in Overseerr since the index was loaded
+                reloaded = self._reload_after_miss(index)
+                if reloaded is not None:
+                    index = reloaded
+                    user, how = index.find(plex_username, plex_id)
+            if user is None:
+                current_app.logger.info(f"OVERSEERR API DEBUG: No match found for Plex username '{plex_username}' among {len(index.users)} users")
+                return False, None, f"No Overseerr user found with Plex username: {plex_username}"
             
-            current_app.logger.info(f"OVERSEERR API DEBUG: No match found for Plex username '{plex_username}' among {len(users)} users")
-            return False, None, f"No Overseerr user found with Plex username: {plex_username}"
+            current_app.logger.info(f"OVERSEERR API DEBUG: Found {how} match for '{plex_username}'")
+            return True, user, f"Found user ({how}): {user.get('username', user.get('email', 'Unknown'))}"
             
         except Exception as e:
             current_app.logger.error(f"Overseerr get user by plex username error: {e}")
@@ -264,7 +400,7 @@ class OverseerrService:
     def link_plex_users(self, plex_users: List[Dict]) -> Tuple[bool, List[Dict], str]:
         """Link Plex users to Overseerr users"""
         try:
-            success, overseerr_users, message = self.get_users()
+            success, index, message = self.get_user_index()
             if not success:
                 return False, [], f"Failed to get Overseerr users: {message}"
             
@@ -274,12 +410,8 @@ class OverseerrService:
                 plex_id = str(plex_user.get('id', ''))
                 plex_username = plex_user.get('username', plex_user.get('title', 'Unknown'))
                 
-                # Find matching Overseerr user by plexUsername
-                overseerr_user = None
-                for ou in overseerr_users:
-                    if ou.get('plexUsername') == plex_username:
-                        overseerr_user = ou
-                        break
+                # Find matching Overseerr user by plexUsername, falling back to the Plex id
+                overseerr_user, _ = index.find(plex_username, plex_id or None)
                 
                 linked_user = {
                     'plex_id': plex_id,
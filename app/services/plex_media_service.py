@@ -760,11 +760,14 @@ class PlexMediaService(BaseMediaService):
 
     def get_formatted_sessions(self) -> List[Dict[str, Any]]:
         """Get active Plex sessions formatted for display"""
+        return self.format_sessions(self.get_active_sessions())
+
+    def format_sessions(self, raw_sessions: List[Any]) -> List[Dict[str, Any]]:
+        """Format sessions returned by get_active_sessions() for display"""
         from app.models import User, UserType
         from flask import url_for
         import re
         
-        raw_sessions = self.get_active_sessions()
         if not raw_sessions:
             return []
         
@@ -1112,6 +1115,58 @@ class PlexMediaService(BaseMediaService):
             'version': 'Unknown'
         }
 
+    def _fetch_show_leaves(self, server, show_id: str, page: int = 1, per_page: int = 24,
+                           search_query: str = '') -> Tuple[Any, List[Any], int]:
+        """
+        Episodes of a show from ``/library/metadata/<key>/allLeaves``, found by rating key.
+
+        The show itself is fetched for its ``leafCount``. Without a search only the
+        requested page is asked for (``X-Plex-Container-Start``/``-Size``), so any show
+        loads in two requests. A search needs every title and summary, so all leaves
+        come back in one container and are filtered here. Either way the page is put
+        in season/episode order locally.
+
+        Returns ``(show, episodes, total)``; ``show`` is None if no show has that key.
+        """
+        rating_key = str(show_id).strip()
+        try:
+            show = server.fetchItem(int(rating_key) if rating_key.isdigit() else rating_key)
+        except NotFound:
+            return None, [], 0
+        if getattr(show, 'type', None) != 'show':
+            return None, [], 0
+
+        leaves_key = f"/library/metadata/{show.ratingKey}/allLeaves"
+        leaf_count = getattr(show, 'leafCount', None)
+        if search_query or leaf_count is None:
+            episodes = server.fetchItems(leaves_key, container_size=max(leaf_count or 0, per_page, 1))
+            if search_query:
+                search_lower = search_query.lower()
+                episodes = [episode for episode in episodes
+                            if search_lower in (episode.title or '').lower() or search_lower in (episode.summary or '').lower()]
+            total = len(episodes)
+            episodes = episodes[(page - 1) * per_page:page * per_page]
+        else:
+            total = leaf_count
+            episodes = server.fetchItems(leaves_key, container_start=(page - 1) * per_page,
+                                         container_size=per_page, maxresults=per_page)
+
+        episodes = sorted(self._listing_only(episodes), key=lambda episode: (getattr(episode, 'parentIndex', None) or 0,
+                                                                             getattr(episode, 'index', None) or 0))
+        return show, episodes, total
+
+    @staticmethod
+    def _listing_only(items):
+        """
+        Stop plexapi from reloading listed items. A partial object fetches its full
+        metadata the first time an attribute that is empty in the listing is read.
+        The formatting code probes optional fields with ``hasattr``, so every item
+        would cost one extra request.
+        """
+        for item in items:
+            item._autoReload = False
+        return items
+
     def get_library_content(self, library_key: str, page: int = 1, per_page: int = 24, parent_id: str = None) -> Dict[str, Any]:
         """Get content from a specific Plex library"""
         try:
@@ -1151,33 +1206,8 @@ class PlexMediaService(BaseMediaService):
             # If parent_id is provided, get episodes for that specific show
             if parent_id:
                 try:
-                    # Get the show by its rating key (ensure it's just the numeric ID)
-                    rating_key = str(parent_id).strip()
-                    self.log_info(f"Fetching show with rating key: {rating_key}")
-                    
-                    # Try different methods to get the show
-                    show = None
-                    try:
-                        # Method 1: Search by rating key in the library (most reliable)
-                        for item in library_section.all():
-                            if hasattr(item, 'ratingKey') and str(item.ratingKey) == rating_key:
-                                show = item
-                                break
-                        
-                        # Method 2: If not found, try direct fetchItem as fallback
-                        if not show:
-                            try:
-                                show = server.fetchItem(int(rating_key))
-                            except (ValueError, Exception) as e2:
-                                self.log_warning(f"fetchItem with int rating key failed: {e2}")
-                                # Method 3: Try with string rating key
-                                try:
-                                    show = server.fetchItem(rating_key)
-                                except Exception as e3:
-                                    self.log_warning(f"fetchItem with string rating key failed: {e3}")
-                                    
-                    except Exception as e1:
-                        self.log_warning(f"Error searching library for rating key {rating_key}: {e1}")
+                    self.log_info(f"Fetching episodes for show with rating key: {parent_id}")
+                    show, page_items, total_items = self._fetch_show_leaves(server, parent_id, page, per_page)
                     if not show:
                         return {
                             'items': [],
@@ -1190,14 +1220,6 @@ class PlexMediaService(BaseMediaService):
                             'error': f'Show with ID {parent_id} not found'
                         }
                     
-                    # Get all episodes from all seasons using the PlexAPI approach
-                    all_episodes = []
-                    for season in show.seasons():
-                        for episode in season.episodes():
-                            all_episodes.append(episode)
-                    
-                    all_items = all_episodes
-                    
                 except Exception as e:
                     self.log_error(f"Error getting episodes for show {parent_id}: {e}")
                     return {
@@ -1211,14 +1233,10 @@ class PlexMediaService(BaseMediaService):
                         'error': f'Error getting episodes: {str(e)}'
                     }
             else:
-                # Get all items from the library
-                all_items = library_section.all()
-            total_items = len(all_items)
-            
-            # Calculate pagination
-            start_idx = (page - 1) * per_page
-            end_idx = start_idx + per_page
-            page_items = all_items[start_idx:end_idx]
+                # Ask the server for just this page; the total comes from a zero-size request
+                page_items = self._listing_only(library_section.search(container_start=(page - 1) * per_page,
+                                                                       container_size=per_page, maxresults=per_page))
+                total_items = library_section.totalViewSize()
             
             # Process items into standardized format
             processed_items = []
@@ -1367,26 +1385,11 @@ class PlexMediaService(BaseMediaService):
                     'error': 'Could not connect to Plex server'
                 }
             
-            # Find the show by rating key
-            show = None
-            rating_key = str(show_id).strip()
-            self.log_info(f"Fetching episodes for show with rating key: {rating_key}")
-            
-            # Search through all library sections to find the show
-            for section in server.library.sections():
-                if section.type == 'show':  # Only check TV show libraries
-                    try:
-                        for item in section.all():
-                            if hasattr(item, 'ratingKey') and str(item.ratingKey) == rating_key:
-                                show = item
-                                break
-                        if show:
-                            break
-                    except Exception as e:
-                        self.log_warning(f"Error searching section {section.title}: {e}")
-                        continue
-            
-            if not show:
+            self.log_info(f"Fetching episodes for show with rating key: {show_id}")
+            try:
+                show, episodes_page, total_episodes = self._fetch_show_leaves(server, show_id, page, per_page, search_query)
+            except Exception as e:
+                self.log_warning(f"Error getting episodes: {e}")
                 return {
                     'items': [],
                     'total': 0,
@@ -1395,17 +1398,10 @@ class PlexMediaService(BaseMediaService):
                     'pages': 0,
                     'has_prev': False,
                     'has_next': False,
-                    'error': f'Show with ID {show_id} not found'
+                    'error': f'Error retrieving episodes: {str(e)}'
                 }
             
-            # Get all episodes from all seasons
-            all_episodes = []
-            try:
-                for season in show.seasons():
-                    for episode in season.episodes():
-                        all_episodes.append(episode)
-            except Exception as e:
-                self.log_warning(f"Error getting episodes: {e}")
+            if not show:
                 return {
                     'items': [],
                     'total': 0,
@@ -1414,25 +1410,10 @@ class PlexMediaService(BaseMediaService):
                     'pages': 0,
                     'has_prev': False,
                     'has_next': False,
-                    'error': f'Error retrieving episodes: {str(e)}'
+                    'error': f'Show with ID {show_id} not found'
                 }
             
-            # Filter episodes by search query if provided
-            if search_query:
-                filtered_episodes = []
-                search_lower = search_query.lower()
-                for episode in all_episodes:
-                    if (search_lower in episode.title.lower() if episode.title else False) or \
-                       (search_lower in episode.summary.lower() if episode.summary else False):
-                        filtered_episodes.append(episode)
-                all_episodes = filtered_episodes
-            
-            # Calculate pagination
-            total_episodes = len(all_episodes)
             total_pages = (total_episodes + per_page - 1) // per_page
-            start_idx = (page - 1) * per_page
-            end_idx = start_idx + per_page
-            episodes_page = all_episodes[start_idx:end_idx]
             
             # Format episodes for response
             formatted_episodes = []
@@ -2,7 +2,9 @@
 import os
 import sys
 import json
+import time
 import importlib
+import importlib.util
 from typing import Dict, List, Optional, Type, Any
 from flask import current_app
 from app.models_plugins import Plugin, PluginStatus, PluginType
@@ -14,11 +16,21 @@ import tempfile
 import shutil
 
 class PluginManager:
-    """Manages plugin loading, installation, and lifecycle"""
+    """
+    Manages plugin loading, installation, and lifecycle.
+
+    ``discover_plugins`` runs at app creation and only registers the enabled
+    plugins. A plugin's module, and what it pulls in (plexapi, xmltodict, the
+    Jellyfin client, ...), is imported by ``get_plugin_class`` the first time a
+    service of that type is created, so a worker that never talks to a server
+    type never loads its client library.
+    """
     
     def __init__(self):
         self._loaded_plugins: Dict[str, Type[BaseMediaService]] = {}
         self._plugin_instances: Dict[str, BaseMediaService] = {}
+        self._registry: Dict[str, tuple] = {}  # plugin_id -> (module_path, service_class) of enabled plugins
+        self.initialized = False
         self._core_plugins = {
             'plex': {
                 'name': 'Plex',
@@ -109,6 +121,32 @@ class PluginManager:
         
         db.session.commit()
     
+    def discover_plugins(self):
+        """Register the enabled plugins (and add missing core plugins) without importing their modules"""
+        self.initialize_core_plugins()
+        registry = {}
+        for plugin in self.get_enabled_plugins():
+            try:
+                found = importlib.util.find_spec(plugin.module_path) is not None
+            except (ImportError, ValueError):
+                found = False
+            if not found:
+                current_app.logger.error(f"Plugin module {plugin.module_path} of enabled plugin '{plugin.plugin_id}' not found")
+                plugin.status = PluginStatus.ERROR
+                plugin.last_error = "Plugin module not found at startup"
+                continue
+            registry[plugin.plugin_id] = (plugin.module_path, plugin.service_class)
+        db.session.commit()
+        self._registry = registry
+        self.initialized = True
+        current_app.logger.info(f"Discovered {len(registry)} enabled plugins: {', '.join(sorted(registry)) or 'none'}")
+    
+    def reload_all_plugins(self):
+        """Forget the loaded plugin classes and discover the enabled plugins again"""
+        self._loaded_plugins.clear()
+        self._plugin_instances.clear()
+        self.discover_plugins()
+    
     def get_available_plugins(self) -> List[Plugin]:
         """Get all available plugins"""
         return Plugin.query.all()
@@ -146,6 +184,7 @@ class PluginManager:
                 test_instance = service_class(test_config)
                 # Store the loaded class
                 self._loaded_plugins[plugin_id] = service_class
+                self._registry[plugin_id] = (plugin.module_path, plugin.service_class)
             except Exception as e:
                 plugin.status = PluginStatus.ERROR
                 plugin.last_error = f"Plugin instantiation failed: {str(e)}"
@@ -222,6 +261,7 @@ class PluginManager:
             # Remove from loaded plugins
             if plugin_id in self._loaded_plugins:
                 del self._loaded_plugins[plugin_id]
+            self._registry.pop(plugin_id, None)
             
             if plugin_id in self._plugin_instances:
                 del self._plugin_instances[plugin_id]
@@ -241,46 +281,56 @@ class PluginManager:
     
     def _load_plugin(self, plugin: Plugin) -> Optional[Type[BaseMediaService]]:
         """Load a plugin class from its module"""
+        return self._import_plugin_class(plugin.plugin_id, plugin.module_path, plugin.service_class)
+    
+    def _import_plugin_class(self, plugin_id: str, module_path: str, class_name: str) -> Optional[Type[BaseMediaService]]:
+        """Import a plugin's module and return its service class"""
         try:
             # Import the module
-            module = importlib.import_module(plugin.module_path)
+            started = time.perf_counter()
+            module = importlib.import_module(module_path)
             
             # Get the service class
-            service_class = getattr(module, plugin.service_class)
+            service_class = getattr(module, class_name)
             
             # Verify it's a BaseMediaService subclass
             if not issubclass(service_class, BaseMediaService):
-                raise ValueError(f"Plugin class {plugin.service_class} is not a BaseMediaService subclass")
+                raise ValueError(f"Plugin class {class_name} is not a BaseMediaService subclass")
             
+            current_app.logger.debug(f"Plugin_Manager.py - Imported plugin '{plugin_id}' in {(time.perf_counter() - started) * 1000:.0f} ms")
             return service_class
             
         except ImportError as e:
-            current_app.logger.error(f"Failed to import plugin module {plugin.module_path}: {e}")
+            current_app.logger.error(f"Failed to import plugin module {module_path}: {e}")
             return None
         except AttributeError as e:
-            current_app.logger.error(f"Plugin class {plugin.service_class} not found in {plugin.module_path}: {e}")
+            current_app.logger.error(f"Plugin class {class_name} not found in {module_path}: {e}")
             return None
         except Exception as e:
-            current_app.logger.error(f"Error loading plugin {plugin.plugin_id}: {e}")
+            current_app.logger.error(f"Error loading plugin {plugin_id}: {e}")
             return None
     
     def get_plugin_class(self, plugin_id: str) -> Optional[Type[BaseMediaService]]:
-        """Get a loaded plugin class"""
+        """Get a plugin class, importing its module on first use"""
         if plugin_id in self._loaded_plugins:
             return self._loaded_plugins[plugin_id]
         
-        # Try to load if not already loaded
-        plugin = Plugin.query.filter_by(plugin_id=plugin_id, status=PluginStatus.ENABLED).first()
-        if plugin:
-            service_class = self._load_plugin(plugin)
-            if service_class:
-                self._loaded_plugins[plugin_id] = service_class
-                return service_class
+        spec = self._registry.get(plugin_id)
+        if spec is None:
+            # Not discovered at startup, e.g. enabled since by another worker
+            plugin = Plugin.query.filter_by(plugin_id=plugin_id, status=PluginStatus.ENABLED).first()
+            if not plugin:
+                return None
+            spec = (plugin.module_path, plugin.service_class)
         
-        return None
+        service_class = self._import_plugin_class(plugin_id, *spec)
+        if service_class:
+            self._registry[plugin_id] = spec
+            self._loaded_plugins[plugin_id] = service_class
+        return service_class
     
     def load_all_enabled_plugins(self):
-        """Load all enabled plugins at startup"""
+        """Import every enabled plugin now (startup uses ``discover_plugins`` and imports on first use)"""
         enabled_plugins = self.get_enabled_plugins()
         
         for plugin in enabled_plugins:
@@ -288,6 +338,7 @@ class PluginManager:
                 service_class = self._load_plugin(plugin)
                 if service_class:
                     self._loaded_plugins[plugin.plugin_id] = service_class
+                    self._registry[plugin.plugin_id] = (plugin.module_path, plugin.service_class)
                     current_app.logger.info(f"Loaded plugin: {plugin.plugin_id}")
                 else:
                     current_app.logger.error(f"Failed to load enabled plugin: {plugin.plugin_id}")
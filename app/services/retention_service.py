@@ -0,0 +1,332 @@
+# File: app/services/retention_service.py
+"""
+Retention policy for stream history and the audit log.
+
+``media_stream_history`` and ``history_logs`` only ever grew. With
+``STREAM_HISTORY_RETENTION_DAYS`` / ``HISTORY_LOG_RETENTION_DAYS`` set,
+``apply_retention`` moves rows older than that out of the hot tables:
+
+1. Stream rows are first added to ``stream_history_rollups`` (daily totals
+   per user, library and media type). Activity summaries and library charts
+   read those together with the live rows, so the totals don't change.
+2. The raw rows, including their raw service payload, are appended to
+   gzip-compressed JSONL files under ``RETENTION_ARCHIVE_DIR``. There is one
+   file per table and month, and each file is listed in ``history_archives``.
+3. The rows are deleted in batches of ``RETENTION_BATCH_SIZE``. Each batch is
+   its own short transaction through ``write_queue``, so the session monitor
+   and syncs keep writing while a large backlog is worked off.
+
+A crash between writing a file and committing the delete can leave a few
+rows in the archive twice. Readers drop duplicate ids, so this is harmless.
+
+``iter_archived_rows`` and ``export_rows`` read archived ranges back, the
+latter followed by the live rows, for ``flask retention export``. Per-item
+details such as popular titles, peak hours and heatmaps only cover the
+retained rows.
+
+The policy runs daily as a background job (see ``task_service``) and on
+demand with ``flask retention run``. Both settings default to 0, which keeps
+everything.
+"""
+import enum
+import gzip
+import json
+import os
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, bindparam, func, or_, select, tuple_
+
+from app.extensions import db
+from app.models import EventType, HistoryArchive, HistoryLog
+from app.models_media_services import MediaStreamHistory, StreamHistoryRollup
+from app.models_payloads import RawPayload, decode_payload, delete_payloads
+from app.services import library_stats_cache, write_queue
+from app.utils.timezone_utils import utcnow
+
+# table name -> (model, timestamp column name, config key holding the retention in days)
+POLICIES = {
+    'media_stream_history': (MediaStreamHistory, 'started_at', 'STREAM_HISTORY_RETENTION_DAYS'),
+    'history_logs': (HistoryLog, 'timestamp', 'HISTORY_LOG_RETENTION_DAYS'),
+}
+
+# A stream that never got a stop time is only archived once it is this much older than the cutoff
+_OPEN_STREAM_GRACE = timedelta(days=1)
+
+
+def archive_dir():
+    return current_app.config.get('RETENTION_ARCHIVE_DIR') or os.path.join(current_app.instance_path, 'archives')
+
+
+def retention_days(table_name):
+    return max(0, int(current_app.config.get(POLICIES[table_name][2]) or 0))
+
+
+def _cutoff(days):
+    # History timestamps are stored as naive UTC
+    return utcnow().replace(tzinfo=None) - timedelta(days=days)
+
+
+def _expired_filter(table_name, cutoff):
+    model, timestamp_name, _ = POLICIES[table_name]
+    timestamp = getattr(model, timestamp_name)
+    if table_name == 'media_stream_history':
+        return and_(timestamp < cutoff, or_(model.stopped_at.isnot(None), timestamp < cutoff - _OPEN_STREAM_GRACE))
+    return timestamp < cutoff
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, enum.Enum):
+        return value.name
+    return str(value)
+
+
+def _parse_timestamp(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def _load_rows(table_name, cutoff, after_id, limit):
+    """The next batch of expired rows as plain dicts, raw service payloads included."""
+    model = POLICIES[table_name][0]
+    table = model.__table__
+    rows = [dict(row) for row in db.session.execute(
+        select(table).where(_expired_filter(table_name, cutoff), table.c.id > after_id)
+        .order_by(table.c.id).limit(limit)
+    ).mappings()]
+    if rows and table_name == 'media_stream_history':
+        payloads = db.session.execute(
+            select(RawPayload.owner_id, RawPayload.data, RawPayload.encoding).where(
+                RawPayload.owner_type == table_name, RawPayload.field == 'service_data',
+                RawPayload.owner_id.in_([row['id'] for row in rows]))
+        )
+        by_id = {payload.owner_id: decode_payload(payload.data, payload.encoding) for payload in payloads}
+        for row in rows:
+            row['service_data'] = by_id.get(row['id'])
+    return rows
+
+
+def _write_archive_files(table_name, rows):
+    """
+    Append ``rows`` to the monthly archive files and update their ``history_archives``
+    entries in the session. The files are synced to disk before this returns.
+    """
+    timestamp_name = POLICIES[table_name][1]
+    by_period = defaultdict(list)
+    for row in rows:
+        by_period[(row[timestamp_name] or datetime(1970, 1, 1)).strftime('%Y-%m')].append(row)
+
+    base_dir = archive_dir()
+    os.makedirs(os.path.join(base_dir, table_name), exist_ok=True)
+    for period, period_rows in sorted(by_period.items()):
+        relative_path = os.path.join(table_name, f"{period}.jsonl.gz")
+        full_path = os.path.join(base_dir, relative_path)
+        # Each batch is a separate gzip member; concatenated members read back as one stream
+        with open(full_path, 'ab') as raw_file:
+            with gzip.GzipFile(fileobj=raw_file, mode='ab', compresslevel=6) as gzip_file:
+                for row in period_rows:
+                    gzip_file.write(json.dumps(row, default=_json_default, separators=(',', ':')).encode('utf-8') + b'\n')
+            raw_file.flush()
+            os.fsync(raw_file.fileno())
+
+        timestamps = [row[timestamp_name] for row in period_rows if row[timestamp_name]]
+        entry = HistoryArchive.query.filter_by(table_name=table_name, period=period).first()
+        if entry is None:
+            entry = HistoryArchive(table_name=table_name, period=period, path=relative_path, row_count=0)
+            db.session.add(entry)
+        if timestamps:
+            entry.first_at = min([entry.first_at] + timestamps) if entry.first_at else min(timestamps)
+            entry.last_at = max([entry.last_at] + timestamps) if entry.last_at else max(timestamps)
+        entry.row_count = (entry.row_count or 0) + len(period_rows)
+        entry.size_bytes = os.path.getsize(full_path)
+
+
+def _add_rollups(rows):
+    """Add a batch of stream rows to the daily ``stream_history_rollups`` totals (in the session's transaction)."""
+    totals = defaultdict(lambda: [0, 0, 0, 0])  # key -> [plays, duration, watched, untimed]
+    for row in rows:
+        key = (row['started_at'].date(), row['user_uuid'], row['server_id'], row['library_id'], row['media_type'])
+        duration = row['duration_seconds'] or 0
+        watched = duration if duration > 0 else max(row['view_offset_at_end_seconds'] or 0, 0)
+        counts = totals[key]
+        counts[0] += 1
+        counts[1] += duration
+        counts[2] += watched
+        counts[3] += 0 if watched > 0 else 1
+
+    # Core statements rather than ORM objects: a batch touches up to one rollup row per source row
+    table = StreamHistoryRollup.__table__
+    user_days = {(key[0], key[1]) for key in totals if key[1] is not None}
+    anonymous_days = {key[0] for key in totals if key[1] is None}
+    match = [tuple_(table.c.day, table.c.user_uuid).in_(user_days)] if user_days else []
+    if anonymous_days:
+        match.append(and_(table.c.user_uuid.is_(None), table.c.day.in_(anonymous_days)))
+    existing = {}
+    for row in db.session.execute(
+        select(table.c.id, table.c.day, table.c.user_uuid, table.c.server_id, table.c.library_id, table.c.media_type)
+        .where(or_(*match))
+    ):
+        existing[(row.day, row.user_uuid, row.server_id, row.library_id, row.media_type)] = row.id
+
+    updates, inserts = [], []
+    for key, (plays, duration, watched, untimed) in totals.items():
+        values = {'add_plays': plays, 'add_duration': duration, 'add_watched': watched, 'add_untimed': untimed}
+        if key in existing:
+            updates.append(dict(values, rollup_id=existing[key]))
+        else:
+            inserts.append({'day': key[0], 'user_uuid': key[1], 'server_id': key[2], 'library_id': key[3], 'media_type': key[4],
+                            'plays': plays, 'duration_seconds': duration, 'watched_seconds': watched, 'untimed_plays': untimed})
+    if updates:
+        db.session.execute(
+            table.update().where(table.c.id == bindparam('rollup_id')).values(
+                plays=table.c.plays + bindparam('add_plays'),
+                duration_seconds=table.c.duration_seconds + bindparam('add_duration'),
+                watched_seconds=table.c.watched_seconds + bindparam('add_watched'),
+                untimed_plays=table.c.untimed_plays + bindparam('add_untimed')),
+            updates)
+    if inserts:
+        db.session.execute(table.insert(), inserts)
+
+
+def count_expired(table_name, days=None):
+    days = retention_days(table_name) if days is None else days
+    if not days:
+        return 0
+    model = POLICIES[table_name][0]
+    return db.session.query(func.count(model.id)).filter(_expired_filter(table_name, _cutoff(days))).scalar() or 0
+
+
+def apply_table_retention(table_name, days=None, progress_callback=None):
+    """
+    Archive and delete the expired rows of one table. Returns the number of rows removed.
+    ``progress_callback(done, total, message)`` may return False to stop after the current batch.
+    """
+    days = retention_days(table_name) if days is None else days
+    if not days:
+        return 0
+    model = POLICIES[table_name][0]
+    cutoff = _cutoff(days)
+    batch_size = max(1, int(current_app.config.get('RETENTION_BATCH_SIZE', 1000)))
+    pause = float(current_app.config.get('RETENTION_BATCH_PAUSE_SECONDS', 0))
+    total = count_expired(table_name, days)
+    done = 0
+    last_id = 0
+    current_app.logger.info(f"Retention_Service.py - apply_table_retention(): {total} {table_name} rows are older than {days} days.")
+
+    while True:
+        rows = _load_rows(table_name, cutoff, last_id, batch_size)
+        db.session.rollback()  # end the read transaction before the files are written
+        if not rows:
+            break
+        ids = [row['id'] for row in rows]
+        last_id = ids[-1]
+        _write_archive_files(table_name, rows)
+        with write_queue.serialized('retention'):
+            if table_name == 'media_stream_history':
+                _add_rollups(rows)
+                delete_payloads(model, ids)
+            db.session.execute(model.__table__.delete().where(model.__table__.c.id.in_(ids)))
+            db.session.commit()
+        done += len(rows)
+        if progress_callback and progress_callback(done, max(total, done), f"Archived {done} {table_name} rows") is False:
+            break
+        if pause:
+            time.sleep(pause)
+
+    if done and table_name == 'media_stream_history':
+        library_stats_cache.invalidate_all()
+    return done
+
+
+def apply_retention(progress_callback=None):
+    """Apply every configured retention policy. Returns a result dict like the other background jobs."""
+    from app.utils.helpers import log_event
+
+    removed = {}
+    for table_name in POLICIES:
+        days = retention_days(table_name)
+        if days:
+            removed[table_name] = apply_table_retention(table_name, days, progress_callback=progress_callback)
+    if not removed:
+        return {'success': True, 'removed': {}, 'message': "No retention policy is configured."}
+
+    message = "Retention: " + ", ".join(f"{count} {table_name} rows archived" for table_name, count in removed.items())
+    if any(removed.values()):
+        log_event(EventType.SETTING_CHANGE, message, details={'removed': removed, 'archive_dir': archive_dir()})
+    current_app.logger.info(f"Retention_Service.py - apply_retention(): {message}")
+    return {'success': True, 'removed': removed, 'message': message}
+
+
+def iter_archived_rows(table_name, since=None, until=None):
+    """Yield archived rows of ``table_name`` (as dicts) whose timestamp lies in [since, until), oldest month first."""
+    timestamp_name = POLICIES[table_name][1]
+    query = HistoryArchive.query.filter_by(table_name=table_name)
+    if since is not None:
+        query = query.filter(or_(HistoryArchive.last_at.is_(None), HistoryArchive.last_at >= since))
+    if until is not None:
+        query = query.filter(or_(HistoryArchive.first_at.is_(None), HistoryArchive.first_at < until))
+    seen_ids = set()
+    for entry in query.order_by(HistoryArchive.period).all():
+        full_path = os.path.join(archive_dir(), entry.path)
+        if not os.path.exists(full_path):
+            current_app.logger.warning(f"Retention_Service.py - iter_archived_rows(): Archive file {full_path} is missing.")
+            continue
+        with gzip.open(full_path, 'rt', encoding='utf-8') as archive_file:
+            for line in archive_file:
+                row = json.loads(line)
+                if row['id'] in seen_ids:
+                    continue
+                seen_ids.add(row['id'])
+                timestamp = _parse_timestamp(row.get(timestamp_name))
+                if since is not None and (timestamp is None or timestamp < since):
+                    continue
+                if until is not None and (timestamp is None or timestamp >= until):
+                    continue
+                yield row
+
+
+def export_rows(table_name, since=None, until=None, include_live=True, batch_size=1000):
+    """Archived rows in [since, until) followed by the matching rows still in the table."""
+    yield from iter_archived_rows(table_name, since, until)
+    if not include_live:
+        return
+    model, timestamp_name, _ = POLICIES[table_name]
+    table = model.__table__
+    conditions = []
+    if since is not None:
+        conditions.append(table.c[timestamp_name] >= since)
+    if until is not None:
+        conditions.append(table.c[timestamp_name] < until)
+    last_id = 0
+    while True:
+        rows = db.session.execute(select(table).where(table.c.id > last_id, *conditions)
+                                  .order_by(table.c.id).limit(batch_size)).mappings().all()
+        if not rows:
+            return
+        for row in rows:
+            yield json.loads(json.dumps(dict(row), default=_json_default))
+        last_id = rows[-1]['id']
+
+
+def archive_status():
+    """Per table: retention setting, live and expired row counts, and archived rows/bytes/range."""
+    status = {}
+    for table_name, (model, _, _) in POLICIES.items():
+        archived = db.session.query(
+            func.coalesce(func.sum(HistoryArchive.row_count), 0), func.coalesce(func.sum(HistoryArchive.size_bytes), 0),
+            func.count(HistoryArchive.id), func.min(HistoryArchive.first_at), func.max(HistoryArchive.last_at)
+        ).filter(HistoryArchive.table_name == table_name).one()
+        status[table_name] = {
+            'retention_days': retention_days(table_name),
+            'live_rows': db.session.query(func.count(model.id)).scalar() or 0,
+            'expired_rows': count_expired(table_name),
+            'archived_rows': int(archived[0]),
+            'archived_bytes': int(archived[1]),
+            'archive_files': archived[2],
+            'archived_from': archived[3].isoformat() if archived[3] else None,
+            'archived_until': archived[4].isoformat() if archived[4] else None,
+        }
+    return status
@@ -0,0 +1,292 @@
+# File: app/services/session_feed.py
+"""
+Snapshot of the active streaming sessions, shared by every open streaming page.
+
+The session monitor already fetches the sessions of every server on each
+tick. While someone is watching the streaming page, it also formats them
+(``format_sessions``, no second upstream call) and publishes the result
+here. The page then reads the snapshot instead of querying the servers
+itself:
+
+- ``streaming.sessions_partial`` renders the current snapshot (or takes a
+  fresh one if the monitor hasn't published lately);
+- ``streaming.session_events`` is a Server-Sent Events stream that sends
+  only the sessions that were added, changed or removed since the version
+  the page has, plus the summary line when it changes.
+
+A snapshot only gets a new version when something visible changed, so an
+open tab costs a blocked thread and a keepalive comment while nothing
+happens.
+
+The monitor also notes how many sessions are active on every tick, open
+page or not, so the dashboard card and the navbar badge can show (and
+version their responses by) the count without asking the servers.
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import deque
+
+from flask import current_app, has_request_context
+
+from app.services import geoip_service
+from app.services.media_service_factory import MediaServiceFactory
+from app.services.media_service_manager import MediaServiceManager
+
+_HISTORY = 20  # Versions a reconnecting page can resume from
+_DEMAND_WINDOW_SECONDS = 300  # Keep publishing this long after the page was last loaded
+
+_condition = threading.Condition()
+_history = deque(maxlen=_HISTORY)  # (version, fingerprints)
+_current = None
+_version = 0
+_listeners = 0
+_last_demand = 0.0
+_noted_count = None  # (number of active sessions, monotonic time), noted by the monitor every tick
+
+
+class Snapshot:
+    def __init__(self, version, sessions, fingerprints, summary_fingerprint):
+        self.version = version
+        self.sessions = sessions
+        self.fingerprints = fingerprints  # feed_id -> fingerprint, in display order
+        self.summary_fingerprint = summary_fingerprint
+        self.taken_at = time.monotonic()
+
+    def by_id(self):
+        return {session['feed_id']: session for session in self.sessions}
+
+
+def _feed_id(server_id, session_key):
+    return f"s{server_id}-" + re.sub(r'[^A-Za-z0-9_-]', '_', str(session_key))
+
+
+def _fingerprint(value):
+    return hashlib.sha1(json.dumps(value, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def monitor_interval_seconds():
+    from app.models import Setting
+    try:
+        return max(5, int(Setting.get('SESSION_MONITORING_INTERVAL_SECONDS', 30)))
+    except (TypeError, ValueError):
+        return 30
+
+
+def _format_all(raw_sessions):
+    sessions = []
+    raw_by_server = None
+    if raw_sessions is not None:
+        raw_by_server = {}
+        for raw in raw_sessions:
+            server_id = raw.get('server_id') if isinstance(raw, dict) else getattr(raw, 'server_id', None)
+            raw_by_server.setdefault(server_id, []).append(raw)
+
+    for server in MediaServiceManager.get_all_servers():
+        service = MediaServiceFactory.create_service_from_db(server)
+        if not service:
+            continue
+        try:
+            if raw_by_server is None:
+                formatted = service.get_formatted_sessions()
+            else:
+                formatted = service.format_sessions(raw_by_server.get(server.id, []))
+        except Exception as e:
+            current_app.logger.error(f"Session_Feed.py - Error getting formatted sessions from {server.server_nickname}: {e}")
+            continue
+        for session in formatted or []:
+            session['feed_id'] = _feed_id(server.id, session.get('session_key'))
+            sessions.append(session)
+    return sessions
+
+
+def build_sessions(raw_sessions=None):
+    """
+    Formatted sessions of every server, with GeoIP labels for WAN addresses.
+    ``raw_sessions`` are the monitor's ``get_all_active_sessions()``; without
+    them every server is queried.
+    """
+    if has_request_context():
+        sessions = _format_all(raw_sessions)
+    else:
+        # Formatting builds proxy URLs with url_for, which needs a request context
+        with current_app.test_request_context('/'):
+            sessions = _format_all(raw_sessions)
+
+    # Resolve every WAN address in one pass; known viewers come from the GeoIP cache
+    wan_ips = [session.get('location_ip') for session in sessions if session.get('is_public_ip')]
+    if wan_ips:
+        try:
+            geoip_results = geoip_service.lookup_many(wan_ips)
+            for session in sessions:
+                if session.get('is_public_ip'):
+                    session['geoip_label'] = geoip_service.place_label(geoip_results.get(session.get('location_ip')))
+        except Exception as e:
+            current_app.logger.warning(f"Session_Feed.py - GeoIP lookup for streaming sessions failed: {e}")
+    return sessions
+
+
+def publish(sessions):
+    """Store a new snapshot if anything visible changed and wake the event streams. Returns the current snapshot."""
+    global _current, _version
+    fingerprints = {session['feed_id']: _fingerprint(session) for session in sessions}
+    summary_fingerprint = _fingerprint(summarize(sessions, 'merged')[0])
+    note_count(len(sessions))
+    with _condition:
+        if _current is not None and list(_current.fingerprints.items()) == list(fingerprints.items()):
+            _current.taken_at = time.monotonic()  # Still current; nothing to send
+            return _current
+        _version += 1
+        _current = Snapshot(_version, sessions, fingerprints, summary_fingerprint)
+        _history.append((_version, fingerprints, summary_fingerprint))
+        _condition.notify_all()
+        return _current
+
+
+def refresh(raw_sessions=None):
+    return publish(build_sessions(raw_sessions))
+
+
+def current(max_age_seconds=None):
+    """The latest snapshot, or None if there is none or it is older than ``max_age_seconds``."""
+    with _condition:
+        snapshot = _current
+    if snapshot is None:
+        return None
+    if max_age_seconds is not None and time.monotonic() - snapshot.taken_at > max_age_seconds:
+        return None
+    return snapshot
+
+
+def state_at(version):
+    """``(fingerprints, summary_fingerprint)`` of an earlier version, or None if it is no longer kept."""
+    with _condition:
+        for kept_version, fingerprints, summary_fingerprint in _history:
+            if kept_version == version:
+                return fingerprints, summary_fingerprint
+    return None
+
+
+def wait_for_change(version, timeout):
+    """Block until there is a snapshot newer than ``version`` or the timeout passes. Returns the latest snapshot."""
+    with _condition:
+        _condition.wait_for(lambda: _current is not None and _current.version != version, timeout)
+        return _current
+
+
+def diff(fingerprints, snapshot):
+    """Feed ids added, updated and removed between ``fingerprints`` and ``snapshot``."""
+    added = [feed_id for feed_id in snapshot.fingerprints if feed_id not in fingerprints]
+    updated = [feed_id for feed_id, value in snapshot.fingerprints.items()
+               if feed_id in fingerprints and fingerprints[feed_id] != value]
+    removed = [feed_id for feed_id in fingerprints if feed_id not in snapshot.fingerprints]
+    return added, updated, removed
+
+
+def note_count(count):
+    """Record the number of active sessions the monitor just saw."""
+    global _noted_count
+    _noted_count = (count, time.monotonic())
+
+
+def active_count(max_age_seconds=None):
+    """The last noted number of active sessions, or None if there is none or it is older than ``max_age_seconds``."""
+    noted = _noted_count
+    if noted is None:
+        return None
+    if max_age_seconds is not None and time.monotonic() - noted[1] > max_age_seconds:
+        return None
+    return noted[0]
+
+
+def fresh_age_seconds():
+    """How old a snapshot or count may be and still count as current: two monitor ticks and some slack."""
+    return 2 * monitor_interval_seconds() + 5
+
+
+def note_demand():
+    """Record that the streaming page was loaded, so the monitor keeps publishing snapshots."""
+    global _last_demand
+    _last_demand = time.monotonic()
+
+
+def wanted():
+    """True while a streaming page is open (an event stream or a recent page load)."""
+    return _listeners > 0 or time.monotonic() - _last_demand < _DEMAND_WINDOW_SECONDS
+
+
+def acquire_listener():
+    """Count an event stream; False if ``STREAMING_EVENTS_MAX_CLIENTS`` are already open."""
+    global _listeners
+    with _condition:
+        if _listeners >= current_app.config.get('STREAMING_EVENTS_MAX_CLIENTS', 20):
+            return False
+        _listeners += 1
+        return True
+
+
+def release_listener():
+    global _listeners
+    with _condition:
+        _listeners = max(0, _listeners - 1)
+    note_demand()
+
+
+def _empty_stats():
+    return {
+        'total_streams': 0,
+        'direct_play_count': 0,
+        'transcode_count': 0,
+        'total_bandwidth_mbps': 0.0,
+        'lan_bandwidth_mbps': 0.0,
+        'wan_bandwidth_mbps': 0.0
+    }
+
+
+def _count(stats, session, bitrate_mbps):
+    stats['total_streams'] += 1
+    if session.get('is_transcode_calc', False):
+        stats['transcode_count'] += 1
+    else:
+        stats['direct_play_count'] += 1
+    stats['total_bandwidth_mbps'] += bitrate_mbps
+    if session.get('location_type_calc') == 'LAN':
+        stats['lan_bandwidth_mbps'] += bitrate_mbps
+    else:
+        stats['wan_bandwidth_mbps'] += bitrate_mbps
+
+
+def _round(stats):
+    for key in ('total_bandwidth_mbps', 'lan_bandwidth_mbps', 'wan_bandwidth_mbps'):
+        stats[key] = round(stats[key], 1)
+
+
+def summarize(sessions, view_mode):
+    """
+    Summary statistics of the sessions, and for the categorized views the
+    sessions grouped by server name ('categorized') or service ('service'),
+    each with its own statistics.
+    """
+    summary_stats = _empty_stats()
+    groups = {}
+    for session in sessions:
+        bitrate_calc = session.get('bitrate_calc', 0)
+        bitrate_mbps = bitrate_calc / 1000.0 if bitrate_calc else 0.0  # Convert kbps to Mbps
+        _count(summary_stats, session, bitrate_mbps)
+
+        if view_mode == 'categorized':
+            group_name = session.get('server_name', 'Unknown Server')
+        elif view_mode == 'service':
+            group_name = session.get('service_type', 'unknown').title()
+        else:
+            continue
+        group = groups.setdefault(group_name, {'sessions': [], 'stats': _empty_stats()})
+        group['sessions'].append(session)
+        _count(group['stats'], session, bitrate_mbps)
+
+    _round(summary_stats)
+    for group in groups.values():
+        _round(group['stats'])
+    return summary_stats, groups
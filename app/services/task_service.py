@@ -2,15 +2,39 @@
 from flask import current_app
 from app.extensions import scheduler 
 from app.models import Setting, EventType, User, UserType
-from app.models_media_services import ServiceType, MediaStreamHistory
+from app.models_media_services import ServiceType, MediaServer, MediaStreamHistory
 from app.utils.helpers import log_event
 from . import user_service # user_service is needed for deleting users
+from . import activity_summary_service
+from . import library_stats_cache
+from . import media_item_index
+from . import write_queue
+from . import session_feed
+from . import metrics
 from app.services.media_service_manager import MediaServiceManager
 from datetime import datetime, timezone, timedelta 
 from app.extensions import db
+import threading
+import time
 
 _active_stream_sessions = {}
 
+EXPIRATION_JOB_ID = 'check_user_expirations'
+_expiration_lock = threading.Lock()  # One expiration run at a time; a re-armed job may fire while one is running
+
+
+def _session_server(session, service_type):
+    """
+    The server a session was reported by. MediaServiceManager.get_all_active_sessions
+    tags every session with its server_id; untagged sessions fall back to the
+    first server of the service type.
+    """
+    server_id = session.get('server_id') if isinstance(session, dict) else getattr(session, 'server_id', None)
+    server = db.session.get(MediaServer, server_id) if server_id else None
+    if server is None:
+        server = MediaServer.query.filter_by(service_type=service_type).first()
+    return server
+
 # --- Scheduled Tasks ---
 
 def monitor_media_sessions_task():
@@ -24,6 +48,7 @@ def monitor_media_sessions_task():
     global _active_stream_sessions
     with scheduler.app.app_context():
         current_app.logger.info("=== MEDIA SESSION MONITOR TASK STARTING ===")
+        tick_started = time.perf_counter()
         
         # Check for any active media servers from the database
         all_servers = MediaServiceManager.get_all_servers(active_only=True)
@@ -36,10 +61,17 @@ def monitor_media_sessions_task():
             current_app.logger.warning("No active media servers configured in the database. Skipping task.")
             return
 
+        queued = False
+        active_sessions = None
         try:
             # This gets sessions from all active servers (Plex, Jellyfin, etc.)
             current_app.logger.debug("Calling MediaServiceManager.get_all_active_sessions()...")
             active_sessions = MediaServiceManager.get_all_active_sessions()
+            session_feed.note_count(len(active_sessions))  # Dashboard card and navbar badge read this
+            metrics.set_active_streams(all_servers, active_sessions)
+            # Everything below is database work; hold the writer lock until the commit
+            write_queue.acquire('session monitor')
+            queued = True
             now_utc = datetime.now(timezone.utc)
             current_app.logger.debug(f"Retrieved {len(active_sessions)} active sessions from MediaServiceManager")
             
@@ -74,6 +106,9 @@ def monitor_media_sessions_task():
             
             current_session_keys = set(current_sessions_dict.keys())
 
+            # Libraries whose history changes this tick; their cached statistics are dropped after the commit
+            libraries_with_new_history = set()
+
             # Step 1: Check for stopped streams
             stopped_session_keys = set(_active_stream_sessions.keys()) - current_session_keys
             if stopped_session_keys:
@@ -86,6 +121,8 @@ def monitor_media_sessions_task():
                             final_duration = history_record.view_offset_at_end_seconds
                             history_record.duration_seconds = final_duration if final_duration and final_duration > 0 else 0
                             history_record.stopped_at = now_utc
+                            activity_summary_service.record_stream_stopped(history_record)
+                            libraries_with_new_history.add(history_record.library_id)
                             current_app.logger.info(f"DURATION DEBUG: Session {session_key} stopped - view_offset_at_end_seconds: {history_record.view_offset_at_end_seconds}s, final duration_seconds: {history_record.duration_seconds}s")
                             current_app.logger.info(f"Marked session {session_key} (DB ID: {stream_history_id}) as stopped. Final duration: {history_record.duration_seconds}s.")
                         else:
@@ -97,9 +134,6 @@ def monitor_media_sessions_task():
             else:
                 current_app.logger.info(f"Processing {len(current_sessions_dict)} new or ongoing sessions...")
 
-            # Import MediaServer for both Plex and Jellyfin session handling
-            from app.models_media_services import MediaServer
-            
             for session_key, session in current_sessions_dict.items():
                 # Handle different session formats for user lookup
                 mum_user = None
@@ -110,7 +144,7 @@ def monitor_media_sessions_task():
                     jellyfin_username = session.get('UserName')
                     if jellyfin_username:
                         # Find service user for Jellyfin username on the correct server
-                        jellyfin_server = MediaServer.query.filter_by(service_type=ServiceType.JELLYFIN).first()
+                        jellyfin_server = _session_server(session, ServiceType.JELLYFIN)
                         if jellyfin_server:
                             user_media_access = User.query.filter_by(userType=UserType.SERVICE).filter_by(
                                 server_id=jellyfin_server.id,
@@ -146,8 +180,11 @@ def monitor_media_sessions_task():
                     # Plex session - look up by user ID via service user
                     user_id_from_session = None
                     
-                    # Try different ways to get user ID from Plex session
-                    if hasattr(session, 'user') and session.user:
+                    # Try different ways to get user ID from Plex session. The <User id> of the
+                    # session XML is enough for shared users; session.user would look them up on plex.tv.
+                    if getattr(session, '_userId', None) not in (None, 1):
+                        user_id_from_session = session._userId
+                    elif hasattr(session, 'user') and session.user:
                         if hasattr(session.user, 'id'):
                             user_id_from_session = session.user.id
                         else:
@@ -160,7 +197,7 @@ def monitor_media_sessions_task():
                     
                     if user_id_from_session:
                         # Look up user by external_user_id in service user for Plex server
-                        plex_server = MediaServer.query.filter_by(service_type=ServiceType.PLEX).first()
+                        plex_server = _session_server(session, ServiceType.PLEX)
                         if plex_server:
                             user_media_access = User.query.filter_by(userType=UserType.SERVICE).filter_by(
                                 server_id=plex_server.id,
@@ -230,6 +267,8 @@ def monitor_media_sessions_task():
                         
                         # Extract library name from Plex session
                         library_name = getattr(session, 'librarySectionTitle', None)
+                        library_external_id = getattr(session, 'librarySectionID', None)
+                        grandparent_key = getattr(session, 'grandparentRatingKey', None)
                     else:
                         # Jellyfin session format (dict)
                         now_playing = session.get('NowPlayingItem', {})
@@ -252,6 +291,8 @@ def monitor_media_sessions_task():
                         
                         # For Jellyfin, the Id is already the correct external_media_item_id
                         external_media_item_id = rating_key
+                        grandparent_key = now_playing.get('SeriesId')
+                        library_external_id = None
                         
                         # Position in ticks for Jellyfin
                         position_ticks = play_state.get('PositionTicks', 0)
@@ -267,12 +308,10 @@ def monitor_media_sessions_task():
                     # Determine which server this session belongs to
                     if isinstance(session, dict):
                         # Jellyfin session - find Jellyfin server
-                        jellyfin_server = MediaServer.query.filter_by(service_type=ServiceType.JELLYFIN).first()
-                        current_server = jellyfin_server
+                        current_server = _session_server(session, ServiceType.JELLYFIN)
                     else:
                         # Plex session - find Plex server
-                        plex_server = MediaServer.query.filter_by(service_type=ServiceType.PLEX).first()
-                        current_server = plex_server
+                        current_server = _session_server(session, ServiceType.PLEX)
                     
                     if not current_server:
                         current_app.logger.warning(f"Could not find server for session {session_key}. Skipping.")
@@ -298,6 +337,11 @@ def monitor_media_sessions_task():
                     current_app.logger.debug(f"Media: {media_title} ({media_type})")
                     current_app.logger.debug(f"Platform: {platform}, Player: {player_title}")
                     
+                    library_id, media_item_id, grandparent_media_item_id = media_item_index.resolve(
+                        current_server.id, rating_key=rating_key, external_id=external_media_item_id,
+                        grandparent_key=grandparent_key, library_external_id=library_external_id, library_name=library_name
+                    )
+                    
                     new_history_record = MediaStreamHistory(
                         user_uuid=user_media_access.uuid,  # Use unified user_uuid field
                         server_id=current_server.id,
@@ -315,6 +359,9 @@ def monitor_media_sessions_task():
                         grandparent_title=grandparent_title,
                         parent_title=parent_title,
                         library_name=library_name,
+                        library_id=library_id,
+                        media_item_id=media_item_id,
+                        grandparent_media_item_id=grandparent_media_item_id,
                         media_duration_seconds=media_duration_s,
                         view_offset_at_end_seconds=view_offset_s
                     )
@@ -326,6 +373,8 @@ def monitor_media_sessions_task():
                     db.session.flush() # Flush to get the ID
                     
                     _active_stream_sessions[session_key] = new_history_record.id
+                    activity_summary_service.record_stream_started(new_history_record)
+                    libraries_with_new_history.add(new_history_record.library_id)
                     current_app.logger.debug(f"Successfully created MediaStreamHistory record (ID: {new_history_record.id}) for session {session_key}.")
                     current_app.logger.debug(f"Added session {session_key} to _active_stream_sessions tracking")
                 
@@ -371,73 +420,168 @@ def monitor_media_sessions_task():
             current_app.logger.debug("About to commit all database changes...")
             db.session.commit()
             current_app.logger.debug("Database commit successful!")
+            libraries_with_new_history.discard(None)
+            library_stats_cache.invalidate_libraries(libraries_with_new_history)
             current_app.logger.info("=== MEDIA SESSION MONITOR TASK FINISHED ===")
             
         except Exception as e:
             db.session.rollback()
             current_app.logger.error(f"Fatal error in monitor_plex_sessions_task: {e}", exc_info=True)
+        finally:
+            if queued:
+                write_queue.release()
 
-def check_user_access_expirations_task():
+        # Share this tick's sessions with open streaming pages (no extra upstream calls)
+        if active_sessions is not None and session_feed.wanted():
+            try:
+                session_feed.refresh(active_sessions)
+            except Exception as e:
+                current_app.logger.error(f"Task_Service: Could not publish streaming sessions: {e}", exc_info=True)
+        metrics.MONITOR_TICK_SECONDS.observe(time.perf_counter() - tick_started)
+
+def schedule_next_expiration_check(not_before=None):
     """
-    Checks for users whose access has expired and removes them from MUM and Plex.
-    This version correctly compares naive datetimes to ensure accuracy.
+    Arms the one-shot expiration check for the earliest access expiry of any
+    local user, or removes it when nobody's access expires. One
+    indexed MIN query; call it after changing expiry dates (the check re-arms
+    itself after each run).
+
+    Args:
+        not_before: Don't run before this UTC time (e.g. to retry failed removals later)
+
+    Returns:
+        The UTC time the check will run, or None
     """
-    with scheduler.app.app_context():
-        # Check for expired users
-        now_naive = datetime.utcnow()
-        expired_users = User.query.filter(
+    if not scheduler.running:
+        return None
+    try:
+        next_expiry = db.session.query(db.func.min(User.access_expires_at)).filter(
             User.userType == UserType.LOCAL,
-            User.access_expires_at.isnot(None), 
-            User.access_expires_at <= now_naive
-        ).all()
+            User.access_expires_at.isnot(None)
+        ).scalar()
+    except Exception as e:
+        current_app.logger.error(f"Task_Service: Could not read the next access expiry: {e}")
+        return None
 
-        if not expired_users:
-            return
+    try:
+        if next_expiry is None:
+            if scheduler.get_job(EXPIRATION_JOB_ID):
+                scheduler.remove_job(EXPIRATION_JOB_ID)
+            current_app.logger.debug("Task_Service: No upcoming access expiry; expiration check disarmed")
+            return None
+        if next_expiry.tzinfo is None:
+            next_expiry = next_expiry.replace(tzinfo=timezone.utc)
+        run_at = max(next_expiry, not_before or datetime.now(timezone.utc))
+        scheduler.add_job(id=EXPIRATION_JOB_ID, func=check_user_access_expirations_task, trigger='date',
+                          run_date=run_at, replace_existing=True, misfire_grace_time=None, coalesce=True)
+        current_app.logger.debug(f"Task_Service: Expiration check armed for {run_at.isoformat()}")
+        return run_at
+    except Exception as e:
+        current_app.logger.error(f"Task_Service: Could not arm the expiration check: {e}", exc_info=True)
+        return None
 
-        current_app.logger.info(f"Found {len(expired_users)} expired users, processing removals...")
-        
-        system_admin_id = None
-        try:
-            admin = User.get_owner()
-            if admin:
-                system_admin_id = admin.id
-            pass
-        except Exception as e_admin:
-            current_app.logger.warning(f"Could not fetch admin_id for logging expiration task: {e_admin}")
-
-        removal_count = 0
-        for user in expired_users:
-            username_for_log = user.get_display_name()
-            mum_user_id_for_log = user.id
-            original_expiry_for_log = user.access_expires_at
-            
+
+def resync_expiration_check_task():
+    """Re-reads the next access expiry, in case dates were changed without re-arming the check."""
+    with scheduler.app.app_context():
+        schedule_next_expiration_check()
+
+
+def check_user_access_expirations_task():
+    """
+    Removes the users whose access has expired, all in one deprovisioning
+    run, then arms the check for the next expiry. Scheduled for the moment
+    the earliest expiry is due (see schedule_next_expiration_check).
+    """
+    if not _expiration_lock.acquire(blocking=False):
+        return  # The running check re-arms for whatever is due next
+    try:
+        with scheduler.app.app_context():
+            retry_at = None
             try:
-                current_app.logger.info(f"Removing expired user '{username_for_log}' (expired: {original_expiry_for_log})")
-                
-                # Use the unified user service for deletion
-                from app.services.unified_user_service import UnifiedUserService
-                UnifiedUserService.delete_user_completely(user_id=mum_user_id_for_log, admin_id=system_admin_id)
-                removal_count += 1
-                
-                log_event(
-                    EventType.MUM_USER_DELETED_FROM_MUM,
-                    f"User '{username_for_log}' automatically removed due to expired invite-based access (expired: {original_expiry_for_log}).",
-                    user_id=mum_user_id_for_log,
-                    admin_id=system_admin_id, 
-                    details={"reason": "Automated removal: invite access duration expired."}
-                )
-                current_app.logger.info(f"Successfully removed expired user '{username_for_log}'")
-                
+                retry_at = _remove_expired_users()
             except Exception as e:
-                current_app.logger.error(f"Error removing expired user '{username_for_log}': {e}", exc_info=True)
-                log_event(
-                    EventType.ERROR_GENERAL,
-                    f"Task failed to remove expired user '{username_for_log}': {e}",
-                    user_id=mum_user_id_for_log,
-                    admin_id=system_admin_id
-                )
-        
-        current_app.logger.info(f"User expiration check complete. Removed: {removal_count}/{len(expired_users)} users.")
+                db.session.rollback()
+                current_app.logger.error(f"Task_Service: Expiration check failed: {e}", exc_info=True)
+                retry_at = datetime.now(timezone.utc) + timedelta(seconds=current_app.config.get('EXPIRATION_RETRY_SECONDS', 300))
+            finally:
+                schedule_next_expiration_check(not_before=retry_at)
+    finally:
+        _expiration_lock.release()
+
+
+def _remove_expired_users():
+    """Removes every user whose access has expired. Returns when to retry failed removals, or None."""
+    # Check for expired users
+    now_naive = datetime.utcnow()
+    expired_users = User.query.filter(
+        User.userType == UserType.LOCAL,
+        User.access_expires_at.isnot(None),
+        User.access_expires_at <= now_naive
+    ).all()
+
+    if not expired_users:
+        return None
+
+    current_app.logger.info(f"Found {len(expired_users)} expired users, processing removals...")
+    
+    system_admin_id = None
+    try:
+        admin = User.get_owner()
+        if admin:
+            system_admin_id = admin.id
+    except Exception as e_admin:
+        current_app.logger.warning(f"Could not fetch admin_id for logging expiration task: {e_admin}")
+
+    expiry_by_user_id = {user.id: user.access_expires_at for user in expired_users}
+
+    # Remote removals run concurrently per server; DB deletes are committed in batches
+    from app.services import deprovisioning_service
+    run = deprovisioning_service.create_run('expiration', local_user_ids=list(expiry_by_user_id), admin_id=system_admin_id)
+    try:
+        deprovisioning_service.execute_run(run.id)
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error running expiration removals (run {run.id}): {e}", exc_info=True)
+
+    removal_count = 0
+    for outcome in run.outcomes.all():
+        original_expiry_for_log = expiry_by_user_id.get(outcome.user_id)
+        if outcome.status == 'removed':
+            removal_count += 1
+            log_event(
+                EventType.MUM_USER_DELETED_FROM_MUM,
+                f"User '{outcome.username}' automatically removed due to expired invite-based access (expired: {original_expiry_for_log}).",
+                admin_id=system_admin_id,
+                details={"reason": "Automated removal: invite access duration expired.", "deprovision_run_id": run.id,
+                         "remote_errors": outcome.error}
+            )
+            current_app.logger.info(f"Successfully removed expired user '{outcome.username}'")
+        else:
+            current_app.logger.error(f"Error removing expired user '{outcome.username}': {outcome.error}")
+            log_event(
+                EventType.ERROR_GENERAL,
+                f"Task failed to remove expired user '{outcome.username}': {outcome.error or outcome.status}",
+                admin_id=system_admin_id
+            )
+    
+    current_app.logger.info(f"User expiration check complete. Removed: {removal_count}/{len(expired_users)} users.")
+    if removal_count < len(expired_users):
+        return datetime.now(timezone.utc) + timedelta(seconds=current_app.config.get('EXPIRATION_RETRY_SECONDS', 300))
+    return None
+
+
+def refresh_overseerr_users_task():
+    """Reloads the cached Overseerr user lists so linking users doesn't wait on the Overseerr API."""
+    from . import overseerr_service
+    with scheduler.app.app_context():
+        try:
+            refreshed = overseerr_service.refresh_user_indexes()
+            if refreshed:
+                current_app.logger.debug(f"Task_Service: Refreshed Overseerr users for {refreshed} instance(s)")
+        except Exception as e:
+            current_app.logger.error(f"Task_Service: Overseerr user refresh failed: {e}")
+
 
 # Add this helper function to check scheduler status
 def debug_scheduler_status():
@@ -457,7 +601,7 @@ def debug_scheduler_status():
             current_app.logger.info(f"  Trigger: {job.trigger}")
             
         # Check specific expiration job
-        expiration_job = scheduler.get_job('check_user_expirations')
+        expiration_job = scheduler.get_job(EXPIRATION_JOB_ID)
         if expiration_job:
             current_app.logger.info(f"Expiration job found:")
             current_app.logger.info(f"  Next run: {expiration_job.next_run_time}")
@@ -521,12 +665,58 @@ def schedule_all_tasks():
     ):
         log_event(EventType.APP_STARTUP, f"Media session monitoring scheduled ({session_interval_seconds}s interval)")
 
-    # 2. User Access Expiration Check
-    if _schedule_job_if_not_exists_or_reschedule(
-        job_id='check_user_expirations',
-        func=check_user_access_expirations_task,
+    # 2. User Access Expiration Check: a one-shot job at the next expiry that re-arms itself, plus a periodic re-read
+    next_expiration_check = schedule_next_expiration_check(not_before=datetime.now(timezone.utc) + timedelta(seconds=30))
+    if next_expiration_check:
+        log_event(EventType.APP_STARTUP, f"User expiration check scheduled for {next_expiration_check.strftime('%Y-%m-%d %H:%M')} UTC")
+    _schedule_job_if_not_exists_or_reschedule(
+        job_id='resync_user_expirations',
+        func=resync_expiration_check_task,
         trigger_type='interval',
-        seconds=session_interval_seconds,
-        next_run_time=datetime.now(timezone.utc) + timedelta(seconds=30)
-    ):
-        log_event(EventType.APP_STARTUP, f"User expiration check scheduled ({session_interval_seconds}s interval)")
+        minutes=current_app.config.get('EXPIRATION_RESYNC_MINUTES', 60)
+    )
+
+    # 3. Background job queue (library sync, user sync, mass edits, purges). The dispatcher also fails jobs
+    # whose process died (stale heartbeat), so starting a CLI command never touches jobs running elsewhere
+    from . import job_service
+    _schedule_job_if_not_exists_or_reschedule(
+        job_id='dispatch_background_jobs',
+        func=job_service.dispatch_pending_jobs_task,
+        trigger_type='interval',
+        seconds=current_app.config.get('BACKGROUND_JOB_POLL_SECONDS', 5),
+        next_run_time=datetime.now(timezone.utc) + timedelta(seconds=5)
+    )
+
+    # 4. History retention (only when a retention period is configured)
+    if current_app.config.get('STREAM_HISTORY_RETENTION_DAYS') or current_app.config.get('HISTORY_LOG_RETENTION_DAYS'):
+        if _schedule_job_if_not_exists_or_reschedule(
+            job_id='history_retention',
+            func=job_service.enqueue_retention_task,
+            trigger_type='cron',
+            hour=current_app.config.get('RETENTION_RUN_HOUR', 4),
+            minute=15
+        ):
+            log_event(EventType.APP_STARTUP, f"History retention scheduled (daily at {current_app.config.get('RETENTION_RUN_HOUR', 4):02d}:15)")
+
+    # 5. Periodic refresh of stale TV show episode lists
+    prefetch_hours = current_app.config.get('EPISODE_PREFETCH_INTERVAL_HOURS', 6)
+    if prefetch_hours:
+        if _schedule_job_if_not_exists_or_reschedule(
+            job_id='episode_prefetch',
+            func=job_service.enqueue_episode_prefetch_task,
+            trigger_type='interval',
+            hours=prefetch_hours,
+            next_run_time=datetime.now(timezone.utc) + timedelta(minutes=5)
+        ):
+            log_event(EventType.APP_STARTUP, f"Episode prefetch scheduled ({prefetch_hours}h interval)")
+
+    # 6. Overseerr user lists (a no-op while no server has Overseerr enabled)
+    overseerr_minutes = current_app.config.get('OVERSEERR_USER_REFRESH_MINUTES', 30)
+    if overseerr_minutes:
+        _schedule_job_if_not_exists_or_reschedule(
+            job_id='refresh_overseerr_users',
+            func=refresh_overseerr_users_task,
+            trigger_type='interval',
+            minutes=overseerr_minutes,
+            next_run_time=datetime.now(timezone.utc) + timedelta(minutes=1)
+        )
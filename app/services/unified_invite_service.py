@@ -186,6 +186,9 @@ class UnifiedInviteService:
             user.used_invite_id = invite.id
             
             db.session.commit()
+            if invite.membership_duration_days:
+                from app.services.task_service import schedule_next_expiration_check
+                schedule_next_expiration_check()
             
             # Log the event
             log_event(
@@ -0,0 +1,215 @@
+# File: app/services/user_list_service.py
+"""
+SQL-driven listing of the unified ``users`` table for the admin users page.
+
+LOCAL and SERVICE users live in the same table, so the listing is a single
+SELECT over ``users`` with computed sort keys. Filtering, searching, sorting
+and pagination all happen in the database; only the rows of the requested
+page are loaded into Python.
+
+Pagination is keyset based (``after`` / ``before`` cursors encoding the last
+seen sort value and user id). Numbered page links still work through a plain
+OFFSET so the existing pager keeps its shape.
+"""
+import base64
+import json
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import and_, case, func, literal, or_, select
+from sqlalchemy.orm import aliased
+
+from app.extensions import db
+from app.models import User, UserType
+from app.models_media_services import UserActivitySummary
+from app.utils.pagination import KeysetPage
+
+# Sentinels used so that NULL sort values still have a total order for keyset comparisons
+_MIN_DATETIME = datetime(1900, 1, 1)
+
+SORT_COLUMNS = ('username', 'email', 'created_at', 'service_join_date', 'plex_join_date',
+                'last_streamed', 'total_plays', 'total_duration')
+DEFAULT_SORT = 'username_asc'
+
+
+def parse_sort_param(sort_by_param):
+    """Split a ``<column>_<asc|desc>`` sort parameter, falling back to username ascending."""
+    sort_parts = (sort_by_param or DEFAULT_SORT).rsplit('_', 1)
+    sort_column = sort_parts[0]
+    sort_direction = 'desc' if len(sort_parts) > 1 and sort_parts[1] == 'desc' else 'asc'
+    if sort_column not in SORT_COLUMNS:
+        sort_column, sort_direction = 'username', 'asc'
+    return sort_column, sort_direction
+
+
+def _summary_expression(column):
+    """Correlated primary-key lookup of one ``user_activity_summary`` column for the row's uuid."""
+    return (
+        select(column)
+        .where(UserActivitySummary.user_uuid == User.uuid)
+        .correlate(User)
+        .scalar_subquery()
+    )
+
+
+def _last_streamed_expression():
+    return _summary_expression(UserActivitySummary.last_stream_at)
+
+
+def _join_date_expression():
+    """Service users: service_join_date or created_at. Local users: earliest of created_at and linked service join dates."""
+    linked = aliased(User)
+    earliest_linked_join = (
+        select(func.min(linked.service_join_date))
+        .where(linked.userType == UserType.SERVICE, linked.linkedUserId == User.uuid)
+        .correlate(User)
+        .scalar_subquery()
+    )
+    local_join = case(
+        (and_(earliest_linked_join.isnot(None),
+              or_(User.created_at.is_(None), earliest_linked_join < User.created_at)), earliest_linked_join),
+        else_=User.created_at
+    )
+    return case(
+        (User.userType == UserType.LOCAL, local_join),
+        else_=func.coalesce(User.service_join_date, User.created_at)
+    )
+
+
+def _sort_expression(sort_column):
+    """Return a non-nullable SQL expression for the requested sort column."""
+    if sort_column == 'email':
+        return User.sort_email  # Indexed, with and without the user type (ix_users_*sort_email)
+    if sort_column == 'created_at':
+        return func.coalesce(User.created_at, literal(_MIN_DATETIME, type_=db.DateTime))
+    if sort_column in ('service_join_date', 'plex_join_date'):
+        return func.coalesce(_join_date_expression(), literal(_MIN_DATETIME, type_=db.DateTime))
+    if sort_column == 'last_streamed':
+        return func.coalesce(_last_streamed_expression(), literal(_MIN_DATETIME, type_=db.DateTime))
+    if sort_column in ('total_plays', 'total_duration'):
+        total = UserActivitySummary.total_plays if sort_column == 'total_plays' else UserActivitySummary.total_seconds
+        return func.coalesce(_summary_expression(total), 0)
+    return User.sort_name  # Indexed, with and without the user type (ix_users_*sort_name)
+
+
+def _search_filters(search_username='', search_email='', search_notes='', search_term=''):
+    """Build the per-user-type search conditions, mirroring the fields each type exposes on the page."""
+    local_filters = []
+    service_filters = []
+    if search_username:
+        local_filters.append(User.localUsername.ilike(f"%{search_username}%"))
+        service_filters.append(User.external_username.ilike(f"%{search_username}%"))
+    if search_email:
+        local_filters.append(User.discord_email.ilike(f"%{search_email}%"))
+        service_filters.append(User.external_email.ilike(f"%{search_email}%"))
+    if search_notes:
+        local_filters.append(User.notes.ilike(f"%{search_notes}%"))
+        service_filters.append(User.notes.ilike(f"%{search_notes}%"))
+    if search_term:
+        local_filters.append(or_(User.localUsername.ilike(f"%{search_term}%"), User.discord_email.ilike(f"%{search_term}%")))
+        service_filters.append(or_(User.external_username.ilike(f"%{search_term}%"), User.external_email.ilike(f"%{search_term}%")))
+    if not local_filters:
+        return None
+    return or_(
+        and_(User.userType == UserType.LOCAL, or_(*local_filters)),
+        and_(User.userType == UserType.SERVICE, or_(*service_filters))
+    )
+
+
+def build_users_query(user_type_filter='all', server_id='all', search_username='', search_email='',
+                      search_notes='', search_term=''):
+    """Base query over LOCAL and SERVICE users with every list filter applied in SQL."""
+    if user_type_filter == 'local':
+        query = User.query.filter(User.userType == UserType.LOCAL)
+    elif user_type_filter == 'service':
+        query = User.query.filter(User.userType == UserType.SERVICE)
+    else:
+        query = User.query.filter(User.userType.in_([UserType.LOCAL, UserType.SERVICE]))
+
+    search_condition = _search_filters(search_username, search_email, search_notes, search_term)
+    if search_condition is not None:
+        query = query.filter(search_condition)
+
+    # The server filter only narrows service users, local users are always shown
+    if server_id not in (None, '', 'all') and user_type_filter != 'local':
+        try:
+            server_id_int = int(server_id)
+            query = query.filter(or_(User.userType == UserType.LOCAL, User.server_id == server_id_int))
+        except (TypeError, ValueError):
+            current_app.logger.warning(f"Invalid server_id received: {server_id}")
+
+    return query
+
+
+def encode_cursor(sort_value, user_id):
+    """Encode a (sort value, id) pair as an opaque URL-safe cursor."""
+    if isinstance(sort_value, datetime):
+        payload = {'t': 'dt', 'v': sort_value.replace(tzinfo=None).isoformat(), 'id': user_id}
+    else:
+        payload = {'t': 's', 'v': sort_value, 'id': user_id}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by ``encode_cursor``. Returns ``None`` for malformed input."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        value = payload['v']
+        if payload.get('t') == 'dt':
+            value = datetime.fromisoformat(value)
+        return value, int(payload['id'])
+    except Exception:
+        current_app.logger.warning(f"Ignoring malformed users list cursor: {cursor!r}")
+        return None
+
+
+def paginate_users(query, sort_by_param=DEFAULT_SORT, page=1, per_page=12, after=None, before=None):
+    """
+    Sort and paginate a users query in SQL.
+
+    ``after``/``before`` cursors take precedence over ``page`` and use keyset
+    seeks on (sort key, id). ``page`` is still used for the displayed page number.
+    Each item is a ``User`` with ``last_streamed_at`` and ``list_sort_value`` attached.
+    """
+    sort_column, sort_direction = parse_sort_param(sort_by_param)
+    sort_key = _sort_expression(sort_column).label('list_sort_value')
+    last_streamed = _last_streamed_expression().label('last_streamed_at')
+    descending = sort_direction == 'desc'
+    page = max(page or 1, 1)
+
+    total = query.order_by(None).count()
+
+    rows_query = query.add_columns(sort_key, last_streamed)
+    after_key = decode_cursor(after)
+    before_key = decode_cursor(before)
+    sort_expr = sort_key.element
+
+    if after_key or before_key:
+        value, last_id = after_key or before_key
+        # Seeking backwards flips the comparison and the scan order, the page is reversed afterwards
+        forward = bool(after_key) != descending
+        if forward:
+            rows_query = rows_query.filter(or_(sort_expr > value, and_(sort_expr == value, User.id > last_id)))
+        else:
+            rows_query = rows_query.filter(or_(sort_expr < value, and_(sort_expr == value, User.id < last_id)))
+        scan_desc = not forward
+        ordering = (sort_expr.desc(), User.id.desc()) if scan_desc else (sort_expr.asc(), User.id.asc())
+        rows = rows_query.order_by(*ordering).limit(per_page).all()
+        if before_key:
+            rows.reverse()
+    else:
+        ordering = (sort_expr.desc(), User.id.desc()) if descending else (sort_expr.asc(), User.id.asc())
+        rows = rows_query.order_by(*ordering).offset((page - 1) * per_page).limit(per_page).all()
+
+    items = []
+    for user, sort_value, last_streamed_at in rows:
+        user.list_sort_value = sort_value
+        user.last_streamed_at = last_streamed_at
+        items.append(user)
+
+    next_cursor = encode_cursor(items[-1].list_sort_value, items[-1].id) if items else None
+    prev_cursor = encode_cursor(items[0].list_sort_value, items[0].id) if items else None
+    return KeysetPage(items, page, per_page, total, next_cursor=next_cursor, prev_cursor=prev_cursor)
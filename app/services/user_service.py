@@ -2,9 +2,11 @@
 from flask import current_app
 from sqlalchemy.exc import IntegrityError
 from datetime import datetime, timezone, timedelta
-from sqlalchemy import func, case, or_
+from sqlalchemy import func, case, or_, and_
+from sqlalchemy.orm import joinedload
 from app.models import User, UserType, EventType
-from app.models_media_services import ServiceType, MediaServer, MediaStreamHistory
+from app.models_media_services import ServiceType, MediaServer, MediaStreamHistory, StreamHistoryRollup, UserActivitySummary
+from app.models_payloads import prefetch_payloads
 from app.extensions import db
 from app.utils.helpers import log_event, format_duration
 from app.services.media_service_manager import MediaServiceManager
@@ -595,150 +597,35 @@ def mass_update_purge_whitelist(user_uuids: list, should_whitelist: bool, admin_
     log_event(EventType.SETTING_CHANGE, f"Mass updated Purge Whitelist for {updated_count} service users to {should_whitelist}.", admin_id=admin_id, details={"count": updated_count, "whitelisted": should_whitelist})
     return updated_count
 
-def mass_delete_users(user_ids: list, admin_id: int = None):
-    processed_count = 0; error_count = 0;
-    usernames_for_log_detail = []
-    
-    # Import required models
-    from app.utils.helpers import get_user_by_uuid
-    
-    # Convert UUIDs to actual user IDs and separate by type
-    local_user_ids = []
-    standalone_user_ids = []
-    
-    for user_id in user_ids:
-        try:
-            user_obj, user_type = get_user_by_uuid(str(user_id))
-            if user_obj and user_type == "user_app_access":
-                local_user_ids.append(user_obj.id)
-            elif user_obj and user_type == "user_media_access":
-                standalone_user_ids.append(user_obj.id)
-        except Exception as e:
-            current_app.logger.error(f"Mass Delete Error: Invalid user UUID {user_id}: {e}")
-            error_count += 1
-    
-    current_app.logger.info(f"Mass Delete: Processing {len(local_user_ids)} local users and {len(standalone_user_ids)} standalone users")
-    
-    # Delete local users
-    if local_user_ids:
-        users_to_delete = User.query.filter_by(userType=UserType.LOCAL).filter(User.id.in_(local_user_ids)).all()
-        
-        for user in users_to_delete:
-            username_for_log = user.get_display_name()
-            user_deleted_successfully = False
-            
-            try:
-                # Get all service user records for this user to delete from all services
-                user_accesses = User.query.filter_by(userType=UserType.SERVICE).filter_by(linkedUserId=user.uuid).all()
-                
-                # Try to delete from external services first, but don't fail if they're unavailable
-                for access in user_accesses:
-                    server = access.server
-                    if access.external_user_id and server:
-                        try:
-                            # Create service instance and delete user from the actual server
-                            service = MediaServiceFactory.create_service_from_db(server)
-                            if service and hasattr(service, 'delete_user'):
-                                service.delete_user(access.external_user_id)
-                                current_app.logger.info(f"Deleted user {username_for_log} from {server.service_type.value} server {server.server_nickname}")
-                            else:
-                                current_app.logger.warning(f"Cannot delete user from {server.service_type.value} server {server.server_nickname} - service not available or doesn't support deletion")
-                        except Exception as e:
-                            current_app.logger.error(f"Failed to delete user {username_for_log} from {server.service_type.value} server {server.server_nickname}: {e}")
-                            # Continue with deletion from MUM even if server deletion fails
-                
-                # Delete the local user from MUM (this will cascade to linked service user records)
-                db.session.delete(user)
-                user_deleted_successfully = True
-                processed_count += 1
-                usernames_for_log_detail.append(username_for_log)
-                current_app.logger.info(f"Marked local user {username_for_log} for deletion from MUM")
-                
-            except Exception as e:
-                current_app.logger.error(f"Mass Delete Error: Local user {username_for_log} (ID: {user.id}): {e}")
-                error_count += 1
-                # If there was an error, try to rollback any partial changes for this user
-                if not user_deleted_successfully:
-                    try:
-                        db.session.rollback()
-                        db.session.begin()  # Start a new transaction
-                    except Exception as rollback_error:
-                        current_app.logger.error(f"Error during rollback for user {username_for_log}: {rollback_error}")
-    
-    # Delete standalone service users
-    if standalone_user_ids:
-        for standalone_user_id in standalone_user_ids:
-            access_deleted_successfully = False
-            username_for_log = 'Unknown'
-            
-            try:
-                # Get the service user record directly using the actual ID
-                access = User.query.filter_by(userType=UserType.SERVICE).filter(
-                    User.id == standalone_user_id,
-                    User.linkedUserId.is_(None)
-                ).first()
-                
-                if access:
-                    username_for_log = access.external_username or 'Unknown'
-                    server = access.server
-                    
-                    # Try to delete from the actual server first
-                    if access.external_user_id and server:
-                        try:
-                            service = MediaServiceFactory.create_service_from_db(server)
-                            if service and hasattr(service, 'delete_user'):
-                                service.delete_user(access.external_user_id)
-                                current_app.logger.info(f"Deleted standalone user {username_for_log} from {server.service_type.value} server {server.server_nickname}")
-                            else:
-                                current_app.logger.warning(f"Cannot delete user from {server.service_type.value} server {server.server_nickname} - service not available or doesn't support deletion")
-                        except Exception as e:
-                            current_app.logger.error(f"Failed to delete standalone user {username_for_log} from {server.service_type.value} server {server.server_nickname}: {e}")
-                            # Continue with deletion from MUM even if server deletion fails
-                    
-                    # Delete the standalone service user record
-                    db.session.delete(access)
-                    access_deleted_successfully = True
-                    processed_count += 1
-                    usernames_for_log_detail.append(username_for_log)
-                    current_app.logger.info(f"Marked standalone service user {username_for_log} for deletion from MUM")
-                else:
-                    current_app.logger.warning(f"Standalone user with ID {standalone_user_id} not found")
-                    error_count += 1
-                    
-            except Exception as e:
-                current_app.logger.error(f"Mass Delete Error: Standalone user (ID: {standalone_user_id}): {e}")
-                error_count += 1
-                # If there was an error, try to rollback any partial changes for this user
-                if not access_deleted_successfully:
-                    try:
-                        db.session.rollback()
-                        db.session.begin()  # Start a new transaction
-                    except Exception as rollback_error:
-                        current_app.logger.error(f"Error during rollback for standalone user {username_for_log}: {rollback_error}")
-    
-    # Commit all deletions at once
-    if processed_count > 0:
-        try:
-            current_app.logger.info(f"Mass Delete: Committing deletion of {processed_count} users to database...")
-            db.session.commit()
-            current_app.logger.info(f"Mass Delete: Successfully committed {processed_count} user deletions")
-            log_event(EventType.MUM_USER_DELETED_FROM_MUM, f"Mass delete: {processed_count} users removed from MUM and media servers.", admin_id=admin_id, details={'deleted_count': processed_count, 'errors': error_count, 'attempted_ids_count': len(user_ids), 'deleted_usernames_sample': usernames_for_log_detail[:10]})
-        except Exception as e_commit:
-            db.session.rollback()
-            current_app.logger.error(f"Mass Delete: DB commit error: {e_commit}")
-            # All deletions failed due to commit error
-            error_count += processed_count
-            processed_count = 0
-            log_event(EventType.ERROR_GENERAL, f"Mass delete DB commit failed: {e_commit}", admin_id=admin_id, details={'attempted_count': len(user_ids)})
-    elif error_count > 0:
-        # No successes, only errors, still log the attempt
-        current_app.logger.warning(f"Mass Delete: No users were successfully processed. {error_count} errors occurred.")
-        log_event(EventType.ERROR_GENERAL, f"Mass delete attempt failed for all {error_count} users selected.", admin_id=admin_id, details={'attempted_count': len(user_ids), 'errors': error_count})
-    else:
-        current_app.logger.warning("Mass Delete: No users were provided for deletion.")
+def mass_delete_users(user_ids: list, admin_id: int = None, run_in_background: bool = True):
+    """
+    Removes the selected users (by UUID) from their media servers and from MUM.
+
+    Local users are removed together with their linked service accounts; service
+    users are only removed when standalone. The work is handed to the
+    deprovisioning executor and the returned DeprovisionRun can be polled for progress.
+    """
+    from app.services import deprovisioning_service
 
+    user_uuids = [str(user_id) for user_id in user_ids]
+    selected_users = User.query.filter(User.uuid.in_(user_uuids)).all() if user_uuids else []
+    local_user_ids = [u.id for u in selected_users if u.userType == UserType.LOCAL]
+    standalone_user_ids = [u.id for u in selected_users if u.userType == UserType.SERVICE and u.linkedUserId is None]
 
-    return processed_count, error_count
+    skipped_count = len(user_uuids) - len(local_user_ids) - len(standalone_user_ids)
+    if skipped_count:
+        current_app.logger.warning(f"Mass Delete: {skipped_count} selected IDs were not found or are linked service accounts, skipping them")
+
+    current_app.logger.info(f"Mass Delete: Processing {len(local_user_ids)} local users and {len(standalone_user_ids)} standalone users")
+
+    run = deprovisioning_service.create_run(
+        'mass_delete', local_user_ids=local_user_ids, service_user_ids=standalone_user_ids, admin_id=admin_id
+    )
+    if run_in_background:
+        deprovisioning_service.start_run_in_background(run.id)
+    else:
+        run = deprovisioning_service.execute_run(run.id)
+    return run
 
 def update_user_last_streamed(plex_user_id_or_uuid, last_streamed_at_datetime: datetime):
     # Find user via service user using Plex ID or UUID
@@ -846,163 +733,192 @@ def update_user_last_streamed_by_id(user_id, last_streamed_at_datetime: datetime
             current_app.logger.error(f"User_Service.py - update_user_last_streamed_by_id(): DB Commit Error for user {user.get_display_name()} (ID: {user_id}): {e}", exc_info=True)
     return False
 
-def purge_inactive_users(user_ids_to_purge: list[int], admin_id: int, inactive_days_threshold: int, exclude_sharers: bool, exclude_whitelisted: bool, ignore_creation_date_for_never_streamed: bool):
+def purge_inactive_users(user_ids_to_purge: list[int], admin_id: int, inactive_days_threshold: int, exclude_sharers: bool, exclude_whitelisted: bool, ignore_creation_date_for_never_streamed: bool, run_in_background: bool = True):
     """
     Deletes a specific list of service users, but only after re-validating them
-    against the provided criteria as a final safety check.
+    against the provided criteria as a final safety check. Removal runs through
+    the deprovisioning executor; ``run_id`` in the result can be polled for progress.
     """
     if not user_ids_to_purge:
         return {"message": "No users were selected for purge.", "purged_count": 0, "errors": 0}
 
-    # Re-run the eligibility check on the provided list of users as a safeguard.
-    eligible_users_final = get_users_eligible_for_purge(
-        inactive_days_threshold, exclude_sharers, exclude_whitelisted, ignore_creation_date_for_never_streamed
+    # Re-validate only the selected users against the criteria as a safeguard.
+    final_ids_to_delete = revalidate_purge_selection(
+        user_ids_to_purge, inactive_days_threshold, exclude_sharers, exclude_whitelisted, ignore_creation_date_for_never_streamed
     )
-    final_ids_to_delete = {user['id'] for user in eligible_users_final}.intersection(set(user_ids_to_purge))
     
-    purged_count = 0
-    error_count = 0
-    
-    # Query service users instead of local users
-    users_to_process = User.query.filter_by(userType=UserType.SERVICE).filter(
-        User.id.in_(final_ids_to_delete)
-    ).all()
+    skipped_count = len(set(user_ids_to_purge)) - len(final_ids_to_delete)
+    if not final_ids_to_delete:
+        return {"message": f"No users purged: all {skipped_count} selected users were skipped by the final safety check.",
+                "purged_count": 0, "errors": 0, "run_id": None}
+
+    # Remote removals and DB deletes are handled by the deprovisioning executor
+    from app.services import deprovisioning_service
+    run = deprovisioning_service.create_run('purge', service_user_ids=sorted(final_ids_to_delete), admin_id=admin_id)
+    if run_in_background:
+        deprovisioning_service.start_run_in_background(run.id)
+        result_message = f"Purge started for {run.total} service users."
+    else:
+        run = deprovisioning_service.execute_run(run.id)
+        result_message = f"Purge complete: {run.removed} service users removed."
+        if run.failed:
+            result_message += f" {run.failed} errors."
+    if skipped_count:
+        result_message += f" ({skipped_count} skipped by final safety check)."
 
-    for user in users_to_process:
-        try:
-            username = user.external_username or 'Unknown'
-            server = user.server
-            
-            # Try to delete from the actual server first
-            if user.external_user_id and server:
-                try:
-                    service = MediaServiceFactory.create_service_from_db(server)
-                    if service and hasattr(service, 'delete_user'):
-                        service.delete_user(user.external_user_id)
-                        current_app.logger.info(f"Deleted service user {username} from {server.service_type.value} server {server.server_nickname}")
-                    else:
-                        current_app.logger.warning(f"Cannot delete user from {server.service_type.value} server {server.server_nickname} - service not available or doesn't support deletion")
-                except Exception as e:
-                    current_app.logger.error(f"Failed to delete service user {username} from {server.service_type.value} server {server.server_nickname}: {e}")
-                    # Continue with deletion from MUM even if server deletion fails
-            
-            # Delete the service user record from MUM
-            db.session.delete(user)
-            purged_count += 1
-            current_app.logger.info(f"Purged service user {username} (ID: {user.id})")
-            
-        except Exception as e:
-            error_count += 1
-            username = getattr(user, 'external_username', 'Unknown') or 'Unknown'
-            current_app.logger.error(f"User_Service.py - purge_inactive_users(): Error purging service user {username} (ID: {user.id}): {e}")
+    return {"message": result_message, "purged_count": run.removed, "errors": run.failed, "run_id": run.id}
 
-    # Commit all deletions
-    if purged_count > 0:
-        try:
-            db.session.commit()
-            current_app.logger.info(f"Purge: Successfully committed deletion of {purged_count} service users")
-        except Exception as e:
-            db.session.rollback()
-            current_app.logger.error(f"Purge: DB commit error: {e}")
-            error_count += purged_count
-            purged_count = 0
-
-    result_message = f"Purge complete: {purged_count} service users removed."
-    if len(final_ids_to_delete) != len(user_ids_to_purge):
-        result_message += f" ({len(user_ids_to_purge) - len(final_ids_to_delete)} skipped by final safety check)."
-    if error_count > 0:
-        result_message += f" {error_count} errors."
-
-    log_event(EventType.MUM_USER_DELETED_FROM_MUM, result_message, admin_id=admin_id, details={
-        "action": "purge_selected_inactive_service_users", "purged_count": purged_count, "errors": error_count
-    })
-    
-    return {"message": result_message, "purged_count": purged_count, "errors": error_count}
+def _purge_eligibility_query(inactive_days_threshold: int, exclude_sharers: bool, exclude_whitelisted: bool,
+                             ignore_creation_date_for_never_streamed: bool = False, user_ids: list[int] = None):
+    """
+    Single SELECT of (service user, last_streamed_at) for every user matching the purge criteria.
 
-def get_users_eligible_for_purge(inactive_days_threshold: int, exclude_sharers: bool, exclude_whitelisted: bool, ignore_creation_date_for_never_streamed: bool = False):
-    if inactive_days_threshold < 1:
+    Last stream times come from a grouped MAX(started_at) per user_uuid that is left
+    joined to users, so never-streamed users are kept and judged on created_at instead.
+    History removed by the retention policy still counts: the activity summary's
+    last_stream_at and the latest archived rollup day stand in for rows that are gone.
+    Passing ``user_ids`` narrows both the users and the grouped history to those IDs.
+    """
+    if inactive_days_threshold is None or inactive_days_threshold < 1:
         raise ValueError("Inactivity threshold must be at least 1 day.")
 
-    cutoff_date = datetime.now(timezone.utc) - timedelta(days=inactive_days_threshold)
-    
-    # Base query for service users - both standalone and linked
-    query = User.query.filter_by(userType=UserType.SERVICE)
+    # History timestamps are stored as naive UTC
+    cutoff_date = (datetime.now(timezone.utc) - timedelta(days=inactive_days_threshold)).replace(tzinfo=None)
+
+    last_streams = db.session.query(
+        MediaStreamHistory.user_uuid.label('user_uuid'),
+        func.max(MediaStreamHistory.started_at).label('last_streamed_at')
+    ).filter(MediaStreamHistory.user_uuid.isnot(None))
+    archived_days = db.session.query(
+        StreamHistoryRollup.user_uuid.label('user_uuid'),
+        func.max(StreamHistoryRollup.day).label('last_archived_day')
+    ).filter(StreamHistoryRollup.user_uuid.isnot(None))
+    if user_ids is not None:
+        selected_uuids = db.session.query(User.uuid).filter(User.id.in_(user_ids))
+        last_streams = last_streams.filter(MediaStreamHistory.user_uuid.in_(selected_uuids))
+        archived_days = archived_days.filter(StreamHistoryRollup.user_uuid.in_(selected_uuids))
+    last_streams = last_streams.group_by(MediaStreamHistory.user_uuid).subquery()
+    archived_days = archived_days.group_by(StreamHistoryRollup.user_uuid).subquery()
+    last_streamed_at = func.coalesce(last_streams.c.last_streamed_at, UserActivitySummary.last_stream_at)
+    last_archived_day = archived_days.c.last_archived_day
+
+    # A rollup only knows the day, so a user archived on the cutoff day counts as active
+    never_streamed = and_(last_streamed_at.is_(None), last_archived_day.is_(None))
+    streamed_before_cutoff = and_(
+        or_(last_streamed_at.isnot(None), last_archived_day.isnot(None)),
+        or_(last_streamed_at.is_(None), last_streamed_at < cutoff_date),
+        or_(last_archived_day.is_(None), last_archived_day < cutoff_date.date())
+    )
+    if ignore_creation_date_for_never_streamed:
+        never_streamed_rule = never_streamed
+    else:
+        never_streamed_rule = and_(never_streamed, User.created_at.isnot(None), User.created_at < cutoff_date)
+
+    query = db.session.query(User, last_streamed_at.label('last_streamed_at')).outerjoin(
+        last_streams, last_streams.c.user_uuid == User.uuid
+    ).outerjoin(
+        UserActivitySummary, UserActivitySummary.user_uuid == User.uuid
+    ).outerjoin(
+        archived_days, archived_days.c.user_uuid == User.uuid
+    ).filter(
+        User.userType == UserType.SERVICE,
+        or_(streamed_before_cutoff, never_streamed_rule)
+    )
+
+    if user_ids is not None:
+        query = query.filter(User.id.in_(user_ids))
 
     # Apply filters based on the checkboxes
-    if exclude_whitelisted: 
+    if exclude_whitelisted:
         query = query.filter(User.is_purge_whitelisted != True)
-    
+
     if exclude_sharers:
-        # Filter out users who share back their servers (if this field exists)
+        # Filter out users who share back their servers
         query = query.filter(User.shares_back != True)
-        
-    eligible_users_list = []
-    potential_users = query.all()
 
-    for user in potential_users:
-        is_eligible_for_purge = False
-        
-        # Check MediaStreamHistory for service users using user_uuid
-        from app.models_media_services import MediaStreamHistory
-        last_stream = MediaStreamHistory.query.filter_by(user_uuid=user.uuid).order_by(MediaStreamHistory.started_at.desc()).first()
-        last_streamed_at = last_stream.started_at if last_stream else None
-        
-        if last_streamed_at is None:
-            if ignore_creation_date_for_never_streamed:
-                is_eligible_for_purge = True
-            else:
-                created_at_aware = user.created_at.replace(tzinfo=timezone.utc) if user.created_at.tzinfo is None else user.created_at
-                if created_at_aware < cutoff_date:
-                    is_eligible_for_purge = True
-        else: 
-            last_streamed_aware = last_streamed_at.replace(tzinfo=timezone.utc) if last_streamed_at.tzinfo is None else last_streamed_at
-            if last_streamed_aware < cutoff_date:
-                is_eligible_for_purge = True
-        
-        if is_eligible_for_purge:
-            # Process avatar URL using the same logic as user cards
-            avatar_url = None
-            if user.external_avatar_url:
-                avatar_url = user.external_avatar_url
-            elif user.server and user.server.service_type.value == 'plex':
-                # For Plex, check multiple possible locations for the thumb URL
-                thumb_url = None
-                
-                # First try service_settings
-                if user.service_settings and user.service_settings.get('thumb'):
-                    thumb_url = user.service_settings['thumb']
-                # Then try raw_data from the user sync
-                elif user.user_raw_data and user.user_raw_data.get('thumb'):
-                    thumb_url = user.user_raw_data['thumb']
-                # Also check nested raw data structure
-                elif (user.user_raw_data and 
-                      user.user_raw_data.get('plex_user_obj_attrs') and 
-                      user.user_raw_data['plex_user_obj_attrs'].get('thumb')):
-                    thumb_url = user.user_raw_data['plex_user_obj_attrs']['thumb']
-                
-                if thumb_url:
-                    # Check if it's already a full URL (plex.tv avatars) or needs proxy
-                    if thumb_url.startswith('https://plex.tv/') or thumb_url.startswith('http://plex.tv/'):
-                        avatar_url = thumb_url
-                    else:
-                        avatar_url = f"/api/media/plex/images/proxy?path={thumb_url.lstrip('/')}"
-            elif user.server and user.server.service_type.value == 'jellyfin':
-                # For Jellyfin, use the external_user_id to get avatar
-                if user.external_user_id:
-                    avatar_url = f"/api/media/jellyfin/users/avatar?user_id={user.external_user_id}"
-            
-            eligible_users_list.append({ 
-                'id': user.id, 
-                'username': user.external_username or 'Unknown', 
-                'email': user.external_email, 
-                'last_streamed_at': last_streamed_at, 
-                'created_at': user.created_at,
-                'server_name': user.server.server_nickname if user.server else 'Unknown Server',
-                'service_type': user.server.service_type.value if user.server else 'unknown',
-                'avatar_url': avatar_url
-            })
-            
-    return eligible_users_list
+    # Longest inactive first, id as tiebreaker so preview pages are stable
+    return query.order_by(func.coalesce(last_streamed_at, User.created_at).asc(), User.id.asc())
+
+def _purge_candidate_avatar_url(user):
+    """Avatar URL for the purge preview, using the same logic as user cards."""
+    if user.external_avatar_url:
+        return user.external_avatar_url
+    if user.server and user.server.service_type.value == 'plex':
+        # For Plex, check multiple possible locations for the thumb URL
+        thumb_url = None
+
+        # First try service_settings
+        if user.service_settings and user.service_settings.get('thumb'):
+            thumb_url = user.service_settings['thumb']
+        # Then try raw_data from the user sync
+        elif user.user_raw_data and user.user_raw_data.get('thumb'):
+            thumb_url = user.user_raw_data['thumb']
+        # Also check nested raw data structure
+        elif (user.user_raw_data and
+              user.user_raw_data.get('plex_user_obj_attrs') and
+              user.user_raw_data['plex_user_obj_attrs'].get('thumb')):
+            thumb_url = user.user_raw_data['plex_user_obj_attrs']['thumb']
+
+        if thumb_url:
+            # Check if it's already a full URL (plex.tv avatars) or needs proxy
+            if thumb_url.startswith('https://plex.tv/') or thumb_url.startswith('http://plex.tv/'):
+                return thumb_url
+            return f"/api/media/plex/images/proxy?path={thumb_url.lstrip('/')}"
+    elif user.server and user.server.service_type.value == 'jellyfin':
+        # For Jellyfin, use the external_user_id to get avatar
+        if user.external_user_id:
+            return f"/api/media/jellyfin/users/avatar?user_id={user.external_user_id}"
+    return None
+
+def _purge_candidate_dict(user, last_streamed_at):
+    return {
+        'id': user.id,
+        'username': user.external_username or 'Unknown',
+        'email': user.external_email,
+        'last_streamed_at': last_streamed_at,
+        'created_at': user.created_at,
+        'server_name': user.server.server_nickname if user.server else 'Unknown Server',
+        'service_type': user.server.service_type.value if user.server else 'unknown',
+        'avatar_url': _purge_candidate_avatar_url(user)
+    }
+
+def get_users_eligible_for_purge(inactive_days_threshold: int, exclude_sharers: bool, exclude_whitelisted: bool, ignore_creation_date_for_never_streamed: bool = False):
+    query = _purge_eligibility_query(
+        inactive_days_threshold, exclude_sharers, exclude_whitelisted, ignore_creation_date_for_never_streamed
+    ).options(joinedload(User.server))
+    rows = query.all()
+    prefetch_payloads([user for user, _ in rows], 'user_raw_data')
+    return [_purge_candidate_dict(user, last_streamed_at) for user, last_streamed_at in rows]
+
+def preview_purge_inactive_users(inactive_days_threshold: int, exclude_sharers: bool, exclude_whitelisted: bool,
+                                 ignore_creation_date_for_never_streamed: bool = False, page: int = 1, per_page: int = 50):
+    """One page of purge candidates plus the total number of eligible users."""
+    query = _purge_eligibility_query(
+        inactive_days_threshold, exclude_sharers, exclude_whitelisted, ignore_creation_date_for_never_streamed
+    )
+    page = max(page or 1, 1)
+    total = query.order_by(None).count()
+    rows = query.options(joinedload(User.server)).offset((page - 1) * per_page).limit(per_page).all()
+    prefetch_payloads([user for user, _ in rows], 'user_raw_data')
+    return {
+        'eligible_users': [_purge_candidate_dict(user, last_streamed_at) for user, last_streamed_at in rows],
+        'total': total,
+        'page': page,
+        'per_page': per_page,
+        'has_next': page * per_page < total,
+        'next_page': page + 1
+    }
+
+def revalidate_purge_selection(user_ids: list[int], inactive_days_threshold: int, exclude_sharers: bool,
+                               exclude_whitelisted: bool, ignore_creation_date_for_never_streamed: bool = False) -> set:
+    """Return the subset of ``user_ids`` that still match the purge criteria, checking only those users."""
+    if not user_ids:
+        return set()
+    query = _purge_eligibility_query(
+        inactive_days_threshold, exclude_sharers, exclude_whitelisted, ignore_creation_date_for_never_streamed,
+        user_ids=user_ids
+    )
+    return {user_id for user_id, in query.with_entities(User.id).order_by(None).all()}
 
 def get_user_stream_stats(user_id):
     """Aggregates stream history for a user to produce Tautulli-like stats. Uses UUID-based identification only."""
@@ -1024,19 +940,23 @@ def get_user_stream_stats(user_id):
     current_app.logger.debug(f"STATS SERVICE: UUID lookup successful for {user_id} -> user_uuid: {user_obj.uuid}")
 
     # --- Global Stats ---
-    # Perform all aggregations in a single query for efficiency
+    # All-time totals come from the maintained summary row; the windowed counts only
+    # need the last 30 days of history (ix_media_stream_history_user_started)
+    from app.services.activity_summary_service import get_activity_summary
+    summary = get_activity_summary(user_obj.uuid)
+    all_time_plays = summary.total_plays if summary else 0
+    all_time_duration = summary.total_seconds if summary else 0
+
     stats_query = db.session.query(
-        func.count(MediaStreamHistory.id).label('all_time_plays'),
-        func.sum(MediaStreamHistory.duration_seconds).label('all_time_duration'),
         func.sum(case((MediaStreamHistory.started_at >= day_ago, MediaStreamHistory.duration_seconds), else_=0)).label('duration_24h'),
         func.count(case((MediaStreamHistory.started_at >= day_ago, 1), else_=None)).label('plays_24h'),
         func.sum(case((MediaStreamHistory.started_at >= week_ago, MediaStreamHistory.duration_seconds), else_=0)).label('duration_7d'),
         func.count(case((MediaStreamHistory.started_at >= week_ago, 1), else_=None)).label('plays_7d'),
-        func.count(case((MediaStreamHistory.started_at >= month_ago, 1), else_=None)).label('plays_30d'),
-        func.sum(case((MediaStreamHistory.started_at >= month_ago, MediaStreamHistory.duration_seconds), else_=0)).label('duration_30d')
-    ).filter(filter_condition).first()
+        func.count(MediaStreamHistory.id).label('plays_30d'),
+        func.sum(MediaStreamHistory.duration_seconds).label('duration_30d')
+    ).filter(filter_condition, MediaStreamHistory.started_at >= month_ago).first()
 
-    current_app.logger.debug(f"STATS SERVICE: Query result - plays: {stats_query.all_time_plays}, duration: {stats_query.all_time_duration}")
+    current_app.logger.debug(f"STATS SERVICE: Summary - plays: {all_time_plays}, duration: {all_time_duration}")
 
     global_stats = {
         'plays_24h': stats_query.plays_24h or 0,
@@ -1045,9 +965,9 @@ def get_user_stream_stats(user_id):
         'duration_7d': format_duration(stats_query.duration_7d or 0),
         'plays_30d': stats_query.plays_30d or 0,
         'duration_30d': format_duration(stats_query.duration_30d or 0),
-        'all_time_plays': stats_query.all_time_plays or 0,
-        'all_time_duration': format_duration(stats_query.all_time_duration or 0),
-        'all_time_duration_seconds': stats_query.all_time_duration or 0  # Add raw seconds for template
+        'all_time_plays': all_time_plays or 0,
+        'all_time_duration': format_duration(all_time_duration or 0),
+        'all_time_duration_seconds': all_time_duration or 0  # Add raw seconds for template
     }
 
     # --- Player Stats ---
@@ -1060,103 +980,42 @@ def get_user_stream_stats(user_id):
 
     return {'global': global_stats, 'players': player_stats}
 
-def get_bulk_user_stream_stats(user_ids: list[int]) -> dict:
+def get_bulk_user_stream_stats(user_ids: list) -> dict:
     """
-    Efficiently gets total plays and duration for a list of user IDs.
+    Efficiently gets total plays and duration for a list of user UUIDs.
     Returns a dictionary mapping user_id to its stats.
-    Handles both local users and service users.
+    Reads the maintained user_activity_summary rows, one indexed row per user.
     """
     if not user_ids:
         return {}
 
-    # Convert user IDs to UUIDs for the query, separating by user type
-    from app.utils.helpers import get_user_by_uuid
-    app_access_uuids = []
-    media_access_uuids = []
-    uuid_to_user_id = {}
-    
-    for user_id in user_ids:
-        try:
-            user_obj, user_type = get_user_by_uuid(str(user_id))
-            if user_obj and user_type == "user_app_access":
-                app_access_uuids.append(user_obj.uuid)
-                uuid_to_user_id[user_obj.uuid] = user_id
-            elif user_obj and user_type == "user_media_access":
-                media_access_uuids.append(user_obj.uuid)
-                uuid_to_user_id[user_obj.uuid] = user_id
-        except Exception:
-            continue
-    
-    if not app_access_uuids and not media_access_uuids:
-        return {}
-    
+    from app.services.activity_summary_service import get_activity_summaries
+    summaries = get_activity_summaries([str(user_id) for user_id in user_ids])
+
     stats_results = {}
-    
-    # Query for local users
-    # Query for all users using unified user_uuid field
-    all_user_uuids = app_access_uuids + media_access_uuids
-    if all_user_uuids:
-        results = db.session.query(
-            MediaStreamHistory.user_uuid,
-            func.count(MediaStreamHistory.id).label('total_plays'),
-            func.sum(MediaStreamHistory.duration_seconds).label('total_duration')
-        ).filter(MediaStreamHistory.user_uuid.in_(all_user_uuids)).group_by(MediaStreamHistory.user_uuid).all()
-        
-        for user_uuid, plays, duration in results:
-            user_id = uuid_to_user_id.get(user_uuid)
-            if user_id:
-                stats_results[user_id] = {'play_count': plays, 'total_duration': duration or 0}
-    
+    for user_id in user_ids:
+        summary = summaries.get(str(user_id))
+        if summary:
+            stats_results[user_id] = {'play_count': summary.total_plays or 0, 'total_duration': summary.total_seconds or 0}
     return stats_results
 
 def get_bulk_last_known_ips(user_ids: list) -> dict:
     """
-    Efficiently gets the most recent IP address for a list of user IDs.
+    Efficiently gets the most recent IP address for a list of user UUIDs.
     Returns a dictionary mapping user_id to the last known IP address.
-    Supports both local users and service users.
+    Reads the maintained user_activity_summary rows, one indexed row per user.
     """
     if not user_ids:
         return {}
 
-    # Convert user IDs to UUIDs for the query, separating by user type
-    from app.utils.helpers import get_user_by_uuid
-    app_access_uuids = []
-    media_access_uuids = []
-    uuid_to_user_id = {}
-    
-    for user_id in user_ids:
-        try:
-            user_obj, user_type = get_user_by_uuid(str(user_id))
-            if user_obj and user_type == "user_app_access":
-                app_access_uuids.append(user_obj.uuid)
-                uuid_to_user_id[user_obj.uuid] = user_id
-            elif user_obj and user_type == "user_media_access":
-                media_access_uuids.append(user_obj.uuid)
-                uuid_to_user_id[user_obj.uuid] = user_id
-        except Exception:
-            continue  # Skip invalid IDs
-    
+    from app.services.activity_summary_service import get_activity_summaries
+    summaries = get_activity_summaries([str(user_id) for user_id in user_ids])
+
     user_id_to_ip = {}
-    
-    # Handle all users using unified user_uuid field
-    all_user_uuids = app_access_uuids + media_access_uuids
-    if all_user_uuids:
-        subquery = db.session.query(
-            MediaStreamHistory.user_uuid,
-            MediaStreamHistory.ip_address,
-            func.row_number().over(
-                partition_by=MediaStreamHistory.user_uuid,
-                order_by=MediaStreamHistory.started_at.desc()
-            ).label('rn')
-        ).filter(MediaStreamHistory.user_uuid.in_(all_user_uuids)).filter(MediaStreamHistory.ip_address.isnot(None)).subquery()
-
-        results = db.session.query(subquery.c.user_uuid, subquery.c.ip_address).filter(subquery.c.rn == 1).all()
-        
-        for result_uuid, ip_address in results:
-            user_id = uuid_to_user_id.get(result_uuid)
-            if user_id:
-                user_id_to_ip[user_id] = ip_address
-    
+    for user_id in user_ids:
+        summary = summaries.get(str(user_id))
+        if summary and summary.last_ip:
+            user_id_to_ip[user_id] = summary.last_ip
     return user_id_to_ip
 
 def mass_extend_access(user_uuids: list, days_to_extend: int, admin_id: int = None):
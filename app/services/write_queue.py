@@ -0,0 +1,112 @@
+# File: app/services/write_queue.py
+"""
+Single-writer queue for background database writes.
+
+SQLite allows one writer at a time. When the session monitor, a library or
+user sync, job progress updates and audit logging all write from different
+threads, they collide on the database lock and each one spins through the
+busy timeout. Under WAL, readers are not blocked by the writer, so the
+contention is only between writers. This module makes them take turns in
+process instead: ``serialized()`` is a first-come, first-served lock that
+the background writers hold around their write phase (from the first flush
+to the commit).
+
+The lock is reentrant per thread, so a writer that calls ``log_event`` while
+it already holds the lock doesn't deadlock. Network calls should happen
+before taking it.
+
+The queue is only enabled for SQLite (see ``create_app``). Other databases
+handle concurrent writers themselves, so there ``serialized()`` does nothing.
+Other processes (e.g. several gunicorn workers) are not covered; they still
+rely on ``SQLITE_BUSY_TIMEOUT_MS``.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app
+
+_SLOW_WAIT_SECONDS = 1.0
+
+_condition = threading.Condition(threading.Lock())
+_enabled = False
+_next_ticket = 0
+_now_serving = 0
+_owner = None  # thread ident of the current holder
+_depth = 0
+_holder_name = None
+_stats = {'acquired': 0, 'contended': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0}
+
+
+def set_enabled(enabled):
+    global _enabled
+    _enabled = bool(enabled)
+
+
+def is_enabled():
+    return _enabled
+
+
+def acquire(name=None):
+    """Wait for our turn to write. Pair with ``release()``; prefer ``serialized()``."""
+    global _next_ticket, _owner, _depth, _holder_name
+    if not _enabled:
+        return
+    me = threading.get_ident()
+    with _condition:
+        if _owner == me:
+            _depth += 1
+            return
+        ticket = _next_ticket
+        _next_ticket += 1
+        started = time.perf_counter()
+        waited_behind = _holder_name if _owner is not None else None
+        while _now_serving != ticket:
+            _condition.wait()
+        waited = time.perf_counter() - started
+        _owner, _depth, _holder_name = me, 1, name
+        _stats['acquired'] += 1
+        if waited_behind is not None:
+            _stats['contended'] += 1
+        _stats['wait_seconds'] += waited
+        _stats['max_wait_seconds'] = max(_stats['max_wait_seconds'], waited)
+    if waited >= _SLOW_WAIT_SECONDS:
+        try:
+            current_app.logger.info(f"Write_queue.py - acquire(): '{name}' waited {waited:.2f}s for the writer lock (held by '{waited_behind}')")
+        except RuntimeError:  # no app context
+            pass
+
+
+def release():
+    global _now_serving, _owner, _depth, _holder_name
+    if not _enabled:
+        return
+    with _condition:
+        if _owner != threading.get_ident():
+            raise RuntimeError("write_queue.release() called by a thread that doesn't hold the writer lock")
+        _depth -= 1
+        if _depth:
+            return
+        _owner, _holder_name = None, None
+        _now_serving += 1
+        _condition.notify_all()
+
+
+def holds_lock():
+    """True if the current thread is inside ``serialized()``."""
+    return _enabled and _owner == threading.get_ident()
+
+
+@contextmanager
+def serialized(name=None):
+    """Run the block as the only background writer in this process."""
+    acquire(name)
+    try:
+        yield
+    finally:
+        release()
+
+
+def stats():
+    with _condition:
+        return dict(_stats, enabled=_enabled, waiting=max(0, _next_ticket - _now_serving - 1), holder=_holder_name)
@@ -0,0 +1,96 @@
+# File: app/utils/fulltext_search.py
+"""
+Shared plumbing for the full-text indexes (media items, history logs).
+
+Each index is an FTS5 table kept current by triggers on SQLite and a GIN
+index on a ``to_tsvector('simple', ...)`` expression on PostgreSQL; other
+databases, or a SQLite database whose FTS table is missing, fall back to
+``ILIKE``. The services build their own filters and ranking on top of the
+helpers here:
+
+- ``search_backend()`` tells which of the three applies.
+- ``search_terms()`` splits a query into the words that are matched, each
+  as a prefix, all of them required.
+- ``fts_match()`` / ``pg_document()`` / ``pg_query()`` build the FTS5
+  MATCH string and the PostgreSQL expressions.
+- ``rebuild_sqlite_index()`` recreates an FTS table and its triggers, e.g.
+  after an Alembic batch migration rebuilt the content table.
+"""
+import re
+
+from flask import current_app
+from sqlalchemy import func, literal_column
+
+from app.extensions import db
+
+MAX_SEARCH_TERMS = 8
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+_backend_by_index = {}
+
+
+def search_terms(query, limit=MAX_SEARCH_TERMS):
+    """The lowercased words of ``query``, at most ``limit`` of them."""
+    return _TERM_RE.findall((query or '').lower())[:limit]
+
+
+def search_backend(fts_table, rebuild_command):
+    """'fts5', 'postgres' or 'like' for ``fts_table`` on the current database; checked once per database."""
+    key = (str(db.engine.url), fts_table)
+    if key not in _backend_by_index:
+        dialect = db.engine.dialect.name
+        if dialect == 'postgresql':
+            _backend_by_index[key] = 'postgres'
+        elif dialect == 'sqlite':
+            with db.engine.connect() as connection:
+                found = connection.exec_driver_sql(
+                    "SELECT 1 FROM sqlite_master WHERE name = ?", (fts_table,)).first()
+            _backend_by_index[key] = 'fts5' if found else 'like'
+            if not found:
+                current_app.logger.warning(f"Fulltext_Search.py - search_backend(): {fts_table} is missing; search uses LIKE. Run `flask {rebuild_command}`.")
+        else:
+            _backend_by_index[key] = 'like'
+    return _backend_by_index[key]
+
+
+def fts_match(terms):
+    """FTS5 MATCH string requiring every term as a word prefix."""
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def pg_document(*columns):
+    """
+    ``to_tsvector('simple', ...)`` over the space-joined columns. Must compile
+    to the expression of the GIN index for the planner to use it.
+    """
+    blank = literal_column("''")
+    parts = [func.coalesce(column, blank) for column in columns]
+    document = parts[0]
+    for part in parts[1:]:
+        document = document.op('||')(literal_column("' '")).op('||')(part)
+    return func.to_tsvector(literal_column("'simple'::regconfig"), document)
+
+
+def pg_query(terms):
+    """``to_tsquery('simple', ...)`` requiring every term as a prefix."""
+    return func.to_tsquery(literal_column("'simple'::regconfig"), ' & '.join(f"{term}:*" for term in terms))
+
+
+def rebuild_sqlite_index(fts_table, ddl, rebuild_command):
+    """
+    Drop and recreate the SQLite FTS table ``fts_table`` and its
+    ``<fts_table>_insert/_delete/_update`` triggers from ``ddl``, then refill
+    it from its content table. Does nothing on other databases. Returns the
+    backend in use afterwards.
+    """
+    _backend_by_index.pop((str(db.engine.url), fts_table), None)
+    if db.engine.dialect.name != 'sqlite':
+        return search_backend(fts_table, rebuild_command)
+    with db.engine.begin() as connection:
+        for trigger in ('insert', 'delete', 'update'):
+            connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {fts_table}_{trigger}")
+        connection.exec_driver_sql(f"DROP TABLE IF EXISTS {fts_table}")
+        for statement in ddl:
+            connection.exec_driver_sql(statement)
+        connection.exec_driver_sql(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')")
+    return search_backend(fts_table, rebuild_command)
@@ -1,8 +1,9 @@
 # File: app/utils/helpers.py
+import hashlib
 import re
 from datetime import datetime, timezone, timedelta
 from app.utils.timezone_utils import to_app_timezone, format_datetime_human as tz_format_datetime_human
-from flask import current_app, flash, url_for, g as flask_g, redirect, request # Use flask_g to avoid conflict with local g
+from flask import current_app, flash, url_for, g as flask_g, redirect, request, has_request_context # Use flask_g to avoid conflict with local g
 from functools import wraps
 from flask_login import current_user
 # app.models import HistoryLog, EventType # This creates circular import if models also import helpers
@@ -123,8 +124,15 @@ def log_event(event_type, message: str, details: dict = None, # Removed type hin
                 # Don't set user_id if parsing fails
         if invite_id: log_entry.invite_id = invite_id
 
-        db.session.add(log_entry)
-        db.session.commit()
+        if has_request_context():
+            db.session.add(log_entry)
+            db.session.commit()
+        else:
+            # Scheduler and job threads take turns with the other background writers
+            from app.services import write_queue
+            with write_queue.serialized('log_event'):
+                db.session.add(log_entry)
+                db.session.commit()
         # Event logged to database
     except Exception as e:
         db.session.rollback()
@@ -271,6 +279,52 @@ def any_permission_required(permissions):
         return decorated_function
     return decorator
 
+def _conditional_etag(version):
+    """Weak ETag for a version key, scoped to the URL (path and query) and the user."""
+    user_id = current_user.get_id() if current_user.is_authenticated else None
+    raw = repr((version, request.full_path, user_id)).encode('utf-8')
+    return hashlib.sha1(raw).hexdigest()
+
+def conditional_response(version_key):
+    """
+    Decorator for polled partials and JSON endpoints: answers ``If-None-Match``
+    with 304 Not Modified before the view does any work.
+
+    ``version_key()`` returns a cheap value that changes whenever the view's
+    output would (a snapshot version, the newest log id, ...), or None if it
+    can't tell. It is called again after the view, since the view may have
+    refreshed the data. If there is no key the ETag is a hash of the body,
+    which still spares the transfer and the swap. Place it below the login and
+    permission decorators.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            version = version_key()
+            if version is not None:
+                etag = _conditional_etag(version)
+                if request.if_none_match.contains_weak(etag):
+                    from app.services import metrics
+                    metrics.record_cache('etag', hits=1)
+                    response = current_app.response_class(status=304)
+                    response.set_etag(etag, weak=True)
+                    response.headers['Cache-Control'] = 'private, no-cache'
+                    return response
+
+            response = current_app.make_response(f(*args, **kwargs))
+            if response.status_code != 200 or response.is_streamed:
+                return response
+            version = version_key()
+            if version is not None:
+                response.set_etag(_conditional_etag(version), weak=True)
+            else:
+                response.set_etag(hashlib.sha1(response.get_data()).hexdigest(), weak=True)
+            # Browsers keep the body and revalidate every time, so plain fetch() and HTMX polls send If-None-Match
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response.make_conditional(request)
+        return decorated_function
+    return decorator
+
 def get_text_color_for_bg(hex_color):
     """
     Determines if black or white text is more readable on a given hex background color.
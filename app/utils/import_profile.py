@@ -0,0 +1,69 @@
+# File: app/utils/import_profile.py
+"""
+Import-time profile of app startup, for ``flask import-profile``.
+
+Runs ``create_app`` in a fresh interpreter with ``python -X importtime`` and
+parses its report, so the numbers are those of a new gunicorn worker rather
+than of the already-warm CLI process. Also reports which of the heavy
+per-service client libraries were imported at startup; with plugins
+imported on first use there should be none.
+"""
+import os
+import re
+import resource
+import subprocess
+import sys
+
+# Client libraries that should only be imported when a service of that type is used
+HEAVY_MODULES = (
+    'plexapi', 'plexapi.server', 'plexapi.myplex', 'xmltodict',
+    'app.services.plex_media_service', 'app.services.jellyfin_media_service', 'app.services.emby_media_service',
+    'app.services.audiobookshelf_media_service', 'app.services.kavita_media_service',
+    'app.services.komga_media_service', 'app.services.romm_media_service',
+    'maxminddb',
+)
+
+_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)\s*$')
+
+
+def profile_startup(config_name='testing'):
+    """
+    Import ``app`` and call ``create_app(config_name)`` in a subprocess.
+
+    Returns:
+        Dict with 'modules' (dicts of name, self_us, cumulative_us, depth in
+        import order), 'total_us' (the app package and everything it
+        imported), 'heavy' (the HEAVY_MODULES that were imported) and
+        'max_rss_kb' of the subprocess
+    """
+    statement = f"from app import create_app; create_app({config_name!r})"
+    project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env = dict(os.environ, FLASK_LOG_LEVEL='ERROR')
+    rusage_before = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement],
+                               cwd=project_root, env=env, capture_output=True, text=True)
+    max_rss_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    if completed.returncode != 0:
+        raise RuntimeError(f"create_app failed in the profiling process: {completed.stderr.strip().splitlines()[-1:]}")
+
+    modules = []
+    for line in completed.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            modules.append({
+                'name': match.group(4),
+                'self_us': int(match.group(1)),
+                'cumulative_us': int(match.group(2)),
+                'depth': len(match.group(3)) // 2,
+            })
+
+    # Top-level entries (depth 0) add up to everything imported
+    total_us = sum(module['cumulative_us'] for module in modules if module['depth'] == 0)
+    imported = {module['name'] for module in modules}
+    return {
+        'modules': modules,
+        'total_us': total_us,
+        'heavy': [name for name in HEAVY_MODULES if name in imported],
+        # ru_maxrss of children is the largest child so far; only meaningful if this one was the largest
+        'max_rss_kb': max_rss_kb if max_rss_kb > rusage_before else None,
+    }
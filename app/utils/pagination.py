@@ -0,0 +1,33 @@
+# File: app/utils/pagination.py
+"""
+Page object for listings paginated in SQL with keyset cursors (users list,
+history log viewer). Templates use it like a Flask-SQLAlchemy pagination;
+the service building the page supplies the items and the cursors.
+"""
+
+
+class KeysetPage:
+    """Pagination object exposing the Flask-SQLAlchemy pagination interface plus keyset cursors."""
+
+    def __init__(self, items, page, per_page, total, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+        self.pages = (total + per_page - 1) // per_page if per_page else 0
+        self.has_prev = page > 1
+        self.has_next = page < self.pages
+        self.prev_num = page - 1 if self.has_prev else None
+        self.next_num = page + 1 if self.has_next else None
+        self.next_cursor = next_cursor if self.has_next else None
+        self.prev_cursor = prev_cursor if self.has_prev else None
+
+    def iter_pages(self, left_edge=2, right_edge=2, left_current=2, right_current=3):
+        last = self.pages
+        for num in range(1, last + 1):
+            if num <= left_edge or \
+               (self.page - left_current - 1 < num < self.page + right_current) or \
+               num > last - right_edge:
+                yield num
+            elif num == left_edge + 1 or num == last - right_edge:
+                yield None
@@ -6,8 +6,6 @@ Replaces direct requests to plex.tv/api/v2/pins with plexapi.myplex.MyPlexPinLog
 
 import uuid
 from flask import current_app
-from plexapi.myplex import MyPlexPinLogin
-from plexapi.exceptions import PlexApiException, BadRequest
 from app.models import User, UserType, Setting
 
 
@@ -58,6 +56,8 @@ def create_plex_pin_login(client_identifier_suffix="MUM", oauth=False):
         tuple: (MyPlexPinLogin instance, error_message)
                Returns (None, error_message) on failure
     """
+    from plexapi.myplex import MyPlexPinLogin
+    from plexapi.exceptions import PlexApiException
     try:
         headers = get_plex_client_headers(client_identifier_suffix)
         
@@ -98,6 +98,7 @@ def check_plex_pin_status(pin_login):
         tuple: (auth_token, error_message)
                Returns (None, error_message) on failure or if not ready
     """
+    from plexapi.exceptions import PlexApiException
     try:
         # Check if the PIN has been authenticated
         if pin_login.checkLogin():
@@ -0,0 +1,188 @@
+# File: app/utils/sql_profiler.py
+"""
+Opt-in per-request SQL profiler, for finding N+1 query patterns.
+
+With ``SQL_PROFILER_ENABLED`` (off by default in every config) every SQL
+statement a request runs is recorded with its duration and a fingerprint:
+the statement with literals replaced by ``?`` and ``IN`` lists collapsed, so the same query with different ids counts as one.
+A fingerprint that runs ``SQL_PROFILER_N1_THRESHOLD`` times or more in one
+request is flagged as an N+1 suspect.
+
+Profiled responses to a signed-in admin get:
+
+- ``X-SQL-Profile: queries=42; time_ms=18.3; distinct=9; n_plus_one=2``
+- ``Server-Timing: db;dur=18.3;desc="42 queries"`` (shown by browser dev tools)
+
+The last ``SQL_PROFILER_HISTORY`` requests are listed on Settings > API Debug.
+Requests slower than ``SQL_PROFILER_SLOW_REQUEST_MS`` are logged with their
+most expensive fingerprints. Statements run outside a request (scheduled
+jobs, background threads) are not profiled.
+"""
+import hashlib
+import re
+import threading
+import time
+from collections import deque
+
+from flask import current_app, g, has_request_context, request
+from flask_login import current_user
+from sqlalchemy import event
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|\$\d+")  # psycopg / asyncpg style bound parameters
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN\s*\((?:\s*\?\s*,?)+\)", re.IGNORECASE)
+_VALUES_LIST = re.compile(r"\bVALUES\s*(?:\((?:[^()]*)\)\s*,?\s*)+", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+# The panel's own requests would push everything else out of the history
+_IGNORED_ENDPOINTS = {'static', 'settings.sql_profile_partial', 'settings.sql_profile_clear'}
+
+_history_lock = threading.Lock()
+_history = deque(maxlen=50)
+_enabled = False
+
+
+def fingerprint(statement):
+    """The statement with literals, parameter lists and whitespace normalized."""
+    normalized = _STRING.sub('?', statement)
+    normalized = _PLACEHOLDER.sub('?', normalized)
+    normalized = _NUMBER.sub('?', normalized)
+    normalized = _IN_LIST.sub('IN (...)', normalized)
+    normalized = _VALUES_LIST.sub('VALUES (...) ', normalized)
+    return _WHITESPACE.sub(' ', normalized).strip()
+
+
+class RequestProfile:
+    """Statements of one request, grouped by fingerprint."""
+
+    def __init__(self, method, path, endpoint):
+        self.method = method
+        self.path = path
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.statements = {}  # statement text -> [count, seconds], while the request runs
+        self.fingerprints = {}  # fingerprint -> [count, seconds, example statement], once finished
+        self.status = None
+        self.duration_ms = None
+        self.suspects = []
+
+    def record(self, statement, seconds):
+        self.queries += 1
+        self.query_seconds += seconds
+        entry = self.statements.setdefault(statement, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+    def finish(self, status, threshold):
+        self.status = status
+        self.duration_ms = (time.perf_counter() - self.started) * 1000
+        # Normalized once per distinct statement text rather than per execution
+        for statement, (count, seconds) in self.statements.items():
+            entry = self.fingerprints.setdefault(fingerprint(statement), [0, 0.0, statement])
+            entry[0] += count
+            entry[1] += seconds
+        self.statements = {}
+        self.suspects = [key for key, (count, _, _) in self.fingerprints.items() if count >= threshold]
+
+    def top(self, limit=5):
+        """Fingerprints by total time: dicts of id, fingerprint, count, total_ms, example, suspect."""
+        rows = sorted(self.fingerprints.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+        return [{
+            'id': hashlib.sha1(key.encode('utf-8')).hexdigest()[:8],
+            'fingerprint': key,
+            'count': count,
+            'total_ms': seconds * 1000,
+            'example': example,
+            'suspect': key in self.suspects,
+        } for key, (count, seconds, example) in rows]
+
+    def header(self):
+        return (f"queries={self.queries}; time_ms={self.query_seconds * 1000:.1f}; "
+                f"distinct={len(self.fingerprints)}; n_plus_one={len(self.suspects)}")
+
+
+def enabled():
+    return _enabled
+
+
+def recent_profiles():
+    """Profiles of the last requests, newest first."""
+    with _history_lock:
+        return list(reversed(_history))
+
+
+def clear_profiles():
+    with _history_lock:
+        _history.clear()
+
+
+def _is_admin():
+    """Whether the profile may be sent back in headers: the owner, or a local admin with advanced settings access."""
+    from app.models import UserType
+    if not current_user.is_authenticated:
+        return False
+    if current_user.userType == UserType.OWNER:
+        return True
+    return current_user.userType == UserType.LOCAL and current_user.has_permission('manage_advanced_settings')
+
+
+def _statement_started(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and has_request_context() and g.get('sql_profile') is not None:
+        context._profiler_started = time.perf_counter()
+
+
+def _statement_finished(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_profiler_started', None)
+    if started is None or not has_request_context():
+        return
+    profile = g.get('sql_profile')
+    if profile is not None:
+        profile.record(statement, time.perf_counter() - started)
+
+
+def _start_profile():
+    if request.endpoint in _IGNORED_ENDPOINTS:
+        return
+    g.sql_profile = RequestProfile(request.method, request.full_path.rstrip('?'), request.endpoint or 'unmatched')
+
+
+def _finish_profile(response):
+    profile = g.pop('sql_profile', None)
+    if profile is None:
+        return response
+    config = current_app.config
+    profile.finish(response.status_code, config.get('SQL_PROFILER_N1_THRESHOLD', 5))
+    if _is_admin():
+        response.headers['X-SQL-Profile'] = profile.header()
+        response.headers.add('Server-Timing', f'db;dur={profile.query_seconds * 1000:.1f};desc="{profile.queries} queries"')
+    with _history_lock:
+        _history.append(profile)
+
+    if profile.duration_ms >= config.get('SQL_PROFILER_SLOW_REQUEST_MS', 500):
+        offenders = '; '.join(f"{row['count']}x {row['total_ms']:.1f} ms{' [N+1]' if row['suspect'] else ''}: {row['fingerprint'][:200]}"
+                              for row in profile.top(3))
+        current_app.logger.warning(f"Sql_Profiler.py - Slow request {profile.method} {profile.path} ({profile.endpoint}): "
+                                   f"{profile.duration_ms:.0f} ms, {profile.header()}. Top queries: {offenders}")
+    elif profile.suspects:
+        current_app.logger.info(f"Sql_Profiler.py - Possible N+1 in {profile.endpoint}: "
+                                f"{', '.join(str(profile.fingerprints[key][0]) + 'x ' + key[:120] for key in profile.suspects)}")
+    return response
+
+
+def init_sql_profiler(app, engine):
+    """Profile the requests of ``app`` if ``SQL_PROFILER_ENABLED``. Register before other request hooks. Returns whether it's on."""
+    global _history, _enabled
+    if not app.config.get('SQL_PROFILER_ENABLED', False):
+        return False
+    _enabled = True
+    _history = deque(maxlen=max(1, int(app.config.get('SQL_PROFILER_HISTORY', 50))))
+    event.listen(engine, 'before_cursor_execute', _statement_started)
+    event.listen(engine, 'after_cursor_execute', _statement_finished)
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
+    app.logger.info("Sql_Profiler.py - init_sql_profiler(): SQL profiling is on for every request.")
+    return True
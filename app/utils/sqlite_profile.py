@@ -0,0 +1,43 @@
+# File: app/utils/sqlite_profile.py
+"""
+Connection settings for running MUM on SQLite under concurrent load.
+
+Every new SQLite connection gets the PRAGMAs from ``Config.SQLITE_*``:
+
+- ``journal_mode`` (WAL by default): readers see the last committed state
+  and are never blocked by a writer, and a writer isn't blocked by readers.
+- ``synchronous=NORMAL``: under WAL this only gives up durability of the
+  last transactions on power loss, never consistency, and saves an fsync
+  per commit.
+- ``busy_timeout``: how long a writer waits for another writer's lock
+  before failing with "database is locked".
+- ``mmap_size``: read pages through a memory map instead of read() calls.
+
+In-memory databases only get the busy timeout and ``synchronous``.
+"""
+from sqlalchemy import event
+
+
+def apply_sqlite_profile(app, engine):
+    """Register the PRAGMA listener on ``engine``. Returns False (and does nothing) for other databases."""
+    if engine.dialect.name != 'sqlite':
+        return False
+
+    in_memory = engine.url.database in (None, '', ':memory:')
+    pragmas = [f"busy_timeout = {int(app.config.get('SQLITE_BUSY_TIMEOUT_MS', 15000))}",
+               f"synchronous = {app.config.get('SQLITE_SYNCHRONOUS', 'NORMAL')}"]
+    if not in_memory:
+        pragmas.append(f"journal_mode = {app.config.get('SQLITE_JOURNAL_MODE', 'WAL')}")
+        pragmas.append(f"mmap_size = {int(app.config.get('SQLITE_MMAP_SIZE', 0))}")
+
+    @event.listens_for(engine, 'connect')
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(f"PRAGMA {pragma}")
+        finally:
+            cursor.close()
+
+    app.logger.debug(f"Sqlite_profile.py - apply_sqlite_profile(): {', '.join(pragmas)}")
+    return True
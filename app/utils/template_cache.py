@@ -0,0 +1,59 @@
+# File: app/utils/template_cache.py
+"""
+Compiled-template cache and warmup for new workers.
+
+Jinja compiles each template to Python code the first time it is rendered,
+which makes the first page a worker serves noticeably slower than the next.
+Two things take that off the first request:
+
+- ``TEMPLATE_BYTECODE_CACHE`` keeps the compiled code in
+  ``<instance>/template_cache``. A worker loads it from there instead of
+  compiling the template again; entries are keyed by the template source,
+  so edited templates are recompiled.
+- ``TEMPLATE_WARMUP`` lists the templates compiled at app creation: the
+  layout, the navigation bars, the login pages and the dashboard. The
+  entrypoint's ``flask db upgrade`` creates the app once before gunicorn
+  starts, so the workers find them in the cache.
+
+Only the listed templates are loaded up front; the rest are compiled (or
+read from the cache) when first rendered, as before.
+"""
+import os
+import time
+
+from jinja2 import FileSystemBytecodeCache, TemplateNotFound, TemplateSyntaxError
+
+
+def apply_template_cache(app):
+    """Give the app's Jinja environment a file bytecode cache. Returns the cache directory, or None if disabled."""
+    if not app.config.get('TEMPLATE_BYTECODE_CACHE', True):
+        return None
+    cache_dir = os.path.join(app.instance_path, 'template_cache')
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+    except OSError as e:
+        app.logger.warning(f"Template_Cache.py - Could not create {cache_dir}: {e}; templates are compiled in memory only.")
+        return None
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+    return cache_dir
+
+
+def warm_templates(app, names=None):
+    """Compile ``names`` (default: ``TEMPLATE_WARMUP``, a list or comma-separated string). Returns the number compiled."""
+    if names is None:
+        names = app.config.get('TEMPLATE_WARMUP') or ()
+    if isinstance(names, str):
+        names = [name.strip() for name in names.split(',') if name.strip()]
+
+    started = time.perf_counter()
+    compiled = 0
+    for name in names:
+        try:
+            app.jinja_env.get_template(name)
+            compiled += 1
+        except TemplateNotFound:
+            app.logger.warning(f"Template_Cache.py - warm_templates(): {name} not found")
+        except TemplateSyntaxError as e:
+            app.logger.error(f"Template_Cache.py - warm_templates(): {name} does not compile: {e}")
+    app.logger.debug(f"Template_Cache.py - warm_templates(): {compiled} templates ready in {(time.perf_counter() - started) * 1000:.0f} ms")
+    return compiled
@@ -73,13 +73,18 @@ def format_datetime_user(dt: Optional[datetime], include_time: bool = True) -> s
     if dt is None:
         return "N/A"
 
+    from flask import g
     from flask_login import current_user
     from app.models import User, UserType, UserPreferences
 
     if not current_user.is_authenticated:
         return format_datetime(dt)
 
-    prefs = UserPreferences.get_timezone_preference(current_user.id)
+    # Lists format many timestamps per request; look the preference up once
+    prefs = g.get('_timezone_preference')
+    if prefs is None or prefs[0] != current_user.id:
+        prefs = g._timezone_preference = (current_user.id, UserPreferences.get_timezone_preference(current_user.id))
+    prefs = prefs[1]
     preference = prefs.get('preference', 'local')
     local_timezone_str = prefs.get('local_timezone')
     time_format = prefs.get('time_format', '12')
@@ -4,7 +4,9 @@ from discord.ext import commands, tasks # tasks might be useful later
 import asyncio
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
+from functools import partial
 import logging
 
 # --- Setup to allow access to Flask app context and models ---
@@ -22,14 +24,11 @@ try:
     from app.extensions import db as mum_db_session # Using the db session from extensions
     from app.utils.helpers import log_event as mum_log_event_func
     from app.services import user_service as mum_user_service_module
-    from app.services.media_service_manager import MediaServiceManager
 
     User, Setting, EventType, SettingValueType = MUM_User, MUM_Setting, MUM_EventType, MUM_SettingValueType
     db_session = mum_db_session
     log_event_mum = mum_log_event_func
     user_service_for_bot = mum_user_service_module
-    media_service_manager = MediaServiceManager()
-    plex_service_for_bot = media_service_manager.get_service('plex')
     
     # Create a Flask app instance to work with its context
     # This should use the same configuration as your main app
@@ -76,6 +75,56 @@ intents.members = True
 intents.guilds = True       
 bot = commands.Bot(command_prefix="!mum>", intents=intents) # commands.Bot for flexibility
 
+# --- Worker threads for DB and media-server calls ---
+# SQLAlchemy queries and remote removals block. Run on the event loop they stall gateway heartbeats
+# and every other event, so handlers hand them to this executor and await the result.
+_worker_executor = None
+
+def _get_worker_executor():
+    global _worker_executor
+    if _worker_executor is None:
+        workers = flask_app_instance_for_bot.config.get('DISCORD_BOT_DB_WORKERS', 2) if flask_app_instance_for_bot else 2
+        _worker_executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='mum-bot-worker')
+    return _worker_executor
+
+def _call_in_app_context(func, *args, **kwargs):
+    with flask_app_instance_for_bot.app_context():
+        return func(*args, **kwargs)
+
+async def run_in_app_context(func, *args, **kwargs):
+    """Run a blocking function in the Flask app context on a worker thread without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_worker_executor(), partial(_call_in_app_context, func, *args, **kwargs))
+
+
+# --- Guild member cache ---
+class GuildMemberCache:
+    """Ids of the monitored guild's members and their role ids, kept current from gateway events."""
+
+    def __init__(self):
+        self.member_roles = {} # member id -> frozenset of role ids
+        self.complete = False # True once the full member list was loaded; reconciliation needs it
+
+    def load(self, guild: discord.Guild):
+        self.member_roles = {member.id: frozenset(role.id for role in member.roles) for member in guild.members}
+        self.complete = guild.chunked
+
+    def update(self, member: discord.Member):
+        self.member_roles[member.id] = frozenset(role.id for role in member.roles)
+
+    def remove(self, member_id: int):
+        self.member_roles.pop(member_id, None)
+
+    def has_member(self, member_id: int) -> bool:
+        return member_id in self.member_roles
+
+    def has_role(self, member_id: int, role_id: int) -> bool:
+        return role_id in self.member_roles.get(member_id, ())
+
+guild_cache = GuildMemberCache()
+SEEN_MEMBERS_SETTING = 'DISCORD_BOT_SEEN_MEMBER_IDS' # Linked Discord ids the reconciliation pass has seen in the guild
+_removals_in_progress = set() # Discord ids being handled, so an event and a reconciliation pass don't both remove a user
+
 async def send_log_to_discord_channel(message: str, level: str = "INFO", embed_title_override=None):
     if not bot.is_ready() or not LOG_CHANNEL_ID: return # Bot not ready or no log channel
     try:
@@ -177,72 +226,222 @@ async def on_ready():
             bot_logger.error("Monitored Role ID is not configured. Role-based actions will fail.")
             await send_log_to_discord_channel("ERROR: Monitored Role ID not configured!", level="ERROR")
 
+        # Load the member cache (on_ready also fires after reconnects, when members may have changed)
+        if not guild.chunked:
+            await guild.chunk(cache=True)
+        guild_cache.load(guild)
+        bot_logger.info(f"Cached {len(guild_cache.member_roles)} members of guild '{guild.name}'.")
+        if not reconcile_guild_membership.is_running():
+            reconcile_guild_membership.change_interval(minutes=flask_app_instance_for_bot.config.get('DISCORD_BOT_RECONCILE_MINUTES', 30))
+            reconcile_guild_membership.start()
+
 
     # Log to MUM History that bot started
     if flask_app_instance_for_bot and log_event_mum:
         try:
-            with flask_app_instance_for_bot.app_context():
-                log_event_mum(EventType.DISCORD_BOT_START, f"Discord bot '{bot.user.name}' started successfully and connected to Discord.")
+            await run_in_app_context(log_event_mum, EventType.DISCORD_BOT_START, f"Discord bot '{bot.user.name}' started successfully and connected to Discord.")
         except Exception as e_log:
             bot_logger.error(f"Failed to log bot start to MUM history: {e_log}")
 
 
+def _remove_departed_users(departed: dict, log_departure: bool = True):
+    """
+    Runs on a worker thread in the app context. Removes the MUM users linked
+    to Discord ids that are no longer in the guild, unless they are exempt,
+    in one deprovisioning run (remote removals run concurrently per server).
+
+    Args:
+        departed: Discord id -> display name
+
+    Returns:
+        {discord_id: (removed, level, message)} for the Discord log channel
+    """
+    from app.models import UserType
+    from app.services import deprovisioning_service
+
+    if log_departure:
+        for discord_id, display_name in departed.items():
+            log_event_mum(EventType.DISCORD_BOT_USER_LEFT_SERVER, 
+                          f"User {display_name} (Discord ID: {discord_id}) left/removed from Discord server.", 
+                          details={'discord_id': discord_id, 'discord_name': display_name})
+
+    # One query for all ids; a local account takes precedence over a service account with the same Discord id
+    mum_users = {}
+    for mum_user in User.query.filter(User.discord_user_id.in_([str(discord_id) for discord_id in departed])).all():
+        current = mum_users.get(mum_user.discord_user_id)
+        if current is None or (current.userType != UserType.LOCAL and mum_user.userType == UserType.LOCAL):
+            mum_users[mum_user.discord_user_id] = mum_user
+
+    results, to_remove = {}, {}
+    for discord_id, display_name in departed.items():
+        mum_user = mum_users.get(str(discord_id))
+        if not mum_user:
+            results[discord_id] = (False, "INFO", f"User {display_name} who left Discord was not found in MUM. No Plex action.")
+        elif mum_user.is_home_user:
+            results[discord_id] = (False, "INFO", f"User {display_name} ({mum_user.get_display_name()}) is Plex Home User. No bot removal action.")
+        elif mum_user.is_discord_bot_whitelisted:
+            results[discord_id] = (False, "INFO", f"User {display_name} ({mum_user.get_display_name()}) is bot-whitelisted. No removal action.")
+        elif WHITELIST_SHARERS_FOR_BOT and mum_user.shares_back:
+            results[discord_id] = (False, "INFO", f"User {display_name} ({mum_user.get_display_name()}) shares Plex back and 'Whitelist Sharers' is ON. No bot removal action.")
+        else:
+            to_remove[mum_user.id] = discord_id
+    if not to_remove:
+        return results
+
+    bot_logger.info(f"Removing {len(to_remove)} MUM users whose Discord accounts left the server.")
+    run = deprovisioning_service.create_run(
+        'discord_left',
+        local_user_ids=[user.id for user in mum_users.values() if user.id in to_remove and user.userType == UserType.LOCAL],
+        service_user_ids=[user.id for user in mum_users.values() if user.id in to_remove and user.userType == UserType.SERVICE],
+        admin_id=None # Bot action
+    )
+    try:
+        deprovisioning_service.execute_run(run.id)
+    except Exception as e_run:
+        db_session.session.rollback()
+        bot_logger.error(f"Error running removal of departed Discord members (run {run.id}): {e_run}", exc_info=True)
+
+    for outcome in run.outcomes.all():
+        discord_id = to_remove.get(outcome.user_id)
+        display_name = departed.get(discord_id)
+        if outcome.status == 'removed':
+            success_msg = f"Bot removed Plex access for {outcome.username} (Discord: {display_name}) due to leaving server."
+            log_event_mum(EventType.DISCORD_BOT_USER_REMOVED_FROM_PLEX, success_msg, details={'discord_id': discord_id, 'deprovision_run_id': run.id})
+            results[discord_id] = (True, "WARN", success_msg)
+        else:
+            err_msg_remove = f"ERROR removing Plex access for {outcome.username} (Discord: {display_name}): {outcome.error or outcome.status}"
+            log_event_mum(EventType.DISCORD_BOT_ERROR, f"Bot failed to remove user {outcome.username} (left server): {outcome.error or outcome.status}")
+            results[discord_id] = (False, "ERROR", err_msg_remove)
+    return results
+
+
+async def handle_departed_members(departed: dict, log_departure: bool = True):
+    """
+    Remove the MUM users of departed members on a worker thread and report
+    each result to the log channel. Returns the Discord ids whose users were removed.
+    """
+    departed = {discord_id: name for discord_id, name in departed.items() if discord_id not in _removals_in_progress}
+    if not departed:
+        return set()
+    _removals_in_progress.update(departed)
+    try:
+        results = await run_in_app_context(_remove_departed_users, departed, log_departure)
+    except Exception as e:
+        bot_logger.error(f"Error handling departure of {len(departed)} Discord members: {e}", exc_info=True)
+        await send_log_to_discord_channel(f"Error handling departure of {', '.join(departed.values())}: {e}", level="ERROR")
+        return set()
+    finally:
+        _removals_in_progress.difference_update(departed)
+
+    for removed, level, message in results.values():
+        if level == "ERROR": bot_logger.error(message)
+        else: bot_logger.info(message)
+        await send_log_to_discord_channel(message, level=level)
+    return {discord_id for discord_id, (removed, _, _) in results.items() if removed}
+
+
+@bot.event
+async def on_member_join(member: discord.Member):
+    if GUILD_ID and member.guild.id == GUILD_ID:
+        guild_cache.update(member)
+
+
 @bot.event
 async def on_member_remove(member: discord.Member):
     if not BOT_ENABLED_IN_SETTINGS or not flask_app_instance_for_bot or not GUILD_ID or member.guild.id != GUILD_ID:
         return
+    guild_cache.remove(member.id)
 
     bot_logger.info(f"Member left/removed: {member.display_name} ({member.id}) from Guild {member.guild.name}")
     await send_log_to_discord_channel(f"User {member.display_name} (`{member.id}`) left/was removed from the Discord server.", level="INFO")
 
-    with flask_app_instance_for_bot.app_context():
-        log_event_mum(EventType.DISCORD_BOT_USER_LEFT_SERVER, 
-                      f"User {member.display_name} (Discord ID: {member.id}) left/removed from Discord server.", 
-                      details={'discord_id': member.id, 'discord_name': member.display_name})
-        
-        mum_user: User = User.query.filter_by(discord_user_id=str(member.id)).first()
-        if mum_user:
-            if mum_user.is_home_user:
-                msg = f"User {member.display_name} ({mum_user.plex_username}) is Plex Home User. No bot removal action."
-                bot_logger.info(msg); await send_log_to_discord_channel(msg, level="INFO"); return
-            if mum_user.is_discord_bot_whitelisted:
-                msg = f"User {member.display_name} ({mum_user.plex_username}) is bot-whitelisted. No removal action."
-                bot_logger.info(msg); await send_log_to_discord_channel(msg, level="INFO"); return
-            if WHITELIST_SHARERS_FOR_BOT and mum_user.shares_back:
-                msg = f"User {member.display_name} ({mum_user.plex_username}) shares Plex back and 'Whitelist Sharers' is ON. No bot removal action."
-                bot_logger.info(msg); await send_log_to_discord_channel(msg, level="INFO"); return
-
-            bot_logger.info(f"Attempting to remove Plex access for MUM user {mum_user.plex_username} (Discord: {member.display_name}).")
-            try:
-                from app.services.unified_user_service import UnifiedUserService
-                UnifiedUserService.delete_user_completely(mum_user.id, admin_id=None) # Bot action, admin_id can be None or a system ID
-                success_msg = f"Bot removed Plex access for {mum_user.plex_username} (Discord: {member.display_name}) due to leaving server."
-                log_event_mum(EventType.DISCORD_BOT_USER_REMOVED_FROM_PLEX, success_msg, user_id=mum_user.id)
-                await send_log_to_discord_channel(success_msg, level="WARN")
-                try:
-                    await member.send(f"Hello {member.display_name},\n\nYour access to the Plex server linked with '{member.guild.name}' has been automatically removed because you are no longer a member of our Discord server. If you believe this is an error, please contact an administrator.")
-                    await send_log_to_discord_channel(f"Sent DM to {member.display_name} regarding Plex removal (left server).", level="INFO")
-                except discord.Forbidden: await send_log_to_discord_channel(f"Could not send DM to {member.display_name} (DMs likely disabled).", level="WARN")
-                except Exception as e_dm: await send_log_to_discord_channel(f"Error sending DM to {member.display_name}: {e_dm}", level="ERROR")
-            except Exception as e_remove:
-                err_msg_remove = f"ERROR removing Plex access for {mum_user.plex_username} (Discord: {member.display_name}): {e_remove}"
-                bot_logger.error(err_msg_remove, exc_info=True)
-                await send_log_to_discord_channel(err_msg_remove, level="ERROR")
-                log_event_mum(EventType.DISCORD_BOT_ERROR, f"Bot failed to remove user {mum_user.plex_username} (left server): {e_remove}", user_id=mum_user.id)
-        else:
-            bot_logger.info(f"User {member.display_name} who left Discord was not found in MUM database by Discord ID.")
-            await send_log_to_discord_channel(f"User {member.display_name} who left Discord was not found in MUM. No Plex action.", level="INFO")
+    if member.id in await handle_departed_members({member.id: member.display_name}):
+        try:
+            await member.send(f"Hello {member.display_name},\n\nYour access to the Plex server linked with '{member.guild.name}' has been automatically removed because you are no longer a member of our Discord server. If you believe this is an error, please contact an administrator.")
+            await send_log_to_discord_channel(f"Sent DM to {member.display_name} regarding Plex removal (left server).", level="INFO")
+        except discord.Forbidden: await send_log_to_discord_channel(f"Could not send DM to {member.display_name} (DMs likely disabled).", level="WARN")
+        except Exception as e_dm: await send_log_to_discord_channel(f"Error sending DM to {member.display_name}: {e_dm}", level="ERROR")
 
 # Placeholder for on_member_update (role changes)
 @bot.event
 async def on_member_update(before: discord.Member, after: discord.Member):
+    if GUILD_ID and after.guild.id == GUILD_ID:
+        guild_cache.update(after)
     if not BOT_ENABLED_IN_SETTINGS or not flask_app_instance_for_bot or before.guild.id != GUILD_ID or MONITORED_ROLE_ID is None:
         return
     # ... (Logic for Req #9 and #11 to be implemented here) ...
-    # Remember to use `with flask_app_instance_for_bot.app_context():` for DB/service calls
+    # Use guild_cache.has_role() for role checks and `await run_in_app_context(...)` for DB/service calls
     pass
 
 
+def _linked_discord_users():
+    """Runs on a worker thread: Discord id -> display name of every user with a linked Discord account, in one query."""
+    rows = db_session.session.query(User.discord_user_id, User.localUsername, User.plex_username).filter(
+        User.discord_user_id.isnot(None), User.discord_user_id != ''
+    ).all()
+    return {discord_user_id: local_username or plex_username or discord_user_id
+            for discord_user_id, local_username, plex_username in rows}
+
+
+def _reconciliation_state():
+    """Runs on a worker thread: the linked Discord users, and the linked ids already seen in the guild by earlier passes."""
+    seen = Setting.get(SEEN_MEMBERS_SETTING) or []
+    return _linked_discord_users(), {str(discord_id) for discord_id in seen}
+
+
+def _save_seen_member_ids(member_ids):
+    """Runs on a worker thread."""
+    Setting.set(SEEN_MEMBERS_SETTING, sorted(member_ids), SettingValueType.JSON)
+
+
+@tasks.loop(minutes=30) # Interval is set from DISCORD_BOT_RECONCILE_MINUTES when started
+async def reconcile_guild_membership():
+    """
+    Remove users whose Discord account left the guild while the bot wasn't watching (offline, missed events).
+    Only accounts an earlier pass saw in the guild count as departed: a linked account that never joined isn't a leaver.
+    """
+    if not BOT_ENABLED_IN_SETTINGS or not guild_cache.complete:
+        return
+    try:
+        linked, seen = await run_in_app_context(_reconciliation_state)
+    except Exception as e:
+        bot_logger.error(f"Guild reconciliation could not read linked Discord ids: {e}", exc_info=True)
+        return
+
+    present = {discord_id for discord_id in linked if discord_id.isdigit() and guild_cache.has_member(int(discord_id))}
+    # Forget ids that are no longer linked (e.g. users removed since the last pass)
+    now_seen = (seen | present) & set(linked)
+    if now_seen != seen:
+        try:
+            await run_in_app_context(_save_seen_member_ids, now_seen)
+        except Exception as e:
+            bot_logger.error(f"Guild reconciliation could not save the seen member ids: {e}", exc_info=True)
+            return
+
+    departed = [(int(discord_id), linked[discord_id]) for discord_id in seen - present
+                if discord_id in linked and discord_id.isdigit()]
+    if not departed:
+        never_joined = len(set(linked) - now_seen)
+        bot_logger.debug(f"Guild reconciliation: no departures among {len(linked)} linked Discord accounts "
+                         f"({never_joined} never seen in the guild).")
+        return
+
+    max_removals = flask_app_instance_for_bot.config.get('DISCORD_BOT_RECONCILE_MAX_REMOVALS', 10)
+    if len(departed) > max_removals:
+        msg = (f"Guild reconciliation found {len(departed)} linked users who are not in the Discord server, more than "
+               f"the limit of {max_removals}. No users were removed; check the guild and role configuration.")
+        bot_logger.warning(msg); await send_log_to_discord_channel(msg, level="WARN")
+        return
+
+    bot_logger.info(f"Guild reconciliation: {len(departed)} linked users are no longer in the Discord server.")
+    removed = await handle_departed_members(dict(departed))
+    await send_log_to_discord_channel(f"Guild reconciliation removed {len(removed)} of {len(departed)} users who left the Discord server.", level="INFO")
+
+@reconcile_guild_membership.before_loop
+async def before_reconcile_guild_membership():
+    await bot.wait_until_ready()
+
+
 async def main_bot_runner():
     global flask_app_instance_for_bot # Ensure it's the global one
     if not flask_app_instance_for_bot:
@@ -282,6 +481,8 @@ if __name__ == '__main__':
         if bot and bot.is_ready():
             bot_logger.info("Attempting to close bot connection.")
             loop.run_until_complete(bot.close())
+        if _worker_executor:
+            _worker_executor.shutdown(wait=True)
         # loop.close() # Usually not needed if run_until_complete finishes
         # If flask_app_instance_for_bot has any resources to clean up (like DB engine for direct use), do it here.
         # However, create_app() is lightweight.
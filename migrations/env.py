@@ -1,4 +1,5 @@
 import logging
+import re
 from logging.config import fileConfig
 
 from flask import current_app
@@ -51,6 +52,17 @@ def get_metadata():
     return target_db.metadata
 
 
+# SQLite FTS5 search indexes (media_items_fts, history_logs_fts) and their shadow tables are created
+# by raw DDL rather than the models; keep autogenerate from dropping them
+_FTS_TABLE_RE = re.compile(r'_fts(_(data|idx|docsize|config|content))?$')
+
+
+def include_name(name, type_, parent_names):
+    if type_ == 'table' and name and _FTS_TABLE_RE.search(name):
+        return False
+    return True
+
+
 def run_migrations_offline():
     """Run migrations in 'offline' mode.
 
@@ -65,7 +77,8 @@ def run_migrations_offline():
     """
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
-        url=url, target_metadata=get_metadata(), literal_binds=True
+        url=url, target_metadata=get_metadata(), literal_binds=True,
+        include_name=include_name
     )
 
     with context.begin_transaction():
@@ -93,6 +106,7 @@ def run_migrations_online():
     conf_args = current_app.extensions['migrate'].configure_args
     if conf_args.get("process_revision_directives") is None:
         conf_args["process_revision_directives"] = process_revision_directives
+    conf_args.setdefault("include_name", include_name)
 
     connectable = get_engine()
 
@@ -0,0 +1,28 @@
+"""Add worker_id and heartbeat_at to background_jobs
+
+Revision ID: add_background_job_heartbeat
+Revises: add_geoip_cache
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_background_job_heartbeat'
+down_revision = 'add_geoip_cache'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('background_jobs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('worker_id', sa.String(length=128), nullable=True))
+        batch_op.add_column(sa.Column('heartbeat_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('background_jobs', schema=None) as batch_op:
+        batch_op.drop_column('heartbeat_at')
+        batch_op.drop_column('worker_id')
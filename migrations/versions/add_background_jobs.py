@@ -0,0 +1,50 @@
+"""Add background_jobs table for the persistent admin job queue
+
+Revision ID: add_background_jobs
+Revises: add_deprovision_runs
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_background_jobs'
+down_revision = 'add_deprovision_runs'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('background_jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('job_type', sa.String(length=50), nullable=False),
+    sa.Column('dedupe_key', sa.String(length=255), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('title', sa.String(length=255), nullable=True),
+    sa.Column('params', sa.Text(), nullable=True),
+    sa.Column('result', sa.Text(), nullable=True),
+    sa.Column('progress_current', sa.Integer(), nullable=False),
+    sa.Column('progress_total', sa.Integer(), nullable=True),
+    sa.Column('progress_message', sa.String(length=255), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('cancel_requested', sa.Boolean(), nullable=False),
+    sa.Column('admin_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['admin_id'], ['users.id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('background_jobs', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_background_jobs_dedupe_key'), ['dedupe_key'], unique=False)
+        batch_op.create_index(batch_op.f('ix_background_jobs_status'), ['status'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('background_jobs', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_background_jobs_status'))
+        batch_op.drop_index(batch_op.f('ix_background_jobs_dedupe_key'))
+
+    op.drop_table('background_jobs')
@@ -0,0 +1,67 @@
+"""Add deprovision_runs and deprovision_outcomes tables for batched user removal
+
+Revision ID: add_deprovision_runs
+Revises: add_user_activity_summary
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_deprovision_runs'
+down_revision = 'add_user_activity_summary'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('deprovision_runs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('admin_id', sa.Integer(), nullable=True),
+    sa.Column('total', sa.Integer(), nullable=False),
+    sa.Column('processed', sa.Integer(), nullable=False),
+    sa.Column('removed', sa.Integer(), nullable=False),
+    sa.Column('failed', sa.Integer(), nullable=False),
+    sa.Column('remote_errors', sa.Integer(), nullable=False),
+    sa.Column('message', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['admin_id'], ['users.id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('deprovision_runs', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_deprovision_runs_status'), ['status'], unique=False)
+
+    op.create_table('deprovision_outcomes',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('run_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('user_uuid', sa.String(length=36), nullable=True),
+    sa.Column('user_type', sa.String(length=10), nullable=False),
+    sa.Column('username', sa.String(length=255), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('remote_total', sa.Integer(), nullable=False),
+    sa.Column('remote_removed', sa.Integer(), nullable=False),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['run_id'], ['deprovision_runs.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('deprovision_outcomes', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_deprovision_outcomes_run_id'), ['run_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('deprovision_outcomes', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_deprovision_outcomes_run_id'))
+
+    op.drop_table('deprovision_outcomes')
+    with op.batch_alter_table('deprovision_runs', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_deprovision_runs_status'))
+
+    op.drop_table('deprovision_runs')
@@ -0,0 +1,27 @@
+"""Add media_items.episodes_synced_at for the background episode prefetch
+
+Revision ID: add_episode_prefetch
+Revises: add_history_retention
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_episode_prefetch'
+down_revision = 'add_history_retention'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Left empty for existing shows: the first prefetch run fetches them all, most recently watched first
+    with op.batch_alter_table('media_items', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('episodes_synced_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('media_items', schema=None) as batch_op:
+        batch_op.drop_column('episodes_synced_at')
@@ -0,0 +1,35 @@
+"""Add geoip_cache table for cached GeoIP lookups
+
+Revision ID: add_geoip_cache
+Revises: add_episode_prefetch
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_geoip_cache'
+down_revision = 'add_episode_prefetch'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('geoip_cache',
+        sa.Column('ip_address', sa.String(length=45), nullable=False),
+        sa.Column('data', sa.Text(), nullable=False),
+        sa.Column('source', sa.String(length=20), nullable=False),
+        sa.Column('fetched_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('ip_address')
+    )
+    with op.batch_alter_table('geoip_cache', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_geoip_cache_fetched_at'), ['fetched_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('geoip_cache', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_geoip_cache_fetched_at'))
+
+    op.drop_table('geoip_cache')
@@ -0,0 +1,69 @@
+"""Composite (timestamp, id) / (event_type, timestamp) indexes and full-text search for history_logs
+
+Revision ID: add_history_log_search_index
+Revises: add_media_search_index
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from alembic import op
+from sqlalchemy.exc import OperationalError
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_history_log_search_index'
+down_revision = 'add_media_search_index'
+branch_labels = None
+depends_on = None
+
+_SQLITE_DDL = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS history_logs_fts USING fts5(
+        message, details, content='history_logs', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3')""",
+    """CREATE TRIGGER IF NOT EXISTS history_logs_fts_insert AFTER INSERT ON history_logs BEGIN
+        INSERT INTO history_logs_fts(rowid, message, details) VALUES (new.id, new.message, new.details);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS history_logs_fts_delete AFTER DELETE ON history_logs BEGIN
+        INSERT INTO history_logs_fts(history_logs_fts, rowid, message, details) VALUES ('delete', old.id, old.message, old.details);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS history_logs_fts_update AFTER UPDATE OF message, details ON history_logs BEGIN
+        INSERT INTO history_logs_fts(history_logs_fts, rowid, message, details) VALUES ('delete', old.id, old.message, old.details);
+        INSERT INTO history_logs_fts(rowid, message, details) VALUES (new.id, new.message, new.details);
+    END""",
+    "INSERT INTO history_logs_fts(history_logs_fts) VALUES ('rebuild')",
+)
+
+# Must stay identical to app.services.history_service._pg_document() for the planner to use the index
+_PG_DOCUMENT = "to_tsvector('simple'::regconfig, coalesce(message, '') || ' ' || coalesce(details, ''))"
+
+
+def upgrade():
+    # The single-column indexes are prefixes of the new composite ones
+    op.execute("DROP INDEX IF EXISTS ix_history_logs_timestamp")
+    op.execute("DROP INDEX IF EXISTS ix_history_logs_event_type")
+    op.create_index('ix_history_logs_timestamp_id', 'history_logs', ['timestamp', 'id'], unique=False)
+    op.create_index('ix_history_logs_event_type_timestamp', 'history_logs', ['event_type', 'timestamp'], unique=False)
+
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        try:
+            for statement in _SQLITE_DDL:
+                op.execute(statement)
+        except OperationalError as e:  # SQLite built without FTS5; log search falls back to LIKE
+            print(f"Note: Could not create the history_logs_fts search index - {e}")
+    elif dialect == 'postgresql':
+        op.execute(f"CREATE INDEX ix_history_logs_search ON history_logs USING gin ({_PG_DOCUMENT})")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for trigger in ('history_logs_fts_insert', 'history_logs_fts_delete', 'history_logs_fts_update'):
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        op.execute("DROP TABLE IF EXISTS history_logs_fts")
+    elif dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_history_logs_search")
+
+    op.drop_index('ix_history_logs_event_type_timestamp', table_name='history_logs')
+    op.drop_index('ix_history_logs_timestamp_id', table_name='history_logs')
+    op.create_index('ix_history_logs_event_type', 'history_logs', ['event_type'], unique=False)
+    op.create_index('ix_history_logs_timestamp', 'history_logs', ['timestamp'], unique=False)
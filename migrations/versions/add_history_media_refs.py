@@ -0,0 +1,77 @@
+"""Add library_id, media_item_id and grandparent_media_item_id to media_stream_history
+
+Revision ID: add_history_media_refs
+Revises: add_library_stats_index
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_history_media_refs'
+down_revision = 'add_library_stats_index'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('media_stream_history', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('library_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('media_item_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('grandparent_media_item_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_media_stream_history_library_id', 'media_libraries', ['library_id'], ['id'], ondelete='SET NULL')
+        batch_op.create_foreign_key('fk_media_stream_history_media_item_id', 'media_items', ['media_item_id'], ['id'], ondelete='SET NULL')
+        batch_op.create_foreign_key('fk_media_stream_history_grandparent_media_item_id', 'media_items', ['grandparent_media_item_id'], ['id'], ondelete='SET NULL')
+        batch_op.create_index('ix_media_stream_history_library_id_started', ['library_id', 'started_at'], unique=False)
+        batch_op.create_index('ix_media_stream_history_media_item_started', ['media_item_id', 'started_at'], unique=False)
+        batch_op.create_index('ix_media_stream_history_grandparent_item_started', ['grandparent_media_item_id', 'started_at'], unique=False)
+
+    # Link existing history the same way `flask backfill-history-links` does, so library stats keep their data
+    op.execute("""
+        UPDATE media_stream_history SET media_item_id = (
+            SELECT MIN(i.id) FROM media_items i
+            WHERE i.server_id = media_stream_history.server_id AND i.rating_key = media_stream_history.rating_key)
+        WHERE media_item_id IS NULL AND rating_key IS NOT NULL
+    """)
+    op.execute("""
+        UPDATE media_stream_history SET media_item_id = (
+            SELECT MIN(i.id) FROM media_items i
+            WHERE i.server_id = media_stream_history.server_id AND i.external_id = media_stream_history.rating_key)
+        WHERE media_item_id IS NULL AND rating_key IS NOT NULL
+    """)
+    op.execute("""
+        UPDATE media_stream_history SET library_id = COALESCE(
+            (SELECT i.library_id FROM media_items i WHERE i.id = media_stream_history.media_item_id),
+            (SELECT MIN(l.id) FROM media_libraries l
+             WHERE l.server_id = media_stream_history.server_id AND l.name = media_stream_history.library_name))
+        WHERE library_id IS NULL
+    """)
+    op.execute("""
+        UPDATE media_stream_history SET grandparent_media_item_id = (
+            SELECT MIN(i.id) FROM media_items i
+            WHERE i.library_id = media_stream_history.library_id AND i.item_type IN ('show', 'artist')
+              AND i.title = media_stream_history.grandparent_title)
+        WHERE grandparent_media_item_id IS NULL AND grandparent_title IS NOT NULL AND library_id IS NOT NULL
+    """)
+    op.execute("""
+        UPDATE media_stream_history SET media_item_id = (
+            SELECT MIN(i.id) FROM media_items i
+            WHERE i.library_id = media_stream_history.library_id AND i.item_type = 'movie'
+              AND i.title = media_stream_history.media_title)
+        WHERE media_item_id IS NULL AND media_type = 'movie' AND library_id IS NOT NULL
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('media_stream_history', schema=None) as batch_op:
+        batch_op.drop_index('ix_media_stream_history_grandparent_item_started')
+        batch_op.drop_index('ix_media_stream_history_media_item_started')
+        batch_op.drop_index('ix_media_stream_history_library_id_started')
+        batch_op.drop_constraint('fk_media_stream_history_grandparent_media_item_id', type_='foreignkey')
+        batch_op.drop_constraint('fk_media_stream_history_media_item_id', type_='foreignkey')
+        batch_op.drop_constraint('fk_media_stream_history_library_id', type_='foreignkey')
+        batch_op.drop_column('grandparent_media_item_id')
+        batch_op.drop_column('media_item_id')
+        batch_op.drop_column('library_id')
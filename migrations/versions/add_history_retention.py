@@ -0,0 +1,61 @@
+"""Add stream_history_rollups and history_archives for the retention policy
+
+Revision ID: add_history_retention
+Revises: add_history_log_search_index
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_history_retention'
+down_revision = 'add_history_log_search_index'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('stream_history_rollups',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('user_uuid', sa.String(length=36), nullable=True),
+        sa.Column('server_id', sa.Integer(), nullable=False),
+        sa.Column('library_id', sa.Integer(), nullable=True),
+        sa.Column('media_type', sa.String(length=50), nullable=True),
+        sa.Column('plays', sa.Integer(), nullable=False),
+        sa.Column('duration_seconds', sa.Integer(), nullable=False),
+        sa.Column('watched_seconds', sa.Integer(), nullable=False),
+        sa.Column('untimed_plays', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['server_id'], ['media_servers.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['library_id'], ['media_libraries.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('stream_history_rollups', schema=None) as batch_op:
+        batch_op.create_index('ix_stream_history_rollups_library_day', ['library_id', 'day'], unique=False)
+        batch_op.create_index('ix_stream_history_rollups_day', ['day'], unique=False)
+        batch_op.create_index(batch_op.f('ix_stream_history_rollups_user_uuid'), ['user_uuid'], unique=False)
+
+    op.create_table('history_archives',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('table_name', sa.String(length=64), nullable=False),
+        sa.Column('period', sa.String(length=7), nullable=False),
+        sa.Column('path', sa.String(length=255), nullable=False),
+        sa.Column('first_at', sa.DateTime(), nullable=True),
+        sa.Column('last_at', sa.DateTime(), nullable=True),
+        sa.Column('row_count', sa.Integer(), nullable=False),
+        sa.Column('size_bytes', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('table_name', 'period', name='uq_history_archives_table_period')
+    )
+
+
+def downgrade():
+    op.drop_table('history_archives')
+    with op.batch_alter_table('stream_history_rollups', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_stream_history_rollups_user_uuid'))
+        batch_op.drop_index('ix_stream_history_rollups_day')
+        batch_op.drop_index('ix_stream_history_rollups_library_day')
+    op.drop_table('stream_history_rollups')
@@ -0,0 +1,25 @@
+"""Add (server_id, library_name, started_at) index on media_stream_history for library statistics
+
+Revision ID: add_library_stats_index
+Revises: add_background_jobs
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_library_stats_index'
+down_revision = 'add_background_jobs'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('media_stream_history', schema=None) as batch_op:
+        batch_op.create_index('ix_media_stream_history_library_started', ['server_id', 'library_name', 'started_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('media_stream_history', schema=None) as batch_op:
+        batch_op.drop_index('ix_media_stream_history_library_started')
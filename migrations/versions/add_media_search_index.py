@@ -0,0 +1,71 @@
+"""Add media_items.studio and the full-text media search index
+
+Revision ID: add_media_search_index
+Revises: move_raw_payloads_to_side_table
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.exc import OperationalError
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_media_search_index'
+down_revision = 'move_raw_payloads_to_side_table'
+branch_labels = None
+depends_on = None
+
+_SQLITE_DDL = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS media_items_fts USING fts5(
+        title, sort_title, summary, studio, year,
+        content='media_items', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3')""",
+    """CREATE TRIGGER IF NOT EXISTS media_items_fts_insert AFTER INSERT ON media_items BEGIN
+        INSERT INTO media_items_fts(rowid, title, sort_title, summary, studio, year)
+        VALUES (new.id, new.title, new.sort_title, new.summary, new.studio, new.year);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS media_items_fts_delete AFTER DELETE ON media_items BEGIN
+        INSERT INTO media_items_fts(media_items_fts, rowid, title, sort_title, summary, studio, year)
+        VALUES ('delete', old.id, old.title, old.sort_title, old.summary, old.studio, old.year);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS media_items_fts_update AFTER UPDATE OF title, sort_title, summary, studio, year ON media_items BEGIN
+        INSERT INTO media_items_fts(media_items_fts, rowid, title, sort_title, summary, studio, year)
+        VALUES ('delete', old.id, old.title, old.sort_title, old.summary, old.studio, old.year);
+        INSERT INTO media_items_fts(rowid, title, sort_title, summary, studio, year)
+        VALUES (new.id, new.title, new.sort_title, new.summary, new.studio, new.year);
+    END""",
+    "INSERT INTO media_items_fts(media_items_fts) VALUES ('rebuild')",
+)
+
+# Must stay identical to app.services.media_search._pg_document() for the planner to use the index
+_PG_DOCUMENT = ("to_tsvector('simple'::regconfig, coalesce(title, '') || ' ' || coalesce(sort_title, '') || ' ' || "
+                "coalesce(studio, '') || ' ' || coalesce(CAST(year AS TEXT), '') || ' ' || coalesce(summary, ''))")
+
+
+def upgrade():
+    with op.batch_alter_table('media_items', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('studio', sa.String(length=255), nullable=True))
+
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        try:
+            for statement in _SQLITE_DDL:
+                op.execute(statement)
+        except OperationalError as e:  # SQLite built without FTS5; media search falls back to LIKE
+            print(f"Note: Could not create the media_items_fts search index - {e}")
+    elif dialect == 'postgresql':
+        op.execute(f"CREATE INDEX ix_media_items_search ON media_items USING gin ({_PG_DOCUMENT})")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for trigger in ('media_items_fts_insert', 'media_items_fts_delete', 'media_items_fts_update'):
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        op.execute("DROP TABLE IF EXISTS media_items_fts")
+    elif dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_media_items_search")
+
+    with op.batch_alter_table('media_items', schema=None) as batch_op:
+        batch_op.drop_column('studio')
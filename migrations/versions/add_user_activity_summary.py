@@ -0,0 +1,78 @@
+"""Add user_activity_summary table maintained by the session monitor
+
+Revision ID: add_user_activity_summary
+Revises: add_user_list_indexes
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_user_activity_summary'
+down_revision = 'add_user_list_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user_activity_summary',
+    sa.Column('user_uuid', sa.String(length=36), nullable=False),
+    sa.Column('last_stream_at', sa.DateTime(), nullable=True),
+    sa.Column('last_ip', sa.String(length=45), nullable=True),
+    sa.Column('last_media_title', sa.String(length=255), nullable=True),
+    sa.Column('last_media_type', sa.String(length=50), nullable=True),
+    sa.Column('last_grandparent_title', sa.String(length=255), nullable=True),
+    sa.Column('last_parent_title', sa.String(length=255), nullable=True),
+    sa.Column('last_rating_key', sa.String(length=255), nullable=True),
+    sa.Column('last_server_id', sa.Integer(), nullable=True),
+    sa.Column('total_plays', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('total_seconds', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_uuid'], ['users.uuid'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['last_server_id'], ['media_servers.id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('user_uuid')
+    )
+    with op.batch_alter_table('user_activity_summary', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_user_activity_summary_last_stream_at'), ['last_stream_at'], unique=False)
+
+    # Seed the summary from existing stream history so upgraded installs start consistent
+    op.execute("""
+        INSERT INTO user_activity_summary (user_uuid, total_plays, total_seconds, last_stream_at)
+        SELECT h.user_uuid, COUNT(h.id), COALESCE(SUM(h.duration_seconds), 0), MAX(h.started_at)
+        FROM media_stream_history h
+        JOIN users u ON u.uuid = h.user_uuid
+        GROUP BY h.user_uuid
+    """)
+    op.execute("""
+        UPDATE user_activity_summary SET
+            last_ip = (SELECT h.ip_address FROM media_stream_history h
+                       WHERE h.user_uuid = user_activity_summary.user_uuid AND h.ip_address IS NOT NULL
+                       ORDER BY h.started_at DESC, h.id DESC LIMIT 1),
+            last_media_title = (SELECT h.media_title FROM media_stream_history h
+                                WHERE h.user_uuid = user_activity_summary.user_uuid
+                                ORDER BY h.started_at DESC, h.id DESC LIMIT 1),
+            last_media_type = (SELECT h.media_type FROM media_stream_history h
+                               WHERE h.user_uuid = user_activity_summary.user_uuid
+                               ORDER BY h.started_at DESC, h.id DESC LIMIT 1),
+            last_grandparent_title = (SELECT h.grandparent_title FROM media_stream_history h
+                                      WHERE h.user_uuid = user_activity_summary.user_uuid
+                                      ORDER BY h.started_at DESC, h.id DESC LIMIT 1),
+            last_parent_title = (SELECT h.parent_title FROM media_stream_history h
+                                 WHERE h.user_uuid = user_activity_summary.user_uuid
+                                 ORDER BY h.started_at DESC, h.id DESC LIMIT 1),
+            last_rating_key = (SELECT h.rating_key FROM media_stream_history h
+                               WHERE h.user_uuid = user_activity_summary.user_uuid
+                               ORDER BY h.started_at DESC, h.id DESC LIMIT 1),
+            last_server_id = (SELECT h.server_id FROM media_stream_history h
+                              WHERE h.user_uuid = user_activity_summary.user_uuid
+                              ORDER BY h.started_at DESC, h.id DESC LIMIT 1)
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('user_activity_summary', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_user_activity_summary_last_stream_at'))
+
+    op.drop_table('user_activity_summary')
@@ -0,0 +1,37 @@
+"""Add composite indexes for the SQL-driven users listing
+
+Revision ID: add_user_list_indexes
+Revises: add_overseerr_user_id
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_user_list_indexes'
+down_revision = 'add_overseerr_user_id'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.create_index('ix_users_type_created_at', ['userType', 'created_at'], unique=False)
+        batch_op.create_index('ix_users_type_local_username', ['userType', 'localUsername'], unique=False)
+        batch_op.create_index('ix_users_type_external_username', ['userType', 'external_username'], unique=False)
+        batch_op.create_index('ix_users_linked_join_date', ['linkedUserId', 'service_join_date'], unique=False)
+
+    with op.batch_alter_table('media_stream_history', schema=None) as batch_op:
+        batch_op.create_index('ix_media_stream_history_user_started', ['user_uuid', 'started_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('media_stream_history', schema=None) as batch_op:
+        batch_op.drop_index('ix_media_stream_history_user_started')
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index('ix_users_linked_join_date')
+        batch_op.drop_index('ix_users_type_external_username')
+        batch_op.drop_index('ix_users_type_local_username')
+        batch_op.drop_index('ix_users_type_created_at')
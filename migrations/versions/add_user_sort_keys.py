@@ -0,0 +1,45 @@
+"""Add indexed sort_name/sort_email keys for the users listing
+
+Revision ID: add_user_sort_keys
+Revises: add_background_job_heartbeat
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_user_sort_keys'
+down_revision = 'add_background_job_heartbeat'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('sort_name', sa.String(length=255), nullable=False, server_default=''))
+        batch_op.add_column(sa.Column('sort_email', sa.String(length=255), nullable=False, server_default=''))
+
+    # Existing rows; the User before_insert/before_update hooks keep them current from here on
+    op.execute("""
+        UPDATE users SET
+            sort_name = LOWER(COALESCE(CASE WHEN "userType" = 'SERVICE' THEN external_username ELSE "localUsername" END, '')),
+            sort_email = LOWER(COALESCE(CASE WHEN "userType" = 'SERVICE' THEN external_email ELSE email END, ''))
+    """)
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.create_index('ix_users_sort_name', ['sort_name', 'id'], unique=False)
+        batch_op.create_index('ix_users_type_sort_name', ['userType', 'sort_name', 'id'], unique=False)
+        batch_op.create_index('ix_users_sort_email', ['sort_email', 'id'], unique=False)
+        batch_op.create_index('ix_users_type_sort_email', ['userType', 'sort_email', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index('ix_users_type_sort_email')
+        batch_op.drop_index('ix_users_sort_email')
+        batch_op.drop_index('ix_users_type_sort_name')
+        batch_op.drop_index('ix_users_sort_name')
+        batch_op.drop_column('sort_email')
+        batch_op.drop_column('sort_name')
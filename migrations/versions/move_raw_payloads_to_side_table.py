@@ -0,0 +1,133 @@
+"""Move raw service payloads to a compressed raw_payloads side table
+
+Revision ID: move_raw_payloads_to_side_table
+Revises: add_history_media_refs
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+import json
+import zlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'move_raw_payloads_to_side_table'
+down_revision = 'add_history_media_refs'
+branch_labels = None
+depends_on = None
+
+# (table, column) pairs whose JSON moves to raw_payloads; the field name is the column name
+_PAYLOAD_COLUMNS = (
+    ('users', 'user_raw_data'),
+    ('users', 'stream_raw_data'),
+    ('media_stream_history', 'service_data'),
+    ('media_items', 'extra_metadata'),
+)
+_BATCH_SIZE = 1000
+
+
+def _first_number(raw, *keys):
+    for key in keys:
+        if raw.get(key) is not None:
+            try:
+                return int(raw[key])
+            except (TypeError, ValueError):
+                return None
+    return None
+
+
+def _copy_payloads(connection, payloads, table, column):
+    last_id = 0
+    while True:
+        rows = connection.execute(sa.text(
+            f"SELECT id, {column} FROM {table} WHERE id > :last_id AND {column} IS NOT NULL ORDER BY id LIMIT :limit"
+        ), {'last_id': last_id, 'limit': _BATCH_SIZE}).fetchall()
+        if not rows:
+            return
+        inserts = []
+        numbering = []
+        for row_id, value in rows:
+            last_id = row_id
+            if isinstance(value, (bytes, str)):
+                try:
+                    value = json.loads(value)
+                except ValueError:
+                    continue
+            if not value:
+                continue
+            raw = json.dumps(value, separators=(',', ':'), default=str).encode('utf-8')
+            inserts.append({'owner_type': table, 'owner_id': row_id, 'field': column, 'encoding': 'zlib',
+                            'data': zlib.compress(raw, 6), 'raw_size': len(raw)})
+            if table == 'media_items' and isinstance(value, dict):
+                edition = value.get('edition')
+                numbering.append({
+                    'row_id': row_id,
+                    'season': _first_number(value, 'seasonNumber', 'season_number', 'season', 'parentIndex'),
+                    'episode': _first_number(value, 'episodeNumber', 'episode_number', 'episode', 'index'),
+                    'edition': str(edition)[:255] if edition else None,
+                })
+        if inserts:
+            connection.execute(payloads.insert(), inserts)
+        if numbering:
+            connection.execute(sa.text(
+                "UPDATE media_items SET season_number = :season, episode_number = :episode, edition = :edition WHERE id = :row_id"
+            ), numbering)
+
+
+def upgrade():
+    payloads = op.create_table('raw_payloads',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('owner_type', sa.String(length=64), nullable=False),
+        sa.Column('owner_id', sa.Integer(), nullable=False),
+        sa.Column('field', sa.String(length=64), nullable=False),
+        sa.Column('encoding', sa.String(length=16), nullable=False),
+        sa.Column('data', sa.LargeBinary(), nullable=False),
+        sa.Column('raw_size', sa.Integer(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('owner_type', 'owner_id', 'field', name='uq_raw_payloads_owner_field')
+    )
+    with op.batch_alter_table('media_items', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('season_number', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('episode_number', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('edition', sa.String(length=255), nullable=True))
+
+    connection = op.get_bind()
+    for table, column in _PAYLOAD_COLUMNS:
+        _copy_payloads(connection, payloads, table, column)
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('stream_raw_data')
+        batch_op.drop_column('user_raw_data')
+    with op.batch_alter_table('media_stream_history', schema=None) as batch_op:
+        batch_op.drop_column('service_data')
+    with op.batch_alter_table('media_items', schema=None) as batch_op:
+        batch_op.drop_column('extra_metadata')
+
+
+def downgrade():
+    with op.batch_alter_table('media_items', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('extra_metadata', sa.JSON(), nullable=True))
+    with op.batch_alter_table('media_stream_history', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('service_data', sa.Text(), nullable=True))
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('user_raw_data', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('stream_raw_data', sa.Text(), nullable=True))
+
+    connection = op.get_bind()
+    rows = connection.execute(sa.text("SELECT owner_type, owner_id, field, encoding, data FROM raw_payloads")).fetchall()
+    known = set(_PAYLOAD_COLUMNS)
+    for owner_type, owner_id, field, encoding, data in rows:
+        if (owner_type, field) not in known:
+            continue
+        value = zlib.decompress(data) if encoding == 'zlib' else data
+        connection.execute(sa.text(f"UPDATE {owner_type} SET {field} = :value WHERE id = :owner_id"),
+                           {'value': value.decode('utf-8'), 'owner_id': owner_id})
+
+    with op.batch_alter_table('media_items', schema=None) as batch_op:
+        batch_op.drop_column('edition')
+        batch_op.drop_column('episode_number')
+        batch_op.drop_column('season_number')
+    op.drop_table('raw_payloads')
@@ -1,8 +1,10 @@
 import os
 import logging
+import click
 from app import create_app, db
 from app.models import Setting, User # Import models that might be needed for initial checks or commands
 from flask_migrate import Migrate
+from app.bench.cli import bench_cli
 
 # Custom colored logging formatter
 class ColoredFormatter(logging.Formatter):
@@ -64,6 +66,7 @@ def setup_colored_logging(app):
 # then potentially overridden by database settings once the app is initialized.
 app = create_app()
 migrate = Migrate(app, db)
+app.cli.add_command(bench_cli)
 
 # Setup colored logging for better visibility in Docker logs
 setup_colored_logging(app)
@@ -112,6 +115,128 @@ def seed_initial_settings_command():
     #     print("Default theme setting already exists.")
     print("Seed initial settings command - implement as needed.")
 
+@app.cli.command("rebuild-activity-summary")
+def rebuild_activity_summary_command():
+    """
+    Rebuilds the per-user activity summary (plays, watched time, last stream)
+    from the full stream history. The session monitor keeps it current; run
+    this after importing history or if the summary looks out of sync.
+    """
+    from app.services.activity_summary_service import rebuild_activity_summaries
+    rebuilt = rebuild_activity_summaries()
+    print(f"Rebuilt activity summary for {rebuilt} users.")
+
+@app.cli.command("backfill-history-links")
+def backfill_history_links_command():
+    """
+    Links existing stream history rows to their library, media item and show
+    (library_id, media_item_id, grandparent_media_item_id). New rows are linked
+    by the session monitor; run this after the first library content sync or
+    after importing history.
+    """
+    from app.services.media_item_index import backfill_history_links
+    result = backfill_history_links()
+    print(result['message'])
+
+@app.cli.command("rebuild-media-search")
+def rebuild_media_search_command():
+    """
+    Recreates the full-text media search index (SQLite FTS5 table and its
+    triggers) and refills it from media_items. Sync keeps it current; run this
+    after a migration that rebuilt the media_items table.
+    """
+    from app.services.media_search import rebuild_index
+    print(f"Media search index rebuilt (backend: {rebuild_index()}).")
+
+
+@app.cli.command("rebuild-history-search")
+def rebuild_history_search_command():
+    """
+    Recreates the full-text index of the history log viewer (SQLite FTS5
+    table and its triggers) and refills it from history_logs. Run this after
+    a migration that rebuilt the history_logs table.
+    """
+    from app.services.history_service import rebuild_search_index
+    print(f"History log search index rebuilt (backend: {rebuild_search_index()}).")
+
+
+@app.cli.command("import-profile")
+@click.option('--top', type=int, default=25, show_default=True, help="Number of modules to list.")
+@click.option('--config', 'config_name', default='testing', show_default=True,
+              help="Config to create the app with. 'testing' uses an empty in-memory database; "
+                   "'production' reads the real one, so enabled plugins are discovered too.")
+def import_profile_command(top, config_name):
+    """
+    Shows what a new worker imports at startup: the slowest modules by
+    cumulative import time, the total, the peak memory of the process and
+    any per-service client library (plexapi, the Jellyfin client, ...) that
+    was imported before it was needed.
+    """
+    from app.utils.import_profile import profile_startup
+    report = profile_startup(config_name)
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for module in sorted(report['modules'], key=lambda m: m['cumulative_us'], reverse=True)[:top]:
+        print(f"{module['cumulative_us'] / 1000:>14.1f} {module['self_us'] / 1000:>9.1f}  {'  ' * module['depth']}{module['name']}")
+    print(f"\nImport total: {report['total_us'] / 1000:.0f} ms for {len(report['modules'])} modules.")
+    if report['max_rss_kb']:
+        print(f"Peak RSS after create_app: {report['max_rss_kb'] / 1024:.1f} MiB.")
+    if report['heavy']:
+        print(f"Imported at startup although only needed on first use: {', '.join(report['heavy'])}")
+    else:
+        print("No per-service client library was imported at startup.")
+
+
+@app.cli.group("retention")
+def retention_cli():
+    """Archive and export old stream history and audit log rows."""
+
+
+@retention_cli.command("run")
+@click.option('--stream-days', type=int, default=None, help="Override STREAM_HISTORY_RETENTION_DAYS for this run.")
+@click.option('--log-days', type=int, default=None, help="Override HISTORY_LOG_RETENTION_DAYS for this run.")
+def retention_run_command(stream_days, log_days):
+    """
+    Rolls stream history older than the retention period into daily totals,
+    archives the raw rows to compressed files and deletes them in batches.
+    The same runs daily in the background when a retention period is set.
+    """
+    from app.services import retention_service
+    for key, value in (('STREAM_HISTORY_RETENTION_DAYS', stream_days), ('HISTORY_LOG_RETENTION_DAYS', log_days)):
+        if value is not None:
+            app.config[key] = value
+    result = retention_service.apply_retention(
+        progress_callback=lambda done, total, message: print(f"  {message} ({done}/{total})"))
+    print(result['message'])
+
+
+@retention_cli.command("status")
+def retention_status_command():
+    """Shows live, expired and archived row counts per table."""
+    import json
+    from app.services import retention_service
+    print(json.dumps(retention_service.archive_status(), indent=2))
+
+
+@retention_cli.command("export")
+@click.argument('table', type=click.Choice(['media_stream_history', 'history_logs']))
+@click.option('--since', type=click.DateTime(), default=None, help="Only rows at or after this UTC time.")
+@click.option('--until', type=click.DateTime(), default=None, help="Only rows before this UTC time.")
+@click.option('--archived-only', is_flag=True, help="Skip rows still in the live table.")
+@click.option('--output', '-o', type=click.Path(dir_okay=False), required=True,
+              help="JSONL file to write; gzip-compressed if it ends in .gz.")
+def retention_export_command(table, since, until, archived_only, output):
+    """Exports archived and live rows of TABLE as JSON lines."""
+    import gzip
+    import json
+    from app.services import retention_service
+    opener = gzip.open if output.endswith('.gz') else open
+    count = 0
+    with opener(output, 'wt', encoding='utf-8') as output_file:
+        for row in retention_service.export_rows(table, since, until, include_live=not archived_only):
+            output_file.write(json.dumps(row, separators=(',', ':')) + '\n')
+            count += 1
+    print(f"Exported {count} {table} rows to {output}.")
+
 
 if __name__ == '__main__':
     # This is for running with `python run.py` (Flask's development server)
@@ -0,0 +1,65 @@
+import pytest
+
+from app import create_app
+from app.extensions import db
+from app.models import Setting, User
+from app.models_media_services import MediaServer, ServiceType
+from app.models_plugins import Plugin, PluginStatus
+from app.services.plugin_manager import plugin_manager
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv('MUM_BENCH_DATABASE_URL', 'sqlite://')
+    app = create_app('benchmark')
+    app.config['RETENTION_ARCHIVE_DIR'] = str(tmp_path / 'archives')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def server(app):
+    server = MediaServer(server_nickname='plex-1', server_name='Plex', service_type=ServiceType.PLEX,
+                         url='http://plex.invalid', api_key='key')
+    db.session.add(server)
+    db.session.commit()
+    return server
+
+
+@pytest.fixture
+def make_service_user(server):
+    def make(username, **attributes):
+        user = User.create_service_user(server.id, f'ext-{username}', username)
+        for name, value in attributes.items():
+            setattr(user, name, value)
+        db.session.add(user)
+        db.session.commit()
+        return user
+    return make
+
+
+@pytest.fixture
+def owner_id(server):
+    """The owner of an instance past the setup wizard, so requests aren't redirected to setup."""
+    owner = User.create_owner('owner', 'password')
+    db.session.add(owner)
+    db.session.commit()
+    Setting.set('APP_BASE_URL', 'http://localhost')
+    plugin_manager.initialize_core_plugins()
+    Plugin.query.filter_by(plugin_id='plex').first().status = PluginStatus.ENABLED
+    db.session.commit()
+    return owner.get_id()
+
+
+@pytest.fixture
+def client_for(app):
+    """A test client signed in as the user with ``user_id``."""
+    def make(user_id):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+        return client
+    return make
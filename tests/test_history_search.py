@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.extensions import db
+from app.models import EventType, HistoryLog
+from app.services import history_service
+from app.utils import fulltext_search
+
+
+@pytest.fixture(autouse=True)
+def fresh_backends(app):
+    # Every test database has the same URL, so forget what the previous one had
+    fulltext_search._backend_by_index.clear()
+    yield
+    fulltext_search._backend_by_index.clear()
+
+
+@pytest.fixture
+def logs(app):
+    start = datetime(2026, 1, 1)
+    for index in range(7):
+        db.session.add(HistoryLog(timestamp=start + timedelta(minutes=index), event_type=EventType.SETTING_CHANGE,
+                                  message=f'Changed setting {index}', details={'key': f'plugin_{index % 2}'}))
+    # Two entries with the same timestamp, so the cursors have to break the tie on id
+    db.session.add(HistoryLog(timestamp=start + timedelta(minutes=6), event_type=EventType.ERROR_GENERAL,
+                              message='Sync failed for Jellyfin', details={'error': 'timeout'}))
+    db.session.commit()
+
+
+def test_history_search_matches_message_and_details_prefixes(logs):
+    assert history_service.search_backend() == 'fts5'
+
+    def count(search):
+        return HistoryLog.query.filter(history_service.message_filter(search)).count()
+
+    assert count('chang sett') == 7
+    assert count('jelly') == 1
+    assert count('timeo') == 1
+    assert count('plugin_1') == 3
+    assert count('sync setting') == 0
+    assert history_service.message_filter('') is None
+
+
+def test_history_cursors_walk_every_log_once_in_both_directions(logs):
+    query = HistoryLog.query
+    expected = [log.id for log in query.order_by(HistoryLog.timestamp.desc(), HistoryLog.id.desc())]
+
+    pages = [history_service.paginate_history_logs(query, per_page=3)]
+    while pages[-1].has_next:
+        pages.append(history_service.paginate_history_logs(query, page=pages[-1].next_num, per_page=3,
+                                                           after=pages[-1].next_cursor, total=pages[-1].total))
+    assert [log.id for page in pages for log in page.items] == expected
+
+    back = history_service.paginate_history_logs(query, page=1, per_page=3, before=pages[1].prev_cursor)
+    assert [log.id for log in back.items] == expected[:3]
+    assert history_service.paginate_history_logs(query, per_page=3, after='not-a-cursor').items == pages[0].items
+
+
+def test_history_index_rebuild_picks_up_existing_logs(logs):
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql("INSERT INTO history_logs_fts(history_logs_fts) VALUES ('delete-all')")
+    assert HistoryLog.query.filter(history_service.message_filter('jellyfin')).count() == 0
+
+    assert history_service.rebuild_search_index() == 'fts5'
+    assert HistoryLog.query.filter(history_service.message_filter('jellyfin')).count() == 1
@@ -0,0 +1,42 @@
+import pytest
+
+from app.extensions import db
+from app.models import BackgroundJob, Role, User, UserType
+
+
+@pytest.fixture
+def purge_job(owner_id):
+    job = BackgroundJob(job_type='deprovision_run', title='User removal', status='queued',
+                        params={'run_id': 1}, admin_id=User.query.filter_by(userType=UserType.OWNER).one().id)
+    db.session.add(job)
+    db.session.commit()
+    return job.id
+
+
+def _local_user(username, permissions=()):
+    user = User.create_local_user(username, 'password')
+    if permissions:
+        user.roles.append(Role(name=f'{username}-role', permissions=list(permissions)))
+    db.session.add(user)
+    db.session.commit()
+    return user.get_id()
+
+
+@pytest.mark.parametrize('url', ['/admin/api/jobs/{}', '/admin/api/jobs/{}/progress'])
+def test_jobs_are_hidden_from_local_users_without_the_permission(client_for, purge_job, url):
+    client = client_for(_local_user('viewer'))
+
+    assert client.get(url.format(purge_job)).status_code == 404
+
+
+def test_local_users_without_the_permission_cannot_cancel(client_for, purge_job):
+    response = client_for(_local_user('viewer')).post(f'/admin/api/jobs/{purge_job}/cancel')
+
+    assert response.status_code == 404
+    assert db.session.get(BackgroundJob, purge_job).status == 'queued'
+
+
+def test_owner_and_permitted_admins_see_the_job(client_for, owner_id, purge_job):
+    assert client_for(owner_id).get(f'/admin/api/jobs/{purge_job}').json['params'] == {'run_id': 1}
+    admin = client_for(_local_user('purger', permissions=['purge_users']))
+    assert admin.get(f'/admin/api/jobs/{purge_job}').status_code == 200
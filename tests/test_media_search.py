@@ -0,0 +1,81 @@
+import pytest
+
+from app.extensions import db
+from app.models_media_services import MEDIA_SEARCH_FTS_TABLE, MediaItem, MediaLibrary
+from app.services import media_search
+from app.utils import fulltext_search
+
+
+@pytest.fixture(autouse=True)
+def fresh_backends(app):
+    # Every test database has the same URL, so forget what the previous one had
+    fulltext_search._backend_by_index.clear()
+    yield
+    fulltext_search._backend_by_index.clear()
+
+
+@pytest.fixture
+def media(server):
+    library = MediaLibrary(server_id=server.id, external_id='1', name='Movies', library_type='movies')
+    db.session.add(library)
+    db.session.flush()
+
+    def add(title, item_type='movie', **fields):
+        item = MediaItem(server_id=server.id, library_id=library.id, external_id=title, title=title,
+                         sort_title=title.lower(), item_type=item_type, **fields)
+        db.session.add(item)
+        return item
+
+    add('Star Wars', year=1977, summary='A farm boy joins the rebellion.')
+    add('Star Trek', year=2009)
+    add('Wars of the Roses', summary='Two houses fight over the crown.')
+    add('Space Documentary', summary='About star wars and other stories.')
+    add('Star Wars Rebels Pilot', item_type='episode')
+    db.session.commit()
+    return add
+
+
+def _titles(results):
+    return [item.title for item, _ in results]
+
+
+def test_media_search_matches_every_word_as_a_prefix(media):
+    assert media_search.backend() == 'fts5'
+
+    assert _titles(media_search.search('star wa')) == ['Star Wars', 'Space Documentary']
+    assert set(_titles(media_search.search('sta'))) == {'Star Wars', 'Star Trek', 'Space Documentary'}
+    assert media_search.search('star zzz') == []
+    assert media_search.search('  ') == []
+
+
+def test_media_search_ranks_title_matches_first_and_skips_episodes_by_default(media):
+    assert _titles(media_search.search('star wars'))[0] == 'Star Wars'
+    assert 'Star Wars Rebels Pilot' not in _titles(media_search.search('rebel'))
+    assert _titles(media_search.search('rebel', include_episodes=True)) == ['Star Wars Rebels Pilot', 'Star Wars']
+
+
+def test_media_index_follows_inserts_updates_and_deletes(media):
+    item = media('Alien')
+    db.session.commit()
+    assert _titles(media_search.search('ali')) == ['Alien']
+
+    item.title = 'Aliens'
+    db.session.commit()
+    assert _titles(media_search.search('aliens')) == ['Aliens']
+
+    db.session.delete(item)
+    db.session.commit()
+    assert media_search.search('ali') == []
+
+
+def test_media_search_falls_back_to_like_until_the_index_is_rebuilt(media):
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql(f"DROP TABLE {MEDIA_SEARCH_FTS_TABLE}")
+    fulltext_search._backend_by_index.clear()
+
+    assert media_search.backend() == 'like'
+    assert _titles(media_search.search('star wa')) == ['Star Wars', 'Space Documentary']
+    assert MediaItem.query.filter(media_search.match_filter('trek')).count() == 1
+
+    assert media_search.rebuild_index() == 'fts5'
+    assert _titles(media_search.search('trek')) == ['Star Trek']
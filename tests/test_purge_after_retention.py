@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.extensions import db
+from app.models_media_services import MediaStreamHistory, UserActivitySummary
+from app.services import activity_summary_service, retention_service, user_service
+
+
+@pytest.fixture
+def users(server, make_service_user):
+    now = datetime.utcnow()
+    recent = make_service_user('recent', created_at=now - timedelta(days=400))
+    lapsed = make_service_user('lapsed', created_at=now - timedelta(days=400))
+    never = make_service_user('never', created_at=now - timedelta(days=400))
+    for user, days in ((recent, 45), (lapsed, 120)):
+        started_at = now - timedelta(days=days)
+        db.session.add(MediaStreamHistory(user_uuid=user.uuid, server_id=server.id, started_at=started_at,
+                                          stopped_at=started_at + timedelta(minutes=10), media_title='Movie',
+                                          duration_seconds=600))
+    db.session.commit()
+    activity_summary_service.rebuild_activity_summaries()
+
+    assert retention_service.apply_table_retention('media_stream_history', days=30) == 2
+    assert MediaStreamHistory.query.count() == 0
+    return {'recent': recent.id, 'lapsed': lapsed.id, 'never': never.id}
+
+
+def _eligible_ids(users):
+    return user_service.revalidate_purge_selection(list(users.values()), 90, exclude_sharers=False,
+                                                   exclude_whitelisted=False)
+
+
+def test_archived_streams_still_count_as_activity(users):
+    assert _eligible_ids(users) == {users['lapsed'], users['never']}
+
+
+def test_archived_rollups_count_without_an_activity_summary(users):
+    UserActivitySummary.query.delete()
+    db.session.commit()
+
+    assert _eligible_ids(users) == {users['lapsed'], users['never']}
+
+
+def test_preview_reports_the_archived_last_stream(users):
+    preview = user_service.preview_purge_inactive_users(90, exclude_sharers=False, exclude_whitelisted=False)
+
+    assert preview['total'] == 2
+    lapsed = next(candidate for candidate in preview['eligible_users'] if candidate['id'] == users['lapsed'])
+    assert lapsed['last_streamed_at'] is not None
@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.extensions import db
+from app.models import User
+from app.models_media_services import MediaStreamHistory
+from app.services import user_service
+
+NOW = datetime.utcnow()
+
+
+@pytest.fixture
+def users(server, make_service_user):
+    old = NOW - timedelta(days=400)
+    specs = {
+        'active': dict(streamed_days_ago=5),
+        'idle': dict(streamed_days_ago=200),
+        'idle_whitelisted': dict(streamed_days_ago=200, is_purge_whitelisted=True),
+        'idle_sharer': dict(streamed_days_ago=200, shares_back=True),
+        'never_old': dict(),
+        'never_new': dict(created_at=NOW - timedelta(days=3)),
+    }
+    ids = {}
+    for name, spec in specs.items():
+        days = spec.pop('streamed_days_ago', None)
+        spec.setdefault('created_at', old)
+        user = make_service_user(name, **spec)
+        if days is not None:
+            # An older stream as well, so the per-user MAX is what counts
+            for offset in (days, days + 30):
+                db.session.add(MediaStreamHistory(user_uuid=user.uuid, server_id=server.id, media_title='Movie',
+                                                  started_at=NOW - timedelta(days=offset)))
+        ids[name] = user.id
+    local = User.create_local_user('local', 'password')
+    local.created_at = old
+    db.session.add(local)
+    db.session.commit()
+    return ids
+
+
+def _eligible(ids, **options):
+    options = {'exclude_sharers': False, 'exclude_whitelisted': False, **options}
+    found = {user['id'] for user in user_service.get_users_eligible_for_purge(90, **options)}
+    return {name for name, user_id in ids.items() if user_id in found}
+
+
+def test_inactive_and_old_never_streamed_service_users_are_eligible(users):
+    assert _eligible(users) == {'idle', 'idle_whitelisted', 'idle_sharer', 'never_old'}
+
+
+def test_exclusion_checkboxes(users):
+    assert _eligible(users, exclude_whitelisted=True, exclude_sharers=True) == {'idle', 'never_old'}
+
+
+def test_ignoring_creation_date_includes_new_never_streamed_users(users):
+    assert _eligible(users, ignore_creation_date_for_never_streamed=True) == \
+        {'idle', 'idle_whitelisted', 'idle_sharer', 'never_old', 'never_new'}
+
+
+def test_preview_pages_longest_inactive_first(users):
+    first = user_service.preview_purge_inactive_users(90, False, False, page=1, per_page=3)
+    second = user_service.preview_purge_inactive_users(90, False, False, page=2, per_page=3)
+
+    assert first['total'] == 4 and first['has_next'] and not second['has_next']
+    assert first['eligible_users'][0]['id'] == users['never_old']  # created 400 days ago
+    seen = [user['id'] for user in first['eligible_users'] + second['eligible_users']]
+    assert sorted(seen) == sorted(users[name] for name in ('idle', 'idle_whitelisted', 'idle_sharer', 'never_old'))
+
+
+def test_revalidation_only_keeps_still_eligible_selected_users(users):
+    selected = [users['idle'], users['active'], users['never_new']]
+
+    assert user_service.revalidate_purge_selection(selected, 90, False, False) == {users['idle']}
+
+
+def test_threshold_must_be_positive(app):
+    with pytest.raises(ValueError):
+        user_service.get_users_eligible_for_purge(0, False, False)
@@ -0,0 +1,89 @@
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from app.extensions import db
+from app.models import User
+from app.models_media_services import MediaServer, ServiceType
+from app.models_payloads import RawPayload
+
+
+@contextmanager
+def payload_selects():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and 'raw_payloads' in statement:
+            statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+
+def _payload_rows(user_id):
+    return RawPayload.query.filter_by(owner_type='users', owner_id=user_id, field='user_raw_data').count()
+
+
+def test_assigned_payload_is_written_on_flush_and_reloaded_after_commit(make_service_user):
+    user = make_service_user('alice', user_raw_data={'thumb': '/a.png'})
+    assert _payload_rows(user.id) == 1
+
+    user.user_raw_data = {'thumb': '/b.png'}
+    db.session.commit()  # A payload-only change still flushes
+    db.session.expire_all()
+    assert db.session.get(User, user.id).user_raw_data == {'thumb': '/b.png'}
+
+
+def test_empty_payload_and_deleted_owner_leave_no_rows(make_service_user):
+    user = make_service_user('alice', user_raw_data={'thumb': '/a.png'})
+
+    user.user_raw_data = {}
+    db.session.commit()
+    assert _payload_rows(user.id) == 0
+    assert user.user_raw_data == {}
+
+    user.user_raw_data = {'thumb': '/c.png'}
+    db.session.commit()
+    db.session.delete(user)
+    db.session.commit()
+    assert _payload_rows(user.id) == 0
+
+
+def test_rollback_discards_an_unflushed_assignment(make_service_user):
+    user = make_service_user('alice', user_raw_data={'thumb': '/a.png'})
+    user.user_raw_data = {'thumb': '/pending.png'}
+
+    db.session.rollback()
+
+    assert user.user_raw_data == {'thumb': '/a.png'}
+    db.session.commit()
+    assert db.session.get(User, user.id).user_raw_data == {'thumb': '/a.png'}
+
+
+@pytest.mark.parametrize('view', ['cards', 'table'])
+def test_users_list_loads_raw_payloads_in_one_query(client_for, owner_id, server, make_service_user, view):
+    abs_server = MediaServer(server_nickname='abs-1', server_name='ABS', service_type=ServiceType.AUDIOBOOKSHELF,
+                             url='http://abs.invalid', api_key='key')
+    db.session.add(abs_server)
+    db.session.commit()
+    for index in range(4):
+        # Cards show an owner badge from the raw payload of Audiobookshelf users
+        abs_user = User.create_service_user(abs_server.id, f'abs-{index}', f'listener{index}')
+        abs_user.user_raw_data = {'type': 'root'}
+        # Local users without a stored avatar take the Plex thumb from their linked account's payload
+        local_user = User.create_local_user(f'local{index}', 'password')
+        db.session.add_all([abs_user, local_user])
+        db.session.commit()
+        make_service_user(f'plex{index}', linkedUserId=local_user.uuid, user_raw_data={'thumb': f'https://plex.tv/{index}.png'})
+    db.session.expire_all()
+
+    with payload_selects() as statements:
+        response = client_for(owner_id).get(f'/admin/users/?view={view}', headers={'HX-Request': 'true'})
+
+    assert response.status_code == 200
+    assert 'local3' in response.get_data(as_text=True)
+    assert len(statements) <= 1
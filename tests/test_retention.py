@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.extensions import db
+from app.models_media_services import MediaStreamHistory, StreamHistoryRollup
+from app.models_payloads import RawPayload
+from app.services import activity_summary_service, retention_service
+
+NOW = datetime.utcnow()
+
+
+@pytest.fixture
+def history(app, server, make_service_user):
+    app.config.update(RETENTION_BATCH_SIZE=2, RETENTION_BATCH_PAUSE_SECONDS=0)
+    user = make_service_user('alice')
+    old_day = (NOW - timedelta(days=60)).replace(hour=12, minute=0, second=0, microsecond=0)
+
+    def stream(started_at, duration=None, stopped=True, **extra):
+        row = MediaStreamHistory(user_uuid=user.uuid, server_id=server.id, media_title='Movie', media_type='movie',
+                                 started_at=started_at, duration_seconds=duration,
+                                 stopped_at=started_at + timedelta(minutes=5) if stopped else None, **extra)
+        db.session.add(row)
+        return row
+
+    # Three plays on one old day (one without a duration), one more the day after, and recent plays
+    archived = stream(old_day, 600, service_data={'session': 'a'})
+    stream(old_day + timedelta(hours=1), 300)
+    stream(old_day + timedelta(hours=2), None, view_offset_at_end_seconds=120)
+    stream(old_day + timedelta(days=1), 60)
+    stream(NOW - timedelta(days=2), 900)
+    # Never stopped, just past the cutoff: still inside the grace period for open streams
+    stream(NOW - timedelta(days=30, hours=2), None, stopped=False)
+    db.session.commit()
+    activity_summary_service.rebuild_activity_summaries()
+    return {'user_uuid': user.uuid, 'old_day': old_day.date(), 'archived_id': archived.id}
+
+
+def test_expired_rows_are_rolled_up_archived_and_deleted(history):
+    summary_before = activity_summary_service.get_activity_summary(history['user_uuid'])
+    totals_before = (summary_before.total_plays, summary_before.total_seconds)
+
+    assert retention_service.apply_table_retention('media_stream_history', days=30) == 4
+
+    assert MediaStreamHistory.query.count() == 2
+    rollups = {rollup.day: rollup for rollup in StreamHistoryRollup.query.all()}
+    first_day = rollups[history['old_day']]
+    assert (first_day.plays, first_day.duration_seconds, first_day.watched_seconds, first_day.untimed_plays) == (3, 900, 1020, 0)
+    assert rollups[history['old_day'] + timedelta(days=1)].plays == 1
+
+    # The service payload went into the archive with its row and is gone from the side table
+    archived = list(retention_service.iter_archived_rows('media_stream_history'))
+    assert sorted(row['id'] for row in archived) == sorted({row['id'] for row in archived})
+    assert len(archived) == 4
+    assert next(row for row in archived if row['id'] == history['archived_id'])['service_data'] == {'session': 'a'}
+    assert RawPayload.query.filter_by(owner_type='media_stream_history').count() == 0
+
+    activity_summary_service.rebuild_activity_summaries()
+    summary_after = activity_summary_service.get_activity_summary(history['user_uuid'])
+    assert (summary_after.total_plays, summary_after.total_seconds) == totals_before
+
+
+def test_export_returns_archived_then_live_rows(history):
+    retention_service.apply_table_retention('media_stream_history', days=30)
+
+    exported = list(retention_service.export_rows('media_stream_history'))
+
+    assert len(exported) == 6
+    assert [row['started_at'] for row in exported[:4]] == sorted(row['started_at'] for row in exported[:4])
+
+
+def test_a_second_run_only_adds_newly_expired_rows(history):
+    retention_service.apply_table_retention('media_stream_history', days=30)
+
+    assert retention_service.apply_table_retention('media_stream_history', days=30) == 0
+    # The recent play, and the open stream now that it is a day past the cutoff
+    assert retention_service.apply_table_retention('media_stream_history', days=1) == 2
+    assert MediaStreamHistory.query.count() == 0
+    assert sum(rollup.plays for rollup in StreamHistoryRollup.query.all()) == 6
+    assert len(list(retention_service.iter_archived_rows('media_stream_history'))) == 6
+
+
+def test_zero_days_keeps_everything(history):
+    assert retention_service.apply_table_retention('media_stream_history', days=0) == 0
+    assert MediaStreamHistory.query.count() == 6
@@ -0,0 +1,56 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from app.extensions import db
+from app.models_media_services import MediaStreamHistory, StreamHistoryRollup
+from app.services import activity_summary_service
+
+
+@pytest.fixture
+def service_user(server, owner_id, make_service_user):
+    user = make_service_user('alice')
+
+    now = datetime.utcnow()
+    db.session.add_all([
+        MediaStreamHistory(user_uuid=user.uuid, server_id=server.id, started_at=now - timedelta(days=days),
+                           media_title='Movie', duration_seconds=600)
+        for days in (1, 40)
+    ])
+    # Plays the retention policy archived long ago
+    db.session.add(StreamHistoryRollup(day=date.today() - timedelta(days=400), user_uuid=user.uuid, server_id=server.id,
+                                       plays=7, duration_seconds=4200, watched_seconds=4200, untimed_plays=0))
+    db.session.commit()
+    activity_summary_service.rebuild_activity_summaries([user.uuid])
+    return owner_id, user.uuid
+
+
+def _delete_history(client_for, owner_id, time_period):
+    return client_for(owner_id).post('/plex-1/alice/delete_history', data={'time_period': time_period})
+
+
+def test_deleting_all_history_zeroes_totals_including_archived_plays(client_for, service_user):
+    owner_id, user_uuid = service_user
+    assert activity_summary_service.get_activity_summary(user_uuid).total_plays == 9
+
+    response = _delete_history(client_for, owner_id, 'all')
+
+    assert response.status_code == 200
+    db.session.expire_all()
+    summary = activity_summary_service.get_activity_summary(user_uuid)
+    assert summary is None or (summary.total_plays == 0 and summary.total_seconds == 0)
+    assert StreamHistoryRollup.query.filter_by(user_uuid=user_uuid).count() == 0
+    assert MediaStreamHistory.query.filter_by(user_uuid=user_uuid).count() == 0
+
+
+def test_deleting_old_history_keeps_recent_plays(client_for, service_user):
+    owner_id, user_uuid = service_user
+
+    response = _delete_history(client_for, owner_id, '30')
+
+    assert response.status_code == 200
+    db.session.expire_all()
+    summary = activity_summary_service.get_activity_summary(user_uuid)
+    assert summary.total_plays == 1
+    assert summary.total_seconds == 600
+    assert StreamHistoryRollup.query.filter_by(user_uuid=user_uuid).count() == 0
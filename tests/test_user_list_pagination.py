@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.extensions import db
+from app.models import User
+from app.services import user_list_service
+
+
+@pytest.fixture
+def users(make_service_user):
+    created = datetime(2026, 1, 1)
+    names = ['delta', 'Alpha', 'charlie', 'bravo', 'Echo', 'alpha', 'foxtrot']
+    for index, name in enumerate(names):
+        # Pairs share a creation time so the id tiebreaker is exercised
+        make_service_user(name, created_at=created + timedelta(days=index // 2))
+    return names
+
+
+def _walk(sort_by, per_page):
+    """Follow next cursors from the first page; returns the usernames of each page."""
+    pages, cursor, page_number = [], None, 1
+    while True:
+        page = user_list_service.paginate_users(user_list_service.build_users_query(), sort_by, page=page_number,
+                                                per_page=per_page, after=cursor)
+        pages.append([user.external_username for user in page.items])
+        if not page.has_next:
+            return pages
+        cursor, page_number = page.next_cursor, page_number + 1
+
+
+def test_cursor_round_trips_strings_and_datetimes():
+    moment = datetime(2026, 3, 4, 5, 6, 7)
+    assert user_list_service.decode_cursor(user_list_service.encode_cursor('bob', 7)) == ('bob', 7)
+    assert user_list_service.decode_cursor(user_list_service.encode_cursor(moment, 9)) == (moment, 9)
+
+
+@pytest.mark.parametrize('cursor', ['', None, 'not-base64!', 'e30'])
+def test_malformed_cursor_is_ignored(app, cursor):
+    assert user_list_service.decode_cursor(cursor) is None
+
+
+def test_username_sort_is_case_insensitive_with_id_tiebreak(users):
+    pages = _walk('username_asc', per_page=3)
+
+    assert pages == [['Alpha', 'alpha', 'bravo'], ['charlie', 'delta', 'Echo'], ['foxtrot']]
+
+
+@pytest.mark.parametrize('sort_by', ['username_desc', 'created_at_asc', 'created_at_desc', 'email_asc'])
+def test_keyset_pages_match_offset_pages(users, sort_by):
+    offset_order = [user.external_username for user in user_list_service.paginate_users(
+        user_list_service.build_users_query(), sort_by, per_page=100).items]
+
+    pages = _walk(sort_by, per_page=2)
+
+    assert [name for page in pages for name in page] == offset_order
+    assert len(offset_order) == len(users)
+
+
+def test_before_cursor_returns_the_previous_page_in_order(users):
+    query = user_list_service.build_users_query()
+    first = user_list_service.paginate_users(query, 'created_at_desc', page=1, per_page=3)
+    second = user_list_service.paginate_users(query, 'created_at_desc', page=2, per_page=3, after=first.next_cursor)
+
+    back = user_list_service.paginate_users(query, 'created_at_desc', page=1, per_page=3, before=second.prev_cursor)
+
+    assert [user.id for user in back.items] == [user.id for user in first.items]
+    assert not back.has_prev and back.has_next
+
+
+def test_renaming_a_user_updates_its_sort_key(users):
+    user = User.query.filter_by(external_username='foxtrot').one()
+    user.external_username = 'Aardvark'
+    db.session.commit()
+
+    pages = _walk('username_asc', per_page=10)
+
+    assert pages[0][0] == 'Aardvark'